@@ -167,8 +167,9 @@ class HuntBase(object):
     return utils.MapItemsIterator(
         lambda data: HuntResult(data=data, context=self._context), items)
 
-  def GetFilesArchive(self):
-    args = hunt_pb2.ApiGetHuntFilesArchiveArgs(hunt_id=self.hunt_id)
+  def GetFilesArchive(self, offset=0, download_id=None):
+    args = hunt_pb2.ApiGetHuntFilesArchiveArgs(
+        hunt_id=self.hunt_id, offset=offset, download_id=download_id)
     return self._context.SendStreamingRequest("GetHuntFilesArchive", args)
 
 
@@ -77,6 +77,10 @@ class ActionPlugin(object):
 
   require_fastpoll = True
 
+  # Actions that are known to finish quickly are run on a separate lane of the
+  # threaded worker, so they don't wait behind long running actions.
+  short_running = False
+
   last_progress_time = 0
 
   def __init__(self, grr_worker=None):
@@ -94,8 +98,7 @@ class ActionPlugin(object):
         status=rdf_flows.GrrStatus.ReturnedStatus.OK)
     self._last_gc_run = rdfvalue.RDFDatetime.Now()
     self._gc_frequency = config_lib.CONFIG["Client.gc_frequency"]
-    self.proc = psutil.Process()
-    self.cpu_start = self.proc.cpu_times()
+    self.cpu_start = self._GetCPUTimes()
     self.cpu_limit = rdf_flows.GrrMessage().cpu_limit
 
   def Execute(self, message):
@@ -138,7 +141,7 @@ class ActionPlugin(object):
         raise RuntimeError("Message for %s was not Authenticated." %
                            self.message.name)
 
-      self.cpu_start = self.proc.cpu_times()
+      self.cpu_start = self._GetCPUTimes()
       self.cpu_limit = self.message.cpu_limit
 
       if getattr(flags.FLAGS, "debug_client_actions", False):
@@ -149,9 +152,9 @@ class ActionPlugin(object):
 
       # Ensure we always add CPU usage even if an exception occurred.
       finally:
-        used = self.proc.cpu_times()
-        self.cpu_used = (used.user - self.cpu_start.user,
-                         used.system - self.cpu_start.system)
+        user_end, system_end = self._GetCPUTimes()
+        self.cpu_used = (user_end - self.cpu_start[0],
+                         system_end - self.cpu_start[1])
 
     except NetworkBytesExceededError as e:
       self.SetStatus(rdf_flows.GrrStatus.ReturnedStatus.NETWORK_LIMIT_EXCEEDED,
@@ -183,6 +186,12 @@ class ActionPlugin(object):
 
     self._RunGC()
 
+  def _GetCPUTimes(self):
+    """Returns the user and system CPU times charged to this action."""
+    # Actions can run concurrently, so only the CPU time of the thread running
+    # the action is charged to it.
+    return client_utils.ThreadCPUTimes()
+
   def _RunGC(self):
     # After each action we can run the garbage collection to reduce our memory
     # footprint a bit. We don't do it too frequently though since this is
@@ -269,11 +278,8 @@ class ActionPlugin(object):
 
     self.nanny_controller.Heartbeat()
 
-    user_start = self.cpu_start.user
-    system_start = self.cpu_start.system
-    cpu_times = self.proc.cpu_times()
-    user_end = cpu_times.user
-    system_end = cpu_times.system
+    user_start, system_start = self.cpu_start
+    user_end, system_end = self._GetCPUTimes()
 
     used_cpu = user_end - user_start + system_end - system_start
 
@@ -455,6 +461,13 @@ class SuspendableAction(ActionPlugin):
     # through a condition variable.
     self.worker = None
 
+  def _GetCPUTimes(self):
+    # Execute runs in the calling thread while Iterate runs in the
+    # ClientActionWorker thread, so the times of a single thread would miss
+    # most of the work. Suspendable actions are charged the process times.
+    cpu_times = psutil.Process().cpu_times()
+    return cpu_times.user, cpu_times.system
+
   def Run(self, request):
     """Process a server request."""
     # This method will be called multiple times for each new client request,
@@ -3,7 +3,6 @@
 """Test client actions."""
 
 import __builtin__
-import collections
 import logging
 import os
 import platform
@@ -196,6 +195,36 @@ class ActionTest(test_lib.EmptyActionTest):
     self.assertIn("Ran out of iterations", status.error_message)
     self.assertEqual(grr_worker.suspended_actions, {})
 
+  def testSuspendableActionIsChargedProcessCPUTime(self):
+
+    class FakeProcess(object):
+
+      # Read when the action is created, started and finished.
+      times = [(0, 0), (1, 0), (3, 1)]
+
+      def __init__(self, unused_pid=None):
+        pass
+
+      def cpu_times(self):  # pylint: disable=g-bad-name
+        user, system = self.times.pop(0)
+        return mock.Mock(user=user, system=system)
+
+    request = rdf_client.ListDirRequest()
+    request.pathspec.path = self.base_path
+    request.pathspec.pathtype = "OS"
+    request.iterator.number = 100000
+
+    with utils.MultiStubber((psutil, "Process", FakeProcess),
+                            (client_utils, "ThreadCPUTimes", lambda: (0, 0))):
+      responses = self.ExecuteAction(
+          standard.SuspendableListDirectory,
+          request,
+          grr_worker=worker_mocks.FakeClientWorker())
+
+    status = responses[-1]
+    self.assertEqual(status.cpu_time_used.user_cpu_time, 2)
+    self.assertEqual(status.cpu_time_used.system_cpu_time, 1)
+
   def testEnumerateUsersLinux(self):
     """Enumerate users from the wtmp file."""
     # Linux only
@@ -281,15 +310,10 @@ class ActionTest(test_lib.EmptyActionTest):
       def SendClientAlert(self, msg):
         received_messages.append(msg)
 
-    class FakeProcess(object):
+    times = [(1, 0), (2, 0), (3, 0), (10000, 0), (10001, 0)]
 
-      times = [(1, 0), (2, 0), (3, 0), (10000, 0), (10001, 0)]
-
-      def __init__(self, unused_pid=None):
-        self.pcputimes = collections.namedtuple("pcputimes", ["user", "system"])
-
-      def cpu_times(self):  # pylint: disable=g-bad-name
-        return self.pcputimes(*self.times.pop(0))
+    def MockThreadCPUTimes():
+      return times.pop(0)
 
     results = []
 
@@ -299,8 +323,9 @@ class ActionTest(test_lib.EmptyActionTest):
     message = rdf_flows.GrrMessage(name="ProgressAction", cpu_limit=3600)
 
     action_cls = actions.ActionPlugin.classes[message.name]
-    with utils.MultiStubber((psutil, "Process", FakeProcess),
-                            (action_cls, "SendReply", MockSendReply)):
+    with utils.MultiStubber(
+        (client_utils, "ThreadCPUTimes", MockThreadCPUTimes),
+        (action_cls, "SendReply", MockSendReply)):
 
       action_cls._authentication_required = False
       action = action_cls(grr_worker=MockWorker())
@@ -34,6 +34,7 @@ class Echo(actions.ActionPlugin):
   """Returns a message to the server."""
   in_rdfvalue = rdf_client.EchoRequest
   out_rdfvalues = [rdf_client.LogMessage]
+  short_running = True
 
   def Run(self, args):
     self.SendReply(args)
@@ -42,6 +43,7 @@ class Echo(actions.ActionPlugin):
 class GetHostname(actions.ActionPlugin):
   """Retrieves the host name of the client."""
   out_rdfvalues = [rdf_protodict.DataBlob]
+  short_running = True
 
   def Run(self, unused_args):
     self.SendReply(string=socket.gethostname())
@@ -50,6 +52,7 @@ class GetHostname(actions.ActionPlugin):
 class GetPlatformInfo(actions.ActionPlugin):
   """Retrieves platform information."""
   out_rdfvalues = [rdf_client.Uname]
+  short_running = True
 
   def Run(self, unused_args):
     """Populate platform information into a Uname response."""
@@ -126,6 +129,7 @@ class GetConfiguration(actions.ActionPlugin):
   """Retrieves the running configuration parameters."""
   in_rdfvalue = None
   out_rdfvalues = [rdf_protodict.Dict]
+  short_running = True
 
   BLOCKED_PARAMETERS = ["Client.private_key"]
 
@@ -153,6 +157,7 @@ class GetLibraryVersions(actions.ActionPlugin):
   """Retrieves version information for installed libraries."""
   in_rdfvalue = None
   out_rdfvalues = [rdf_protodict.Dict]
+  short_running = True
 
   def GetSSLVersion(self):
     return openssl.backend.openssl_version_text()
@@ -278,6 +283,7 @@ def GetClientInformation():
 class GetClientInfo(actions.ActionPlugin):
   """Obtains information about the GRR client installed."""
   out_rdfvalues = [rdf_client.ClientInformation]
+  short_running = True
 
   def Run(self, unused_args):
     self.SendReply(GetClientInformation())
@@ -287,6 +293,7 @@ class GetClientStats(actions.ActionPlugin):
   """This retrieves some stats about the GRR process."""
   in_rdfvalue = rdf_client.GetClientStatsRequest
   out_rdfvalues = [rdf_client.ClientStats]
+  short_running = True
 
   def Run(self, arg):
     """Returns the client stats."""
@@ -301,6 +308,10 @@ class GetClientStats(actions.ActionPlugin):
         memory_percent=proc.memory_percent(),
         bytes_received=stats.STATS.GetMetricValue("grr_client_received_bytes"),
         bytes_sent=stats.STATS.GetMetricValue("grr_client_sent_bytes"),
+        hash_cache_hits=stats.STATS.GetMetricValue(
+            "grr_client_hash_cache_hits"),
+        hash_cache_misses=stats.STATS.GetMetricValue(
+            "grr_client_hash_cache_misses"),
         create_time=long(proc.create_time() * 1e6),
         boot_time=long(psutil.boot_time() * 1e6))
 
@@ -4,6 +4,7 @@
 import errno
 import fnmatch
 import functools
+import hashlib
 import itertools
 import os
 import platform
@@ -15,9 +16,10 @@ import psutil
 import logging
 
 from grr.client import actions
-from grr.client.client_actions import standard as standard_actions
+from grr.client import hash_cache
 from grr.client.vfs_handlers import files
 
+from grr.lib import multi_literal
 from grr.lib import utils
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import crypto as rdf_crypto
@@ -115,6 +117,102 @@ class LiteralComponent(Component):
     return "%s:%s" % (self.__class__, self.literal)
 
 
+class ContentConditionScanner(object):
+  """Looks for the hits of a single content condition in a stream of data.
+
+  The data of the scanned range is pushed with Feed(). It is split into
+  overlapping blocks, so that hits crossing block boundaries are found too.
+  """
+
+  def __init__(self, params, matching_func, overlap_size, chunk_size):
+    self.matching_func = matching_func
+    self.overlap_size = overlap_size
+    self.chunk_size = chunk_size
+
+    self.start_offset = params.start_offset
+    self.end_offset = params.start_offset + params.length
+    self.bytes_before = params.bytes_before
+    self.bytes_after = params.bytes_after
+    self.first_hit = params.mode == params.Mode.FIRST_HIT
+
+    self.findings = []
+    self.done = False
+
+    self._pending = []
+    self._pending_size = 0
+    self._overlap = None
+    self._current_offset = self.start_offset
+
+  def Feed(self, data):
+    """Scans the next piece of data of the range."""
+    if self.done:
+      return
+
+    self._pending.append(data)
+    self._pending_size += len(data)
+
+    while not self.done:
+      if self._overlap is None:
+        needed = self.overlap_size
+      else:
+        needed = self.chunk_size
+
+      if self._pending_size < needed:
+        break
+
+      self._ScanBlock(needed)
+
+  def Finish(self):
+    """Scans the data left at the end of the range or of the file."""
+    if not self.done and self._pending_size:
+      self._ScanBlock(self._pending_size)
+
+    self.done = True
+
+  def _ScanBlock(self, length):
+    """Scans the overlap and the next length bytes of pending data."""
+    # The overlap and the new data are joined in a single copy, the matching
+    # functions then work on offsets into this buffer.
+    if self._overlap is None:
+      buf = "".join(self._pending)
+      chunk_size = length
+    else:
+      buf = "".join([self._overlap] + self._pending)
+      chunk_size = len(self._overlap) + length
+
+    if len(buf) > chunk_size:
+      self._pending = [buf[chunk_size:]]
+    else:
+      self._pending = []
+    self._pending_size -= length
+
+    pos, match_length = self.matching_func(buf, 0, chunk_size)
+    while pos is not None:
+      if (chunk_size > self.overlap_size and
+          pos + match_length <= self.overlap_size):
+        # We already processed this hit.
+        pos, match_length = self.matching_func(buf, pos + 1, chunk_size)
+        continue
+
+      context_start = max(pos - self.bytes_before, 0)
+      # This might cut off some data if the hit is at the chunk border.
+      context_end = min(pos + match_length + self.bytes_after, chunk_size)
+      data = buf[context_start:context_end]
+      self.findings.append(
+          rdf_client.BufferReference(
+              offset=self._current_offset + context_start,
+              length=len(data),
+              data=data,))
+      if self.first_hit:
+        self.done = True
+        return
+
+      pos, match_length = self.matching_func(buf, pos + 1, chunk_size)
+
+    self._current_offset += chunk_size - self.overlap_size
+    self._overlap = buf[max(0, chunk_size - self.overlap_size):chunk_size]
+
+
 class FileFinderOS(actions.ActionPlugin):
   """The file finder implementation using the OS file api."""
 
@@ -150,9 +248,11 @@ class FileFinderOS(actions.ActionPlugin):
       # Never stop at any device boundary.
       self.mountpoints_blacklist = set()
 
+    # Conditions are compiled once for all the files.
+    self.conditions, self.content_conditions = self.ParseConditions(args)
+
     for fname in self.CollectGlobs(args.paths):
       self.Progress()
-      self.conditions = self.ParseConditions(args)
 
       try:
         stat_object = os.lstat(fname)
@@ -174,6 +274,37 @@ class FileFinderOS(actions.ActionPlugin):
       if not conditions_apply:
         continue
 
+      # We never want to hash/download the link, always the target.
+      target_stat_object = stat_object
+      if (args.action.action_type != args.action.Action.STAT and
+          stat.S_ISLNK(stat_object.st_mode)):
+        try:
+          target_stat_object = os.stat(fname)
+        except OSError:
+          continue
+
+      # Content conditions and hashing share a single read of the file.
+      max_hash_size = None
+      if args.action.action_type == args.action.Action.HASH:
+        max_hash_size = self._GetMaxHashSize(
+            target_stat_object, args.action.hash.max_size,
+            args.action.hash.oversized_file_policy)
+
+      hash_entry = None
+      if self.content_conditions:
+        scanners = [factory() for factory in self.content_conditions]
+        conditions_apply, hash_entry = self._ProcessContents(
+            fname, scanners, max_hash_size, stat_object=target_stat_object)
+        if not conditions_apply:
+          continue
+
+        for scanner in scanners:
+          result.matches.Extend(scanner.findings)
+
+      elif max_hash_size is not None:
+        _, hash_entry = self._ProcessContents(
+            fname, [], max_hash_size, stat_object=target_stat_object)
+
       if args.action.action_type == args.action.Action.STAT:
 
         result.stat_entry = self.Stat(fname, stat_object,
@@ -184,12 +315,7 @@ class FileFinderOS(actions.ActionPlugin):
       else:
         stat_entry = self.Stat(fname, stat_object, True)
 
-      # We never want to hash/download the link, always the target.
-      if stat.S_ISLNK(stat_object.st_mode):
-        try:
-          stat_object = os.stat(fname)
-        except OSError:
-          continue
+      stat_object = target_stat_object
 
       if args.action.action_type == args.action.Action.DOWNLOAD:
         max_bytes = None
@@ -217,9 +343,7 @@ class FileFinderOS(actions.ActionPlugin):
 
       elif args.action.action_type == args.action.Action.HASH:
         result.stat_entry = stat_entry
-        result.hash_entry = self.Hash(fname, stat_object,
-                                      args.action.hash.max_size,
-                                      args.action.hash.oversized_file_policy)
+        result.hash_entry = hash_entry
       self.SendReply(result)
 
   def Stat(self, fname, stat_object, resolve_links):
@@ -233,34 +357,144 @@ class FileFinderOS(actions.ActionPlugin):
         pathtype=rdf_paths.PathSpec.PathType.OS, path=fname)
     return files.MakeStatResponse(stat_object, pathspec=pathspec)
 
+  def _GetMaxHashSize(self, stat_object, policy_max_hash_size,
+                      oversized_file_policy):
+    """Returns the number of bytes to hash or None if hashing is skipped."""
+    file_size = stat_object.st_size
+    if file_size <= policy_max_hash_size:
+      return file_size
+
+    ff_opts = rdf_file_finder.FileFinderHashActionOptions
+    if oversized_file_policy == ff_opts.OversizedFilePolicy.SKIP:
+      return None
+    elif oversized_file_policy == ff_opts.OversizedFilePolicy.HASH_TRUNCATED:
+      return policy_max_hash_size
+
+    raise ValueError("Unknown oversized file policy %s." %
+                     int(oversized_file_policy))
+
   def Hash(self,
            fname,
            stat_object,
            policy_max_hash_size,
            oversized_file_policy,
            resolve_links=True):
-    file_size = stat_object.st_size
-    if file_size <= policy_max_hash_size:
-      max_hash_size = file_size
-    else:
-      ff_opts = rdf_file_finder.FileFinderHashActionOptions
-      if oversized_file_policy == ff_opts.OversizedFilePolicy.SKIP:
-        return
-      elif oversized_file_policy == ff_opts.OversizedFilePolicy.HASH_TRUNCATED:
-        max_hash_size = policy_max_hash_size
+    max_hash_size = self._GetMaxHashSize(stat_object, policy_max_hash_size,
+                                         oversized_file_policy)
+    if max_hash_size is None:
+      return
+
+    _, result = self._ProcessContents(
+        fname, [], max_hash_size, stat_object=stat_object)
+    return result
+
+  READ_BLOCK_SIZE = 1024 * 1024
+
+  def _ProcessContents(self,
+                       fname,
+                       scanners,
+                       max_hash_size=None,
+                       stat_object=None):
+    """Reads the file once, feeding content scanners and hashers.
+
+    Reading stops as soon as all the scanners are done and enough data was
+    hashed, or as soon as one of the scanners is known not to match.
+
+    Args:
+      fname: The file to read.
+      scanners: A list of ContentConditionScanner objects.
+      max_hash_size: Number of bytes to hash, None if no hashing is needed.
+      stat_object: The stat result of the file, if given the hashes are looked
+                   up in and stored to the client's hash cache.
+
+    Returns:
+      A tuple (conditions_apply, hash_entry).
+    """
+    cached_hash = None
+    if max_hash_size is not None and stat_object is not None:
+      digests, num_bytes = hash_cache.GetCachedHashes(stat_object,
+                                                      max_hash_size)
+      if digests is not None:
+        cached_hash = rdf_crypto.Hash(num_bytes=num_bytes, **digests)
+
+    hashers = {}
+    if max_hash_size is not None and cached_hash is None:
+      hashers = {
+          "md5": hashlib.md5(),
+          "sha1": hashlib.sha1(),
+          "sha256": hashlib.sha256()
+      }
+
+    if cached_hash is not None and not scanners:
+      return True, cached_hash
 
     try:
-      file_obj = open(fname, "rb")
+      fd = open(fname, "rb")
     except IOError:
-      return
+      return not scanners, None
 
-    with file_obj:
-      hashers, bytes_read = standard_actions.HashFile().HashFile(
-          ["md5", "sha1", "sha256"], file_obj, max_hash_size)
-    result = rdf_crypto.Hash(**dict((k, v.digest())
-                                    for k, v in hashers.iteritems()))
-    result.num_bytes = bytes_read
-    return result
+    offsets = [(s.start_offset, s.end_offset) for s in scanners]
+    if hashers:
+      offsets.append((0, max_hash_size))
+
+    offset = min(start for start, _ in offsets)
+    end = max(end for _, end in offsets)
+    bytes_hashed = 0
+
+    with fd:
+      fd.seek(offset)
+
+      while offset < end:
+        if (all(s.done for s in scanners) and
+            (not hashers or offset >= max_hash_size)):
+          break
+
+        data = fd.read(min(self.READ_BLOCK_SIZE, end - offset))
+        if not data:
+          break
+
+        self.Progress()
+        block_end = offset + len(data)
+
+        if hashers and offset < max_hash_size:
+          hashed_data = data[:max_hash_size - offset]
+          for hasher in hashers.itervalues():
+            hasher.update(hashed_data)
+          bytes_hashed += len(hashed_data)
+
+        for scanner in scanners:
+          if scanner.done:
+            continue
+
+          start = max(scanner.start_offset, offset)
+          stop = min(scanner.end_offset, block_end)
+          if start < stop:
+            scanner.Feed(data[start - offset:stop - offset])
+
+          if block_end >= scanner.end_offset:
+            scanner.Finish()
+
+          if scanner.done and not scanner.findings:
+            return False, None
+
+        offset = block_end
+
+    for scanner in scanners:
+      scanner.Finish()
+      if not scanner.findings:
+        return False, None
+
+    hash_entry = cached_hash
+    if hashers:
+      digests = dict((k, v.digest()) for k, v in hashers.iteritems())
+      hash_entry = rdf_crypto.Hash(**digests)
+      hash_entry.num_bytes = bytes_hashed
+
+      if stat_object is not None:
+        hash_cache.CacheHashes(fname, stat_object, max_hash_size, bytes_hashed,
+                               digests)
+
+    return True, hash_entry
 
   def CollectGlobs(self, globs):
     expanded_globs = {}
@@ -448,126 +682,64 @@ class FileFinderOS(actions.ActionPlugin):
   OVERLAP_SIZE = 1024 * 1024
   CHUNK_SIZE = 10 * 1024 * 1024
 
-  def _StreamFile(self, fd, offset, length):
-    """Generates overlapping blocks of data read from a file."""
-    to_read = length
-    fd.seek(offset)
-
-    overlap = fd.read(min(self.OVERLAP_SIZE, to_read))
-    to_read -= len(overlap)
-
-    yield overlap
-
-    while to_read > 0:
-      data = fd.read(min(self.CHUNK_SIZE, to_read))
-      if not data:
-        return
-      to_read -= len(data)
-
-      combined_data = overlap + data
-      yield combined_data
-      overlap = combined_data[-self.OVERLAP_SIZE:]
-
-  def _MatchRegex(self, regex, chunk, pos):
-    match = regex.Search(chunk[pos:])
+  def _MatchRegex(self, regex, chunk, pos, endpos):
+    match = regex.Search(chunk, pos, endpos)
     if not match:
       return None, 0
     else:
       start, end = match.span()
-      return start + pos, end - start
+      return start, end - start
 
-  def ContentsRegexMatchCondition(self, condition_obj, path, stat_obj, result):
+  def ContentsRegexMatchCondition(self, condition_obj):
+    """Returns a scanner factory for a regex match condition."""
     params = condition_obj.contents_regex_match
     regex = params.regex
 
-    return self._ScanForMatches(params, path,
-                                functools.partial(self._MatchRegex, regex),
-                                result)
-
-  def _MatchLiteral(self, literal, chunk, pos):
-    pos = chunk.find(literal, pos)
-    if pos == -1:
-      return None, 0
-    else:
-      return pos, len(literal)
+    return functools.partial(ContentConditionScanner, params,
+                             functools.partial(self._MatchRegex, regex),
+                             self.OVERLAP_SIZE, self.CHUNK_SIZE)
 
-  def ContentsLiteralMatchCondition(self, condition_obj, path, stat_obj,
-                                    result):
+  def ContentsLiteralMatchCondition(self, condition_obj):
+    """Returns a scanner factory for a literal match condition."""
     params = condition_obj.contents_literal_match
 
-    literal = utils.SmartStr(params.literal)
+    # All the literals of the condition are searched for in a single pass.
+    matcher = multi_literal.MultiLiteralMatcher([params.literal] +
+                                                list(params.literals))
 
-    return self._ScanForMatches(params, path,
-                                functools.partial(self._MatchLiteral, literal),
-                                result)
+    return functools.partial(ContentConditionScanner, params, matcher.Search,
+                             self.OVERLAP_SIZE, self.CHUNK_SIZE)
 
-  def _ScanForMatches(self, params, path, matching_func, result):
-    try:
-      fd = open(path, mode="rb")
-    except IOError:
-      return False
-
-    current_offset = params.start_offset
-    findings = []
-    for chunk in self._StreamFile(fd, current_offset, params.length):
-      pos, match_length = matching_func(chunk, 0)
-      while pos is not None:
-        if (len(chunk) > self.OVERLAP_SIZE and
-            pos + match_length < self.OVERLAP_SIZE):
-          # We already processed this hit.
-          pos, match_length = matching_func(chunk, pos + 1)
-          continue
+  def ParseConditions(self, args):
+    """Compiles the conditions of the action.
 
-        context_start = max(pos - params.bytes_before, 0)
-        # This might cut off some data if the hit is at the chunk border.
-        context_end = min(pos + match_length + params.bytes_after, len(chunk))
-        data = chunk[context_start:context_end]
-        findings.append(
-            rdf_client.BufferReference(
-                offset=current_offset + context_start,
-                length=len(data),
-                data=data,))
-        if params.mode == params.Mode.FIRST_HIT:
-          for finding in findings:
-            result.matches.append(finding)
-          return True
-
-        pos, match_length = matching_func(chunk, pos + 1)
-
-      current_offset += len(chunk) - self.OVERLAP_SIZE
-
-    if findings:
-      for finding in findings:
-        result.matches.append(finding)
-      return True
-    else:
-      return False
+    Args:
+      args: FileFinderArgs.
 
-  def ParseConditions(self, args):
+    Returns:
+      A tuple (conditions, content_conditions). Conditions are callables
+      checking the stat of a file, content conditions are factories of
+      ContentConditionScanner objects, one is created for every file.
+    """
     type_enum = rdf_file_finder.FileFinderCondition.Type
-    condition_weights = {
-        type_enum.MODIFICATION_TIME: 0,
-        type_enum.ACCESS_TIME: 0,
-        type_enum.INODE_CHANGE_TIME: 0,
-        type_enum.SIZE: 0,
-        type_enum.CONTENTS_REGEX_MATCH: 1,
-        type_enum.CONTENTS_LITERAL_MATCH: 1,
-    }
     condition_handlers = {
         type_enum.MODIFICATION_TIME: self.ModificationTimeCondition,
         type_enum.ACCESS_TIME: self.AccessTimeCondition,
         type_enum.INODE_CHANGE_TIME: self.InodeChangeTimeCondition,
         type_enum.SIZE: self.SizeCondition,
+    }
+    content_condition_handlers = {
         type_enum.CONTENTS_REGEX_MATCH: self.ContentsRegexMatchCondition,
         type_enum.CONTENTS_LITERAL_MATCH: self.ContentsLiteralMatchCondition
     }
 
-    sorted_conditions = sorted(
-        args.conditions,
-        key=lambda cond: condition_weights[cond.condition_type])
-
     conditions = []
-    for cond in sorted_conditions:
-      conditions.append(
-          functools.partial(condition_handlers[cond.condition_type], cond))
-    return conditions
+    content_conditions = []
+    for cond in args.conditions:
+      if cond.condition_type in content_condition_handlers:
+        content_conditions.append(
+            content_condition_handlers[cond.condition_type](cond))
+      else:
+        conditions.append(
+            functools.partial(condition_handlers[cond.condition_type], cond))
+    return conditions, content_conditions
@@ -9,6 +9,7 @@ import shutil
 
 import psutil
 
+from grr.client import hash_cache
 from grr.client.client_actions import file_finder as client_file_finder
 from grr.lib import flags
 from grr.lib import rdfvalue
@@ -275,6 +276,34 @@ class FileFinderTest(test_lib.EmptyActionTest):
       self.assertEqual(
           buffer_ref.data[bytes_before:bytes_before + len(literal)], literal)
 
+  def testLiteralMatchConditionMultipleLiterals(self):
+    searching_path = os.path.join(self.base_path, "searching")
+    paths = [searching_path + "/{dpkg.log,dpkg_false.log,auth.log}"]
+
+    clmc = rdf_file_finder.FileFinderContentsLiteralMatchCondition
+    condition = rdf_file_finder.FileFinderCondition(
+        condition_type="CONTENTS_LITERAL_MATCH",
+        contents_literal_match=clmc(
+            literal="not in any of the files",
+            literals=["pam_unix(ssh:session)", "mydomain.com"],
+            mode="ALL_HITS"))
+
+    raw_results = self._RunFileFinder(
+        paths, self.stat_action, conditions=[condition])
+    relative_results = self._GetRelativeResults(
+        raw_results, base_path=searching_path)
+    self.assertEqual(relative_results, ["auth.log"])
+    self.assertEqual(len(raw_results[0].matches), 9)
+
+    orig_data = open(os.path.join(searching_path, "auth.log")).read()
+    offsets = [m.offset for m in raw_results[0].matches]
+    self.assertEqual(offsets, sorted(offsets))
+    for buffer_ref in raw_results[0].matches:
+      self.assertIn(buffer_ref.data, ["pam_unix(ssh:session)", "mydomain.com"])
+      self.assertEqual(
+          orig_data[buffer_ref.offset:buffer_ref.offset + buffer_ref.length],
+          buffer_ref.data)
+
   def testLiteralMatchConditionLargeFile(self):
     paths = [os.path.join(self.base_path, "new_places.sqlite")]
     literal = "RecentlyBookmarked"
@@ -396,6 +425,66 @@ class FileFinderTest(test_lib.EmptyActionTest):
     self.assertEqual(res.hash_entry.sha256.HexDigest(),
                      hashlib.sha256(data).hexdigest())
 
+  def testCachedHashesOfShortFiles(self):
+    path = os.path.join(self.temp_dir, "hashed_file")
+    with open(path, "wb") as fd:
+      fd.write("hello world")
+
+    action = client_file_finder.FileFinderOS()
+    with test_lib.ConfigOverrider({
+        "Client.hash_cache_path": os.path.join(self.temp_dir, "cache.db")
+    }):
+      hash_cache.ResetHashCache()
+      try:
+        results = [
+            action._ProcessContents(
+                path, [], max_hash_size=4096, stat_object=os.stat(path))
+            for _ in range(2)
+        ]
+      finally:
+        hash_cache.ResetHashCache()
+
+    (_, hashed), (_, cached) = results
+    # The cached entry reports the bytes which were actually hashed.
+    self.assertEqual(hashed.num_bytes, len("hello world"))
+    self.assertEqual(cached, hashed)
+
+  def testContentConditionsWithHashAction(self):
+    searching_path = os.path.join(self.base_path, "searching")
+    paths = [searching_path + "/{dpkg.log,dpkg_false.log,auth.log}"]
+
+    clmc = rdf_file_finder.FileFinderContentsLiteralMatchCondition
+    crmc = rdf_file_finder.FileFinderContentsRegexMatchCondition
+    conditions = [
+        rdf_file_finder.FileFinderCondition(
+            condition_type="CONTENTS_LITERAL_MATCH",
+            contents_literal_match=clmc(literal="mydomain.com",
+                                        mode="ALL_HITS")),
+        rdf_file_finder.FileFinderCondition(
+            condition_type="CONTENTS_REGEX_MATCH",
+            contents_regex_match=crmc(regex=r"pa[nm]_o?unix\(s{2}h"))
+    ]
+
+    hash_action = rdf_file_finder.FileFinderAction(
+        action_type=rdf_file_finder.FileFinderAction.Action.HASH)
+    results = self._RunFileFinder(paths, hash_action, conditions=conditions)
+    self.assertEqual(len(results), 1)
+    res = results[0]
+
+    # Hits of all the conditions are reported, in the conditions order.
+    self.assertEqual(len(res.matches), 7)
+    for buffer_ref in res.matches[:6]:
+      self.assertIn("mydomain.com", buffer_ref.data)
+    self.assertIn("pam_unix(ssh", res.matches[6].data)
+
+    # The file was hashed while it was being scanned.
+    data = open(os.path.join(searching_path, "auth.log"), "rb").read()
+    self.assertEqual(res.hash_entry.num_bytes, len(data))
+    self.assertEqual(res.hash_entry.md5.HexDigest(),
+                     hashlib.md5(data).hexdigest())
+    self.assertEqual(res.hash_entry.sha256.HexDigest(),
+                     hashlib.sha256(data).hexdigest())
+
   def testLinkStat(self):
     """Tests resolving symlinks when getting stat entries."""
     test_dir = os.path.join(self.temp_dir, "lnk_stat_test")
@@ -5,6 +5,7 @@
 import hashlib
 
 from grr.lib import fingerprint
+from grr.client import hash_cache
 from grr.client import vfs
 from grr.client.client_actions import standard
 from grr.lib.rdfvalues import client as rdf_client
@@ -40,6 +41,32 @@ class FingerprintFile(standard.ReadBuffer):
           fingerprint.Fingerprinter.EvalPecoff),
   }
 
+  def _GetCacheableHashNames(self, tuples):
+    """Returns the hashes to look up in the hash cache or None."""
+    # Only plain hashes of the whole file are cached.
+    if (len(tuples) != 1 or
+        tuples[0].fp_type != rdf_client.FingerprintTuple.Type.FPT_GENERIC or
+        not tuples[0].hashers):
+      return None
+
+    return [self._hash_types[h]().name for h in tuples[0].hashers]
+
+  def _GetCachedResults(self, stat_obj, hash_names):
+    digests, _ = hash_cache.GetCachedHashes(stat_obj, hash_types=hash_names)
+    if digests is None:
+      return None
+
+    result = dict(name="generic")
+    for hash_name in hash_names:
+      result[hash_name] = digests[hash_name]
+    return [result]
+
+  def _CacheResults(self, filename, stat_obj, results):
+    digests = dict((k, v) for k, v in results[0].iteritems()
+                   if k in hash_cache.FileHashCache.HASH_TYPES)
+    hash_cache.CacheHashes(filename, stat_obj, None, stat_obj.st_size,
+                           digests)
+
   def Run(self, args):
     """Fingerprint a file."""
     with vfs.VFSOpen(
@@ -55,22 +82,38 @@ class FingerprintFile(standard.ReadBuffer):
         for k in self._fingerprint_types.iterkeys():
           tuples.append(rdf_client.FingerprintTuple(fp_type=k))
 
-      for finger in tuples:
-        hashers = [self._hash_types[h] for h in finger.hashers] or None
-        if finger.fp_type in self._fingerprint_types:
-          invoke = self._fingerprint_types[finger.fp_type]
-          res = invoke(fingerprinter, hashers)
-          if res:
-            response.matching_types.append(finger.fp_type)
-        else:
-          raise RuntimeError("Encountered unknown fingerprint type. %s" %
-                             finger.fp_type)
-
-      # Structure of the results is a list of dicts, each containing the
-      # name of the hashing method, hashes for enabled hash algorithms,
-      # and auxilliary data where present (e.g. signature blobs).
-      # Also see Fingerprint:HashIt()
-      response.results = fingerprinter.HashIt()
+      stat_obj = None
+      hash_names = self._GetCacheableHashNames(tuples)
+      if hash_names is not None:
+        stat_obj = standard.GetLocalFileStat(file_obj)
+
+      cached_results = None
+      if stat_obj is not None:
+        cached_results = self._GetCachedResults(stat_obj, hash_names)
+
+      if cached_results is not None:
+        response.matching_types.append(tuples[0].fp_type)
+        response.results = cached_results
+      else:
+        for finger in tuples:
+          hashers = [self._hash_types[h] for h in finger.hashers] or None
+          if finger.fp_type in self._fingerprint_types:
+            invoke = self._fingerprint_types[finger.fp_type]
+            res = invoke(fingerprinter, hashers)
+            if res:
+              response.matching_types.append(finger.fp_type)
+          else:
+            raise RuntimeError("Encountered unknown fingerprint type. %s" %
+                               finger.fp_type)
+
+        # Structure of the results is a list of dicts, each containing the
+        # name of the hashing method, hashes for enabled hash algorithms,
+        # and auxilliary data where present (e.g. signature blobs).
+        # Also see Fingerprint:HashIt()
+        results = fingerprinter.HashIt()
+        if stat_obj is not None:
+          self._CacheResults(file_obj.filename, stat_obj, results)
+        response.results = results
 
       # We now return data in a more structured form.
       for result in response.results:
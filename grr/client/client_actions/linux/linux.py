@@ -106,6 +106,7 @@ Ifaddrs._fields_ = [  # pylint: disable=protected-access
 class EnumerateInterfaces(actions.ActionPlugin):
   """Enumerates all MAC addresses on this system."""
   out_rdfvalues = [rdf_client.Interface]
+  short_running = True
 
   def Run(self, unused_args):
     """Enumerate all interfaces and collect their MAC addresses."""
@@ -167,6 +168,7 @@ class EnumerateInterfaces(actions.ActionPlugin):
 class GetInstallDate(actions.ActionPlugin):
   """Estimate the install date of this system."""
   out_rdfvalues = [rdf_protodict.DataBlob]
+  short_running = True
 
   def Run(self, unused_args):
     self.SendReply(integer=int(os.stat("/lost+found").st_ctime))
@@ -201,6 +203,7 @@ class EnumerateUsers(actions.ActionPlugin):
   # Client versions 3.0.7.1 and older used to return KnowledgeBaseUser.
   # KnowledgeBaseUser was renamed to User.
   out_rdfvalues = [rdf_client.User, rdf_client.KnowledgeBaseUser]
+  short_running = True
 
   def ParseWtmp(self):
     """Parse wtmp and extract the last logon time."""
@@ -272,6 +275,7 @@ class EnumerateFilesystems(actions.ActionPlugin):
       "squashfs"
   ])
   out_rdfvalues = [rdf_client.Filesystem]
+  short_running = True
 
   def CheckMounts(self, filename):
     """Parses the currently mounted devices."""
@@ -134,6 +134,7 @@ setattr(Ifaddrs, "_fields_", [
 class EnumerateInterfaces(actions.ActionPlugin):
   """Enumerate all MAC addresses of all NICs."""
   out_rdfvalues = [rdf_client.Interface]
+  short_running = True
 
   def Run(self, unused_args):
     """Enumerate all MAC addresses."""
@@ -197,6 +198,7 @@ class EnumerateInterfaces(actions.ActionPlugin):
 class GetInstallDate(actions.ActionPlugin):
   """Estimate the install date of this system."""
   out_rdfvalues = [rdf_protodict.DataBlob]
+  short_running = True
 
   def Run(self, unused_args):
     for f in ["/var/log/CDIS.custom", "/var", "/private"]:
@@ -212,6 +214,7 @@ class GetInstallDate(actions.ActionPlugin):
 class EnumerateFilesystems(actions.ActionPlugin):
   """Enumerate all unique filesystems local to the system."""
   out_rdfvalues = [rdf_client.Filesystem]
+  short_running = True
 
   def Run(self, unused_args):
     """List all local filesystems mounted on this system."""
@@ -3,12 +3,14 @@
 
 
 import functools
+import heapq
 import stat
 
 import logging
 
 from grr.client import actions
 from grr.client import vfs
+from grr.lib import multi_literal
 from grr.lib import utils
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import flows as rdf_flows
@@ -228,6 +230,10 @@ class Grep(actions.ActionPlugin):
 
     utils.XorByteArray(pattern, self.xor_in_key)
 
+  def FindLiterals(self, patterns, data):
+    """Search the data for hits of any of the XOR encoded patterns."""
+    return heapq.merge(*[self.FindLiteral(p, data) for p in patterns])
+
   BUFF_SIZE = 1024 * 1024 * 10
   ENVELOPE_SIZE = 1000
   HIT_LIMIT = 10000
@@ -295,11 +301,20 @@ class Grep(actions.ActionPlugin):
     self.xor_in_key = args.xor_in_key
     self.xor_out_key = args.xor_out_key
 
+    literals = [utils.SmartStr(l) for l in [args.literal] + list(args.literals)
+                if l]
+
     if args.regex:
       find_func = functools.partial(self.FindRegex, args.regex)
-    elif args.literal:
-      find_func = functools.partial(self.FindLiteral,
-                                    bytearray(utils.SmartStr(args.literal)))
+    elif len(literals) == 1:
+      find_func = functools.partial(self.FindLiteral, bytearray(literals[0]))
+    elif literals and self.xor_in_key:
+      # The patterns must not be decoded in memory for longer than needed, so
+      # they are searched for one by one.
+      find_func = functools.partial(self.FindLiterals,
+                                    [bytearray(l) for l in literals])
+    elif literals:
+      find_func = multi_literal.MultiLiteralMatcher(literals).FindIter
     else:
       raise RuntimeError("Grep needs a regex or a literal.")
 
@@ -337,11 +352,10 @@ class Grep(actions.ActionPlugin):
         if end + base_offset - preamble_size > args.start_offset + args.length:
           break
 
-        out_data = ""
-        for i in xrange(
-            max(0, start - args.bytes_before),
-            min(len(data), end + args.bytes_after)):  # pyformat: disable
-          out_data += chr(ord(data[i]) ^ self.xor_out_key)
+        out_data = data[max(0, start - args.bytes_before):
+                        min(len(data), end + args.bytes_after)]
+        if self.xor_out_key:
+          out_data = utils.Xor(out_data, self.xor_out_key)
 
         hits += 1
         self.SendReply(
@@ -489,6 +489,27 @@ class GrepTest(test_lib.EmptyActionTest):
       self.assertTrue("10" in utils.Xor(x.data, self.XOR_OUT_KEY))
       self.assertEqual(request.target.path, x.pathspec.path)
 
+  def testGrepMultipleLiterals(self):
+    # Use the real file system.
+    vfs.VFSInit().Run()
+
+    literals = ["10", "11", "329"]
+    request = rdf_client.GrepSpec(
+        literal=utils.Xor(literals[0], self.XOR_IN_KEY),
+        literals=[utils.Xor(l, self.XOR_IN_KEY) for l in literals[1:]],
+        xor_in_key=self.XOR_IN_KEY,
+        xor_out_key=self.XOR_OUT_KEY)
+    request.target.path = os.path.join(self.base_path, "numbers.txt")
+    request.target.pathtype = rdf_paths.PathSpec.PathType.OS
+
+    data = open(request.target.path, "rb").read()
+    expected = sorted(
+        i for i in xrange(len(data))
+        if any(data.startswith(l, i) for l in literals))
+
+    result = self.RunAction(searching.Grep, request)
+    self.assertEqual([x.offset for x in result], expected)
+
   def testGrepRegex(self):
     # Use the real file system.
     vfs.VFSInit().Run()
@@ -8,6 +8,7 @@ import hashlib
 import os
 import platform
 import socket
+import struct
 import sys
 import time
 import zlib
@@ -19,8 +20,10 @@ import logging
 
 from grr.client import actions
 from grr.client import client_utils_common
+from grr.client import hash_cache
 from grr.client import vfs
 from grr.client.client_actions import tempfiles
+from grr.client.vfs_handlers import files
 from grr.lib import config_lib
 from grr.lib import constants
 from grr.lib import flags
@@ -117,6 +120,116 @@ class HashBuffer(actions.ActionPlugin):
     self.SendReply(offset=args.offset, length=len(data), data=digest)
 
 
+class HashFileChunks(actions.ActionPlugin):
+  """Splits a file into content defined chunks and returns their hashes.
+
+  Chunk boundaries are placed where a rolling hash of the last 32 bytes has
+  its top bits set to zero. They only depend on the data around them, so
+  inserting or removing data in a file only changes the chunks around the
+  modification and the server can skip all the others if it already has them.
+  """
+  in_rdfvalue = rdf_client.FileChunkingRequest
+  out_rdfvalues = [rdf_client.BufferReference]
+
+  # The random values used by the rolling (gear) hash, they must be the same
+  # on all the clients for the chunks to be deduplicated.
+  _GEAR = [
+      struct.unpack("<I", hashlib.sha256(chr(i)).digest()[:4])[0]
+      for i in xrange(256)
+  ]
+
+  # The gear hash only depends on this many previous bytes.
+  _WINDOW_SIZE = 32
+
+  def FindChunkBoundary(self, data, min_size, max_size, mask):
+    """Returns the length of the first chunk of data."""
+    size = len(data)
+    if size <= min_size:
+      return size
+
+    end = min(size, max_size)
+    start = max(0, min_size - self._WINDOW_SIZE)
+
+    gear = self._GEAR
+    h = 0
+    pos = start
+    for byte in bytearray(buffer(data, start, end - start)):
+      h = ((h << 1) + gear[byte]) & 0xFFFFFFFF
+      pos += 1
+      if pos > min_size and not h & mask:
+        return pos
+
+    return end
+
+  def Run(self, args):
+    """Hashes the chunks of the file and sends them to the server."""
+    if args.max_chunk_size > constants.CLIENT_MAX_BUFFER_SIZE:
+      raise RuntimeError("Can not read buffers this large.")
+
+    avg_chunk_size = args.avg_chunk_size
+    if avg_chunk_size & (avg_chunk_size - 1):
+      raise ValueError("Average chunk size must be a power of two.")
+
+    # Use the top bits of the hash, they depend on the whole window.
+    bits = avg_chunk_size.bit_length() - 1
+    mask = ((1 << bits) - 1) << (32 - bits)
+
+    fd = vfs.VFSOpen(args.pathspec, progress_callback=self.Progress)
+    fd.Seek(args.offset)
+
+    offset = args.offset
+    to_read = args.length
+    data = ""
+    chunks = 0
+    while True:
+      # Always have enough data for a full chunk unless we reached the end.
+      if len(data) < args.max_chunk_size and to_read > 0:
+        read_data = fd.Read(min(constants.CLIENT_MAX_BUFFER_SIZE, to_read))
+        to_read -= len(read_data)
+        if not read_data:
+          to_read = 0
+        data += read_data
+        continue
+
+      if not data and chunks:
+        break
+
+      chunk_size = self.FindChunkBoundary(data, args.min_chunk_size,
+                                          args.max_chunk_size, mask)
+      chunk = data[:chunk_size]
+      data = data[chunk_size:]
+
+      self.SendReply(
+          offset=offset, length=len(chunk), data=hashlib.sha256(chunk).digest())
+
+      offset += len(chunk)
+      chunks += 1
+      self.Progress()
+
+
+def GetLocalFileStat(file_obj):
+  """Stats a file opened through the VFS if it's a plain local file.
+
+  Args:
+    file_obj: A VFS handler.
+
+  Returns:
+    An os.stat_result or None if the handler doesn't read a local file
+    directly (e.g. it parses a raw filesystem or applies an offset) or the
+    file can't be stat'ed.
+  """
+  if not isinstance(file_obj, files.File) or file_obj.file_offset:
+    return None
+
+  if file_obj.pathspec.last.HasField("file_size_override"):
+    return None
+
+  try:
+    return os.stat(file_obj.filename)
+  except (IOError, OSError):
+    return None
+
+
 class HashFile(actions.ActionPlugin):
   """Hash an entire file using multiple algorithms."""
   in_rdfvalue = rdf_client.FingerprintRequest
@@ -156,14 +269,27 @@ class HashFile(actions.ActionPlugin):
 
     with vfs.VFSOpen(
         args.pathspec, progress_callback=self.Progress) as file_obj:
-      hashers, bytes_read = self.HashFile(hash_types, file_obj,
-                                          args.max_filesize)
+      stat_obj = GetLocalFileStat(file_obj)
+      digests = None
+      if stat_obj is not None:
+        digests, bytes_read = hash_cache.GetCachedHashes(
+            stat_obj, args.max_filesize, hash_types=hash_types)
+
+      if digests is None:
+        hashers, bytes_read = self.HashFile(hash_types, file_obj,
+                                            args.max_filesize)
+        digests = dict((k, v.digest()) for k, v in hashers.iteritems())
+
+        if stat_obj is not None:
+          hash_cache.CacheHashes(file_obj.filename, stat_obj,
+                                 args.max_filesize, bytes_read, digests)
+      else:
+        digests = dict((k, digests[k]) for k in hash_types)
 
     response = rdf_client.FingerprintResponse(
         pathspec=file_obj.pathspec,
         bytes_read=bytes_read,
-        hash=rdf_crypto.Hash(**dict((k, v.digest())
-                                    for k, v in hashers.iteritems())))
+        hash=rdf_crypto.Hash(**digests))
 
     self.SendReply(response)
 
@@ -313,6 +439,7 @@ class StatFile(ListDirectory):
   """Sends a StatEntry for a single file."""
   in_rdfvalue = rdf_client.ListDirRequest
   out_rdfvalues = [rdf_client.StatEntry]
+  short_running = True
 
   def Run(self, args):
     """Sends a StatEntry for a single file."""
@@ -514,6 +641,7 @@ class ListProcesses(actions.ActionPlugin):
   """This action lists all the processes running on a machine."""
   in_rdfvalue = None
   out_rdfvalues = [rdf_client.Process]
+  short_running = True
 
   def Run(self, unused_arg):
     # psutil will cause an active loop on Windows 2000
@@ -760,6 +888,7 @@ class StatFS(actions.ActionPlugin):
 
 class GetMemorySize(actions.ActionPlugin):
   out_rdfvalues = [rdfvalue.ByteSize]
+  short_running = True
 
   def Run(self, args):
     _ = args
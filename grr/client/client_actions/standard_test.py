@@ -7,10 +7,12 @@ import os
 import time
 
 
+from grr.client import hash_cache
 from grr.client.client_actions import standard
 from grr.lib import action_mocks
 from grr.lib import config_lib
 from grr.lib import flags
+from grr.lib import stats
 from grr.lib import test_lib
 from grr.lib import utils
 from grr.lib.rdfvalues import client as rdf_client
@@ -274,6 +276,111 @@ class TestCopyPathToFile(test_lib.EmptyActionTest):
     self.assertFalse(os.path.exists(result.dest_path.path))
 
 
+class TestHashFileChunks(test_lib.EmptyActionTest):
+  """Test the HashFileChunks client action."""
+
+  def _HashChunks(self, data, **kwargs):
+    path = os.path.join(self.temp_dir, "chunked_file")
+    with open(path, "wb") as fd:
+      fd.write(data)
+
+    request = rdf_client.FileChunkingRequest(
+        pathspec=rdf_paths.PathSpec(
+            path=path, pathtype=rdf_paths.PathSpec.PathType.OS),
+        length=len(data),
+        **kwargs)
+    return self.RunAction(standard.HashFileChunks, request)
+
+  def testChunksCoverTheFile(self):
+    data = os.urandom(1024 * 1024)
+    chunks = self._HashChunks(
+        data, min_chunk_size=4096, avg_chunk_size=16384, max_chunk_size=65536)
+
+    self.assertGreater(len(chunks), 1)
+    offset = 0
+    for chunk in chunks:
+      self.assertEqual(chunk.offset, offset)
+      self.assertLessEqual(chunk.length, 65536)
+      if chunk is not chunks[-1]:
+        self.assertGreater(chunk.length, 4096)
+
+      self.assertEqual(
+          chunk.data,
+          hashlib.sha256(data[offset:offset + chunk.length]).digest())
+      offset += chunk.length
+
+    self.assertEqual(offset, len(data))
+
+  def testInsertedDataOnlyChangesNearbyChunks(self):
+    # Deterministic pseudo random data, so the chunk boundaries are stable.
+    data = "".join(hashlib.sha256(str(i)).digest() for i in xrange(32768))
+    kwargs = dict(
+        min_chunk_size=4096, avg_chunk_size=16384, max_chunk_size=65536)
+
+    original_hashes = set(c.data for c in self._HashChunks(data, **kwargs))
+    modified_hashes = [
+        c.data for c in self._HashChunks("X" * 100 + data, **kwargs)
+    ]
+
+    # Only the first chunk differs.
+    self.assertEqual(
+        len([h for h in modified_hashes if h not in original_hashes]), 1)
+
+  def testEmptyFile(self):
+    chunks = self._HashChunks("")
+
+    self.assertEqual(len(chunks), 1)
+    self.assertEqual(chunks[0].length, 0)
+    self.assertEqual(chunks[0].data, hashlib.sha256("").digest())
+
+
+class TestHashFileCache(test_lib.EmptyActionTest):
+  """Test the HashFile client action with the hash cache enabled."""
+
+  def setUp(self):
+    super(TestHashFileCache, self).setUp()
+    self.config_overrider = test_lib.ConfigOverrider({
+        "Client.hash_cache_path": os.path.join(self.temp_dir, "cache.db")
+    })
+    self.config_overrider.Start()
+    hash_cache.ResetHashCache()
+
+  def tearDown(self):
+    hash_cache.ResetHashCache()
+    self.config_overrider.Stop()
+    super(TestHashFileCache, self).tearDown()
+
+  def _HashFile(self, path):
+    request = rdf_client.FingerprintRequest(
+        pathspec=rdf_paths.PathSpec(
+            path=path, pathtype=rdf_paths.PathSpec.PathType.OS))
+    request.AddRequest(
+        fp_type=rdf_client.FingerprintTuple.Type.FPT_GENERIC,
+        hashers=[
+            rdf_client.FingerprintTuple.HashType.MD5,
+            rdf_client.FingerprintTuple.HashType.SHA256
+        ])
+    return self.RunAction(standard.HashFile, request)[0]
+
+  def testCachedHashes(self):
+    path = os.path.join(self.temp_dir, "hashed_file")
+    with open(path, "wb") as fd:
+      fd.write("hello world")
+
+    hits = stats.STATS.GetMetricValue("grr_client_hash_cache_hits")
+    first = self._HashFile(path)
+    second = self._HashFile(path)
+
+    self.assertEqual(
+        stats.STATS.GetMetricValue("grr_client_hash_cache_hits"), hits + 1)
+    self.assertEqual(first, second)
+    self.assertEqual(second.bytes_read, 11)
+    self.assertEqual(second.hash.md5, hashlib.md5("hello world").digest())
+    self.assertEqual(second.hash.sha256,
+                     hashlib.sha256("hello world").digest())
+    self.assertFalse(second.hash.HasField("sha1"))
+
+
 class TestNetworkByteLimits(test_lib.EmptyActionTest):
   """Test CopyPathToFile client actions."""
 
@@ -52,6 +52,7 @@ def UnicodeFromCodePage(string):
 class GetInstallDate(actions.ActionPlugin):
   """Estimate the install date of this system."""
   out_rdfvalues = [rdf_protodict.DataBlob]
+  short_running = True
 
   def Run(self, unused_args):
     """Estimate the install date of this system."""
@@ -70,6 +71,7 @@ class EnumerateInterfaces(actions.ActionPlugin):
     http://msdn.microsoft.com/en-us/library/aa394217(v=vs.85).aspx
   """
   out_rdfvalues = [rdf_client.Interface]
+  short_running = True
 
   def RunNetAdapterWMIQuery(self):
     pythoncom.CoInitialize()
@@ -96,6 +98,7 @@ class EnumerateInterfaces(actions.ActionPlugin):
 class EnumerateFilesystems(actions.ActionPlugin):
   """Enumerate all unique filesystems local to the system."""
   out_rdfvalues = [rdf_client.Filesystem]
+  short_running = True
 
   def Run(self, unused_args):
     """List all local filesystems mounted on this system."""
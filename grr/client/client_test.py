@@ -181,6 +181,25 @@ class BasicContextTests(test_lib.GRRBaseTest):
       result.append(item)
     self.assertEqual(result, ["C"] * 10 + ["A", "B"] * 10)
 
+  def testMessageHeap(self):
+    heap = comms.MessageHeap()
+    for i in range(10):
+      heap.Push("low%d" % i, 0, 1)
+      heap.Push("high%d" % i, 2, 10)
+
+    self.assertEqual(len(heap), 20)
+    self.assertEqual(heap.Size(), 110)
+
+    result = [heap.Pop()[0] for _ in range(12)]
+    self.assertEqual(result,
+                     ["high%d" % i for i in range(10)] + ["low0", "low1"])
+    self.assertEqual(heap.Size(), 8)
+
+    # Retransmitted messages jump the queue.
+    heap.Push("retransmit", 3, 5)
+    self.assertEqual(heap.Pop(), ("retransmit", 5))
+    self.assertEqual(heap.Pop(), ("low2", 1))
+
 
 def main(argv):
   test_lib.main(argv)
@@ -18,6 +18,7 @@ if sys.platform == "win32":
   NannyController = client_utils_windows.NannyController
 
   KeepAlive = client_utils_windows.KeepAlive
+  ThreadCPUTimes = client_utils_windows.ThreadCPUTimes
   WinChmod = client_utils_windows.WinChmod
 
 elif sys.platform == "darwin":
@@ -35,6 +36,7 @@ elif sys.platform == "darwin":
   NannyController = client_utils_linux.NannyController
 
   KeepAlive = client_utils_osx.KeepAlive
+  ThreadCPUTimes = client_utils_osx.ThreadCPUTimes
 
 else:
   from grr.client import client_utils_linux
@@ -46,3 +48,4 @@ else:
   NannyController = client_utils_linux.NannyController
 
   KeepAlive = client_utils_linux.KeepAlive
+  ThreadCPUTimes = client_utils_linux.ThreadCPUTimes
@@ -10,9 +10,39 @@ import threading
 import time
 
 
+from google.protobuf import message
 import logging
 
 from grr.lib import config_lib
+from grr.lib import rdfvalue
+from grr.lib.rdfvalues import flows as rdf_flows
+
+
+def SerializeTransactionLog(grr_messages):
+  return rdf_flows.MessageList(job=grr_messages).SerializeToString()
+
+
+def ParseTransactionLog(data):
+  """Returns the GrrMessages stored in a serialized transaction log.
+
+  Older clients logged a single GrrMessage instead of a MessageList. Parsed as
+  a MessageList, such a log is either invalid or yields messages without a
+  session id.
+
+  Args:
+    data: The serialized transaction log.
+
+  Returns:
+    A list of GrrMessages.
+  """
+  try:
+    grr_messages = list(rdf_flows.MessageList.FromSerializedString(data).job)
+    if all(grr_message.session_id for grr_message in grr_messages):
+      return grr_messages
+  except (message.Error, rdfvalue.Error):
+    pass
+
+  return [rdf_flows.GrrMessage.FromSerializedString(data)]
 
 
 def HandleAlarm(process):
@@ -4,6 +4,7 @@
 
 
 import os
+import resource
 import threading
 import time
 
@@ -13,10 +14,10 @@ import psutil
 from google.protobuf import message
 import logging
 
+from grr.client import client_utils_common
 from grr.lib import config_lib
 from grr.lib import rdfvalue
 from grr.lib import utils
-from grr.lib.rdfvalues import flows as rdf_flows
 from grr.lib.rdfvalues import paths as rdf_paths
 
 
@@ -225,22 +226,22 @@ class NannyController(object):
   def _GetLogFilename(self):
     return self.nanny_logfile or config_lib.CONFIG["Nanny.logfile"]
 
-  def WriteTransactionLog(self, grr_message):
-    """Write the message into the transaction log."""
-    grr_message = grr_message.SerializeToString()
+  def WriteTransactionLog(self, grr_messages):
+    """Write the messages into the transaction log."""
+    data = client_utils_common.SerializeTransactionLog(grr_messages)
 
     logfile = self._GetLogFilename()
 
     try:
       with open(logfile, "wb") as fd:
-        fd.write(grr_message)
+        fd.write(data)
     except (IOError, OSError):
       # Check if we're missing directories and try to create them.
       if not os.path.isdir(os.path.dirname(logfile)):
         try:
           os.makedirs(os.path.dirname(logfile))
           with open(logfile, "wb") as fd:
-            fd.write(grr_message)
+            fd.write(data)
         except (IOError, OSError):
           logging.exception("Couldn't write nanny transaction log to %s",
                             logfile)
@@ -258,7 +259,7 @@ class NannyController(object):
       pass
 
   def GetTransactionLog(self):
-    """Return a GrrMessage instance from the transaction log or None."""
+    """Return the GrrMessages in the transaction log or None."""
     try:
       with open(self._GetLogFilename(), "rb") as fd:
         data = fd.read(self.max_log_size)
@@ -267,7 +268,7 @@ class NannyController(object):
 
     try:
       if data:
-        return rdf_flows.GrrMessage.FromSerializedString(data)
+        return client_utils_common.ParseTransactionLog(data)
     except (message.Error, rdfvalue.Error):
       return
 
@@ -290,3 +291,13 @@ class NannyController(object):
 def KeepAlive():
   # Not yet supported for Linux.
   pass
+
+
+# The resource module of Python 2 doesn't define RUSAGE_THREAD.
+RUSAGE_THREAD = 1
+
+
+def ThreadCPUTimes():
+  """Returns the user and system CPU times of the calling thread."""
+  usage = resource.getrusage(RUSAGE_THREAD)
+  return usage.ru_utime, usage.ru_stime
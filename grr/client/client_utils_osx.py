@@ -10,6 +10,8 @@ import platform
 
 import logging
 
+import psutil
+
 from grr.client import client_utils_linux
 from grr.client.osx import objc
 from grr.lib import utils
@@ -316,3 +318,13 @@ class OSXVersion(object):
 def KeepAlive():
   # Not yet supported for OSX.
   pass
+
+
+def ThreadCPUTimes():
+  """Returns the user and system CPU times of the calling thread.
+
+  OSX doesn't account CPU time per thread in a way we can query, so these are
+  the times of the whole process.
+  """
+  cpu_times = psutil.Process().cpu_times()
+  return cpu_times.user, cpu_times.system
@@ -8,6 +8,7 @@ import imp
 import os
 import sys
 import tempfile
+import threading
 import time
 import mox
 
@@ -197,17 +198,40 @@ server.nfs:/vol/home /home/user nfs rw,nosuid,relatime 0 0
     with tempfile.NamedTemporaryFile() as fd:
       nanny_controller = client_utils_linux.NannyController()
       nanny_controller.StartNanny(nanny_logfile=fd.name)
-      grr_message = rdf_flows.GrrMessage(session_id="W:test")
+      grr_messages = [
+          rdf_flows.GrrMessage(session_id="W:test", request_id=1),
+          rdf_flows.GrrMessage(session_id="W:test2", request_id=2)
+      ]
 
-      nanny_controller.WriteTransactionLog(grr_message)
-      self.assertRDFValuesEqual(grr_message,
-                                nanny_controller.GetTransactionLog())
+      nanny_controller.WriteTransactionLog(grr_messages)
+      self.assertEqual(grr_messages, nanny_controller.GetTransactionLog())
       nanny_controller.CleanTransactionLog()
 
       self.assertIsNone(nanny_controller.GetTransactionLog())
 
+      # Logs written by older clients hold a single message.
+      with open(nanny_controller._GetLogFilename(), "wb") as log_fd:
+        log_fd.write(grr_messages[0].SerializeToString())
+      self.assertEqual([grr_messages[0]], nanny_controller.GetTransactionLog())
+
       nanny_controller.StopNanny()
 
+  def testLinuxThreadCPUTimes(self):
+    """CPU time used by other threads is not charged to the caller."""
+    user_start, system_start = client_utils_linux.ThreadCPUTimes()
+
+    def Spin():
+      end = time.time() + 0.5
+      while time.time() < end:
+        pass
+
+    thread = threading.Thread(target=Spin)
+    thread.start()
+    thread.join()
+
+    user_end, system_end = client_utils_linux.ThreadCPUTimes()
+    self.assertLess(user_end - user_start + system_end - system_start, 0.25)
+
 
 class OSXVersionTests(test_lib.GRRBaseTest):
 
@@ -17,9 +17,9 @@ import win32security
 
 from google.protobuf import message
 
+from grr.client import client_utils_common
 from grr.lib import config_lib
 from grr.lib import utils
-from grr.lib.rdfvalues import flows as rdf_flows
 from grr.lib.rdfvalues import paths as rdf_paths
 
 DACL_PRESENT = 1
@@ -250,16 +250,16 @@ class NannyController(object):
       logging.debug("Failed to heartbeat nanny at %s: %s",
                     config_lib.CONFIG["Nanny.service_key"], e)
 
-  def WriteTransactionLog(self, grr_message):
-    """Write the message into the transaction log.
+  def WriteTransactionLog(self, grr_messages):
+    """Write the messages into the transaction log.
 
     Args:
-      grr_message: A GrrMessage instance.
+      grr_messages: A list of GrrMessage instances.
     """
-    grr_message = grr_message.SerializeToString()
+    data = client_utils_common.SerializeTransactionLog(grr_messages)
     try:
       _winreg.SetValueEx(self._GetKey(), "Transaction", 0, _winreg.REG_BINARY,
-                         grr_message)
+                         data)
       NannyController.synced = False
     except exceptions.WindowsError:
       pass
@@ -278,7 +278,7 @@ class NannyController(object):
       pass
 
   def GetTransactionLog(self):
-    """Return a GrrMessage instance from the transaction log or None."""
+    """Return the GrrMessages in the transaction log or None."""
     try:
       value, reg_type = _winreg.QueryValueEx(self._GetKey(), "Transaction")
     except exceptions.WindowsError:
@@ -288,7 +288,7 @@ class NannyController(object):
       return
 
     try:
-      return rdf_flows.GrrMessage.FromSerializedString(value)
+      return client_utils_common.ParseTransactionLog(value)
     except message.Error:
       return
 
@@ -343,6 +343,32 @@ def KeepAlive():
   kernel32.SetThreadExecutionState(ctypes.c_int(es_system_required))
 
 
+class FileTime(ctypes.Structure):
+  _fields_ = [("dwLowDateTime", ctypes.c_ulong),
+              ("dwHighDateTime", ctypes.c_ulong)]
+
+  def Seconds(self):
+    # FILETIME durations are counted in 100 nanosecond intervals.
+    return ((self.dwHighDateTime << 32) + self.dwLowDateTime) / 1e7
+
+
+def ThreadCPUTimes():
+  """Returns the user and system CPU times of the calling thread."""
+  kernel32 = Kernel32().kernel32
+  kernel32.GetCurrentThread.restype = ctypes.c_void_p
+
+  creation_time, exit_time, kernel_time, user_time = (FileTime(), FileTime(),
+                                                      FileTime(), FileTime())
+  if not kernel32.GetThreadTimes(
+      ctypes.c_void_p(kernel32.GetCurrentThread()),
+      ctypes.byref(creation_time),
+      ctypes.byref(exit_time),
+      ctypes.byref(kernel_time), ctypes.byref(user_time)):
+    raise ctypes.WinError()
+
+  return user_time.Seconds(), kernel_time.Seconds()
+
+
 def RtlGetVersion(os_version_info_struct):
   """Wraps the lowlevel RtlGetVersion routine.
 
@@ -49,6 +49,11 @@ The client goes through a state machine:
 5) When not in FAST POLL mode, the polling frequency is controlled by the
    Timer() object. It is currently a geometrically decreasing function which
    starts at the Client.poll_min and approaches the Client.poll_max setting.
+   Poll intervals are randomized by Client.poll_jitter and the server may
+   replace Client.poll_max with its own hint. If Client.long_poll_timeout is
+   set, idle clients ask the server to hold their request open until there is
+   work for them, the time spent waiting on the server is deducted from the
+   next poll interval.
 
 6) If a 500 error occurs in the CONNECTED state, the client will assume that the
    server is temporarily down. The client will switch to the RETRY state and
@@ -76,11 +81,15 @@ Examples:
 
 
 import base64
+import collections
+import heapq
+import itertools
 import os
 
 import pdb
 import posixpath
 import Queue
+import random
 import sys
 import threading
 import time
@@ -122,6 +131,9 @@ class HTTPObject(object):
     # Contains the decoded data from the 'control' endpoint.
     self.messages = self.source = self.nonce = None
     self.duration = duration
+    # Polling hints sent by the server with the 'control' response.
+    self.long_poll_duration = 0
+    self.poll_interval_hint = 0
 
   def Success(self):
     """Returns if the request was successful."""
@@ -434,11 +446,18 @@ class Timer(object):
   timing policy.
   """
 
+  # Upper bound for poll intervals requested by the server.
+  MAX_POLL_INTERVAL_HINT = 3600
+
   def __init__(self, heart_beat_cb=None):
     self.heart_beat_cb = heart_beat_cb
     self.poll_min = config_lib.CONFIG["Client.poll_min"]
     self.sleep_time = self.poll_max = config_lib.CONFIG["Client.poll_max"]
     self.poll_slew = config_lib.CONFIG["Client.poll_slew"]
+    self.poll_jitter = config_lib.CONFIG["Client.poll_jitter"]
+
+    # Seconds the last request was held open by the server.
+    self.long_poll_duration = 0
 
   def FastPoll(self):
     """Switch to fast poll mode."""
@@ -448,12 +467,44 @@ class Timer(object):
     """Switch to slow poll mode."""
     self.sleep_time = self.poll_max
 
+  def IsIdle(self):
+    """Returns True once the timer has backed off to the slow poll interval."""
+    return self.sleep_time >= self.poll_max
+
+  def SetPollIntervalHint(self, poll_interval):
+    """Uses the poll interval suggested by the server while idle."""
+    if poll_interval:
+      poll_max = min(self.MAX_POLL_INTERVAL_HINT,
+                     max(self.poll_min, poll_interval))
+    else:
+      poll_max = config_lib.CONFIG["Client.poll_max"]
+
+    if poll_max != self.poll_max:
+      self.poll_max = poll_max
+      self.sleep_time = min(self.sleep_time, poll_max)
+
+  def LongPolled(self, duration):
+    """Records the time the last request was held open by the server."""
+    self.long_poll_duration = duration
+
+  def GetWaitTime(self):
+    """Returns the number of seconds until the next poll."""
+    wait_time = self.sleep_time
+    if self.poll_jitter:
+      wait_time *= random.uniform(1 - self.poll_jitter, 1 + self.poll_jitter)
+
+    # Time spent waiting on the server counts towards the poll interval.
+    return max(0, wait_time - self.long_poll_duration)
+
   def Wait(self):
     """Wait until the next action is needed."""
-    time.sleep(self.sleep_time - int(self.sleep_time))
+    wait_time = self.GetWaitTime()
+    self.long_poll_duration = 0
+
+    time.sleep(wait_time - int(wait_time))
 
     # Split a long sleep interval into 1 second intervals so we can heartbeat.
-    for _ in xrange(int(self.sleep_time)):
+    for _ in xrange(int(wait_time)):
       time.sleep(1)
 
       if self.heart_beat_cb:
@@ -527,16 +578,24 @@ class GRRClientWorker(object):
     self.client = client
 
     # Queue of messages from the server to be processed.
-    self._in_queue = []
+    self._in_queue = collections.deque()
 
-    # Queue of messages to be sent to the server.
-    self._out_queue = []
-
-    # A tally of the total byte count of messages
-    self._out_queue_size = 0
+    # Queue of messages to be sent to the server. The queue also keeps the
+    # tally of the total byte count of messages.
+    self._out_queue = MessageHeap()
 
     self._is_active = False
 
+    # Number of client actions currently executing.
+    self._active_actions = 0
+
+    # Messages currently being processed, in the order they were started. All
+    # of them are kept in the nanny transaction log.
+    self._transactions = collections.OrderedDict()
+    # Transactions which didn't heartbeat since the nanny was last told about
+    # progress.
+    self._transactions_without_heartbeat = set()
+
     # If True, ClientStats will be forcibly sent to server during next
     # CheckStats() call, if less than STATS_MIN_SEND_INTERVAL time has passed
     # since last stats notification was sent.
@@ -546,6 +605,8 @@ class GRRClientWorker(object):
     self.last_stats_sent_time = None
 
     self.proc = psutil.Process(os.getpid())
+    self._cpu_percent = 0.0
+    self._cpu_sample_time = 0
 
     # We store suspended actions in this dict. We can retrieve the suspended
     # client action from here if needed.
@@ -599,25 +660,12 @@ class GRRClientWorker(object):
     queue = rdf_flows.MessageList()
 
     length = 0
-    self._out_queue.sort(key=lambda msg: msg[0])
-
-    # Front pops are quadratic so we reverse the queue.
-    self._out_queue.reverse()
-
     while self._out_queue and length < max_size:
-      message = self._out_queue.pop()[1]
+      message, message_length = self._out_queue.Pop()
       queue.job.Append(message)
       stats.STATS.IncrementCounter("grr_client_sent_messages")
 
-      # We deliberately look at the serialized length as bytes here.
-      message_length = len(message.Get("args"))
-
-      # Maintain the output queue tally
       length += message_length
-      self._out_queue_size -= message_length
-
-    # Restore the old order.
-    self._out_queue.reverse()
 
     return queue
 
@@ -763,13 +811,11 @@ class GRRClientWorker(object):
     # The simple queue has no size restrictions so we never block and ignore
     # this parameter.
     _ = blocking
-    self._out_queue.append((-1 * priority, message))
 
-    # Maintain the tally of the output queue size.  We estimate the size of the
-    # message by only considering the args member. This is usually close enough
-    # estimate to the overall size and avoids us un-necessarily serializing
-    # here.
-    self._out_queue_size += len(message.Get("args"))
+    # We estimate the size of the message by only considering the args member.
+    # This is usually close enough estimate to the overall size and avoids us
+    # un-necessarily serializing here.
+    self._out_queue.Push(message, priority, len(message.Get("args")))
 
   def HandleMessage(self, message):
     """Entry point for processing jobs.
@@ -777,7 +823,10 @@ class GRRClientWorker(object):
     Args:
         message: The GrrMessage that was delivered from the server.
     """
-    self._is_active = True
+    with self.lock:
+      self._active_actions += 1
+      self._is_active = True
+
     try:
       # Try to retrieve a suspended action from the client worker.
       try:
@@ -793,19 +842,69 @@ class GRRClientWorker(object):
         action = action_cls(grr_worker=self)
 
       # Write the message to the transaction log.
-      self.nanny_controller.WriteTransactionLog(message)
-
-      # Heartbeat so we have the full period to work on this message.
-      action.Progress()
-      action.Execute(message)
+      self._StartTransaction(message)
+      action.nanny_controller = _TransactionNannyController(self, message)
 
-      # If we get here without exception, we can remove the transaction.
-      self.nanny_controller.CleanTransactionLog()
+      success = False
+      try:
+        # Heartbeat so we have the full period to work on this message.
+        action.Progress()
+        action.Execute(message)
+        success = True
+      finally:
+        # If we get here without exception, we can remove the transaction.
+        self._EndTransaction(message, clean=success)
     finally:
-      self._is_active = False
+      with self.lock:
+        self._active_actions -= 1
+        self._is_active = self._active_actions > 0
       # We want to send ClientStats when client action is complete.
       self._send_stats_on_check = True
 
+  def _StartTransaction(self, message):
+    """Records the message as being processed in the transaction log."""
+    with self.lock:
+      self._transactions[id(message)] = message
+      self._transactions_without_heartbeat.add(id(message))
+      self.nanny_controller.WriteTransactionLog(self._transactions.values())
+
+  def _EndTransaction(self, message, clean=True):
+    """Removes the message from the transaction log.
+
+    Args:
+      message: The GrrMessage that was processed.
+      clean: If False and no other message is in progress, the message is left
+             in the transaction log.
+    """
+    with self.lock:
+      self._transactions.pop(id(message), None)
+
+      if self._transactions:
+        self.nanny_controller.WriteTransactionLog(self._transactions.values())
+      elif clean:
+        self.nanny_controller.CleanTransactionLog()
+
+      self._TransactionHeartbeatLocked(message)
+
+  def TransactionHeartbeat(self, message):
+    """Records progress of the action processing message.
+
+    The nanny is only heartbeated once every message in progress has made
+    progress, so an action that hangs is not kept alive by the heartbeats of
+    actions running next to it.
+
+    Args:
+      message: The GrrMessage whose action made progress.
+    """
+    with self.lock:
+      self._TransactionHeartbeatLocked(message)
+
+  def _TransactionHeartbeatLocked(self, message):
+    self._transactions_without_heartbeat.discard(id(message))
+    if not self._transactions_without_heartbeat:
+      self._transactions_without_heartbeat = set(self._transactions)
+      self.nanny_controller.Heartbeat()
+
   def QueueMessages(self, messages):
     """Queue a message from the server for processing.
 
@@ -832,8 +931,8 @@ class GRRClientWorker(object):
     # As long as our output queue has some room we can process some
     # input messages:
     while self._in_queue and (
-        self._out_queue_size < config_lib.CONFIG["Client.max_out_queue"]):
-      message = self._in_queue.pop(0)
+        self._out_queue.Size() < config_lib.CONFIG["Client.max_out_queue"]):
+      message = self._in_queue.popleft()
 
       try:
         self.HandleMessage(message)
@@ -856,6 +955,18 @@ class GRRClientWorker(object):
     rss_size = self.proc.memory_info().rss
     return rss_size / 1024 / 1024 > config_lib.CONFIG["Client.rss_max"]
 
+  def CPUExceeded(self):
+    """Returns True if the client uses too much CPU to start more actions."""
+    now = time.time()
+    # The usage is measured over at least a second, shorter intervals are too
+    # noisy.
+    if now - self._cpu_sample_time >= 1:
+      self._cpu_percent = self.proc.cpu_percent(0)
+      self._cpu_sample_time = now
+
+    return (self._cpu_percent >
+            config_lib.CONFIG["Client.concurrent_actions_cpu_limit"])
+
   def InQueueSize(self):
     """Returns the number of protobufs ready to be sent in the queue."""
     return len(self._in_queue)
@@ -919,25 +1030,85 @@ class GRRClientWorker(object):
         require_fastpoll=False)
 
 
+class _TransactionNannyController(object):
+  """The nanny controller handed to the action processing a message.
+
+  Heartbeats of the action are reported to the worker, see
+  GRRClientWorker.TransactionHeartbeat. Everything else is passed on to the
+  worker's nanny controller.
+  """
+
+  def __init__(self, worker, message):
+    self._worker = worker
+    self._message = message
+
+  def Heartbeat(self):
+    self._worker.TransactionHeartbeat(self._message)
+
+  def __getattr__(self, name):
+    return getattr(self._worker.nanny_controller, name)
+
+
+class MessageHeap(object):
+  """A priority queue of messages keeping a tally of their total size.
+
+  Messages with a higher priority are popped first, messages of the same
+  priority are popped in the order they were pushed. Both Push() and Pop() are
+  O(log n), so large backlogs of replies don't make every poll slower.
+
+  This class is not thread safe, callers are expected to hold a lock.
+  """
+
+  def __init__(self):
+    self._heap = []
+    # Used to break ties between messages of the same priority.
+    self._counter = itertools.count()
+    self._size = 0
+
+  def Push(self, item, priority, size):
+    heapq.heappush(self._heap,
+                   (-int(priority), next(self._counter), item, size))
+    self._size += size
+
+  def Pop(self):
+    """Removes the next message from the heap.
+
+    Returns:
+      A tuple (item, size).
+
+    Raises:
+      IndexError: if the heap is empty.
+    """
+    _, _, item, size = heapq.heappop(self._heap)
+    self._size -= size
+    return item, size
+
+  def Size(self):
+    """Returns the total size of all messages in the heap."""
+    return self._size
+
+  def __len__(self):
+    return len(self._heap)
+
+
 class SizeQueue(object):
   """A Queue which limits the total size of its elements.
 
   The standard Queue implementations uses the total number of elements to block
   on. In the client we want to limit the total memory footprint, hence we need
   to use the total size as a measure of how full the queue is.
-
-  TODO(user): this class needs some attention to ensure it is thread safe.
   """
-  total_size = 0
 
   def __init__(self, maxsize=1024, nanny=None):
     self.lock = threading.RLock()
-    self.queue = []
-    self._reversed = []
-    self.total_size = 0
+    self._heap = MessageHeap()
     self.maxsize = maxsize
     self.nanny = nanny
 
+  @property
+  def total_size(self):
+    return self._heap.Size()
+
   def Put(self,
           item,
           priority=rdf_flows.GrrMessage.Priority.MEDIUM_PRIORITY,
@@ -982,25 +1153,24 @@ class SizeQueue(object):
           raise Queue.Full
 
     with self.lock:
-      self.queue.append((-1 * priority, item))
-      self.total_size += len(item)
+      self._heap.Push(item, priority, len(item))
 
   def Get(self):
-    """Retrieves the items from the queue."""
-    with self.lock:
-      if self._reversed:
-        # We have leftovers from a partial Get().
-        self._reversed.reverse()
-        self.queue = self._reversed + self.queue
+    """Retrieves the items from the queue.
+
+    Items are removed from the queue as they are yielded, so the caller can
+    stop early and leave the remaining items for the next Get().
 
-      self.queue.sort(key=lambda msg: msg[0])  # by priority only.
-      self.queue.reverse()
-      self._reversed, self.queue = self.queue, []
+    Yields:
+      Items, highest priority first.
+    """
+    while True:
+      with self.lock:
+        if not self._heap:
+          return
+        item, _ = self._heap.Pop()
 
-      while self._reversed:
-        item = self._reversed.pop()[1]
-        self.total_size -= len(item)
-        yield item
+      yield item
 
   def Size(self):
     return self.total_size
@@ -1009,11 +1179,156 @@ class SizeQueue(object):
     return self.total_size >= self.maxsize
 
 
+class ActionExecutor(object):
+  """Runs client actions on a bounded number of threads.
+
+  Actions are split into two lanes: actions marked as short running (see
+  ActionPlugin.short_running) have their own threads, so they don't wait
+  behind long running actions like recursive file finds. Requests belonging to
+  a single session are executed in order, at most max_per_session at a time.
+
+  An additional long running action is only started while the client is within
+  its memory limits and its CPU usage is below
+  Client.concurrent_actions_cpu_limit. A single action can always run, so the
+  worker never stalls completely.
+  """
+
+  SHORT = "short"
+  LONG = "long"
+
+  def __init__(self,
+               worker,
+               max_threads=2,
+               max_short_threads=1,
+               max_per_session=1,
+               max_pending=1024):
+    self.worker = worker
+    self.max_per_session = max_per_session
+    self.max_pending = max_pending
+
+    self._cond = threading.Condition()
+    self._pending = {self.SHORT: [], self.LONG: []}
+    self._pending_count = 0
+    # Messages waiting to run, per session, in the order they arrived.
+    self._session_queues = {}
+    self._running_per_session = {}
+    self._running = {self.SHORT: 0, self.LONG: 0}
+    self._stopped = False
+    self._short_lane_enabled = max_short_threads > 0
+
+    self._threads = []
+    for lane, count in [(self.LONG, max(max_threads, 1)),
+                        (self.SHORT, max_short_threads)]:
+      for index in xrange(count):
+        thread = threading.Thread(
+            target=self._WorkerLoop,
+            args=(lane,),
+            name="ActionExecutor-%s-%d" % (lane, index))
+        thread.daemon = True
+        thread.start()
+        self._threads.append(thread)
+
+  def _GetLane(self, message):
+    action_cls = actions.ActionPlugin.classes.get(message.name)
+    if (self._short_lane_enabled and action_cls is not None and
+        action_cls.short_running):
+      return self.SHORT
+
+    return self.LONG
+
+  def Submit(self, message):
+    """Queues a message for execution, blocking if too many are pending."""
+    with self._cond:
+      while self._pending_count >= self.max_pending:
+        self._cond.wait(1)
+
+      self._pending[self._GetLane(message)].append(message)
+      self._session_queues.setdefault(message.session_id,
+                                      collections.deque()).append(message)
+      self._pending_count += 1
+      self._cond.notify_all()
+
+  def RunningCount(self):
+    with self._cond:
+      return self._running[self.SHORT] + self._running[self.LONG]
+
+  def PendingCount(self):
+    with self._cond:
+      return self._pending_count
+
+  def Stop(self):
+    """Stops the executor threads, dropping messages which didn't start."""
+    with self._cond:
+      self._stopped = True
+      self._cond.notify_all()
+
+  def _Overloaded(self, lane):
+    """Returns True if no additional action may start in the lane."""
+    if lane != self.LONG:
+      return False
+
+    return self.worker.MemoryExceeded() or self.worker.CPUExceeded()
+
+  def _Take(self, lane, overloaded=False):
+    """Returns the first message of the lane which can run now, or None."""
+    if lane == self.LONG and self._running[self.LONG] and overloaded:
+      return None
+
+    pending = self._pending[lane]
+    for index, message in enumerate(pending):
+      session_id = message.session_id
+      if self._running_per_session.get(session_id, 0) >= self.max_per_session:
+        continue
+
+      # Only the oldest waiting message of a session may start.
+      session_queue = self._session_queues[session_id]
+      if session_queue[0] is not message:
+        continue
+
+      del pending[index]
+      session_queue.popleft()
+      if not session_queue:
+        del self._session_queues[session_id]
+
+      self._pending_count -= 1
+      self._running[lane] += 1
+      self._running_per_session[session_id] = (
+          self._running_per_session.get(session_id, 0) + 1)
+      return message
+
+  def _WorkerLoop(self, lane):
+    while True:
+      # The resource checks query psutil, so they are done without holding the
+      # lock.
+      overloaded = self._Overloaded(lane)
+
+      with self._cond:
+        if self._stopped:
+          return
+
+        message = self._Take(lane, overloaded=overloaded)
+        if message is None:
+          self._cond.wait(1)
+          continue
+
+      try:
+        self.worker.HandleMessageWithErrorReporting(message)
+      finally:
+        with self._cond:
+          self._running[lane] -= 1
+          session_id = message.session_id
+          self._running_per_session[session_id] -= 1
+          if not self._running_per_session[session_id]:
+            del self._running_per_session[session_id]
+          self._cond.notify_all()
+
+
 class GRRThreadedWorker(GRRClientWorker, threading.Thread):
   """This client worker runs the main loop in another thread.
 
   The client which uses this worker is not blocked while queuing messages to be
-  worked on. There is only a single working thread though.
+  worked on. Messages are handed to an ActionExecutor, so independent flows
+  on the client make progress in parallel.
 
   The overall effect is that the HTTP client is not blocked waiting for actions
   to be executed, and at the same time, the client working thread is not blocked
@@ -1026,7 +1341,10 @@ class GRRThreadedWorker(GRRClientWorker, threading.Thread):
     # This queue should never hit its maximum since the server will throttle
     # messages before this.
     self._in_queue = utils.HeartbeatQueue(
-        callback=self.nanny_controller.Heartbeat, maxsize=1024)
+        callback=self._IdleHeartbeat, maxsize=1024)
+
+    # Created by the worker thread in run().
+    self.executor = None
 
     # The size of the output queue controls the worker thread. Once this queue
     # is too large, the worker thread will block until the queue is drained.
@@ -1098,7 +1416,10 @@ class GRRThreadedWorker(GRRClientWorker, threading.Thread):
 
   def InQueueSize(self):
     """Returns the number of protobufs ready to be sent in the queue."""
-    return self._in_queue.qsize()
+    size = self._in_queue.qsize()
+    if self.executor:
+      size += self.executor.PendingCount()
+    return size
 
   def OutQueueSize(self):
     """Returns the total size of messages ready to be sent."""
@@ -1115,12 +1436,17 @@ class GRRThreadedWorker(GRRClientWorker, threading.Thread):
     # is anything in the transaction log we assume its there because we crashed
     # last time and let the server know.
 
-    last_request = self.nanny_controller.GetTransactionLog()
-    if last_request:
+    # All requests that were being processed concurrently are failed, we
+    # can't tell which of them killed the client.
+    last_requests = self.nanny_controller.GetTransactionLog() or []
+    nanny_status = None
+    if last_requests:
+      nanny_status = self.nanny_controller.GetNannyStatus()
+
+    for last_request in last_requests:
       status = rdf_flows.GrrStatus(
           status=rdf_flows.GrrStatus.ReturnedStatus.CLIENT_KILLED,
           error_message="Client killed during transaction")
-      nanny_status = self.nanny_controller.GetNannyStatus()
       if nanny_status:
         status.nanny_status = nanny_status
 
@@ -1139,34 +1465,70 @@ class GRRThreadedWorker(GRRClientWorker, threading.Thread):
     action = action_cls(grr_worker=self)
     action.Run(None, ttl=1)
 
+  def _IdleHeartbeat(self):
+    # Running actions heartbeat on their own (see ActionPlugin.Progress()), we
+    # must not keep a stuck action alive by heartbeating while waiting for new
+    # messages.
+    if not self._is_active:
+      self.nanny_controller.Heartbeat()
+
+  def HandleMessageWithErrorReporting(self, message):
+    """Handles the message, reporting any errors back to the server."""
+    try:
+      self.HandleMessage(message)
+      # Catch any errors and keep going here
+    except Exception as e:  # pylint: disable=broad-except
+      logging.warn("%s", e)
+      self.SendReply(
+          rdf_flows.GrrStatus(
+              status=rdf_flows.GrrStatus.ReturnedStatus.GENERIC_ERROR,
+              error_message=utils.SmartUnicode(e)),
+          request_id=message.request_id,
+          response_id=1,
+          session_id=message.session_id,
+          task_id=message.task_id,
+          message_type=rdf_flows.GrrMessage.Type.STATUS)
+      if flags.FLAGS.debug:
+        pdb.post_mortem()
+
   def run(self):
     """Main thread for processing messages."""
 
     self.OnStartup()
 
+    self.executor = ActionExecutor(
+        self,
+        max_threads=config_lib.CONFIG["Client.max_concurrent_actions"],
+        max_short_threads=config_lib.CONFIG[
+            "Client.max_concurrent_short_actions"],
+        max_per_session=config_lib.CONFIG[
+            "Client.max_concurrent_actions_per_session"])
+
     while True:
       message = self._in_queue.get()
 
       # A message of None is our terminal message.
       if message is None:
+        self.executor.Stop()
         break
 
-      try:
-        self.HandleMessage(message)
-        # Catch any errors and keep going here
-      except Exception as e:  # pylint: disable=broad-except
-        logging.warn("%s", e)
-        self.SendReply(
-            rdf_flows.GrrStatus(
-                status=rdf_flows.GrrStatus.ReturnedStatus.GENERIC_ERROR,
-                error_message=utils.SmartUnicode(e)),
-            request_id=message.request_id,
-            response_id=1,
-            session_id=message.session_id,
-            task_id=message.task_id,
-            message_type=rdf_flows.GrrMessage.Type.STATUS)
-        if flags.FLAGS.debug:
-          pdb.post_mortem()
+      self.executor.Submit(message)
+
+
+# Long polls end this many seconds before the HTTP request of the client times
+# out, so the server still has time to send its response.
+LONG_POLL_TIMEOUT_MARGIN = 10
+
+
+def GetLongPollTimeout():
+  """Returns how long the server may hold a poll request, 0 to not long poll.
+
+  Client.long_poll_timeout is clamped so the request doesn't time out on the
+  client while the server is still holding it.
+  """
+  max_timeout = (config_lib.CONFIG["Client.http_timeout"] -
+                 LONG_POLL_TIMEOUT_MARGIN)
+  return max(0, min(config_lib.CONFIG["Client.long_poll_timeout"], max_timeout))
 
 
 class GRRHTTPClient(object):
@@ -1301,13 +1663,18 @@ class GRRHTTPClient(object):
 
     # Try to decrypt the message into the http_object.
     try:
+      response_comms = rdf_flows.ClientCommunication.FromSerializedString(
+          http_object.data)
       http_object.messages, http_object.source, http_object.nonce = (
-          self.communicator.DecryptMessage(http_object.data))
+          self.communicator.DecodeMessages(response_comms))
 
+      http_object.long_poll_duration = response_comms.long_poll_duration
+      http_object.poll_interval_hint = response_comms.poll_interval_hint
       return True
 
     # Something went wrong - the response seems invalid!
-    except communicator.DecodingError as e:
+    except (communicator.DecodingError, rdfvalue.DecodeError,
+            type_info.TypeValueError, ValueError, AttributeError) as e:
       logging.info("Protobuf decode error: %s.", e)
       return False
 
@@ -1376,6 +1743,9 @@ class GRRHTTPClient(object):
       # the input queue.
       payload.queue_size = self.client_worker.InQueueSize()
 
+      if self._CanLongPoll(message_list):
+        payload.long_poll_timeout = GetLongPollTimeout()
+
     nonce = self.communicator.EncodeMessages(message_list, payload)
     payload_data = payload.SerializeToString()
     response = self.MakeRequest(payload_data)
@@ -1419,6 +1789,9 @@ class GRRHTTPClient(object):
       response.code = 500
       return response
 
+    self.timer.SetPollIntervalHint(response.poll_interval_hint)
+    self.timer.LongPolled(response.long_poll_duration)
+
     # Check to see if any inbound messages want us to fastpoll. This means we
     # drop to fastpoll immediately on a new request rather than waiting for the
     # next beacon to report results.
@@ -1441,6 +1814,14 @@ class GRRHTTPClient(object):
 
     return response
 
+  def _CanLongPoll(self, message_list):
+    """Returns True if the server may hold our next request open."""
+    # While the request is held, nothing can be sent to the server so we only
+    # long poll if there is nothing to report.
+    return bool(GetLongPollTimeout() and self.timer.IsIdle() and
+                not message_list.job and not self.client_worker.IsActive() and
+                self.client_worker.OutQueueSize() == 0)
+
   def SendForemanRequest(self):
     self.client_worker.SendReply(
         rdf_protodict.DataBlob(),
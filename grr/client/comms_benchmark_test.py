@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""Benchmarks the client's outbound message queues with large backlogs."""
+
+
+from grr.client import comms
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.lib.rdfvalues import client as rdf_client
+from grr.lib.rdfvalues import flows as rdf_flows
+
+
+class ClientQueuesBenchmark(test_lib.AverageMicroBenchmarks):
+  """Measures the cost of draining a large backlog of replies."""
+
+  REPEATS = 5
+  BACKLOG_SIZE = 50000
+
+  def _StatEntryMessage(self, i):
+    return rdf_flows.GrrMessage(
+        session_id="W:1234",
+        request_id=1,
+        response_id=i,
+        priority=i % 3,
+        payload=rdf_client.StatEntry(st_size=i, st_ino=i))
+
+  def testSizeQueueDrain(self):
+    """Filling a SizeQueue and draining it in 10k chunks."""
+    serialized = [
+        self._StatEntryMessage(i).SerializeToString()
+        for i in xrange(self.BACKLOG_SIZE)
+    ]
+
+    def FillAndDrain():
+      queue = comms.SizeQueue(maxsize=len(serialized) * 1000)
+      for i, message in enumerate(serialized):
+        queue.Put(message, priority=i % 3, block=False)
+
+      while queue.Size():
+        for count, _ in enumerate(queue.Get(), 1):
+          if count == 10000:
+            break
+
+    self.TimeIt(FillAndDrain, name="SizeQueue %d" % self.BACKLOG_SIZE)
+
+  def testWorkerDrain(self):
+    """Queueing replies on the worker and draining them in small posts."""
+    messages = [self._StatEntryMessage(i) for i in xrange(self.BACKLOG_SIZE)]
+
+    def FillAndDrain():
+      worker = comms.GRRClientWorker()
+      for message in messages:
+        worker.QueueResponse(message, priority=message.priority)
+
+      while worker.OutQueueSize():
+        worker.Drain(max_size=100000)
+
+    self.TimeIt(FillAndDrain, name="GRRClientWorker %d" % self.BACKLOG_SIZE)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -2,6 +2,7 @@
 """Test for client comms."""
 
 
+import threading
 import time
 
 import requests
@@ -10,6 +11,8 @@ from grr.client import comms
 from grr.lib import flags
 from grr.lib import test_lib
 from grr.lib import utils
+from grr.lib import worker_mocks
+from grr.lib.rdfvalues import flows as rdf_flows
 
 
 def _make_http_response(code=200):
@@ -234,6 +237,304 @@ class HTTPManagerTest(test_lib.GRRBaseTest):
     self.assertEqual(result.data, "Good")
 
 
+class BlockingWorker(object):
+  """A minimal worker for ActionExecutor that blocks on selected messages."""
+
+  def __init__(self):
+    self.lock = threading.Lock()
+    self.started = []
+    self.events = {}
+    self.memory_exceeded = False
+    self.cpu_exceeded = False
+
+  def MemoryExceeded(self):
+    return self.memory_exceeded
+
+  def CPUExceeded(self):
+    return self.cpu_exceeded
+
+  def HandleMessageWithErrorReporting(self, message):
+    with self.lock:
+      self.started.append(message.name + ":" + str(message.request_id))
+      event = self.events.get(message.request_id)
+
+    if event:
+      event.wait(10)
+
+
+class TimerTest(test_lib.GRRBaseTest):
+  """Tests the client's polling policy."""
+
+  def setUp(self):
+    super(TimerTest, self).setUp()
+    self.config_overrider = test_lib.ConfigOverrider({
+        "Client.poll_min": 1,
+        "Client.poll_max": 600,
+        "Client.poll_jitter": 0.1
+    })
+    self.config_overrider.Start()
+    self.timer = comms.Timer()
+
+  def tearDown(self):
+    self.config_overrider.Stop()
+    super(TimerTest, self).tearDown()
+
+  def testJitter(self):
+    wait_times = set()
+    for _ in xrange(100):
+      wait_time = self.timer.GetWaitTime()
+      self.assertGreaterEqual(wait_time, 540)
+      self.assertLessEqual(wait_time, 660)
+      wait_times.add(wait_time)
+
+    self.assertGreater(len(wait_times), 1)
+
+  def testPollIntervalHint(self):
+    self.timer.SetPollIntervalHint(60)
+    self.assertEqual(self.timer.sleep_time, 60)
+    self.assertTrue(self.timer.IsIdle())
+
+    # Hints are clamped.
+    self.timer.SetPollIntervalHint(0.01)
+    self.assertEqual(self.timer.poll_max, 1)
+    self.timer.SetPollIntervalHint(1e6)
+    self.assertEqual(self.timer.poll_max, comms.Timer.MAX_POLL_INTERVAL_HINT)
+
+    # Without a hint the configured value is used again.
+    self.timer.SetPollIntervalHint(0)
+    self.assertEqual(self.timer.poll_max, 600)
+
+  def testLongPollIsDeductedFromTheWaitTime(self):
+    self.timer.poll_jitter = 0
+    self.timer.LongPolled(500)
+    self.assertEqual(self.timer.GetWaitTime(), 100)
+
+    self.timer.LongPolled(700)
+    self.assertEqual(self.timer.GetWaitTime(), 0)
+
+    sleeps = []
+    with utils.Stubber(time, "sleep", sleeps.append):
+      self.timer.Wait()
+
+    # The deduction only applies to a single wait.
+    self.assertEqual(sum(sleeps), 0)
+    self.assertEqual(self.timer.GetWaitTime(), 600)
+
+
+class LongPollTimeoutTest(test_lib.GRRBaseTest):
+  """Tests the long poll timeout requested by the client."""
+
+  def _GetLongPollTimeout(self, long_poll_timeout, http_timeout):
+    with test_lib.ConfigOverrider({
+        "Client.long_poll_timeout": long_poll_timeout,
+        "Client.http_timeout": http_timeout
+    }):
+      return comms.GetLongPollTimeout()
+
+  def testLongPollTimeoutBelowHTTPTimeout(self):
+    self.assertEqual(self._GetLongPollTimeout(60, 100), 60)
+
+  def testLongPollTimeoutIsClampedToHTTPTimeout(self):
+    self.assertEqual(self._GetLongPollTimeout(100, 100), 90)
+    self.assertEqual(self._GetLongPollTimeout(600, 100), 90)
+
+  def testNoLongPollsWithoutMargin(self):
+    self.assertEqual(self._GetLongPollTimeout(60, 5), 0)
+    self.assertEqual(self._GetLongPollTimeout(0, 100), 0)
+
+
+class ActionExecutorTest(test_lib.GRRBaseTest):
+  """Tests the concurrent action executor of the threaded worker."""
+
+  def setUp(self):
+    super(ActionExecutorTest, self).setUp()
+    self.worker = BlockingWorker()
+    self.executor = None
+
+  def tearDown(self):
+    if self.executor:
+      for event in self.worker.events.values():
+        event.set()
+      self.executor.Stop()
+    super(ActionExecutorTest, self).tearDown()
+
+  def _Message(self, name, session_id, request_id):
+    return rdf_flows.GrrMessage(
+        name=name, session_id=session_id, request_id=request_id)
+
+  def _WaitForStarted(self, count):
+    for _ in xrange(100):
+      with self.worker.lock:
+        if len(self.worker.started) >= count:
+          return list(self.worker.started)
+      time.sleep(0.05)
+
+    self.fail("Only %d actions started." % len(self.worker.started))
+
+  def testShortActionsAreNotBlockedByLongOnes(self):
+    self.worker.events[1] = threading.Event()
+    self.executor = comms.ActionExecutor(
+        self.worker, max_threads=1, max_short_threads=1)
+
+    self.executor.Submit(self._Message("FileFinderOS", "aff4:/flows/W:1", 1))
+    self._WaitForStarted(1)
+    self.executor.Submit(self._Message("ListProcesses", "aff4:/flows/W:2", 2))
+
+    self.assertEqual(
+        self._WaitForStarted(2), ["FileFinderOS:1", "ListProcesses:2"])
+
+  def testIndependentSessionsRunInParallel(self):
+    self.worker.events[1] = threading.Event()
+    self.executor = comms.ActionExecutor(
+        self.worker, max_threads=2, max_short_threads=0)
+
+    self.executor.Submit(self._Message("FileFinderOS", "aff4:/flows/W:1", 1))
+    self.executor.Submit(self._Message("Grep", "aff4:/flows/W:2", 2))
+
+    self.assertItemsEqual(self._WaitForStarted(2), ["FileFinderOS:1", "Grep:2"])
+
+  def testRequestsOfASessionRunInOrder(self):
+    self.worker.events[1] = threading.Event()
+    self.executor = comms.ActionExecutor(
+        self.worker, max_threads=2, max_short_threads=1)
+
+    self.executor.Submit(self._Message("FileFinderOS", "aff4:/flows/W:1", 1))
+    self.executor.Submit(self._Message("ListProcesses", "aff4:/flows/W:1", 2))
+    self._WaitForStarted(1)
+
+    time.sleep(0.2)
+    self.assertEqual(self.worker.started, ["FileFinderOS:1"])
+
+    self.worker.events[1].set()
+    self.assertEqual(
+        self._WaitForStarted(2), ["FileFinderOS:1", "ListProcesses:2"])
+
+  def testNoAdditionalActionsWhenMemoryIsExceeded(self):
+    self.worker.events[1] = threading.Event()
+    self.worker.memory_exceeded = True
+    self.executor = comms.ActionExecutor(
+        self.worker, max_threads=2, max_short_threads=0)
+
+    self.executor.Submit(self._Message("FileFinderOS", "aff4:/flows/W:1", 1))
+    self.executor.Submit(self._Message("Grep", "aff4:/flows/W:2", 2))
+    self._WaitForStarted(1)
+
+    time.sleep(0.2)
+    self.assertEqual(self.worker.started, ["FileFinderOS:1"])
+
+    self.worker.events[1].set()
+    self.assertEqual(self._WaitForStarted(2), ["FileFinderOS:1", "Grep:2"])
+
+  def testNoAdditionalActionsWhenCPUIsExceeded(self):
+    self.worker.events[1] = threading.Event()
+    self.worker.cpu_exceeded = True
+    self.executor = comms.ActionExecutor(
+        self.worker, max_threads=2, max_short_threads=1)
+
+    self.executor.Submit(self._Message("FileFinderOS", "aff4:/flows/W:1", 1))
+    self.executor.Submit(self._Message("Grep", "aff4:/flows/W:2", 2))
+    self._WaitForStarted(1)
+    # Short actions are still admitted.
+    self.executor.Submit(self._Message("ListProcesses", "aff4:/flows/W:3", 3))
+    self._WaitForStarted(2)
+
+    time.sleep(0.2)
+    self.assertEqual(self.worker.started,
+                     ["FileFinderOS:1", "ListProcesses:3"])
+
+    self.worker.cpu_exceeded = False
+    self.assertEqual(
+        self._WaitForStarted(3),
+        ["FileFinderOS:1", "ListProcesses:3", "Grep:2"])
+
+
+class FakeNannyController(object):
+  """Records the transaction log and the heartbeats."""
+
+  def __init__(self):
+    self.transaction_log = None
+    self.heartbeats = 0
+
+  def Heartbeat(self):
+    self.heartbeats += 1
+
+  def WriteTransactionLog(self, grr_messages):
+    self.transaction_log = list(grr_messages)
+
+  def CleanTransactionLog(self):
+    self.transaction_log = None
+
+  def GetTransactionLog(self):
+    return self.transaction_log
+
+  def GetNannyStatus(self):
+    return None
+
+
+class WorkerTransactionTest(test_lib.GRRBaseTest):
+  """Tests the transaction log of concurrently executing actions."""
+
+  def setUp(self):
+    super(WorkerTransactionTest, self).setUp()
+    self.worker = worker_mocks.FakeThreadedWorker(start_worker_thread=False)
+    self.nanny_controller = FakeNannyController()
+    self.worker.nanny_controller = self.nanny_controller
+
+    self.messages = [
+        rdf_flows.GrrMessage(
+            session_id="aff4:/flows/W:%d" % i, request_id=i, name="Grep")
+        for i in range(3)
+    ]
+
+  def testTransactionLogHoldsAllMessagesInProgress(self):
+    for message in self.messages:
+      self.worker._StartTransaction(message)
+    self.assertEqual(self.nanny_controller.transaction_log, self.messages)
+
+    self.worker._EndTransaction(self.messages[1])
+    self.assertEqual(self.nanny_controller.transaction_log,
+                     [self.messages[0], self.messages[2]])
+
+    self.worker._EndTransaction(self.messages[0])
+    self.worker._EndTransaction(self.messages[2])
+    self.assertIsNone(self.nanny_controller.transaction_log)
+
+  def testNannyWaitsForAllActionsToMakeProgress(self):
+    for message in self.messages[:2]:
+      self.worker._StartTransaction(message)
+
+    # Only one of the actions makes progress, the other one might be stuck.
+    for _ in range(3):
+      self.worker.TransactionHeartbeat(self.messages[0])
+    self.assertEqual(self.nanny_controller.heartbeats, 0)
+
+    self.worker.TransactionHeartbeat(self.messages[1])
+    self.assertEqual(self.nanny_controller.heartbeats, 1)
+
+    # A finished action doesn't hold back the others.
+    self.worker.TransactionHeartbeat(self.messages[0])
+    self.worker._EndTransaction(self.messages[1])
+    self.assertEqual(self.nanny_controller.heartbeats, 2)
+
+  def testAllLoggedRequestsAreFailedOnStartup(self):
+    self.nanny_controller.transaction_log = self.messages[:2]
+
+    self.worker.OnStartup()
+
+    statuses = [
+        response for response in self.worker.Drain()
+        if response.type == rdf_flows.GrrMessage.Type.STATUS
+    ]
+    self.assertEqual([(status.session_id, status.request_id)
+                      for status in statuses],
+                     [(message.session_id, message.request_id)
+                      for message in self.messages[:2]])
+    for status in statuses:
+      self.assertEqual(status.payload.status,
+                       rdf_flows.GrrStatus.ReturnedStatus.CLIENT_KILLED)
+    self.assertIsNone(self.nanny_controller.transaction_log)
+
+
 def main(argv):
   test_lib.main(argv)
 
@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+"""A persistent cache of file hashes on the client.
+
+Hunts regularly hash the same unchanged files over and over. The cache maps
+the identity of a file (device, inode) to its hashes, and entries are only
+used if the size, mtime and ctime of the file did not change since it was
+hashed.
+"""
+
+
+import os
+import sqlite3
+import stat
+import threading
+import time
+
+import logging
+
+from grr.lib import config_lib
+from grr.lib import registry
+from grr.lib import stats
+
+
+def _IsCacheable(stat_obj):
+  # Some platforms (e.g. Windows) don't report inode numbers, we can't tell
+  # files apart there. SQLite integers are signed 64 bit values.
+  return (stat.S_ISREG(stat_obj.st_mode) and 0 < stat_obj.st_ino < 2**63 and
+          stat_obj.st_dev < 2**63)
+
+
+class FileHashCache(object):
+  """A size bounded, least recently used, on-disk cache of file hashes."""
+
+  HASH_TYPES = ["md5", "sha1", "sha256"]
+
+  # When the cache is full, this fraction of the entries is evicted at once so
+  # we don't have to evict on every insertion.
+  EVICTION_FRACTION = 0.1
+
+  def __init__(self, path, max_entries=100000):
+    self.path = path
+    self.max_entries = max_entries
+    self.lock = threading.RLock()
+
+    # Client actions may run in different threads, access is serialized using
+    # the lock.
+    self.db = sqlite3.connect(path, check_same_thread=False)
+    self.db.text_factory = str
+    # This is a cache, losing the last updates on a crash is fine.
+    self.db.execute("PRAGMA synchronous=OFF")
+    self.db.execute("CREATE TABLE IF NOT EXISTS hashes ("
+                    "device INTEGER, inode INTEGER, size INTEGER, "
+                    "mtime REAL, ctime REAL, num_bytes INTEGER, "
+                    "md5 BLOB, sha1 BLOB, sha256 BLOB, last_used REAL, "
+                    "PRIMARY KEY (device, inode))")
+    self.db.execute("CREATE INDEX IF NOT EXISTS hashes_last_used "
+                    "ON hashes (last_used)")
+    self.db.commit()
+
+    self.entries = self.db.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+  def Get(self, stat_obj, num_bytes, hash_types=None):
+    """Returns the cached hashes of a file.
+
+    Args:
+      stat_obj: An os.stat_result of the file, taken before reading it.
+      num_bytes: The number of bytes at the start of the file which are
+                 hashed.
+      hash_types: The names of the needed hashes, defaults to all of them.
+
+    Returns:
+      A dict of hash type to binary digest or None if there is no valid entry.
+    """
+    hash_types = hash_types or self.HASH_TYPES
+
+    row = None
+    if _IsCacheable(stat_obj):
+      with self.lock:
+        try:
+          row = self.db.execute(
+              "SELECT size, mtime, ctime, num_bytes, md5, sha1, sha256 "
+              "FROM hashes WHERE device = ? AND inode = ?",
+              (stat_obj.st_dev, stat_obj.st_ino)).fetchone()
+
+          if row and self._IsValid(row, stat_obj, num_bytes, hash_types):
+            # The update is committed along with the next insertion.
+            self.db.execute("UPDATE hashes SET last_used = ? WHERE "
+                            "device = ? AND inode = ?",
+                            (time.time(), stat_obj.st_dev, stat_obj.st_ino))
+          else:
+            row = None
+        except sqlite3.Error as e:
+          logging.warning("Hash cache lookup failed: %s", e)
+          row = None
+
+    if row is None:
+      stats.STATS.IncrementCounter("grr_client_hash_cache_misses")
+      return None
+
+    stats.STATS.IncrementCounter("grr_client_hash_cache_hits")
+    return dict((hash_type, str(digest))
+                for hash_type, digest in zip(self.HASH_TYPES, row[4:])
+                if digest is not None)
+
+  def _IsValid(self, row, stat_obj, num_bytes, hash_types):
+    size, mtime, ctime, cached_num_bytes = row[:4]
+    if (size != stat_obj.st_size or mtime != stat_obj.st_mtime or
+        ctime != stat_obj.st_ctime or cached_num_bytes != num_bytes):
+      return False
+
+    digests = dict(zip(self.HASH_TYPES, row[4:]))
+    return all(digests.get(hash_type) is not None for hash_type in hash_types)
+
+  def Put(self, stat_obj, num_bytes, digests, path=None):
+    """Stores the hashes of a file.
+
+    Args:
+      stat_obj: An os.stat_result of the file, taken before reading it.
+      num_bytes: The number of bytes at the start of the file which were
+                 hashed.
+      digests: A dict of hash type to binary digest.
+      path: If given, the file is stat'ed again and the hashes are only
+            stored if it wasn't modified while it was hashed.
+    """
+    if not _IsCacheable(stat_obj):
+      return
+
+    if path is not None:
+      try:
+        new_stat = os.stat(path)
+      except OSError:
+        return
+
+      if (new_stat.st_mtime != stat_obj.st_mtime or
+          new_stat.st_ctime != stat_obj.st_ctime or
+          new_stat.st_size != stat_obj.st_size):
+        return
+
+    values = [
+        buffer(digests[h]) if h in digests else None for h in self.HASH_TYPES
+    ]
+
+    with self.lock:
+      key = (stat_obj.st_dev, stat_obj.st_ino)
+      try:
+        exists = self.db.execute(
+            "SELECT 1 FROM hashes WHERE device = ? AND inode = ?",
+            key).fetchone()
+
+        self.db.execute("INSERT OR REPLACE INTO hashes VALUES "
+                        "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        key + (stat_obj.st_size, stat_obj.st_mtime,
+                               stat_obj.st_ctime, num_bytes) + tuple(values) +
+                        (time.time(),))
+        if not exists:
+          self.entries += 1
+
+        if self.entries > self.max_entries:
+          self._Evict()
+
+        self.db.commit()
+      except sqlite3.Error as e:
+        logging.warning("Unable to update the hash cache: %s", e)
+
+  def _Evict(self):
+    """Removes the least recently used entries."""
+    to_evict = self.entries - int(self.max_entries *
+                                  (1 - self.EVICTION_FRACTION))
+    self.db.execute("DELETE FROM hashes WHERE rowid IN (SELECT rowid FROM "
+                    "hashes ORDER BY last_used LIMIT ?)", (to_evict,))
+    self.entries = self.db.execute("SELECT COUNT(*) FROM hashes").fetchone()[0]
+
+  def Close(self):
+    with self.lock:
+      self.db.commit()
+      self.db.close()
+
+
+_HASH_CACHE = None
+_HASH_CACHE_LOCK = threading.Lock()
+
+
+def GetHashCache():
+  """Returns the client's hash cache or None if it is disabled."""
+  global _HASH_CACHE
+
+  with _HASH_CACHE_LOCK:
+    if _HASH_CACHE is None:
+      path = config_lib.CONFIG["Client.hash_cache_path"]
+      if not path:
+        return None
+
+      try:
+        _HASH_CACHE = FileHashCache(
+            path, max_entries=config_lib.CONFIG["Client.hash_cache_size"])
+      except sqlite3.Error as e:
+        logging.warning("Unable to open the hash cache %s: %s", path, e)
+        return None
+
+    return _HASH_CACHE
+
+
+def ResetHashCache():
+  """Closes the hash cache, the next GetHashCache() call reopens it."""
+  global _HASH_CACHE
+
+  with _HASH_CACHE_LOCK:
+    if _HASH_CACHE is not None:
+      _HASH_CACHE.Close()
+      _HASH_CACHE = None
+
+
+def _NumBytes(stat_obj, max_length):
+  if max_length is None:
+    return stat_obj.st_size
+  return min(stat_obj.st_size, max_length)
+
+
+def GetCachedHashes(stat_obj, max_length=None, hash_types=None):
+  """Returns the cached hashes of a file or None if they are not known.
+
+  Args:
+    stat_obj: An os.stat_result of the file, taken before reading it.
+    max_length: Only this many bytes at the start of the file are hashed.
+    hash_types: The names of the needed hashes, defaults to all of them.
+
+  Returns:
+    A tuple (digests, num_bytes), digests is a dict of hash type to binary
+    digest or None if the hashes are not cached.
+  """
+  num_bytes = _NumBytes(stat_obj, max_length)
+
+  cache = GetHashCache()
+  if cache is None:
+    return None, num_bytes
+
+  return cache.Get(stat_obj, num_bytes, hash_types=hash_types), num_bytes
+
+
+def CacheHashes(path, stat_obj, max_length, num_bytes, digests):
+  """Stores the hashes of a file if the cache is enabled.
+
+  Args:
+    path: The local path of the file.
+    stat_obj: An os.stat_result of the file, taken before reading it.
+    max_length: The maximum number of bytes that were going to be hashed.
+    num_bytes: The number of bytes at the start of the file which were hashed.
+    digests: A dict of hash type to binary digest.
+  """
+  # Files whose content doesn't match their size (e.g. in /proc) can't be
+  # validated using stat.
+  if num_bytes != _NumBytes(stat_obj, max_length):
+    return
+
+  cache = GetHashCache()
+  if cache is not None:
+    cache.Put(stat_obj, num_bytes, digests, path=path)
+
+
+class HashCacheInit(registry.InitHook):
+
+  def RunOnce(self):
+    stats.STATS.RegisterCounterMetric("grr_client_hash_cache_hits")
+    stats.STATS.RegisterCounterMetric("grr_client_hash_cache_misses")
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""Tests for the client hash cache."""
+
+
+import hashlib
+import os
+
+from grr.client import hash_cache
+from grr.lib import flags
+from grr.lib import stats
+from grr.lib import test_lib
+
+
+class FileHashCacheTest(test_lib.GRRBaseTest):
+  """Tests the FileHashCache."""
+
+  def setUp(self):
+    super(FileHashCacheTest, self).setUp()
+    self.cache = hash_cache.FileHashCache(
+        os.path.join(self.temp_dir, "hash_cache.db"), max_entries=10)
+
+  def tearDown(self):
+    self.cache.Close()
+    super(FileHashCacheTest, self).tearDown()
+
+  def _WriteFile(self, name, data):
+    path = os.path.join(self.temp_dir, name)
+    with open(path, "wb") as fd:
+      fd.write(data)
+    return path
+
+  def _Digests(self, data):
+    return dict(
+        md5=hashlib.md5(data).digest(),
+        sha1=hashlib.sha1(data).digest(),
+        sha256=hashlib.sha256(data).digest())
+
+  def testCacheHit(self):
+    path = self._WriteFile("file", "hello")
+    stat_obj = os.stat(path)
+    self.assertIsNone(self.cache.Get(stat_obj, 5))
+
+    self.cache.Put(stat_obj, 5, self._Digests("hello"), path=path)
+    self.assertEqual(self.cache.Get(os.stat(path), 5), self._Digests("hello"))
+
+    # A different number of hashed bytes doesn't match.
+    self.assertIsNone(self.cache.Get(os.stat(path), 3))
+
+  def testMissingHashTypes(self):
+    path = self._WriteFile("file", "hello")
+    digests = dict(md5=hashlib.md5("hello").digest())
+    self.cache.Put(os.stat(path), 5, digests)
+
+    self.assertEqual(
+        self.cache.Get(os.stat(path), 5, hash_types=["md5"]), digests)
+    self.assertIsNone(self.cache.Get(os.stat(path), 5))
+
+  def testModifiedFileMisses(self):
+    path = self._WriteFile("file", "hello")
+    stat_obj = os.stat(path)
+    self.cache.Put(stat_obj, 5, self._Digests("hello"))
+
+    with open(path, "wb") as fd:
+      fd.write("world")
+    os.utime(path, (stat_obj.st_atime, stat_obj.st_mtime + 10))
+
+    self.assertIsNone(self.cache.Get(os.stat(path), 5))
+
+  def testFileChangedWhileHashing(self):
+    path = self._WriteFile("file", "hello")
+    stat_obj = os.stat(path)
+
+    with open(path, "ab") as fd:
+      fd.write(" world")
+
+    self.cache.Put(stat_obj, 5, self._Digests("hello"), path=path)
+    self.assertIsNone(self.cache.Get(stat_obj, 5))
+
+  def testEviction(self):
+    paths = [self._WriteFile("file%d" % i, str(i)) for i in range(11)]
+    for path in paths:
+      self.cache.Put(os.stat(path), 1, self._Digests(open(path).read()))
+
+    self.assertLessEqual(self.cache.entries, 10)
+    # The least recently used entry is gone.
+    self.assertIsNone(self.cache.Get(os.stat(paths[0]), 1))
+    self.assertIsNotNone(self.cache.Get(os.stat(paths[-1]), 1))
+
+  def testPersistence(self):
+    path = self._WriteFile("file", "hello")
+    self.cache.Put(os.stat(path), 5, self._Digests("hello"))
+    self.cache.Close()
+
+    self.cache = hash_cache.FileHashCache(
+        os.path.join(self.temp_dir, "hash_cache.db"))
+    self.assertEqual(self.cache.Get(os.stat(path), 5), self._Digests("hello"))
+
+  def testCounters(self):
+    path = self._WriteFile("file", "hello")
+    hits = stats.STATS.GetMetricValue("grr_client_hash_cache_hits")
+    misses = stats.STATS.GetMetricValue("grr_client_hash_cache_misses")
+
+    self.cache.Get(os.stat(path), 5)
+    self.cache.Put(os.stat(path), 5, self._Digests("hello"))
+    self.cache.Get(os.stat(path), 5)
+
+    self.assertEqual(
+        stats.STATS.GetMetricValue("grr_client_hash_cache_hits"), hits + 1)
+    self.assertEqual(
+        stats.STATS.GetMetricValue("grr_client_hash_cache_misses"), misses + 1)
+
+
+class HashCacheHelpersTest(test_lib.GRRBaseTest):
+  """Tests the module level helpers."""
+
+  def tearDown(self):
+    hash_cache.ResetHashCache()
+    super(HashCacheHelpersTest, self).tearDown()
+
+  def testDisabledByDefault(self):
+    with test_lib.ConfigOverrider({"Client.hash_cache_path": ""}):
+      hash_cache.ResetHashCache()
+      self.assertIsNone(hash_cache.GetHashCache())
+
+  def testTruncatedHashes(self):
+    path = os.path.join(self.temp_dir, "file")
+    with open(path, "wb") as fd:
+      fd.write("hello world")
+
+    with test_lib.ConfigOverrider({
+        "Client.hash_cache_path": os.path.join(self.temp_dir, "cache.db")
+    }):
+      hash_cache.ResetHashCache()
+      stat_obj = os.stat(path)
+      digests = dict(md5=hashlib.md5("hello").digest())
+
+      # Only the number of bytes we expected to read can be stored.
+      hash_cache.CacheHashes(path, stat_obj, 5, 4, digests)
+      self.assertEqual(hash_cache.GetCachedHashes(stat_obj, 5, ["md5"]),
+                       (None, 5))
+
+      hash_cache.CacheHashes(path, stat_obj, 5, 5, digests)
+      self.assertEqual(hash_cache.GetCachedHashes(stat_obj, 5, ["md5"]),
+                       (digests, 5))
+      self.assertEqual(hash_cache.GetCachedHashes(stat_obj, None, ["md5"]),
+                       (None, 11))
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -10,6 +10,8 @@ from grr.client import client_build_test
 from grr.client import client_test
 from grr.client import client_utils_test
 from grr.client import client_vfs_test
+from grr.client import comms_benchmark_test
 from grr.client import comms_test
+from grr.client import hash_cache_test
 from grr.client.client_actions import tests
 from grr.client.osx import objc_test
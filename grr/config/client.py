@@ -104,6 +104,17 @@ config_lib.DEFINE_float("Client.error_poll_min", 60,
 
 config_lib.DEFINE_float("Client.poll_slew", 1.15, "Slew of poll time.")
 
+config_lib.DEFINE_float("Client.poll_jitter", 0.1,
+                        "Poll intervals are randomly stretched or shrunk by "
+                        "up to this fraction so clients don't poll in sync.")
+
+config_lib.DEFINE_integer("Client.long_poll_timeout", 0,
+                          "If set, an idle client asks the frontend to hold "
+                          "its poll request open for up to this many seconds "
+                          "until there is work for it. The time the request "
+                          "was held is deducted from the next poll interval. "
+                          "Capped at 10 seconds below Client.http_timeout.")
+
 config_lib.DEFINE_integer("Client.connection_error_limit", 60 * 24,
                           "If the client encounters this many connection "
                           "errors, it exits and restarts. Retries are one "
@@ -125,6 +136,34 @@ config_lib.DEFINE_integer("Client.max_post_size", 40000000,
 config_lib.DEFINE_integer("Client.max_out_queue", 51200000,
                           "Maximum size of the output queue.")
 
+config_lib.DEFINE_integer("Client.max_concurrent_actions", 2,
+                          "Maximum number of client actions executed in "
+                          "parallel by the threaded worker.")
+
+config_lib.DEFINE_integer("Client.max_concurrent_short_actions", 1,
+                          "Number of threads reserved for client actions that "
+                          "are known to finish quickly.")
+
+config_lib.DEFINE_float("Client.concurrent_actions_cpu_limit", 80,
+                        "An additional long running client action is only "
+                        "started while the client process uses less than this "
+                        "percentage of a CPU.")
+
+config_lib.DEFINE_integer("Client.max_concurrent_actions_per_session", 1,
+                          "Maximum number of client actions of a single flow "
+                          "executed in parallel. With the default of 1, "
+                          "requests of a flow are executed in order.")
+
+config_lib.DEFINE_string(
+    name="Client.hash_cache_path",
+    help="Path of the on-disk cache of file hashes. Files which didn't "
+    "change since they were last hashed are not hashed again. The cache is "
+    "disabled if this is empty.",
+    default="")
+
+config_lib.DEFINE_integer("Client.hash_cache_size", 100000,
+                          "Maximum number of files in the hash cache.")
+
 config_lib.DEFINE_integer("Client.foreman_check_frequency", 1800,
                           "The minimum number of seconds before checking with "
                           "the foreman for new work.")
@@ -262,6 +301,30 @@ config_lib.DEFINE_string(
     default="ZCOMPRESS",
     help="Type of compression (ZCOMPRESS, UNCOMPRESSED)")
 
+config_lib.DEFINE_integer(
+    "Network.compression_min_size", 256,
+    "Message lists smaller than this many bytes are sent uncompressed.")
+
+config_lib.DEFINE_integer(
+    "Network.compression_level", 6,
+    "The zlib compression level (1-9) used for message lists.")
+
+config_lib.DEFINE_integer(
+    "Network.compression_large_size", 1024 * 1024,
+    "Message lists of at least this many bytes are compressed using "
+    "Network.compression_large_level instead.")
+
+config_lib.DEFINE_integer(
+    "Network.compression_large_level", 1,
+    "The zlib compression level used for large message lists. Large lists "
+    "are mostly file contents and a low level saves a lot of CPU time.")
+
+config_lib.DEFINE_integer(
+    "Network.compression_dictionary_max_size", 0,
+    "Message lists smaller than this many bytes are compressed using a "
+    "preset dictionary which helps a lot with small lists. The receiving "
+    "end must support this, 0 disables the dictionary.")
+
 # Installer options.
 config_lib.DEFINE_string(
     name="Installer.logfile",
@@ -22,6 +22,25 @@ config_lib.DEFINE_integer(
     default=600,
     help="How long do we wait for a transaction lock.")
 
+config_lib.DEFINE_bool(
+    "Datastore.tracing", False,
+    "If True, the latency, rows, columns and bytes of all data store calls "
+    "are recorded in the stats by method and class of subject, and slow "
+    "calls are kept in the slow query log.")
+
+config_lib.DEFINE_float(
+    "Datastore.slow_query_threshold", 1.0,
+    "Data store calls taking at least this many seconds are logged as slow "
+    "queries when Datastore.tracing is enabled.")
+
+config_lib.DEFINE_integer(
+    "Datastore.slow_query_log_size", 100,
+    "The number of most recent slow queries kept by every process.")
+
+config_lib.DEFINE_integer(
+    "Datastore.slow_query_stack_depth", 10,
+    "The number of frames of the caller's stack kept with a slow query.")
+
 DATASTORE_PATHING = [
     r"%{(?P<path>files/hash/generic/sha256/...).*}",
     r"%{(?P<path>files/hash/generic/sha1/...).*}",
@@ -95,6 +95,10 @@ setup_args = dict(
         # store support:
         # pip install grr-response[mysqldatastore]
         "mysqldatastore": ["MySQL-python==1.2.5"],
+        # This is an optional component. Install to get the Parquet instant
+        # output plugin:
+        # pip install grr-response[parquetoutput]
+        "parquetoutput": ["pyarrow==0.16.0"],
     },
     data_files=["version.ini"])
 
@@ -4,6 +4,14 @@
 from grr.lib import config_lib
 from grr.lib import rdfvalue
 
+config_lib.DEFINE_integer("Export.metadata_cache_size", 10000,
+                          "Maximum number of clients whose export metadata is "
+                          "cached.")
+
+config_lib.DEFINE_integer("Export.metadata_cache_max_age", 300,
+                          "Number of seconds client export metadata is cached "
+                          "for before it's fetched again.")
+
 config_lib.DEFINE_string("BigQuery.service_acct_json", None,
                          "The json contents of the service account file.")
 
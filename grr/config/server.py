@@ -41,6 +41,58 @@ config_lib.DEFINE_integer("Worker.well_known_flow_lease_time", 600,
                           "Duration of a well known flow lease time in "
                           "seconds.")
 
+config_lib.DEFINE_integer(
+    "Worker.prefetch_batch_size", 50,
+    "The worker locks and reads the requests and responses of up to this many "
+    "flows at once instead of one flow at a time. 1 disables batching.")
+
+config_lib.DEFINE_integer(
+    "Worker.well_known_flow_shards", 4,
+    "Responses to well known flows are spread over this many queues which "
+    "are drained by workers independently of each other.")
+
+config_lib.DEFINE_bool(
+    "Worker.priority_threadpool", False,
+    "If True, the worker processes well known flows, flows and hunts in "
+    "separate priority lanes of its thread pool so short well known flow "
+    "tasks don't queue behind long running hunts.")
+
+config_lib.DEFINE_integer(
+    "Worker.hunt_lane_threads", 0,
+    "The maximum number of threads processing hunts at the same time when "
+    "Worker.priority_threadpool is set, 0 for no limit.")
+
+config_lib.DEFINE_integer(
+    "Hunt.client_batch_size", 100,
+    "Clients added to a hunt are registered and started in batches of at "
+    "most this many clients.")
+
+config_lib.DEFINE_integer(
+    "Hunt.client_rate_batch_interval", 10,
+    "Hunts with a client rate start the clients due within this many "
+    "seconds together in one batch.")
+
+config_lib.DEFINE_integer(
+    "Hunt.results_buffer_size", 1000,
+    "Hunts buffer the results of their clients and write them to the results "
+    "collections once this many are buffered.")
+
+config_lib.DEFINE_float(
+    "Hunt.results_buffer_max_delay", 10,
+    "Buffered hunt results are written at the latest when a new result "
+    "arrives this many seconds after the oldest one.")
+
+config_lib.DEFINE_bool(
+    "Worker.flow_profiling", False,
+    "If True, the time spent in each flow state and its data store calls is "
+    "recorded in the stats and in a flame graph profile served by the stats "
+    "server at /flow_profile.")
+
+config_lib.DEFINE_string(
+    "Worker.flow_profile_path", "",
+    "If set, the flow profile is written to this file in the folded stacks "
+    "format when the process exits.")
+
 config_lib.DEFINE_integer("Worker.compaction_lease_time", 3600,
                           "Duration of collections lease time for compaction "
                           "in seconds.")
@@ -55,6 +107,22 @@ config_lib.DEFINE_integer("Worker.queue_shards", 5,
                           "Queue notifications will be sharded across "
                           "this number of datastore subjects.")
 
+config_lib.DEFINE_integer(
+    "Worker.num_processes", 1,
+    "If larger than 1, the worker forks this many worker processes after "
+    "initialization and supervises them. The notification shards are split "
+    "between the processes.")
+
+config_lib.DEFINE_integer(
+    "Worker.process_restart_delay", 10,
+    "Worker processes which die within this many seconds after they were "
+    "started are restarted after this delay.")
+
+config_lib.DEFINE_integer(
+    "Worker.process_stats_interval", 10,
+    "How often (in seconds) worker processes report their stats to the "
+    "supervisor.")
+
 config_lib.DEFINE_integer("Worker.notification_expiry_time", 600,
                           "The queue manager expires stale notifications "
                           "after this many seconds.")
@@ -158,6 +226,48 @@ config_lib.DEFINE_integer("Frontend.message_expiry_time", 600,
                           "Maximum time messages remain valid within the "
                           "system.")
 
+config_lib.DEFINE_integer("Frontend.long_poll_max_time", 0,
+                          "Maximum number of seconds the frontend holds a "
+                          "poll request of an idle client open while waiting "
+                          "for messages for it. Long polling is disabled if "
+                          "this is 0.")
+
+config_lib.DEFINE_integer("Frontend.max_long_polls", 1000,
+                          "Maximum number of poll requests a frontend holds "
+                          "open at the same time. Further clients get an "
+                          "immediate answer.")
+
+config_lib.DEFINE_float("Frontend.long_poll_check_interval", 5,
+                        "How often, in seconds, the queue of a long polling "
+                        "client is checked for new messages.")
+
+config_lib.DEFINE_integer("Frontend.empty_queue_cache_ttl", 0,
+                          "If set, client queues found empty are not queried "
+                          "again for this many seconds unless new tasks are "
+                          "announced for them. Only enable this if all "
+                          "processes scheduling client tasks can reach the "
+                          "frontend, see Server.client_wakeup_socket_dir.")
+
+config_lib.DEFINE_float(
+    "Server.event_batch_window", 0,
+    "If set, published events are collected for up to this many seconds and "
+    "written in batches with one notification per listener. Events which "
+    "are not written yet are lost if the process dies.")
+
+config_lib.DEFINE_integer(
+    "Server.event_batch_size", 1000,
+    "Batches of events are written as soon as they hold this many messages.")
+
+config_lib.DEFINE_string("Server.client_wakeup_socket_dir", "",
+                         "A directory for unix sockets used to tell "
+                         "frontends on this machine about new client tasks "
+                         "scheduled by other processes. Disabled if empty.")
+
+config_lib.DEFINE_float("Frontend.poll_interval_hint", 0,
+                        "If set, idle clients are asked to poll every this "
+                        "many seconds instead of using their configured "
+                        "Client.poll_max.")
+
 config_lib.DEFINE_string("Frontend.upload_store", "FileUploadFileStore",
                          "The implementation of the upload file store.")
 
@@ -6,8 +6,10 @@
 import cStringIO
 import itertools
 import os
+import Queue
 import re
 import sys
+import threading
 import zipfile
 
 
@@ -16,6 +18,7 @@ import yaml
 import logging
 
 from grr.lib import aff4
+from grr.lib import data_store
 from grr.lib import rdfvalue
 from grr.lib import utils
 from grr.lib.flows.general import export as flow_export
@@ -24,6 +27,166 @@ from grr.lib.rdfvalues import structs as rdf_structs
 from grr.proto import api_utils_pb2
 
 
+class ApiArchiveGenerationMember(rdf_structs.RDFProtoStruct):
+  protobuf = api_utils_pb2.ApiArchiveGenerationMember
+
+
+class ArchiveGenerationManifest(object):
+  """Persisted record of the file members written into a generated archive.
+
+  Archive generation is deterministic, so an interrupted download can be
+  resumed by replaying the collection: files that are recorded in the manifest
+  and end before the resume offset are skipped without reading their contents.
+  """
+
+  CREATE_TIME_ATTRIBUTE = "archive:create_time"
+  GENERATED_SIZE_ATTRIBUTE = "archive:generated_size"
+  MEMBER_PREFIX = "archive:member:"
+
+  def __init__(self, urn, token=None):
+    super(ArchiveGenerationManifest, self).__init__()
+
+    self.urn = urn
+    self.token = token
+
+    self.create_time = None
+    self.generated_size = 0
+    self.members = {}
+
+    self._unflushed_members = []
+
+  def Load(self):
+    """Reads the manifest from the data store."""
+    for attribute, value, _ in data_store.DB.ResolvePrefix(
+        self.urn,
+        "archive:",
+        timestamp=data_store.DB.NEWEST_TIMESTAMP,
+        token=self.token):
+      if attribute == self.CREATE_TIME_ATTRIBUTE:
+        self.create_time = rdfvalue.RDFDatetime(value)
+      elif attribute == self.GENERATED_SIZE_ATTRIBUTE:
+        self.generated_size = int(value)
+      elif attribute.startswith(self.MEMBER_PREFIX):
+        member = ApiArchiveGenerationMember.FromSerializedString(value)
+        self.members[member.sha256] = member
+
+    return self
+
+  def Reset(self):
+    """Drops the stored manifest and starts a new one."""
+    data_store.DB.DeleteSubject(self.urn, sync=True, token=self.token)
+
+    self.create_time = rdfvalue.RDFDatetime.Now()
+    self.generated_size = 0
+    self.members = {}
+    self._unflushed_members = []
+
+    return self
+
+  @classmethod
+  def DeleteExpired(cls, archives_urn, max_age, token=None):
+    """Deletes the manifests under archives_urn older than max_age."""
+    deadline = rdfvalue.RDFDatetime.Now() - max_age
+
+    expired_subjects = []
+    for subject, _, create_time in data_store.DB.ScanAttribute(
+        archives_urn, cls.CREATE_TIME_ATTRIBUTE, token=token):
+      if rdfvalue.RDFDatetime(create_time) < deadline:
+        expired_subjects.append(subject)
+
+    if expired_subjects:
+      data_store.DB.DeleteSubjects(expired_subjects, sync=True, token=token)
+
+  def AddMember(self, member):
+    self.members[member.sha256] = member
+    self._unflushed_members.append(member)
+
+  def Flush(self):
+    """Writes members added since the last flush and the generated size."""
+    values = {
+        self.CREATE_TIME_ATTRIBUTE: [
+            self.create_time.AsMicroSecondsFromEpoch()
+        ],
+        self.GENERATED_SIZE_ATTRIBUTE: [self.generated_size],
+    }
+    for member in self._unflushed_members:
+      values[self.MEMBER_PREFIX + member.sha256] = [
+          member.SerializeToString()
+      ]
+
+    data_store.DB.MultiSet(self.urn, values, token=self.token)
+    self._unflushed_members = []
+
+
+class _OrderedFilesStreamer(object):
+  """Reads AFF4 streams ahead on a background thread.
+
+  AFF4Stream.MultiStream reads the chunks of many files at once, but it groups
+  the files by their type. Runs of consecutive files of the same type are
+  streamed together, so the files keep their order, and a bounded queue limits
+  how far the reader gets ahead of the consumer.
+
+  Exceptions about missing chunks are reported by MultiStream after the other
+  files of the same run, the consumer has to expect them late.
+  """
+
+  # Sentinel put into the queue when all the files were read.
+  _DONE = object()
+
+  def __init__(self, fds, max_queued_chunks=16):
+    super(_OrderedFilesStreamer, self).__init__()
+
+    self.fds = fds
+    self.max_queued_chunks = max_queued_chunks
+    self._stop = threading.Event()
+
+  def _ReadFiles(self, items_queue):
+    """Streams all the fds into the queue, gives up if streaming is stopped."""
+
+    def Put(item):
+      while not self._stop.is_set():
+        try:
+          items_queue.put(item, timeout=1)
+          return True
+        except Queue.Full:
+          pass
+      return False
+
+    for _, fds_run in itertools.groupby(self.fds, lambda fd: fd.__class__):
+      fds_run = list(fds_run)
+      last_fd = fds_run[0]
+      try:
+        for fd, chunk, exception in aff4.AFF4Stream.MultiStream(fds_run):
+          last_fd = fd
+          if not Put((fd, chunk, exception)):
+            return
+      except Exception as e:  # pylint: disable=broad-except
+        # Files before the one that was read last are complete.
+        for fd in fds_run[fds_run.index(last_fd):]:
+          if not Put((fd, None, e)):
+            return
+
+    Put(self._DONE)
+
+  def Stream(self):
+    """Yields (fd, chunk, exception) tuples, see AFF4Stream.MultiStream."""
+    items_queue = Queue.Queue(maxsize=self.max_queued_chunks)
+    reader = threading.Thread(
+        target=self._ReadFiles, args=(items_queue,), name="ArchiveFilesReader")
+    reader.daemon = True
+    reader.start()
+
+    try:
+      while True:
+        item = items_queue.get()
+        if item is self._DONE:
+          return
+        yield item
+    finally:
+      # Unblocks the reader if the consumer went away early.
+      self._stop.set()
+
+
 class CollectionArchiveGenerator(object):
   """Class that generates downloaded files archive from a collection."""
 
@@ -42,7 +205,8 @@ class CollectionArchiveGenerator(object):
                prefix=None,
                description=None,
                predicate=None,
-               client_id=None):
+               client_id=None,
+               manifest=None):
     """CollectionArchiveGenerator constructor.
 
     Args:
@@ -56,6 +220,9 @@ class CollectionArchiveGenerator(object):
       predicate: If not None, only the files matching the predicate will be
           archived, all others will be skipped.
       client_id: The client_id to use when exporting a flow results collection.
+      manifest: An optional ArchiveGenerationManifest. If given, written
+          members are recorded in it so that ZIP archive generation can be
+          resumed.
     Raises:
       ValueError: if prefix is None.
     """
@@ -68,6 +235,7 @@ class CollectionArchiveGenerator(object):
       self.archive_generator = utils.StreamingTarGenerator()
     else:
       raise ValueError("Unknown archive format: %s" % archive_format)
+    self.archive_format = archive_format
 
     if not prefix:
       raise ValueError("Prefix can't be None.")
@@ -83,6 +251,8 @@ class CollectionArchiveGenerator(object):
     self.predicate = predicate or (lambda _: True)
     self.client_id = client_id
 
+    self.manifest = manifest
+
   @property
   def output_size(self):
     return self.archive_generator.output_size
@@ -95,6 +265,11 @@ class CollectionArchiveGenerator(object):
       except flow_export.ItemNotExportableError:
         pass
 
+  def _ManifestMtime(self):
+    if self.manifest and self.manifest.create_time:
+      return self.manifest.create_time.AsSecondsFromEpoch()
+    return 0
+
   def _WriteDescription(self):
     """Writes description into a MANIFEST file in the archive."""
 
@@ -116,32 +291,144 @@ class CollectionArchiveGenerator(object):
     manifest_fd.write(yaml.safe_dump(manifest))
 
     manifest_fd.seek(0)
-    st = os.stat_result((0644, 0, 0, 0, 0, 0, len(manifest_fd.getvalue()), 0, 0,
-                         0))
+    st = os.stat_result((0644, 0, 0, 0, 0, 0, len(manifest_fd.getvalue()), 0,
+                         self._ManifestMtime(), 0))
 
     for chunk in self.archive_generator.WriteFromFD(
         manifest_fd, os.path.join(self.prefix, "MANIFEST"), st=st):
       yield chunk
 
-  def Generate(self, collection, token=None):
-    """Generates archive from a given collection.
+  def _RecordMember(self, sha256_hash, header_written, failed):
+    if not self.manifest or self.archive_format != self.ZIP:
+      return
+
+    member = ApiArchiveGenerationMember(
+        sha256=str(sha256_hash),
+        end_offset=self.output_size,
+        failed=failed)
+    if header_written:
+      zinfo = self.archive_generator.last_zinfo
+      member.crc = zinfo.CRC
+      member.file_size = zinfo.file_size
+      member.compress_size = zinfo.compress_size
+    self.manifest.AddMember(member)
+
+  def _GetSentMember(self, sha256_hash, offset):
+    """Returns the manifest member if it was completely sent before offset."""
+    if not self.manifest:
+      return None
+
+    member = self.manifest.members.get(str(sha256_hash))
+    if member is not None and member.end_offset <= offset:
+      return member
+
+  def _RecordLateFailure(self, fd, sha256_hash):
+    """Marks a file that was already written as failed."""
+    self.archived_files -= 1
+    self.failed_files.append(utils.SmartUnicode(fd.urn))
+
+    member = self.manifest and self.manifest.members.get(str(sha256_hash))
+    if member:
+      member.failed = True
+      self.manifest.AddMember(member)
+    else:
+      self._RecordMember(sha256_hash, False, True)
+
+  def _WriteFiles(self, fds_to_write, offset):
+    """Writes contents of the given files, skipping ones sent before offset."""
+    streamer = _OrderedFilesStreamer([
+        fd for fd, (_, _, sha256_hash) in fds_to_write
+        if self._GetSentMember(sha256_hash, offset) is None
+    ])
+    streamed_items = streamer.Stream()
+
+    # Hashes of the files that were written already, keyed by fd.
+    written_fds = {}
+    item = None
+    try:
+      for fd, (content_path, st, sha256_hash) in fds_to_write:
+        member = self._GetSentMember(sha256_hash, offset)
+        if member is not None:
+          if member.failed:
+            self.archived_files -= 1
+            self.failed_files.append(utils.SmartUnicode(fd.urn))
 
-    Iterates the collection and generates an archive by yielding contents
-    of every referenced AFF4Stream.
+          # A non empty file size means that a header was written.
+          if member.file_size:
+            self.archive_generator.SkipFile(
+                content_path,
+                crc=member.crc,
+                file_size=member.file_size,
+                compress_size=member.compress_size,
+                st=st)
+          continue
 
-    Args:
-      collection: Iterable with items that point to aff4 paths.
-      token: User's ACLToken.
+        header_written = False
+        failed = False
+        while True:
+          if item is None:
+            item = next(streamed_items, None)
+            if item is None:
+              break
 
-    Yields:
-      Binary chunks comprising the generated archive.
-    """
+          item_fd, chunk, exception = item
+          if item_fd in written_fds:
+            logging.exception(exception)
+            self._RecordLateFailure(item_fd, written_fds[item_fd])
+            item = None
+            continue
+
+          if item_fd is not fd:
+            # The item belongs to one of the following files.
+            break
+
+          item = None
+          if exception:
+            logging.exception(exception)
+            failed = True
+            continue
+
+          if not header_written:
+            yield self.archive_generator.WriteFileHeader(content_path, st=st)
+            header_written = True
+          yield self.archive_generator.WriteFileChunk(chunk)
+
+        if header_written:
+          yield self.archive_generator.WriteFileFooter()
+
+        if failed:
+          self.archived_files -= 1
+          self.failed_files.append(utils.SmartUnicode(fd.urn))
+
+        if header_written or failed:
+          self._RecordMember(sha256_hash, header_written, failed)
+        written_fds[fd] = sha256_hash
+
+      # Failures of the last files are reported after all of them.
+      late_items = itertools.chain([item] if item else [], streamed_items)
+      for item_fd, _, exception in late_items:
+        logging.exception(exception)
+        self._RecordLateFailure(item_fd, written_fds[item_fd])
+    finally:
+      streamed_items.close()
+
+  def _Generate(self, collection, offset, token=None):
+    """Generates the whole archive, see Generate."""
     hashes = set()
     for fd_urn_batch in utils.Grouper(
         self._ItemsToUrns(collection), self.BATCH_SIZE):
 
-      fds_to_write = {}
-      for fd in aff4.FACTORY.MultiOpen(fd_urn_batch, token=token):
+      # MultiOpen doesn't keep the order of the urns, but the archive has to
+      # be written in the collection order.
+      fds_by_urn = dict((fd.urn, fd) for fd in aff4.FACTORY.MultiOpen(
+          fd_urn_batch, token=token))
+
+      fds_to_write = []
+      for urn in fd_urn_batch:
+        fd = fds_by_urn.pop(rdfvalue.RDFURN(urn), None)
+        if fd is None:
+          continue
+
         self.total_files += 1
 
         if not self.predicate(fd):
@@ -161,8 +448,9 @@ class CollectionArchiveGenerator(object):
           if sha256_hash not in hashes:
             # Make sure size of the original file is passed. It's required
             # when output_writer is StreamingTarWriter.
-            st = os.stat_result((0644, 0, 0, 0, 0, 0, fd.size, 0, 0, 0))
-            fds_to_write[fd] = (content_path, st)
+            st = os.stat_result((0644, 0, 0, 0, 0, 0, fd.size, 0,
+                                 self._FileMtime(fd), 0))
+            fds_to_write.append((fd, (content_path, st, sha256_hash)))
             hashes.add(sha256_hash)
 
           up_prefix = "../" * len(fd.urn.Split())
@@ -170,32 +458,83 @@ class CollectionArchiveGenerator(object):
                                                     archive_path)
 
       if fds_to_write:
-        prev_fd = None
-        for fd, chunk, exception in aff4.AFF4Stream.MultiStream(fds_to_write):
-          if exception:
-            logging.exception(exception)
+        for chunk in self._WriteFiles(fds_to_write, offset):
+          yield chunk
 
-            self.archived_files -= 1
-            self.failed_files.append(utils.SmartUnicode(fd.urn))
-            continue
+      if self.manifest:
+        self.manifest.Flush()
+
+    for chunk in self._WriteDescription():
+      yield chunk
 
-          if prev_fd != fd:
-            if prev_fd:
-              yield self.archive_generator.WriteFileFooter()
-            prev_fd = fd
+    yield self.archive_generator.Close()
 
-            content_path, st = fds_to_write[fd]
-            yield self.archive_generator.WriteFileHeader(content_path, st=st)
+  def _FileMtime(self, fd):
+    """Returns the modification time of a file member.
 
-          yield self.archive_generator.WriteFileChunk(chunk)
+    Resumable archives have to be generated the same way every time, so their
+    members get the time the file was hashed. Other archives use the time of
+    the download.
 
-        if self.archive_generator.is_file_write_in_progress:
-          yield self.archive_generator.WriteFileFooter()
+    Args:
+      fd: The AFF4Stream that is written.
 
-    for chunk in self._WriteDescription():
-      yield chunk
+    Returns:
+      Seconds since epoch, 0 for the current time.
+    """
+    if not self.manifest:
+      return 0
 
-    yield self.archive_generator.Close()
+    hash_value = fd.Get(fd.Schema.HASH)
+    if hash_value is None or not hash_value.age:
+      return self._ManifestMtime()
+    return hash_value.age.AsSecondsFromEpoch()
+
+  def _GenerateFromOffset(self, collection, offset, token=None):
+    try:
+      for chunk in self._Generate(collection, offset, token=token):
+        # output_size includes all the chunks produced so far, so the current
+        # chunk starts at output_size - len(chunk).
+        chunk_start = self.output_size - len(chunk)
+        if chunk_start < offset:
+          chunk = chunk[offset - chunk_start:]
+        if chunk:
+          yield chunk
+    finally:
+      # This is also reached when the generator is closed because the
+      # connection was dropped.
+      if self.manifest:
+        self.manifest.generated_size = max(self.manifest.generated_size,
+                                           self.output_size)
+        self.manifest.Flush()
+
+  def Generate(self, collection, token=None, offset=0):
+    """Generates archive from a given collection.
+
+    Iterates the collection and generates an archive by yielding contents
+    of every referenced AFF4Stream. Files are read ahead on a background
+    thread, but always written in the collection order.
+
+    Args:
+      collection: Iterable with items that point to aff4 paths.
+      token: User's ACLToken.
+      offset: Only the archive contents starting at this offset are yielded.
+          Files that the manifest records as completely written before the
+          offset are not read again.
+
+    Returns:
+      A generator yielding binary chunks comprising the generated archive.
+
+    Raises:
+      ValueError: if the archive can't be resumed from the given offset.
+    """
+    if offset:
+      if self.archive_format != self.ZIP:
+        raise ValueError("Only ZIP archives can be resumed.")
+      if not self.manifest or offset > self.manifest.generated_size:
+        raise ValueError("Archive wasn't generated up to offset %d." % offset)
+
+    return self._GenerateFromOffset(collection, offset, token=token)
 
 
 class ApiDataObject(rdf_structs.RDFProtoStruct):
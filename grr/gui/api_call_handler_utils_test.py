@@ -6,6 +6,7 @@
 
 import hashlib
 import os
+import StringIO
 import tarfile
 import zipfile
 
@@ -16,7 +17,9 @@ from grr.gui import api_call_handler_utils
 
 from grr.lib import aff4
 from grr.lib import flags
+from grr.lib import rdfvalue
 from grr.lib import test_lib
+from grr.lib import utils
 from grr.lib.aff4_objects import collects
 from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import crypto as rdf_crypto
@@ -277,6 +280,134 @@ class CollectionArchiveGeneratorTest(test_lib.GRRBaseTest):
             [u"aff4:/C.0000000000000000/fs/os/foo/bar/中国新闻网新闻中.txt"]
     })
 
+  def _GenerateZipWithManifest(self, offset=0):
+    manifest = api_call_handler_utils.ArchiveGenerationManifest(
+        rdfvalue.RDFURN("aff4:/users/test/archives/test.zip"), token=self.token)
+    if offset:
+      manifest.Load()
+    else:
+      manifest.Reset()
+
+    archive_generator = api_call_handler_utils.CollectionArchiveGenerator(
+        prefix="test_prefix",
+        description="Test description",
+        client_id=self.client_id,
+        manifest=manifest)
+    return "".join(
+        archive_generator.Generate(
+            self.stat_entries, token=self.token, offset=offset))
+
+  def testResumesZipArchiveWithoutRereadingSentFiles(self):
+    full_archive = self._GenerateZipWithManifest()
+
+    zip_fd = zipfile.ZipFile(StringIO.StringIO(full_archive))
+    second_file_offset = zip_fd.getinfo(
+        "test_prefix/hashes/87298cc2f31fba73181ea2a9e6ef10dc"
+        "e21ed95e98bdac9c4e1504ea16f486e4").header_offset
+
+    streamed_urns = []
+    original_multi_stream = aff4.AFF4Stream.MultiStream
+
+    def RecordingMultiStream(fds):
+      streamed_urns.extend(fd.urn for fd in fds)
+      return original_multi_stream(fds)
+
+    with utils.Stubber(aff4.AFF4Stream, "MultiStream",
+                       staticmethod(RecordingMultiStream)):
+      resumed_archive = self._GenerateZipWithManifest(offset=second_file_offset)
+
+    self.assertEqual(full_archive[:second_file_offset] + resumed_archive,
+                     full_archive)
+    # Only the file that wasn't completely sent is read again.
+    self.assertEqual(streamed_urns, [self.paths[1]])
+
+  def testRaisesWhenResumingBeyondGeneratedOffset(self):
+    full_archive = self._GenerateZipWithManifest()
+
+    with self.assertRaises(ValueError):
+      self._GenerateZipWithManifest(offset=len(full_archive) + 1)
+
+  def testRaisesWhenResumingTarArchive(self):
+    archive_generator = api_call_handler_utils.CollectionArchiveGenerator(
+        archive_format=api_call_handler_utils.CollectionArchiveGenerator.TAR_GZ,
+        prefix="test_prefix",
+        client_id=self.client_id)
+
+    with self.assertRaises(ValueError):
+      archive_generator.Generate(self.stat_entries, token=self.token, offset=1)
+
+  def _CreateFiles(self, aff4_types):
+    stat_entries = []
+    for i, aff4_type in enumerate(aff4_types):
+      path = self.client_id.Add("fs/os/foo/bar/file%02d.txt" % i)
+      with aff4.FACTORY.Create(path, aff4_type, token=self.token) as fd:
+        fd.Write("content%02d" % i)
+        fd.Set(fd.Schema.HASH,
+               rdf_crypto.Hash(sha256=hashlib.sha256("content%02d" %
+                                                     i).digest()))
+      stat_entries.append(
+          rdf_client.StatEntry(pathspec=rdf_paths.PathSpec(
+              path="foo/bar/file%02d.txt" % i,
+              pathtype=rdf_paths.PathSpec.PathType.OS)))
+    return stat_entries
+
+  def testWritesFilesInCollectionOrder(self):
+    stat_entries = self._CreateFiles([aff4.AFF4Image] * 10 +
+                                     [aff4.AFF4MemoryStream] * 5 +
+                                     [aff4.AFF4Image] * 5)
+
+    streamed_batches = []
+    original_multi_stream = aff4.AFF4Stream.MultiStream
+
+    def RecordingMultiStream(fds):
+      streamed_batches.append(len(fds))
+      return original_multi_stream(fds)
+
+    archive_generator = api_call_handler_utils.CollectionArchiveGenerator(
+        prefix="test_prefix", client_id=self.client_id)
+    with utils.Stubber(aff4.AFF4Stream, "MultiStream",
+                       staticmethod(RecordingMultiStream)):
+      archive = "".join(
+          archive_generator.Generate(stat_entries, token=self.token))
+
+    zip_fd = zipfile.ZipFile(StringIO.StringIO(archive))
+    contents = [
+        zip_fd.read(name) for name in zip_fd.namelist()
+        if name.startswith("test_prefix/hashes/")
+    ]
+    self.assertEqual(contents, ["content%02d" % i for i in range(20)])
+    # Consecutive files of the same type are streamed together.
+    self.assertEqual(streamed_batches, [10, 5, 5])
+
+  def testAccountsForFailuresReportedAfterFollowingFiles(self):
+    stat_entries = self._CreateFiles([aff4.AFF4Image] * 3)
+    broken_path = self.client_id.Add("fs/os/foo/bar/file01.txt")
+    aff4.FACTORY.Delete(broken_path.Add("0000000000"), token=self.token)
+
+    manifest = api_call_handler_utils.ArchiveGenerationManifest(
+        rdfvalue.RDFURN("aff4:/users/test/archives/test.zip"),
+        token=self.token).Reset()
+    archive_generator = api_call_handler_utils.CollectionArchiveGenerator(
+        prefix="test_prefix", client_id=self.client_id, manifest=manifest)
+    archive = "".join(
+        archive_generator.Generate(stat_entries, token=self.token))
+
+    zip_fd = zipfile.ZipFile(StringIO.StringIO(archive))
+    contents = [
+        zip_fd.read(name) for name in zip_fd.namelist()
+        if name.startswith("test_prefix/hashes/")
+    ]
+    self.assertEqual(contents, ["content00", "content02"])
+    self.assertEqual(archive_generator.archived_files, 2)
+    self.assertEqual(archive_generator.failed_files, [broken_path])
+
+    broken_hash = hashlib.sha256("content01").digest()
+    failed_members = [
+        member.sha256 for member in manifest.members.values() if member.failed
+    ]
+    self.assertEqual(failed_members,
+                     [str(rdf_crypto.Hash(sha256=broken_hash).sha256)])
+
 
 class FilterCollectionTest(test_lib.GRRBaseTest):
   """Test for FilterCollection."""
@@ -920,6 +920,16 @@ class ApiCallRouter(object):
 
     raise NotImplementedError()
 
+  @Category("Other")
+  @Http("GET", "/api/stats/datastore/slow-queries")
+  @ArgsType(api_stats.ApiListDataStoreSlowQueriesArgs)
+  @ResultType(api_stats.ApiListDataStoreSlowQueriesResult)
+  @NoAuditLogRequired()
+  def ListDataStoreSlowQueries(self, args, token=None):
+    """List the slowest recent data store calls of the server."""
+
+    raise NotImplementedError()
+
   # Approvals methods.
   # =================
   #
@@ -488,6 +488,13 @@ class ApiCallRouterWithApprovalChecksWithoutRobotAccess(
 
     return self.delegate.GetReport(args, token=token)
 
+  def ListDataStoreSlowQueries(self, args, token=None):
+    # Slow queries contain data store subjects, e.g. client file paths, so only
+    # admins can list them.
+    self.CheckIfUserIsAdmin(token=token)
+
+    return self.delegate.ListDataStoreSlowQueries(args, token=token)
+
   # Approvals methods.
   # =================
   #
@@ -333,6 +333,16 @@ class ApiCallRouterWithApprovalChecksWithoutRobotAccessTest(
     self.CreateAdminUser(self.token.username)
     self.router.GetGrrBinary(None, token=self.token)
 
+  ACCESS_CHECKED_METHODS.extend([
+      "ListDataStoreSlowQueries"])  # pyformat: disable
+
+  def testListDataStoreSlowQueriesIsAccessChecked(self):
+    with self.assertRaises(access_control.UnauthorizedAccess):
+      self.router.ListDataStoreSlowQueries(None, token=self.token)
+
+    self.CreateAdminUser(self.token.username)
+    self.router.ListDataStoreSlowQueries(None, token=self.token)
+
   ACCESS_CHECKED_METHODS.extend([
       "GetGrrUser"])  # pyformat: disable
 
@@ -271,6 +271,9 @@ class ApiCallRouterWithoutChecks(api_call_router.ApiCallRouter):
   def GetReport(self, args, token=None):
     return api_stats.ApiGetReportHandler()
 
+  def ListDataStoreSlowQueries(self, args, token=None):
+    return api_stats.ApiListDataStoreSlowQueriesHandler()
+
   # Approvals methods.
   # =================
   #
@@ -27,6 +27,7 @@ from grr.lib.rdfvalues import client as rdf_client
 from grr.lib.rdfvalues import file_finder as rdf_file_finder
 from grr.lib.rdfvalues import flows as rdf_flows
 from grr.lib.rdfvalues import paths as rdf_paths
+from grr.lib.rdfvalues import protodict as rdf_protodict
 from grr.lib.rdfvalues import structs as rdf_structs
 
 from grr.proto.api import flow_pb2
@@ -201,13 +202,13 @@ class ApiFlow(rdf_structs.RDFProtoStruct):
       except ValueError:
         pass
 
-      flow_state_dict = flow_obj.Get(flow_obj.Schema.FLOW_STATE_DICT)
-      if flow_state_dict is not None:
-        flow_state_data = flow_state_dict.ToDict()
-
-        if flow_state_data:
-          self.state_data = (api_call_handler_utils.ApiDataObject()
-                             .InitFromDataObject(flow_state_data))
+      # FLOW_STATE_DICT is only updated when the flow finishes, the state
+      # also includes the changes of a running flow.
+      if flow_obj.state:
+        flow_state_data = rdf_protodict.AttributedDict().FromDict(
+            flow_obj.state).ToDict()
+        self.state_data = (api_call_handler_utils.ApiDataObject()
+                           .InitFromDataObject(flow_state_data))
 
     return self
 
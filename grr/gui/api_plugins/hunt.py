@@ -735,14 +735,19 @@ class ApiGetHuntFilesArchiveHandler(api_call_handler_base.ApiCallHandler):
 
   args_type = ApiGetHuntFilesArchiveArgs
 
-  def _WrapContentGenerator(self, generator, collection, args, token=None):
+  DOWNLOAD_ID_RE = re.compile(r"^[0-9a-f]{8}$")
+
+  # Manifests of resumable downloads are deleted after this time.
+  MANIFEST_TTL = rdfvalue.Duration("7d")
+
+  def _WrapContentGenerator(self, generator, content, args, token=None):
     user = aff4.FACTORY.Create(
         aff4.ROOT_URN.Add("users").Add(token.username),
         aff4_type=aff4_users.GRRUser,
         mode="rw",
         token=token)
     try:
-      for item in generator.Generate(collection, token=token):
+      for item in content:
         yield item
 
       user.Notify("ArchiveGenerationFinished", None,
@@ -783,12 +788,39 @@ class ApiGetHuntFilesArchiveHandler(api_call_handler_base.ApiCallHandler):
     else:
       raise ValueError("Unknown archive format: %s" % args.archive_format)
 
+    # Resumable ZIP archives are generated deterministically, so a manifest of
+    # written files allows resuming an interrupted download without rereading
+    # them. The client picks the download id that the manifest is kept under.
+    manifest = None
+    if args.download_id:
+      if args.archive_format != args.ArchiveFormat.ZIP:
+        raise ValueError("Only ZIP archive downloads can be resumed.")
+
+      if not self.DOWNLOAD_ID_RE.match(args.download_id):
+        raise ValueError("Invalid download_id: %s" % args.download_id)
+
+      archives_urn = aff4.ROOT_URN.Add("users").Add(token.username).Add(
+          "archives")
+      manifest = api_call_handler_utils.ArchiveGenerationManifest(
+          archives_urn.Add("%s_%s" % (target_file_prefix, args.download_id)),
+          token=token)
+      if args.offset:
+        manifest.Load()
+      else:
+        api_call_handler_utils.ArchiveGenerationManifest.DeleteExpired(
+            archives_urn, self.MANIFEST_TTL, token=token)
+        manifest.Reset()
+    elif args.offset:
+      raise ValueError("A download_id is needed to resume a download.")
+
     generator = api_call_handler_utils.CollectionArchiveGenerator(
         prefix=target_file_prefix,
         description=description,
-        archive_format=archive_format)
+        archive_format=archive_format,
+        manifest=manifest)
+    content = generator.Generate(collection, token=token, offset=args.offset)
     content_generator = self._WrapContentGenerator(
-        generator, collection, args, token=token)
+        generator, content, args, token=token)
     return api_call_handler_base.ApiBinaryStream(
         target_file_prefix + file_extension,
         content_generator=content_generator)
@@ -993,8 +1025,7 @@ class ApiListHuntClientsHandler(api_call_handler_base.ApiCallHandler):
     hunt_urn = args.hunt_id.ToURN()
     hunt = aff4.FACTORY.Open(hunt_urn, aff4_type=hunts.GRRHunt, token=token)
 
-    clients_by_status = hunt.GetClientsByStatus()
-    hunt_clients = clients_by_status[args.client_status.name]
+    hunt_clients = hunt.GetClientsWithStatus(args.client_status.name)
     total_count = len(hunt_clients)
 
     if args.count:
@@ -17,6 +17,7 @@ from grr.gui.api_plugins import hunt as hunt_plugin
 from grr.lib import access_control
 from grr.lib import action_mocks
 from grr.lib import aff4
+from grr.lib import data_store
 from grr.lib import flags
 from grr.lib import flow
 from grr.lib import hunts
@@ -283,6 +284,66 @@ class ApiGetHuntFilesArchiveHandlerTest(api_test_lib.ApiCallHandlerTest,
     self.assertEqual(manifest["processed_files"], 10)
     self.assertEqual(manifest["ignored_files"], 0)
 
+  def _GetZipArchive(self, download_id, offset=0):
+    result = self.handler.Handle(
+        hunt_plugin.ApiGetHuntFilesArchiveArgs(
+            hunt_id=self.hunt.urn.Basename(),
+            archive_format="ZIP",
+            offset=offset,
+            download_id=download_id),
+        token=self.token)
+    return result.filename, "".join(result.GenerateContent())
+
+  def testResumesZipArchiveOfTheSameDownload(self):
+    filename, content = self._GetZipArchive("0000000a")
+    self.assertEqual(filename, "hunt_%s.zip" %
+                     self.hunt.urn.Basename().replace(":", "_"))
+
+    # Another download of the same hunt doesn't touch the first manifest.
+    self._GetZipArchive("0000000b")
+
+    offset = len(content) / 2
+    resumed_filename, resumed_content = self._GetZipArchive(
+        "0000000a", offset=offset)
+    self.assertEqual(resumed_filename, filename)
+    self.assertEqual(resumed_content, content[offset:])
+
+  def testRejectsInvalidDownloadId(self):
+    for download_id in ["../../foo", "0000000A", "000000000"]:
+      with self.assertRaises(ValueError):
+        self._GetZipArchive(download_id)
+
+  def testDeletesExpiredManifests(self):
+    archives_urn = aff4.ROOT_URN.Add("users").Add(
+        self.token.username).Add("archives")
+
+    # Zip archives can't hold times before 1980.
+    now = rdfvalue.RDFDatetime.FromHumanReadable("2017-01-01")
+    with test_lib.FakeTime(now):
+      self._GetZipArchive("0000000a")
+    self.assertEqual(
+        len(list(data_store.DB.ScanAttribute(
+            archives_urn, "archive:create_time", token=self.token))), 1)
+
+    ttl = hunt_plugin.ApiGetHuntFilesArchiveHandler.MANIFEST_TTL
+    with test_lib.FakeTime(now + ttl + rdfvalue.Duration("1s")):
+      self._GetZipArchive("0000000b")
+    subjects = [
+        subject
+        for subject, _, _ in data_store.DB.ScanAttribute(
+            archives_urn, "archive:create_time", token=self.token)
+    ]
+    self.assertEqual(len(subjects), 1)
+    self.assertTrue(subjects[0].endswith("_0000000b"))
+
+  def testResumeRequiresDownloadId(self):
+    with self.assertRaises(ValueError):
+      self.handler.Handle(
+          hunt_plugin.ApiGetHuntFilesArchiveArgs(
+              hunt_id=self.hunt.urn.Basename(), archive_format="ZIP",
+              offset=10),
+          token=self.token)
+
   def testGeneratesTarGzArchive(self):
     result = self.handler.Handle(
         hunt_plugin.ApiGetHuntFilesArchiveArgs(
@@ -5,6 +5,7 @@ from grr.gui import api_call_handler_base
 from grr.gui.api_plugins.report_plugins import rdf_report_plugins
 from grr.gui.api_plugins.report_plugins import report_plugins
 from grr.lib import aff4
+from grr.lib import data_store_tracer
 from grr.lib import rdfvalue
 from grr.lib import timeseries
 from grr.lib import utils
@@ -211,3 +212,48 @@ class ApiGetReportHandler(api_call_handler_base.ApiCallHandler):
     return rdf_report_plugins.ApiReport(
         desc=report.GetReportDescriptor(),
         data=report.GetReportData(args, token))
+
+
+class ApiDataStoreSlowQuery(rdf_structs.RDFProtoStruct):
+  protobuf = stats_pb2.ApiDataStoreSlowQuery
+
+
+class ApiListDataStoreSlowQueriesArgs(rdf_structs.RDFProtoStruct):
+  protobuf = stats_pb2.ApiListDataStoreSlowQueriesArgs
+
+
+class ApiListDataStoreSlowQueriesResult(rdf_structs.RDFProtoStruct):
+  protobuf = stats_pb2.ApiListDataStoreSlowQueriesResult
+
+
+class ApiListDataStoreSlowQueriesHandler(api_call_handler_base.ApiCallHandler):
+  """Lists the slowest recent data store calls of this process."""
+
+  args_type = ApiListDataStoreSlowQueriesArgs
+  result_type = ApiListDataStoreSlowQueriesResult
+
+  def Handle(self, args, token=None):
+    result = ApiListDataStoreSlowQueriesResult()
+    for query in data_store_tracer.GetSlowQueries():
+      if args.method and query.method != args.method:
+        continue
+      if args.subject_class and query.subject_class != args.subject_class:
+        continue
+      if args.count and len(result.items) >= args.count:
+        break
+
+      result.items.append(
+          ApiDataStoreSlowQuery(
+              timestamp=rdfvalue.RDFDatetime(int(query.timestamp * 1e6)),
+              method=query.method,
+              subject=query.subject,
+              subject_class=query.subject_class,
+              duration=query.duration,
+              rows=query.rows,
+              columns=query.columns,
+              payload_bytes=query.payload_bytes,
+              error=query.error,
+              thread_name=query.thread_name,
+              stack=query.stack))
+
+    return result
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""This module contains tests for stats API handlers."""
+
+
+
+from grr.gui import api_test_lib
+from grr.gui.api_plugins import stats as stats_plugin
+
+from grr.lib import data_store
+from grr.lib import data_store_tracer
+from grr.lib import flags
+from grr.lib import test_lib
+
+
+class ApiListDataStoreSlowQueriesHandlerTest(api_test_lib.ApiCallHandlerTest):
+  """Test for ApiListDataStoreSlowQueriesHandler."""
+
+  def setUp(self):
+    super(ApiListDataStoreSlowQueriesHandlerTest, self).setUp()
+    self.handler = stats_plugin.ApiListDataStoreSlowQueriesHandler()
+
+  def tearDown(self):
+    data_store_tracer.StopTracing()
+    super(ApiListDataStoreSlowQueriesHandlerTest, self).tearDown()
+
+  def testReturnsNothingWhenTracingIsDisabled(self):
+    result = self.handler.Handle(
+        stats_plugin.ApiListDataStoreSlowQueriesArgs(), token=self.token)
+    self.assertEqual(len(result.items), 0)
+
+  def testReturnsFilteredSlowQueries(self):
+    data_store_tracer.StartTracing(slow_query_threshold=0)
+    data_store.DB.Set(
+        "aff4:/C.1000000000000000", "metadata:value", "x", token=self.token)
+    list(
+        data_store.DB.ResolvePrefix(
+            "aff4:/C.1000000000000000", "metadata:", token=self.token))
+
+    result = self.handler.Handle(
+        stats_plugin.ApiListDataStoreSlowQueriesArgs(subject_class="client"),
+        token=self.token)
+    self.assertItemsEqual([item.method for item in result.items],
+                          ["Set", "ResolvePrefix"])
+
+    result = self.handler.Handle(
+        stats_plugin.ApiListDataStoreSlowQueriesArgs(method="ResolvePrefix"),
+        token=self.token)
+    self.assertEqual(len(result.items), 1)
+
+    item = result.items[0]
+    self.assertEqual(item.subject, "aff4:/C.1000000000000000")
+    self.assertEqual(item.subject_class, "client")
+    self.assertEqual(item.columns, 1)
+    self.assertTrue(item.stack)
+
+    result = self.handler.Handle(
+        stats_plugin.ApiListDataStoreSlowQueriesArgs(count=1),
+        token=self.token)
+    self.assertEqual(len(result.items), 1)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -20,6 +20,7 @@ from grr.gui.api_plugins import output_plugin_regression_test
 from grr.gui.api_plugins import reflection_regression_test
 from grr.gui.api_plugins import reflection_test
 from grr.gui.api_plugins import stats_regression_test
+from grr.gui.api_plugins import stats_test
 from grr.gui.api_plugins import user_regression_test
 from grr.gui.api_plugins import user_test
 from grr.gui.api_plugins import vfs_regression_test
@@ -139,8 +139,8 @@ class MultiGetFileClientMock(ActionMock):
   def __init__(self, *args, **kwargs):
     super(MultiGetFileClientMock, self).__init__(
         standard.HashFile, standard.StatFile, standard.HashBuffer,
-        standard.TransferBuffer, file_fingerprint.FingerprintFile, *args,
-        **kwargs)
+        standard.HashFileChunks, standard.TransferBuffer,
+        file_fingerprint.FingerprintFile, *args, **kwargs)
 
 
 class ListDirectoryClientMock(ActionMock):
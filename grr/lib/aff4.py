@@ -576,6 +576,64 @@ class Factory(object):
         follow_symlinks=False,
         transaction=transaction)
 
+  def MultiOpenWithLock(self,
+                        urns,
+                        aff4_type=None,
+                        token=None,
+                        age=NEWEST_TIME,
+                        lease_time=100):
+    """Locks a bunch of urns and opens the ones we got a lock on.
+
+    This never blocks, urns locked by someone else are skipped. The locks are
+    taken one by one but all the locked objects are read from the data store
+    in a single call.
+
+    Args:
+      urns: The urns to open.
+      aff4_type: If set, we raise an InstantiationError if any of the objects
+          exists and is not an instance of this type.
+      token: The Security Token to use for opening these items.
+      age: The age policy used to build the objects.
+      lease_time: Maximum time the objects stay locked.
+
+    Returns:
+      A dict of AFF4 objects keyed by urn. Each object has to be used in a
+      'with ...' statement to release its lock.
+    """
+    if token is None:
+      token = data_store.default_token
+
+    transactions = {}
+    try:
+      for urn in urns:
+        urn = rdfvalue.RDFURN(urn)
+        try:
+          transactions[urn] = data_store.DB.DBSubjectLock(
+              urn, lease_time=lease_time, token=token)
+        except data_store.DBSubjectLockError:
+          pass
+
+      local_cache = dict(self.GetAttributes(transactions, age=age, token=token))
+
+      result = {}
+      for urn, transaction in transactions.iteritems():
+        result[urn] = self.Open(
+            urn,
+            aff4_type=aff4_type,
+            mode="rw",
+            token=token,
+            local_cache=local_cache,
+            age=age,
+            follow_symlinks=False,
+            transaction=transaction)
+
+      return result
+
+    except Exception:
+      for transaction in transactions.itervalues():
+        transaction.Release()
+      raise
+
   def _AcquireLock(self,
                    urn,
                    token=None,
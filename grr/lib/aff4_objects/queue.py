@@ -33,7 +33,7 @@ class Queue(aff4.AFF4Object):
     return urn.Add("Records").Add("%016x.%06x" % (timestamp, suffix))
 
   @classmethod
-  def StaticAdd(cls, queue_urn, token, rdf_value):
+  def StaticAdd(cls, queue_urn, token, rdf_value, mutation_pool=None):
     """Adds an rdf value the queue.
 
     Adds an rdf value to a queue. Does not require that the queue be locked, or
@@ -47,6 +47,9 @@ class Queue(aff4.AFF4Object):
 
       rdf_value: The rdf value to add to the queue.
 
+      mutation_pool: An optional MutationPool object to write to. If not given,
+                     the data_store is used directly.
+
     Raises:
       ValueError: rdf_value has unexpected type.
 
@@ -61,11 +64,18 @@ class Queue(aff4.AFF4Object):
       queue_urn = rdfvalue.RDFURN(queue_urn)
 
     result_subject = cls._MakeURN(queue_urn, timestamp)
-    data_store.DB.Set(result_subject,
-                      cls.VALUE_ATTRIBUTE,
-                      rdf_value.SerializeToString(),
-                      timestamp=timestamp,
-                      token=token)
+    if mutation_pool:
+      mutation_pool.Set(
+          result_subject,
+          cls.VALUE_ATTRIBUTE,
+          rdf_value.SerializeToString(),
+          timestamp=timestamp)
+    else:
+      data_store.DB.Set(result_subject,
+                        cls.VALUE_ATTRIBUTE,
+                        rdf_value.SerializeToString(),
+                        timestamp=timestamp,
+                        token=token)
 
   def Add(self, rdf_value):
     """Adds an rdf value to the queue.
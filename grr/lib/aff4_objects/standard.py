@@ -2,7 +2,9 @@
 """These are standard aff4 objects."""
 
 
+import bisect
 import StringIO
+import struct
 
 from grr.lib import aff4
 from grr.lib import data_store
@@ -91,11 +93,32 @@ class HashList(rdfvalue.RDFBytes):
                                            self.HASH_SIZE])
 
 
+class BlobOffsetList(rdfvalue.RDFBytes):
+  """A list of offsets at which the blobs of a BlobImage end."""
+
+  OFFSET_SIZE = 8
+
+  @classmethod
+  def FromOffsets(cls, offsets):
+    return cls(struct.pack("<%dQ" % len(offsets), *offsets))
+
+  def __len__(self):
+    return len(self._value) / self.OFFSET_SIZE
+
+  def AsList(self):
+    return list(struct.unpack("<%dQ" % len(self), self._value))
+
+
 class BlobImage(aff4.AFF4ImageBase):
   """An AFF4 stream which stores chunks by hashes.
 
   The hash stream is kept within an AFF4 Attribute, instead of another stream
   making it more efficient for smaller files.
+
+  Blobs normally all have the same size (the chunksize), except for the last
+  one. Images can also be built from blobs of varying sizes (see
+  AddVariableSizeBlob), in this case the end offset of every blob is stored
+  as well.
   """
   # Size of a sha256 hash
   _HASH_SIZE = 32
@@ -167,9 +190,12 @@ class BlobImage(aff4.AFF4ImageBase):
     if self.mode == "w":
       self.index = StringIO.StringIO("")
       self.finalized = False
+      self.blob_offsets = []
     else:
       self.index = StringIO.StringIO(self.Get(self.Schema.HASHES, ""))
       self.finalized = self.Get(self.Schema.FINALIZED, False)
+      self.blob_offsets = self.Get(self.Schema.BLOB_OFFSETS,
+                                   BlobOffsetList()).AsList()
 
   def Truncate(self, offset=0):
     if offset != 0:
@@ -177,6 +203,26 @@ class BlobImage(aff4.AFF4ImageBase):
     super(BlobImage, self).Truncate(0)
     self.index = StringIO.StringIO("")
     self.finalized = False
+    self.blob_offsets = []
+
+  def _ReadPartial(self, length):
+    """Read as much as possible, but not more than length."""
+    if not self.blob_offsets:
+      return super(BlobImage, self)._ReadPartial(length)
+
+    # Blobs have different sizes, look for the one containing the offset.
+    chunk = bisect.bisect_right(self.blob_offsets, self.offset)
+    if chunk >= len(self.blob_offsets):
+      return ""
+
+    chunk_start = self.blob_offsets[chunk - 1] if chunk else 0
+    fd = self._GetChunkForReading(chunk)
+    fd.seek(self.offset - chunk_start)
+
+    result = fd.read(min(length, self.blob_offsets[chunk] - self.offset))
+    self.offset += len(result)
+
+    return result
 
   def _GetChunkForWriting(self, chunk):
     """Chunks must be added using the AddBlob() method."""
@@ -228,6 +274,9 @@ class BlobImage(aff4.AFF4ImageBase):
       self.Set(self.Schema.SIZE(self.size))
       self.Set(self.Schema.HASHES(self.index.getvalue()))
       self.Set(self.Schema.FINALIZED(self.finalized))
+      if self.blob_offsets:
+        self.Set(self.Schema.BLOB_OFFSETS(
+            BlobOffsetList.FromOffsets(self.blob_offsets)))
     super(BlobImage, self).Flush(sync=sync)
 
   def AppendContent(self, src_fd):
@@ -267,6 +316,10 @@ class BlobImage(aff4.AFF4ImageBase):
     if self.finalized and length > 0:
       raise IOError("Can't add blobs to finalized BlobImage")
 
+    if self.blob_offsets:
+      raise IOError("Can't add fixed size blobs to a BlobImage with variable "
+                    "sized blobs")
+
     self.content_dirty = True
     self.index.seek(0, 2)
     self.index.write(blob_hash)
@@ -275,6 +328,27 @@ class BlobImage(aff4.AFF4ImageBase):
     if length < self.chunksize:
       self.finalized = True
 
+  def AddVariableSizeBlob(self, blob_hash, length):
+    """Add another blob of any size to this image using its hash.
+
+    Images built with this method can't be extended with AddBlob().
+
+    Args:
+      blob_hash: sha256 binary digest
+      length: int length of blob
+    Raises:
+      IOError: if fixed size blobs were already added.
+    """
+    self.index.seek(0, 2)
+    if self.index.tell() and not self.blob_offsets:
+      raise IOError("Can't add variable sized blobs to a BlobImage with fixed "
+                    "size blobs")
+
+    self.content_dirty = True
+    self.index.write(blob_hash)
+    self.size += length
+    self.blob_offsets.append(self.size)
+
   def GetContentAge(self):
     content_age = super(BlobImage, self).GetContentAge()
     if content_age:
@@ -303,6 +377,10 @@ class BlobImage(aff4.AFF4ImageBase):
                                "Once a blobimage is finalized, further writes"
                                " will raise exceptions.")
 
+    BLOB_OFFSETS = aff4.Attribute(
+        "aff4:blob_offsets", BlobOffsetList,
+        "End offsets of the blobs, for images with variable sized blobs.")
+
 
 class AFF4SparseImage(aff4.AFF4ImageBase):
   """A class to store partial files."""
@@ -65,6 +65,31 @@ class BlobImageTest(test_lib.AFF4ObjectTest):
     dest_fd.Seek(0)
     self.assertEqual(dest_fd.Read(5000), src_content + src_content)
 
+  def testVariableSizeBlobs(self):
+    blobs = ["abc", "", "defghijk", "l", "mnopqrstuvwxyz"]
+    content = "".join(blobs)
+
+    with aff4.FACTORY.Create(
+        "aff4:/foo", aff4_type=aff4_standard.BlobImage, token=self.token) as fd:
+      fd.SetChunksize(4)
+      for blob in blobs:
+        blob_hash = data_store.DB.StoreBlob(blob, token=self.token)
+        fd.AddVariableSizeBlob(blob_hash.decode("hex"), len(blob))
+
+      self.assertRaises(IOError, fd.AddBlob, "\x00" * 32, 4)
+
+    fd = aff4.FACTORY.Open("aff4:/foo", token=self.token)
+    self.assertEqual(fd.size, len(content))
+    self.assertEqual(fd.Read(1000), content)
+
+    for offset in xrange(len(content)):
+      for length in [1, 3, 10]:
+        fd.Seek(offset)
+        self.assertEqual(fd.Read(length), content[offset:offset + length])
+
+    chunks = [chunk for _, chunk, _ in aff4.AFF4Stream.MultiStream([fd])]
+    self.assertEqual("".join(chunks), content)
+
   def testMultiStreamStreamsSingleFileWithSingleChunk(self):
     with aff4.FACTORY.Create(
         "aff4:/foo", aff4_type=aff4_standard.BlobImage, token=self.token) as fd:
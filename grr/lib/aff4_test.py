@@ -1490,6 +1490,36 @@ class AFF4Tests(test_lib.AFF4ObjectTest):
       # Check that the object is correctly opened by reading the attribute
       self.assertEqual(obj.Get(obj.Schema.HOSTNAME), "client1")
 
+  def testMultiOpenWithLock(self):
+    urns = [rdfvalue.RDFURN("aff4:/C.%016X" % i) for i in range(3)]
+    for i, urn in enumerate(urns):
+      client = aff4.FACTORY.Create(
+          urn, aff4_grr.VFSGRRClient, mode="w", token=self.token)
+      client.Set(client.Schema.HOSTNAME("client%d" % i))
+      client.Close()
+
+    with aff4.FACTORY.OpenWithLock(urns[0], token=self.token):
+      objs = aff4.FACTORY.MultiOpenWithLock(urns, token=self.token)
+
+    # The locked object is skipped.
+    self.assertItemsEqual(objs.keys(), urns[1:])
+    for i, urn in enumerate(urns[1:], 1):
+      self.assertEqual(objs[urn].Get(objs[urn].Schema.HOSTNAME), "client%d" % i)
+
+      # We hold the locks until the objects are closed.
+      self.assertRaises(
+          aff4.LockError,
+          aff4.FACTORY.OpenWithLock,
+          urn,
+          token=self.token,
+          blocking=False)
+
+      with objs[urn]:
+        pass
+
+      with aff4.FACTORY.OpenWithLock(urn, token=self.token, blocking=False):
+        pass
+
   def testSynchronousOpenWithLockWorksCorrectly(self):
     client = aff4.FACTORY.Create(
         self.client_id, aff4_grr.VFSGRRClient, mode="w", token=self.token)
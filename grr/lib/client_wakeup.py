@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""Notifications about client queues which received new tasks.
+
+Tasks for clients are written into the client's queue in the data store and
+frontends only find them when the client polls. Whenever tasks are scheduled,
+the names of the affected queues are published on a channel so frontends can
+wake up long polling clients and know which queues are worth querying.
+
+Subscribers in the same process are called directly. Other processes on the
+same machine (e.g. workers publishing to frontends) are reached through unix
+datagram sockets in Server.client_wakeup_socket_dir, every listening process
+binds one socket in there and removes it again when it stops. Sockets left
+behind by processes that died are removed by the next process that starts
+listening. Notifications are best effort, they may be dropped when a receiver
+is too slow.
+"""
+
+
+import atexit
+import errno
+import os
+import socket
+import threading
+import time
+
+import logging
+
+from grr.lib import config_lib
+from grr.lib import registry
+from grr.lib import stats
+from grr.lib import utils
+
+
+class ClientWakeupChannel(object):
+  """Fans out the names of client queues which received new tasks."""
+
+  # Maximum size of a single datagram.
+  MAX_DATAGRAM_SIZE = 32 * 1024
+
+  # How long the list of listening sockets is cached.
+  SOCKET_LIST_MAX_AGE = 10
+
+  def __init__(self, socket_dir=None):
+    self.socket_dir = socket_dir
+    self.subscribers = []
+    self.lock = threading.Lock()
+
+    self.listen_socket = None
+    self.listen_path = None
+    self.send_socket = None
+    self.socket_paths = []
+    self.socket_paths_time = 0
+
+  def Subscribe(self, callback):
+    """Calls callback(queues) whenever there are new tasks in queues."""
+    with self.lock:
+      self.subscribers.append(callback)
+
+  def Unsubscribe(self, callback):
+    with self.lock:
+      if callback in self.subscribers:
+        self.subscribers.remove(callback)
+
+  def Publish(self, queues):
+    """Announces new tasks in the given queues.
+
+    Args:
+      queues: An iterable of queue URNs.
+    """
+    queues = set(utils.SmartStr(queue) for queue in queues)
+    if not queues:
+      return
+
+    stats.STATS.IncrementCounter("grr_client_wakeups_published", len(queues))
+    self._Notify(queues)
+
+    if self.socket_dir:
+      self._SendToListeners(queues)
+
+  def _Notify(self, queues):
+    with self.lock:
+      subscribers = list(self.subscribers)
+
+    for callback in subscribers:
+      try:
+        callback(queues)
+      except Exception as e:  # pylint: disable=broad-except
+        logging.exception("Client wakeup subscriber failed: %s", e)
+
+  def _ListSocketPaths(self):
+    try:
+      names = os.listdir(self.socket_dir)
+    except OSError:
+      names = []
+
+    return [
+        os.path.join(self.socket_dir, name) for name in names
+        if name.endswith(".sock")
+    ]
+
+  def _GetListenerPaths(self):
+    """Returns the sockets of all other listening processes."""
+    now = time.time()
+    if now - self.socket_paths_time > self.SOCKET_LIST_MAX_AGE:
+      self.socket_paths = self._ListSocketPaths()
+      self.socket_paths_time = now
+
+    return [path for path in self.socket_paths if path != self.listen_path]
+
+  def _SendToListeners(self, queues):
+    """Sends the queue names to all other processes on this machine."""
+    paths = self._GetListenerPaths()
+    if not paths:
+      return
+
+    datagrams = []
+    current = []
+    current_size = 0
+    for queue in queues:
+      if current and current_size + len(queue) + 1 > self.MAX_DATAGRAM_SIZE:
+        datagrams.append("\n".join(current))
+        current = []
+        current_size = 0
+
+      current.append(queue)
+      current_size += len(queue) + 1
+    datagrams.append("\n".join(current))
+
+    with self.lock:
+      if self.send_socket is None:
+        self.send_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # Never block the publisher, receivers poll their queues anyways.
+        self.send_socket.setblocking(0)
+
+      for path in paths:
+        for datagram in datagrams:
+          try:
+            self.send_socket.sendto(datagram, path)
+          except socket.error as e:
+            if e.errno not in (errno.EAGAIN, errno.ECONNREFUSED, errno.ENOENT,
+                               errno.ENOBUFS):
+              logging.warning("Unable to send client wakeup to %s: %s", path,
+                              e)
+            stats.STATS.IncrementCounter("grr_client_wakeups_dropped")
+            break
+
+  def _RemoveStaleSockets(self):
+    """Removes the sockets of processes which stopped without cleaning up."""
+    for path in self._ListSocketPaths():
+      probe = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+      try:
+        probe.connect(path)
+      except socket.error as e:
+        # Nobody is bound to the socket any more.
+        if e.errno == errno.ECONNREFUSED:
+          try:
+            os.unlink(path)
+          except OSError:
+            pass
+      finally:
+        probe.close()
+
+    self.socket_paths_time = 0
+
+  def Listen(self):
+    """Starts receiving notifications published by other processes."""
+    if not self.socket_dir or self.listen_socket is not None:
+      return
+
+    self._RemoveStaleSockets()
+
+    self.listen_path = os.path.join(self.socket_dir,
+                                    "wakeup-%d.sock" % os.getpid())
+    try:
+      os.unlink(self.listen_path)
+    except OSError:
+      pass
+
+    self.listen_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    self.listen_socket.bind(self.listen_path)
+    atexit.register(self.Stop)
+
+    thread = threading.Thread(
+        name="ClientWakeupListener",
+        target=self._ReceiveLoop,
+        args=(self.listen_socket,))
+    thread.daemon = True
+    thread.start()
+
+  def Stop(self):
+    """Stops receiving notifications and removes the socket of this process."""
+    with self.lock:
+      listen_socket = self.listen_socket
+      self.listen_socket = None
+
+    if listen_socket is None:
+      return
+
+    try:
+      os.unlink(self.listen_path)
+    except OSError:
+      pass
+
+    # Wakes up the receiving thread.
+    try:
+      listen_socket.shutdown(socket.SHUT_RDWR)
+    except socket.error:
+      pass
+    listen_socket.close()
+
+  def _ReceiveLoop(self, listen_socket):
+    while True:
+      try:
+        data = listen_socket.recv(self.MAX_DATAGRAM_SIZE)
+      except socket.error as e:
+        if e.errno == errno.EINTR:
+          continue
+        if self.listen_socket is listen_socket:
+          logging.warning("Client wakeup listener stopped: %s", e)
+        return
+
+      if self.listen_socket is not listen_socket:
+        return
+
+      self._Notify(set(data.split("\n")))
+
+
+CHANNEL = None
+
+
+def PublishQueues(queues):
+  """Publishes new tasks in the given queues on the process' channel."""
+  if CHANNEL is not None:
+    CHANNEL.Publish(queues)
+
+
+class ClientWakeupInit(registry.InitHook):
+  """Creates the channel of this process."""
+
+  def RunOnce(self):
+    global CHANNEL
+    CHANNEL = ClientWakeupChannel(
+        socket_dir=config_lib.CONFIG["Server.client_wakeup_socket_dir"])
+
+    stats.STATS.RegisterCounterMetric("grr_client_wakeups_published")
+    stats.STATS.RegisterCounterMetric("grr_client_wakeups_dropped")
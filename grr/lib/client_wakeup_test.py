@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""Tests for the client wakeup channel."""
+
+
+import os
+import socket
+import threading
+
+from grr.lib import client_wakeup
+from grr.lib import flags
+from grr.lib import queue_manager
+from grr.lib import test_lib
+from grr.lib.rdfvalues import client as rdf_client
+from grr.lib.rdfvalues import flows as rdf_flows
+
+
+class ClientWakeupChannelTest(test_lib.GRRBaseTest):
+  """Tests the ClientWakeupChannel."""
+
+  def testSubscribers(self):
+    channel = client_wakeup.ClientWakeupChannel()
+    published = []
+    channel.Subscribe(published.append)
+
+    channel.Publish([rdf_client.ClientURN("C.1000000000000000").Queue()])
+    self.assertEqual(published, [set(["aff4:/C.1000000000000000/tasks"])])
+
+    # Nothing is published without queues.
+    channel.Publish([])
+    self.assertEqual(len(published), 1)
+
+    channel.Unsubscribe(published.append)
+    channel.Publish(["aff4:/C.1000000000000001/tasks"])
+    self.assertEqual(len(published), 1)
+
+  def testCrossProcessNotifications(self):
+    receiver = client_wakeup.ClientWakeupChannel(socket_dir=self.temp_dir)
+    received = []
+    event = threading.Event()
+
+    def Callback(queues):
+      received.append(queues)
+      event.set()
+
+    receiver.Subscribe(Callback)
+    receiver.Listen()
+
+    sender = client_wakeup.ClientWakeupChannel(socket_dir=self.temp_dir)
+    queues = set("aff4:/C.%016x/tasks" % i for i in range(2000))
+    sender.Publish(queues)
+
+    # Many queues are split into several datagrams.
+    while set().union(*received) != queues:
+      event.clear()
+      self.assertTrue(event.wait(10))
+
+    self.assertGreater(len(received), 1)
+
+  def testListenerRemovesStaleSockets(self):
+    # A socket left behind by a process that died.
+    stale_path = os.path.join(self.temp_dir, "wakeup-1.sock")
+    stale_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    stale_socket.bind(stale_path)
+    stale_socket.close()
+
+    # A socket of a process that is still listening.
+    live_path = os.path.join(self.temp_dir, "wakeup-2.sock")
+    live_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    live_socket.bind(live_path)
+
+    channel = client_wakeup.ClientWakeupChannel(socket_dir=self.temp_dir)
+    channel.Listen()
+    try:
+      self.assertFalse(os.path.exists(stale_path))
+      self.assertTrue(os.path.exists(live_path))
+    finally:
+      channel.Stop()
+      live_socket.close()
+
+  def testStopRemovesSocket(self):
+    channel = client_wakeup.ClientWakeupChannel(socket_dir=self.temp_dir)
+    channel.Listen()
+    self.assertTrue(os.path.exists(channel.listen_path))
+
+    channel.Stop()
+    self.assertFalse(os.path.exists(channel.listen_path))
+
+    # Stopping twice is fine.
+    channel.Stop()
+
+  def testScheduleAnnouncesTasks(self):
+    published = []
+    client_wakeup.CHANNEL.Subscribe(published.append)
+    try:
+      client_id = rdf_client.ClientURN("C.1000000000000000")
+      with queue_manager.QueueManager(token=self.token) as manager:
+        manager.QueueClientMessage(
+            rdf_flows.GrrMessage(
+                queue=client_id.Queue(), generate_task_id=True))
+
+        # Nothing is announced before the tasks are written.
+        self.assertEqual(published, [])
+
+      self.assertEqual(published, [set([str(client_id.Queue())])])
+
+      queue_manager.QueueManager(token=self.token).Schedule([
+          rdf_flows.GrrMessage(queue=client_id.Queue(), generate_task_id=True)
+      ])
+      self.assertEqual(len(published), 2)
+    finally:
+      client_wakeup.CHANNEL.Unsubscribe(published.append)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -4,6 +4,7 @@
 
 import hmac
 import struct
+import threading
 import time
 import zlib
 
@@ -19,6 +20,27 @@ from grr.lib.rdfvalues import crypto as rdf_crypto
 from grr.lib.rdfvalues import flows as rdf_flows
 
 
+# A preset dictionary for compressing message lists. Small message lists
+# (status messages, single responses) don't contain enough data for zlib to
+# find repetitions so we prime it with strings commonly found in serialized
+# GrrMessages. zlib prefers close matches so the most common strings are at the
+# end. Changing this breaks compatibility with deployed endpoints, a new
+# compression type has to be added instead.
+COMPRESSION_DICTIONARY = "".join([
+    "/proc/", "/usr/bin/", "/usr/lib/", "/etc/", "/home/", "/tmp/", "/var/",
+    "C:\\Windows\\System32\\", "C:\\Program Files\\", "C:\\Users\\",
+    "HKEY_LOCAL_MACHINE\\SOFTWARE\\", "HKEY_USERS\\",
+    "ClientStats", "CpuSample", "IOSample", "Process", "Interface",
+    "NetworkAddress", "User", "Volume", "Uname", "ClientInformation",
+    "FileFinderResult", "FileFinderArgs", "FingerprintResponse", "Hash",
+    "BufferReference", "DataBlob", "Dict", "KeyValue", "Iterator",
+    "ExecuteBinaryResponse", "ListDirRequest", "GetFileStatRequest",
+    "CpuSeconds", "GrrStatus", "StatEntry", "PathSpec", "OS", "TSK",
+    "REGISTRY", "aff4:/hunts/H:", "aff4:/flows/W:", "aff4:/flows/H:",
+    "/tasks", "aff4:/C."
+])
+
+
 class CommunicatorInit(registry.InitHook):
 
   def RunOnce(self):
@@ -257,10 +279,114 @@ class ReceivedCipher(Cipher):
       return True
 
 
+_PRIMED_COMPRESSORS = {}
+_PRIMED_COMPRESSORS_LOCK = threading.Lock()
+_PRIMED_DECOMPRESSOR = None
+
+
+def _GetPrimedCompressor(level):
+  """Returns a zlib compressor which already consumed the dictionary."""
+  with _PRIMED_COMPRESSORS_LOCK:
+    compressor = _PRIMED_COMPRESSORS.get(level)
+    if compressor is None:
+      compressor = zlib.compressobj(level)
+      compressor.compress(COMPRESSION_DICTIONARY)
+      compressor.flush(zlib.Z_SYNC_FLUSH)
+      _PRIMED_COMPRESSORS[level] = compressor
+
+    return compressor.copy()
+
+
+def _GetPrimedDecompressor():
+  """Returns a zlib decompressor which already produced the dictionary."""
+  global _PRIMED_DECOMPRESSOR
+
+  with _PRIMED_COMPRESSORS_LOCK:
+    if _PRIMED_DECOMPRESSOR is None:
+      # Python 2 zlib doesn't support preset dictionaries. Instead, the
+      # dictionary is compressed as the start of the stream and only the
+      # remainder is sent. The decompressor just needs some valid encoding of
+      # the dictionary to end up with the same history, so the level used
+      # here doesn't matter.
+      compressor = zlib.compressobj(zlib.Z_BEST_SPEED)
+      prefix = (compressor.compress(COMPRESSION_DICTIONARY) +
+                compressor.flush(zlib.Z_SYNC_FLUSH))
+      decompressor = zlib.decompressobj()
+      if decompressor.decompress(prefix) != COMPRESSION_DICTIONARY:
+        raise RuntimeError("Unable to prime decompressor.")
+      _PRIMED_DECOMPRESSOR = decompressor
+
+    return _PRIMED_DECOMPRESSOR.copy()
+
+
+def CompressData(data, compression, level=zlib.Z_DEFAULT_COMPRESSION):
+  """Compresses data.
+
+  Args:
+    data: The string to compress.
+    compression: A SignedMessageList.CompressionType.
+    level: The zlib compression level.
+
+  Returns:
+    The compressed string.
+
+  Raises:
+    ValueError: If the compression type is not supported.
+  """
+  compression_type = rdf_flows.SignedMessageList.CompressionType
+  if compression == compression_type.UNCOMPRESSED:
+    return data
+
+  if compression == compression_type.ZCOMPRESSION:
+    return zlib.compress(data, level)
+
+  if compression == compression_type.ZCOMPRESSION_DICTIONARY:
+    compressor = _GetPrimedCompressor(level)
+    return compressor.compress(data) + compressor.flush()
+
+  raise ValueError("Compression scheme not supported: %s" % compression)
+
+
+def DecompressData(data, compression):
+  """Reverses CompressData().
+
+  Args:
+    data: The compressed string.
+    compression: A SignedMessageList.CompressionType.
+
+  Returns:
+    The decompressed string.
+
+  Raises:
+    DecodingError: If decompression fails.
+  """
+  compression_type = rdf_flows.SignedMessageList.CompressionType
+  if compression == compression_type.UNCOMPRESSED:
+    return data
+
+  try:
+    if compression == compression_type.ZCOMPRESSION:
+      return zlib.decompress(data)
+
+    if compression == compression_type.ZCOMPRESSION_DICTIONARY:
+      decompressor = _GetPrimedDecompressor()
+      return decompressor.decompress(data) + decompressor.flush()
+  except zlib.error as e:
+    raise DecodingError("Failed to decompress: %s" % e)
+
+  raise DecodingError("Compression scheme not supported")
+
+
 class Communicator(object):
   """A class responsible for encoding and decoding comms."""
   server_name = None
 
+  # ClientCommunication fields that are sent inside the encrypted
+  # SignedMessageList, so that they are covered by the HMAC.
+  SIGNED_COMMS_FIELDS = [
+      "long_poll_timeout", "long_poll_duration", "poll_interval_hint"
+  ]
+
   def __init__(self, certificate=None, private_key=None):
     """Creates a communicator.
 
@@ -276,19 +402,37 @@ class Communicator(object):
     # A cache for encrypted ciphers
     self.encrypted_cipher_cache = utils.FastStore(max_size=50000)
 
+  def _GetCompression(self, data_size):
+    """Chooses compression type and level for a message list of this size."""
+    compression_type = rdf_flows.SignedMessageList.CompressionType
+    if (config_lib.CONFIG["Network.compression"] != "ZCOMPRESS" or
+        data_size < config_lib.CONFIG["Network.compression_min_size"]):
+      return compression_type.UNCOMPRESSED, None
+
+    if data_size >= config_lib.CONFIG["Network.compression_large_size"]:
+      return (compression_type.ZCOMPRESSION,
+              config_lib.CONFIG["Network.compression_large_level"])
+
+    level = config_lib.CONFIG["Network.compression_level"]
+    if data_size < config_lib.CONFIG["Network.compression_dictionary_max_size"]:
+      return compression_type.ZCOMPRESSION_DICTIONARY, level
+
+    return compression_type.ZCOMPRESSION, level
+
   def EncodeMessageList(self, message_list, signed_message_list):
     """Encode the MessageList into the signed_message_list rdfvalue."""
     # By default uncompress
     uncompressed_data = message_list.SerializeToString()
     signed_message_list.message_list = uncompressed_data
 
-    if config_lib.CONFIG["Network.compression"] == "ZCOMPRESS":
-      compressed_data = zlib.compress(uncompressed_data)
+    compression, level = self._GetCompression(len(uncompressed_data))
+    if (compression !=
+        rdf_flows.SignedMessageList.CompressionType.UNCOMPRESSED):
+      compressed_data = CompressData(uncompressed_data, compression, level)
 
       # Only compress if it buys us something.
       if len(compressed_data) < len(uncompressed_data):
-        signed_message_list.compression = (
-            rdf_flows.SignedMessageList.CompressionType.ZCOMPRESSION)
+        signed_message_list.compression = compression
         signed_message_list.message_list = compressed_data
 
   def _GetServerCipher(self):
@@ -319,7 +463,9 @@ class Communicator(object):
        message_list: A MessageList rdfvalue containing a list of
        GrrMessages.
 
-       result: A ClientCommunication rdfvalue which will be filled in.
+       result: A ClientCommunication rdfvalue which will be filled in. Fields
+       in SIGNED_COMMS_FIELDS that are already set are moved into the
+       encrypted payload.
 
        destination: The CN of the remote system this should go to.
 
@@ -359,6 +505,11 @@ class Communicator(object):
     signed_message_list = rdf_flows.SignedMessageList(timestamp=timestamp)
     self.EncodeMessageList(message_list, signed_message_list)
 
+    for field in self.SIGNED_COMMS_FIELDS:
+      if result.HasField(field):
+        signed_message_list.Set(field, result.Get(field))
+        result.Set(field, None)
+
     result.encrypted_cipher_metadata = cipher.encrypted_cipher_metadata
 
     # Include the encrypted cipher.
@@ -418,18 +569,8 @@ class Communicator(object):
     Raises:
       DecodingError: If decompression fails.
     """
-    compression = signed_message_list.compression
-    if compression == rdf_flows.SignedMessageList.CompressionType.UNCOMPRESSED:
-      data = signed_message_list.message_list
-
-    elif (compression ==
-          rdf_flows.SignedMessageList.CompressionType.ZCOMPRESSION):
-      try:
-        data = zlib.decompress(signed_message_list.message_list)
-      except zlib.error as e:
-        raise DecodingError("Failed to decompress: %s" % e)
-    else:
-      raise DecodingError("Compression scheme not supported")
+    data = DecompressData(signed_message_list.message_list,
+                          signed_message_list.compression)
 
     try:
       result = rdf_flows.MessageList.FromSerializedString(data)
@@ -444,6 +585,9 @@ class Communicator(object):
     Args:
         response_comms: A ClientCommunication rdfvalue
 
+    The fields in SIGNED_COMMS_FIELDS of response_comms are replaced with the
+    values from the encrypted payload.
+
     Returns:
        list of messages and the CN where they came from.
 
@@ -492,6 +636,13 @@ class Communicator(object):
     except rdfvalue.DecodeError as e:
       raise DecryptionError(str(e))
 
+    # Values sent in the clear are not trusted.
+    for field in self.SIGNED_COMMS_FIELDS:
+      value = None
+      if signed_message_list.HasField(field):
+        value = signed_message_list.Get(field)
+      response_comms.Set(field, value)
+
     message_list = self.DecompressMessageList(signed_message_list)
 
     # Are these messages authenticated?
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""Benchmarks the compression of message lists."""
+
+
+import time
+
+from grr.lib import client_fixture
+from grr.lib import communicator
+from grr.lib import flags
+from grr.lib import rdfvalue
+from grr.lib import test_lib
+from grr.lib import utils
+from grr.lib.rdfvalues import client as rdf_client
+from grr.lib.rdfvalues import flows as rdf_flows
+
+
+class MessageListCompressionBenchmark(test_lib.MicroBenchmarks):
+  """Compares CPU time and size of the compression types and levels."""
+
+  units = "ms"
+
+  REPEATS = 20
+
+  def setUp(self):
+    super(MessageListCompressionBenchmark, self).setUp(["Bytes", "Ratio"],
+                                                       ["<20", "<20"])
+
+  def _StatEntries(self):
+    """Returns all the StatEntries in the client fixture."""
+    result = []
+    for _, (_, attributes) in client_fixture.VFS:
+      stat = attributes.get("aff4:stat")
+      if stat:
+        result.append(
+            rdf_client.StatEntry.FromTextFormat(utils.SmartStr(stat)))
+    return result
+
+  def _MessageList(self, payloads):
+    message_list = rdf_flows.MessageList()
+    for i, payload in enumerate(payloads):
+      message_list.job.Append(
+          session_id=rdfvalue.SessionID(flow_name="ABCDEF"),
+          request_id=1,
+          response_id=i + 1,
+          name="ListDirectory",
+          payload=payload)
+    return message_list.SerializeToString()
+
+  def _MessageLists(self):
+    stat_entries = self._StatEntries()
+    status = rdf_flows.GrrStatus(cpu_time_used=rdf_client.CpuSeconds(
+        user_cpu_time=0.1, system_cpu_time=0.05))
+    # File contents are a mix of text like and binary data.
+    contents = "".join(
+        stat_entry.SerializeToString() for stat_entry in stat_entries)
+    buffers = [
+        rdf_client.BufferReference(
+            offset=offset, length=4096, data=contents[offset:offset + 4096])
+        for offset in range(0, len(contents), 4096)
+    ]
+
+    return [("GrrStatus", self._MessageList([status])),
+            ("1 StatEntry", self._MessageList(stat_entries[:1])),
+            ("%d StatEntries" % len(stat_entries),
+             self._MessageList(stat_entries)),
+            ("%d StatEntries" % (10 * len(stat_entries)),
+             self._MessageList(stat_entries * 10)),
+            ("%d BufferReferences" % len(buffers),
+             self._MessageList(buffers))]
+
+  def testCompression(self):
+    """Compression of message lists found in client_fixture."""
+    compression_type = rdf_flows.SignedMessageList.CompressionType
+    codecs = [("none", compression_type.UNCOMPRESSED, None)]
+    for level in [1, 6, 9]:
+      codecs.append(("zlib %d" % level, compression_type.ZCOMPRESSION, level))
+      codecs.append(("zlib+dict %d" % level,
+                     compression_type.ZCOMPRESSION_DICTIONARY, level))
+
+    for list_name, data in self._MessageLists():
+      for codec_name, compression, level in codecs:
+        start = time.time()
+        for _ in xrange(self.REPEATS):
+          compressed = communicator.CompressData(data, compression, level)
+        time_taken = (time.time() - start) / self.REPEATS
+
+        self.assertEqual(
+            communicator.DecompressData(compressed, compression), data)
+        self.AddResult("%s (%s)" % (list_name, codec_name), time_taken,
+                       self.REPEATS, len(compressed),
+                       "%.2f" % (float(len(compressed)) / len(data)))
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -116,6 +116,21 @@ class ClientCommsTest(test_lib.GRRBaseTest):
       self.assertEqual(decoded_messages[i].auth_state,
                        rdf_flows.GrrMessage.AuthorizationState.UNAUTHENTICATED)
 
+  def testPollSettingsAreSentInTheEncryptedPayload(self):
+    result = rdf_flows.ClientCommunication(long_poll_timeout=60)
+    self.client_communicator.EncodeMessages(rdf_flows.MessageList(), result)
+    self.assertFalse(result.HasField("long_poll_timeout"))
+
+    # Values added in the clear are replaced by the encrypted ones.
+    result.long_poll_timeout = 3600
+    result.poll_interval_hint = 1
+    request_comms = rdf_flows.ClientCommunication.FromSerializedString(
+        result.SerializeToString())
+    self.server_communicator.DecodeMessages(request_comms)
+
+    self.assertEqual(request_comms.long_poll_timeout, 60)
+    self.assertFalse(request_comms.HasField("poll_interval_hint"))
+
   def MakeClientAFF4Record(self):
     """Make a client in the data store."""
     client_cert = self.ClientCertFromPrivateKey(self.client_private_key)
@@ -240,6 +255,55 @@ class ClientCommsTest(test_lib.GRRBaseTest):
 
       self.assertEqual(compressed_len, uncompressed_len)
 
+  def testCompressionTypes(self):
+    compression_type = rdf_flows.SignedMessageList.CompressionType
+    data = "aff4:/C.1000000000000000/tasks" * 100
+
+    for compression in [
+        compression_type.UNCOMPRESSED, compression_type.ZCOMPRESSION,
+        compression_type.ZCOMPRESSION_DICTIONARY
+    ]:
+      for level in [1, 6, 9]:
+        compressed = communicator.CompressData(data, compression, level)
+        self.assertEqual(
+            communicator.DecompressData(compressed, compression), data)
+
+    with self.assertRaises(communicator.DecodingError):
+      communicator.DecompressData("garbage",
+                                  compression_type.ZCOMPRESSION_DICTIONARY)
+
+  def testCompressionMinSize(self):
+    with test_lib.ConfigOverrider({"Network.compression_min_size": 0}):
+      self.testCommunications()
+      compressed_len = len(self.cipher_text)
+
+    # Small message lists are not worth compressing.
+    with test_lib.ConfigOverrider({"Network.compression_min_size": 100000}):
+      self.testCommunications()
+      self.assertGreater(len(self.cipher_text), compressed_len)
+
+  def testDictionaryCompression(self):
+    # The server can parse messages compressed with the dictionary.
+    with test_lib.ConfigOverrider({
+        "Network.compression_dictionary_max_size": 100000
+    }):
+      self.testCommunications()
+
+    # Small message lists benefit from the dictionary.
+    message_list = rdf_flows.MessageList(job=[
+        rdf_flows.GrrMessage(
+            session_id="aff4:/flows/W:ABCDEF",
+            args_rdf_name="GrrStatus",
+            type=rdf_flows.GrrMessage.Type.STATUS)
+    ])
+    data = message_list.SerializeToString()
+    compression_type = rdf_flows.SignedMessageList.CompressionType
+    self.assertLess(
+        len(
+            communicator.CompressData(
+                data, compression_type.ZCOMPRESSION_DICTIONARY)),
+        len(communicator.CompressData(data, compression_type.ZCOMPRESSION)))
+
   def testX509Verify(self):
     """X509 Verify can have several failure paths."""
 
@@ -38,7 +38,9 @@ able to filter it directly).
 import abc
 import atexit
 import sys
+import threading
 import time
+import types
 
 import logging
 
@@ -56,6 +58,9 @@ flags.DEFINE_bool("list_storage", False, "List all storage subsystems present.")
 # A global data store handle
 DB = None
 
+# Callbacks notified about the data store calls, see AddCallObserver.
+CALL_OBSERVERS = []
+
 # There are stub methods that don't return/yield as indicated by the docstring.
 # pylint: disable=g-doc-return-or-yield
 
@@ -182,6 +187,140 @@ class MutationPool(object):
             len(self.delete_attributes_requests))
 
 
+def _Length(value):
+  """Returns the length of a sequence without consuming iterators."""
+  if isinstance(value, (list, tuple, set, dict)):
+    return len(value)
+  return 0
+
+
+def _PayloadSize(value):
+  """Estimates the number of bytes of a value passed to or from a data store."""
+  if isinstance(value, basestring):
+    return len(value)
+  if isinstance(value, (list, tuple, set)):
+    return sum(_PayloadSize(item) for item in value)
+  if isinstance(value, dict):
+    return sum(
+        _PayloadSize(k) + _PayloadSize(v) for k, v in value.iteritems())
+  if isinstance(value, rdfvalue.RDFValue):
+    return len(value.SerializeToString())
+  return 0
+
+
+class DataStoreCall(object):
+  """A call of a DataStore method, as passed to the call observers."""
+
+  # Methods returning the cells of the row args[0].
+  ROW_RESULT_METHODS = ["ResolvePrefix", "ResolveMulti", "ResolveRow"]
+
+  # Methods returning (subject, cells) pairs.
+  ROWS_RESULT_METHODS = ["MultiResolvePrefix", "ScanAttributes"]
+
+  def __init__(self, method, args, kwargs):
+    self.method = method
+    self.args = args
+    self.kwargs = kwargs
+    self.start_time = time.time()
+    self.duration = 0
+    # The number of bytes written or read by the call.
+    self.payload_bytes = 0
+    # The number of rows (subjects or blobs) and columns (attribute values)
+    # written, deleted or read by the call.
+    self.rows = 0
+    self.columns = 0
+    self.error = None
+
+  def _Argument(self, position, keyword):
+    if len(self.args) > position:
+      return self.args[position]
+    return self.kwargs.get(keyword)
+
+  @property
+  def subject(self):
+    """The subject, subjects or subject prefix the call operates on."""
+    for keyword in ["subject", "subjects", "subject_prefix"]:
+      if keyword in self.kwargs:
+        return self.kwargs[keyword]
+    if self.args:
+      return self.args[0]
+    return None
+
+  def CountArguments(self):
+    """Counts the rows and columns written or deleted by the call."""
+    method = self.method
+    if method == "Set":
+      self.rows, self.columns = 1, 1
+    elif method == "MultiSet":
+      values = self._Argument(1, "values") or {}
+      self.rows = 1
+      self.columns = sum(_Length(v) or 1 for v in values.itervalues())
+    elif method == "DeleteAttributes":
+      self.rows = 1
+      self.columns = _Length(self._Argument(1, "attributes"))
+    elif method == "MultiDeleteAttributes":
+      self.rows = _Length(self._Argument(0, "subjects"))
+      self.columns = self.rows * _Length(self._Argument(1, "attributes"))
+    elif method in ["DeleteSubject", "StoreBlob", "ReadBlob", "BlobExists",
+                    "DeleteBlob"]:
+      self.rows = 1
+    elif method == "DeleteSubjects":
+      self.rows = _Length(self._Argument(0, "subjects"))
+    elif method == "StoreBlobs":
+      self.rows = _Length(self._Argument(0, "contents"))
+    elif method in ["ReadBlobs", "BlobsExist", "DeleteBlobs"]:
+      self.rows = _Length(self._Argument(0, "identifiers"))
+
+  def CountResult(self, result):
+    """Counts the rows and columns read from a single result of the call."""
+    if self.method in self.ROW_RESULT_METHODS:
+      self.rows = 1
+      self.columns += 1
+    elif self.method in self.ROWS_RESULT_METHODS:
+      self.rows += 1
+      self.columns += _Length(result[1])
+    elif self.method == "ScanAttribute":
+      self.rows += 1
+      self.columns += 1
+    elif self.method == "Resolve" and result and result[0] is not None:
+      self.rows, self.columns = 1, 1
+
+  def CountResults(self, results):
+    """Counts the rows and columns read from the return value of the call."""
+    if self.method in self.ROW_RESULT_METHODS + self.ROWS_RESULT_METHODS:
+      if isinstance(results, dict):
+        results = results.items()
+      elif not isinstance(results, (list, tuple)):
+        # Don't consume iterators returned to the caller.
+        return
+      for result in results:
+        self.CountResult(result)
+    else:
+      self.CountResult(results)
+
+
+def AddCallObserver(observer):
+  """Calls observer(call) with a DataStoreCall after every data store call.
+
+  Only the outermost call is reported when data store methods are implemented
+  by calling other ones. Observers are run in the thread which made the call
+  and must be fast.
+
+  Args:
+    observer: The callback.
+  """
+  if observer not in CALL_OBSERVERS:
+    CALL_OBSERVERS.append(observer)
+
+  if DB is not None:
+    DB.ObserveCalls()
+
+
+def RemoveCallObserver(observer):
+  if observer in CALL_OBSERVERS:
+    CALL_OBSERVERS.remove(observer)
+
+
 class DataStore(object):
   """Abstract database access."""
 
@@ -198,6 +337,25 @@ class DataStore(object):
   flusher_thread = None
   monitor_thread = None
 
+  # The methods reported to the CALL_OBSERVERS.
+  OBSERVED_METHODS = [
+      "DeleteSubject", "DeleteSubjects", "Set", "MultiSet",
+      "MultiDeleteAttributes", "DeleteAttributes", "Resolve",
+      "MultiResolvePrefix", "ResolvePrefix", "ResolveMulti", "ResolveRow",
+      "ScanAttributes", "ScanAttribute", "DBSubjectLock", "ReadBlob",
+      "ReadBlobs", "StoreBlob", "StoreBlobs", "BlobExists", "BlobsExist",
+      "DeleteBlob", "DeleteBlobs"
+  ]
+
+  # The arguments holding the data written by the observed methods, as
+  # (position, keyword) after self.
+  WRITTEN_ARGUMENTS = {
+      "Set": (2, "value"),
+      "MultiSet": (1, "values"),
+      "StoreBlob": (0, "content"),
+      "StoreBlobs": (0, "contents"),
+  }
+
   def __init__(self):
     security_manager = access_control.AccessControlManager.GetPlugin(
         config_lib.CONFIG["Datastore.security_manager"])()
@@ -209,6 +367,95 @@ class DataStore(object):
     self.flusher_thread.start()
     self.monitor_thread = None
 
+    self.observed = False
+    self.observer_local = threading.local()
+    if CALL_OBSERVERS:
+      self.ObserveCalls()
+
+  def ObserveCalls(self):
+    """Starts reporting the calls of this data store to CALL_OBSERVERS."""
+    if self.observed:
+      return
+
+    self.observed = True
+    for name in self.OBSERVED_METHODS:
+      method = getattr(self, name, None)
+      if method is not None:
+        setattr(self, name, self._ObservedMethod(name, method))
+
+  def _ObservedMethod(self, name, method):
+    """Wraps a method so its calls are reported to the CALL_OBSERVERS."""
+
+    def Wrapper(*args, **kwargs):
+      local = self.observer_local
+      if not CALL_OBSERVERS or getattr(local, "in_call", False):
+        return method(*args, **kwargs)
+
+      call = DataStoreCall(name, args, kwargs)
+      call.CountArguments()
+      if name in self.WRITTEN_ARGUMENTS:
+        position, keyword = self.WRITTEN_ARGUMENTS[name]
+        if len(args) > position:
+          call.payload_bytes = _PayloadSize(args[position])
+        else:
+          call.payload_bytes = _PayloadSize(kwargs.get(keyword))
+
+      local.in_call = True
+      try:
+        result = method(*args, **kwargs)
+      except Exception as e:
+        call.error = e
+        raise
+      finally:
+        local.in_call = False
+        call.duration = time.time() - call.start_time
+        if call.error is not None:
+          self._NotifyObservers(call)
+
+      if isinstance(result, types.GeneratorType):
+        return self._ObservedGenerator(call, result)
+
+      if name not in self.WRITTEN_ARGUMENTS:
+        call.payload_bytes += _PayloadSize(result)
+      call.CountResults(result)
+      self._NotifyObservers(call)
+      return result
+
+    return Wrapper
+
+  def _ObservedGenerator(self, call, generator):
+    """Reports a call returning a generator once it is exhausted or closed."""
+    local = self.observer_local
+    try:
+      while True:
+        start = time.time()
+        local.in_call = True
+        try:
+          item = generator.next()
+        except StopIteration:
+          return
+        finally:
+          local.in_call = False
+          call.duration += time.time() - start
+
+        call.payload_bytes += _PayloadSize(item)
+        call.CountResult(item)
+        yield item
+
+    except Exception as e:
+      call.error = e
+      raise
+
+    finally:
+      self._NotifyObservers(call)
+
+  def _NotifyObservers(self, call):
+    for observer in list(CALL_OBSERVERS):
+      try:
+        observer(call)
+      except Exception as e:  # pylint: disable=broad-except
+        logging.exception("Data store call observer failed: %s", e)
+
   def GetRequiredResolveAccess(self, attribute_prefix):
     """Returns required level of access for resolve operations.
 
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+"""Traces the calls of the data store.
+
+The tracer is enabled with Datastore.tracing and works with every DataStore
+implementation since it is a data store call observer. For every method and
+class of subjects (queue, flow, client, hunt, aff4 file, ...) it records the
+latency, the number of rows and columns and the payload bytes of the calls in
+stats.STATS.
+
+Calls slower than Datastore.slow_query_threshold are kept in a ring buffer of
+the last Datastore.slow_query_log_size slow queries together with a summary of
+the stack of the caller, so the code issuing expensive queries can be found.
+The log is served by the stats server at /datastore_slow_queries and by the
+ListDataStoreSlowQueries API method.
+"""
+
+
+import collections
+import os
+import re
+import threading
+import traceback
+
+from grr.lib import config_lib
+from grr.lib import data_store
+from grr.lib import queues
+from grr.lib import registry
+from grr.lib import stats
+from grr.lib import utils
+
+# Latency bins of the datastore_call_latency metric.
+LATENCY_BINS = [
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+]
+
+_BLOB_METHODS = frozenset([
+    "ReadBlob", "ReadBlobs", "StoreBlob", "StoreBlobs", "BlobExists",
+    "BlobsExist", "DeleteBlob", "DeleteBlobs"
+])
+
+_CLIENT_ID_RE = re.compile(r"^[cC]\.[0-9a-fA-F]{16}$")
+
+_QUEUE_NAMES = frozenset(queue.Basename() for queue in queues.WORKER_LIST)
+
+# Top level directories of the file store and the client's VFS.
+_FILE_ROOTS = frozenset(["files", "blobs", "fs", "registry", "temp"])
+
+# Frames in these files are left out of the stack summaries.
+_SKIPPED_FILES = frozenset([
+    os.path.splitext(data_store.__file__)[0],
+    os.path.splitext(__file__)[0]
+])
+
+
+def GetSubjectClass(method, subject):
+  """Classifies the subject of a data store call.
+
+  Args:
+    method: The name of the data store method.
+    subject: The subject, list of subjects or subject prefix of the call.
+
+  Returns:
+    One of "queue", "flow", "hunt", "client", "aff4_file", "blob" or "other".
+  """
+  if method in _BLOB_METHODS:
+    return "blob"
+
+  if isinstance(subject, (list, tuple, set)):
+    if not subject:
+      return "other"
+    subject = next(iter(subject))
+
+  if subject is None:
+    return "other"
+
+  path = utils.SmartStr(subject)
+  if path.startswith("aff4:"):
+    path = path[5:]
+  components = path.strip("/").split("/")
+
+  first = components[0]
+  second = components[1] if len(components) > 1 else None
+  if first in _QUEUE_NAMES:
+    return "queue"
+  if first == "hunts":
+    return "hunt"
+  if first == "flows":
+    return "flow"
+  if first in _FILE_ROOTS:
+    return "aff4_file"
+  if _CLIENT_ID_RE.match(first):
+    if second == "tasks":
+      return "queue"
+    if second == "flows":
+      return "flow"
+    if second in _FILE_ROOTS:
+      return "aff4_file"
+    return "client"
+  return "other"
+
+
+SlowQuery = collections.namedtuple(
+    "SlowQuery", ["timestamp", "method", "subject", "subject_class",
+                  "duration", "rows", "columns", "payload_bytes", "error",
+                  "thread_name", "stack"])
+
+
+class DataStoreTracer(object):
+  """Records metrics and slow queries of the data store calls."""
+
+  def __init__(self, slow_query_threshold=None, slow_query_log_size=None,
+               stack_depth=None):
+    if slow_query_threshold is None:
+      slow_query_threshold = config_lib.CONFIG[
+          "Datastore.slow_query_threshold"]
+    if slow_query_log_size is None:
+      slow_query_log_size = config_lib.CONFIG["Datastore.slow_query_log_size"]
+    if stack_depth is None:
+      stack_depth = config_lib.CONFIG["Datastore.slow_query_stack_depth"]
+
+    self.slow_query_threshold = slow_query_threshold
+    self.stack_depth = stack_depth
+    self.lock = threading.Lock()
+    self.slow_queries = collections.deque(maxlen=slow_query_log_size)
+
+  def OnDataStoreCall(self, call):
+    """Records a data store call."""
+    subject_class = GetSubjectClass(call.method, call.subject)
+    fields = [call.method, subject_class]
+
+    stats.STATS.RecordEvent("datastore_call_latency", call.duration,
+                            fields=fields)
+    stats.STATS.IncrementCounter("datastore_call_rows", delta=call.rows,
+                                 fields=fields)
+    stats.STATS.IncrementCounter("datastore_call_columns",
+                                 delta=call.columns, fields=fields)
+    stats.STATS.IncrementCounter("datastore_call_bytes",
+                                 delta=call.payload_bytes, fields=fields)
+    if call.error is not None:
+      stats.STATS.IncrementCounter("datastore_call_errors", fields=fields)
+
+    if call.duration >= self.slow_query_threshold:
+      self.RecordSlowQuery(call, subject_class)
+
+  def _StackSummary(self):
+    """Returns the innermost frames of the caller outside of the data store."""
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if os.path.splitext(frame[0])[0] not in _SKIPPED_FILES
+    ]
+
+    return [
+        "%s:%d %s" % (filename, line, function)
+        for filename, line, function, _ in frames[-self.stack_depth:]
+    ]
+
+  def RecordSlowQuery(self, call, subject_class):
+    subject = call.subject
+    if isinstance(subject, (list, tuple, set)):
+      subject = ", ".join(utils.SmartStr(s) for s in list(subject)[:3]) + (
+          ", ..." if len(subject) > 3 else "")
+    elif subject is not None:
+      subject = utils.SmartStr(subject)
+
+    query = SlowQuery(
+        timestamp=call.start_time,
+        method=call.method,
+        subject=subject,
+        subject_class=subject_class,
+        duration=call.duration,
+        rows=call.rows,
+        columns=call.columns,
+        payload_bytes=call.payload_bytes,
+        error=str(call.error) if call.error is not None else None,
+        thread_name=threading.current_thread().name,
+        stack=self._StackSummary())
+
+    with self.lock:
+      self.slow_queries.append(query)
+
+  def GetSlowQueries(self):
+    """Returns the slow queries, slowest first."""
+    with self.lock:
+      queries = list(self.slow_queries)
+    return sorted(queries, key=lambda query: query.duration, reverse=True)
+
+  def Reset(self):
+    with self.lock:
+      self.slow_queries.clear()
+
+
+TRACER = None
+
+
+def StartTracing(**kwargs):
+  """Enables the tracer in this process."""
+  global TRACER
+  if TRACER is None:
+    TRACER = DataStoreTracer(**kwargs)
+    data_store.AddCallObserver(TRACER.OnDataStoreCall)
+  return TRACER
+
+
+def StopTracing():
+  global TRACER
+  if TRACER is not None:
+    data_store.RemoveCallObserver(TRACER.OnDataStoreCall)
+    TRACER = None
+
+
+def GetSlowQueries():
+  """Returns the slow queries of this process, empty if tracing is off."""
+  if TRACER is None:
+    return []
+  return TRACER.GetSlowQueries()
+
+
+class DataStoreTracerInit(registry.InitHook):
+  """Enables the tracer if configured."""
+
+  pre = ["DataStoreInit"]
+
+  def RunOnce(self):
+    fields = [("method", str), ("subject_class", str)]
+    stats.STATS.RegisterEventMetric(
+        "datastore_call_latency", bins=LATENCY_BINS, fields=fields,
+        units="SECONDS")
+    stats.STATS.RegisterCounterMetric("datastore_call_rows", fields=fields)
+    stats.STATS.RegisterCounterMetric("datastore_call_columns", fields=fields)
+    stats.STATS.RegisterCounterMetric(
+        "datastore_call_bytes", fields=fields, units="BYTES")
+    stats.STATS.RegisterCounterMetric("datastore_call_errors", fields=fields)
+
+    if config_lib.CONFIG["Datastore.tracing"]:
+      StartTracing()
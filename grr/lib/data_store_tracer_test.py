@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+"""Tests for the data store tracer."""
+
+
+from grr.lib import data_store
+from grr.lib import data_store_tracer
+from grr.lib import flags
+from grr.lib import stats
+from grr.lib import test_lib
+
+
+class DataStoreTracerTest(test_lib.GRRBaseTest):
+  """Tests the DataStoreTracer."""
+
+  def setUp(self):
+    super(DataStoreTracerTest, self).setUp()
+    self.tracer = data_store_tracer.DataStoreTracer(
+        slow_query_threshold=0, slow_query_log_size=2, stack_depth=5)
+    data_store.AddCallObserver(self.tracer.OnDataStoreCall)
+
+  def tearDown(self):
+    data_store.RemoveCallObserver(self.tracer.OnDataStoreCall)
+    super(DataStoreTracerTest, self).tearDown()
+
+  def testSubjectClasses(self):
+    for method, subject, subject_class in [
+        ("ResolvePrefix", "aff4:/F/3", "queue"),
+        ("ResolvePrefix", "aff4:/C.1000000000000000/tasks", "queue"),
+        ("MultiSet", "aff4:/C.1000000000000000/flows/F:ABCDEF", "flow"),
+        ("MultiSet", "aff4:/flows/W:Foreman", "flow"),
+        ("ResolveRow", "aff4:/C.1000000000000000", "client"),
+        ("ResolveRow", "aff4:/C.1000000000000000/fs/os/etc/passwd",
+         "aff4_file"),
+        ("ResolveRow", "aff4:/files/hash/generic/sha256/abcd", "aff4_file"),
+        ("MultiResolvePrefix", ["aff4:/hunts/H:123456/Results"], "hunt"),
+        ("ReadBlobs", ["abcd"], "blob"),
+        ("ResolveRow", "aff4:/users/test", "other"),
+        ("DeleteSubjects", [], "other"),
+    ]:
+      self.assertEqual(
+          data_store_tracer.GetSubjectClass(method, subject), subject_class,
+          "%s(%s)" % (method, subject))
+
+  def _GetMetric(self, name, method, subject_class):
+    return stats.STATS.GetMetricValue(name, fields=[method, subject_class])
+
+  def testCallMetrics(self):
+    subject = "aff4:/hunts/H:DA7A57/Results"
+    rows = self._GetMetric("datastore_call_rows", "MultiSet", "hunt")
+    columns = self._GetMetric("datastore_call_columns", "MultiSet", "hunt")
+    payload = self._GetMetric("datastore_call_bytes", "MultiSet", "hunt")
+    latency = self._GetMetric("datastore_call_latency", "MultiSet", "hunt")
+
+    data_store.DB.MultiSet(
+        subject, {"metadata:a": ["x" * 10, "y" * 10],
+                  "metadata:b": ["z" * 10]},
+        replace=False,
+        token=self.token)
+
+    self.assertEqual(
+        self._GetMetric("datastore_call_rows", "MultiSet", "hunt") - rows, 1)
+    self.assertEqual(
+        self._GetMetric("datastore_call_columns", "MultiSet", "hunt") -
+        columns, 3)
+    self.assertGreaterEqual(
+        self._GetMetric("datastore_call_bytes", "MultiSet", "hunt") - payload,
+        30)
+    self.assertEqual(
+        self._GetMetric("datastore_call_latency", "MultiSet", "hunt").count -
+        latency.count, 1)
+
+    columns = self._GetMetric("datastore_call_columns", "ResolvePrefix",
+                              "hunt")
+    results = data_store.DB.ResolvePrefix(
+        subject, "metadata:", token=self.token)
+    self.assertEqual(len(list(results)), 3)
+    self.assertEqual(
+        self._GetMetric("datastore_call_columns", "ResolvePrefix", "hunt") -
+        columns, 3)
+
+  def testSlowQueryLog(self):
+    for i in range(3):
+      data_store.DB.Set(
+          "aff4:/C.1000000000000000/fs/os/%d" % i,
+          "metadata:value",
+          "x",
+          token=self.token)
+
+    # Only the last queries are kept.
+    queries = self.tracer.GetSlowQueries()
+    self.assertEqual(len(queries), 2)
+    self.assertItemsEqual([query.subject for query in queries], [
+        "aff4:/C.1000000000000000/fs/os/1", "aff4:/C.1000000000000000/fs/os/2"
+    ])
+
+    query = queries[0]
+    self.assertEqual(query.method, "Set")
+    self.assertEqual(query.subject_class, "aff4_file")
+    self.assertEqual((query.rows, query.columns), (1, 1))
+    self.assertEqual(len(query.stack), 5)
+    # The innermost frame is the caller of the data store.
+    self.assertIn("testSlowQueryLog", query.stack[-1])
+
+  def testFastQueriesAreNotLogged(self):
+    self.tracer.slow_query_threshold = 3600
+    data_store.DB.Set(
+        "aff4:/C.1000000000000000", "metadata:value", "x", token=self.token)
+    self.assertEqual(self.tracer.GetSlowQueries(), [])
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 """The GRR event publishing classes."""
 
+import atexit
 import functools
+import threading
+import time
 
 
 import logging
 
+from grr.lib import config_lib
 from grr.lib import queue_manager
 from grr.lib import rdfvalue
 from grr.lib import registry
@@ -133,49 +137,98 @@ class Events(object):
       ValueError: If the message is invalid. The message must be a Semantic
         Value (instance of RDFValue) or a full GrrMessage.
     """
-    with queue_manager.WellKnownQueueManager(token=token) as manager:
-      event_name_map = registry.EventRegistry.EVENT_NAME_MAP
-      for event_name, messages in events.iteritems():
-        handler_urns = []
-        if isinstance(event_name, basestring):
-          for event_cls in event_name_map.get(event_name, []):
-            if event_cls.well_known_session_id is None:
-              logging.error("Well known flow %s has no session_id.",
-                            event_cls.__name__)
-            else:
-              handler_urns.append(event_cls.well_known_session_id)
-
-        else:
-          handler_urns.append(event_name)
+    messages_by_handler = {}
+    event_name_map = registry.EventRegistry.EVENT_NAME_MAP
+    for event_name, messages in events.iteritems():
+      handler_urns = []
+      inline_handlers = []
+      if isinstance(event_name, basestring):
+        for event_cls in event_name_map.get(event_name, []):
+          if event_cls.well_known_session_id is None:
+            logging.error("Well known flow %s has no session_id.",
+                          event_cls.__name__)
+          elif event_cls.PROCESS_INLINE and not delay:
+            inline_handlers.append(event_cls)
+          else:
+            handler_urns.append(event_cls.well_known_session_id)
+
+      else:
+        handler_urns.append(event_name)
+
+      for msg in messages:
+        # Allow the event name to be either a string or a URN of an event
+        # listener.
+        if not isinstance(msg, rdfvalue.RDFValue):
+          raise ValueError("Can only publish RDFValue instances.")
+
+        # Wrap the message in a GrrMessage if needed.
+        if not isinstance(msg, rdf_flows.GrrMessage):
+          msg = rdf_flows.GrrMessage(payload=msg)
+
+        # Randomize the response id or events will get overwritten.
+        msg.response_id = msg.task_id = msg.GenerateTaskID()
+        # Well known flows always listen for request id 0.
+        msg.request_id = 0
+
+        for event_cls in inline_handlers:
+          cls._ProcessInline(event_cls, msg, token=token)
+
+        # Forward the message to the well known flow's queue.
+        for event_urn in handler_urns:
+          messages_by_handler.setdefault(event_urn, []).append(msg)
+
+      stats.STATS.IncrementCounter(
+          "grr_events_published",
+          len(messages),
+          fields=[utils.SmartStr(event_name)])
+
+    if not messages_by_handler:
+      return
+
+    if delay:
+      timestamp = (rdfvalue.RDFDatetime.Now() + delay).AsMicroSecondsFromEpoch()
+      cls.QueueEvents(messages_by_handler, timestamp=timestamp, token=token)
+    elif EVENT_BUFFER is not None:
+      EVENT_BUFFER.Add(messages_by_handler, token=token)
+    else:
+      cls.QueueEvents(messages_by_handler, token=token)
+
+  @classmethod
+  def QueueEvents(cls, messages_by_handler, timestamp=None, token=None):
+    """Writes event messages into the queues of their listeners.
 
+    Args:
+      messages_by_handler: A dict of lists of GrrMessages keyed by the session
+        ids of the listeners.
+      timestamp: If set, the listeners are notified at this time.
+      token: ACL token.
+    """
+    with queue_manager.WellKnownQueueManager(token=token) as manager:
+      for event_urn, messages in messages_by_handler.iteritems():
         for msg in messages:
-          # Allow the event name to be either a string or a URN of an event
-          # listener.
-          if not isinstance(msg, rdfvalue.RDFValue):
-            raise ValueError("Can only publish RDFValue instances.")
-
-          # Wrap the message in a GrrMessage if needed.
-          if not isinstance(msg, rdf_flows.GrrMessage):
-            msg = rdf_flows.GrrMessage(payload=msg)
-
-          # Randomize the response id or events will get overwritten.
-          msg.response_id = msg.task_id = msg.GenerateTaskID()
-          # Well known flows always listen for request id 0.
-          msg.request_id = 0
-
-          timestamp = None
-          if delay:
-            timestamp = (
-                rdfvalue.RDFDatetime.Now() + delay).AsMicroSecondsFromEpoch()
-
-          # Forward the message to the well known flow's queue.
-          for event_urn in handler_urns:
-            manager.QueueResponse(event_urn, msg)
-            manager.QueueNotification(
-                rdf_flows.GrrNotification(
-                    session_id=event_urn,
-                    priority=msg.priority,
-                    timestamp=timestamp))
+          manager.QueueResponse(event_urn, msg)
+
+        # A single notification makes the worker process all the messages.
+        manager.QueueNotification(
+            rdf_flows.GrrNotification(
+                session_id=event_urn,
+                priority=max(msg.priority for msg in messages),
+                timestamp=timestamp))
+
+    stats.STATS.IncrementCounter("grr_event_notifications",
+                                 len(messages_by_handler))
+
+  @classmethod
+  def _ProcessInline(cls, event_cls, msg, token=None):
+    event_obj = event_cls(
+        event_cls.well_known_session_id, mode="rw", token=token)
+    try:
+      event_obj.ProcessMessage(msg)
+    except Exception as e:  # pylint: disable=broad-except
+      logging.exception("Error in %s.ProcessMessage: %s", event_cls.__name__,
+                        e)
+      stats.STATS.IncrementCounter(
+          "well_known_flow_errors", fields=[str(event_obj.session_id)])
 
   @classmethod
   def PublishEventInline(cls, event_name, msg, token=None):
@@ -196,3 +249,103 @@ class Events(object):
       event_obj = event_cls(
           event_cls.well_known_session_id, mode="rw", token=token)
       event_obj.ProcessMessage(msg)
+
+
+class EventBuffer(object):
+  """Collects published events and writes them in batches.
+
+  All the events published for a listener within one batch window share a
+  single notification and their messages are written together. Events are
+  only durable once the batch was written.
+  """
+
+  def __init__(self, batch_window, max_batch_size):
+    """Constructor.
+
+    Args:
+      batch_window: How long (in seconds) events are collected at most.
+      max_batch_size: Batches are written as soon as they hold this many
+                      events.
+    """
+    self.batch_window = batch_window
+    self.max_batch_size = max_batch_size
+
+    self.lock = threading.Lock()
+    # Pending messages by listener, keyed by the id of the token they were
+    # published with.
+    self.pending = {}
+    self.pending_size = 0
+    self.flush_thread = None
+
+  def Add(self, messages_by_handler, token=None):
+    """Adds the messages of some events to the current batch."""
+    # Publishers may change the messages once they are published.
+    copies = {}
+    for messages in messages_by_handler.itervalues():
+      for msg in messages:
+        if id(msg) not in copies:
+          copies[id(msg)] = msg.Copy()
+
+    with self.lock:
+      _, batch = self.pending.setdefault(id(token), (token, {}))
+      for event_urn, messages in messages_by_handler.iteritems():
+        batch.setdefault(event_urn, []).extend(
+            copies[id(msg)] for msg in messages)
+
+      # Events with several listeners still only count once.
+      self.pending_size += len(copies)
+
+      full = self.pending_size >= self.max_batch_size
+
+      if self.flush_thread is None:
+        self.flush_thread = threading.Thread(
+            name="EventBufferFlusher", target=self._FlushLoop)
+        self.flush_thread.daemon = True
+        self.flush_thread.start()
+
+    if full:
+      self.Flush()
+
+  def Flush(self):
+    """Writes all the pending events."""
+    with self.lock:
+      pending = self.pending
+      self.pending = {}
+      self.pending_size = 0
+
+    for token, messages_by_handler in pending.itervalues():
+      # Listeners of the same event share its message.
+      event_ids = set(
+          id(msg)
+          for messages in messages_by_handler.itervalues() for msg in messages)
+      stats.STATS.RecordEvent("grr_event_batch_size", len(event_ids))
+      Events.QueueEvents(messages_by_handler, token=token)
+
+  def _FlushLoop(self):
+    while True:
+      time.sleep(self.batch_window)
+      try:
+        self.Flush()
+      except Exception as e:  # pylint: disable=broad-except
+        logging.exception("Unable to write events: %s", e)
+
+
+EVENT_BUFFER = None
+
+
+class EventsInit(registry.InitHook):
+  """Sets up the event buffer and the event stats."""
+
+  def RunOnce(self):
+    global EVENT_BUFFER
+    batch_window = config_lib.CONFIG["Server.event_batch_window"]
+    if batch_window > 0:
+      EVENT_BUFFER = EventBuffer(batch_window,
+                                 config_lib.CONFIG["Server.event_batch_size"])
+      atexit.register(EVENT_BUFFER.Flush)
+
+    stats.STATS.RegisterCounterMetric(
+        "grr_events_published", fields=[("event", str)])
+    stats.STATS.RegisterCounterMetric("grr_event_notifications")
+    stats.STATS.RegisterEventMetric(
+        "grr_event_batch_size", bins=[1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])
@@ -7,8 +7,11 @@ from grr.lib import events
 from grr.lib import flags
 from grr.lib import flow
 from grr.lib import maintenance_utils
+from grr.lib import queue_manager
 from grr.lib import rdfvalue
+from grr.lib import stats
 from grr.lib import test_lib
+from grr.lib import utils
 from grr.lib.flows.general import audit
 from grr.lib.rdfvalues import flows as rdf_flows
 from grr.lib.rdfvalues import paths as rdf_paths
@@ -51,6 +54,18 @@ class FlowDoneListener(flow.EventListener):
     FlowDoneListener.received_events.append(message)
 
 
+class InlineListener(flow.EventListener):
+  well_known_session_id = rdfvalue.SessionID(flow_name="test4")
+  EVENTS = ["InlineTestEvent"]
+  PROCESS_INLINE = True
+
+  received_events = []
+
+  @flow.EventHandler(auth_required=False)
+  def ProcessMessage(self, message=None, event=None):
+    self.__class__.received_events.append((message, event))
+
+
 class GeneralFlowsTest(test_lib.FlowTestsBaseclass):
 
   def testClientEventNotification(self):
@@ -162,6 +177,71 @@ class GeneralFlowsTest(test_lib.FlowTestsBaseclass):
                        "aff4:/Source%d" % i)
       self.assertEqual(NoClientListener.received_events[i][1].path, "foobar")
 
+  def _GetNotifications(self, session_id):
+    manager = queue_manager.QueueManager(token=self.token)
+    return [
+        notification
+        for notification in manager.GetNotificationsForAllShards(
+            session_id.Queue()) if notification.session_id == session_id
+    ]
+
+  def testBufferedEvents(self):
+    NoClientListener.received_events = []
+    session_id = NoClientListener.well_known_session_id
+    published = stats.STATS.GetMetricValue(
+        "grr_events_published", fields=["TestEvent"])
+
+    event_buffer = events.EventBuffer(3600, 1000)
+    with utils.Stubber(events, "EVENT_BUFFER", event_buffer):
+      for i in range(10):
+        events.Events.PublishEvent(
+            "TestEvent",
+            rdf_flows.GrrMessage(
+                source="Source%d" % i,
+                payload=rdf_paths.PathSpec(path="foobar"),
+                auth_state="AUTHENTICATED"),
+            token=self.token)
+
+      # Nothing is written before the batch is complete.
+      self.assertEqual(self._GetNotifications(session_id), [])
+      event_buffer.Flush()
+
+    # All the events share a single notification.
+    self.assertEqual(len(self._GetNotifications(session_id)), 1)
+    self.assertEqual(
+        stats.STATS.GetMetricValue(
+            "grr_events_published", fields=["TestEvent"]), published + 10)
+
+    test_lib.MockWorker(token=self.token).Simulate()
+    self.assertEqual(
+        sorted(message.source for message, _ in
+               NoClientListener.received_events),
+        ["aff4:/Source%d" % i for i in range(10)])
+
+  def testEventBufferMaxBatchSize(self):
+    session_id = NoClientListener.well_known_session_id
+    event_buffer = events.EventBuffer(3600, 5)
+    with utils.Stubber(events, "EVENT_BUFFER", event_buffer):
+      for _ in range(4):
+        events.Events.PublishEvent(
+            "TestEvent", rdf_paths.PathSpec(path="foobar"), token=self.token)
+      self.assertEqual(self._GetNotifications(session_id), [])
+
+      events.Events.PublishEvent(
+          "TestEvent", rdf_paths.PathSpec(path="foobar"), token=self.token)
+      self.assertEqual(len(self._GetNotifications(session_id)), 1)
+
+  def testInlineListener(self):
+    InlineListener.received_events = []
+    events.Events.PublishEvent(
+        "InlineTestEvent", rdf_paths.PathSpec(path="foobar"), token=self.token)
+
+    # The event is processed right away and never queued.
+    self.assertEqual(len(InlineListener.received_events), 1)
+    self.assertEqual(InlineListener.received_events[0][1].path, "foobar")
+    self.assertEqual(
+        self._GetNotifications(InlineListener.well_known_session_id), [])
+
   def testUserModificationAudit(self):
     audit.AuditEventListener.created_logs.clear()
     worker = test_lib.MockWorker(token=self.token)
@@ -14,12 +14,16 @@ import time
 import logging
 
 from grr.lib import aff4
+from grr.lib import config_lib
+from grr.lib import data_store
 from grr.lib import rdfvalue
 from grr.lib import registry
+from grr.lib import stats
 from grr.lib import utils
 from grr.lib.aff4_objects import filestore
 from grr.lib.flows.general import collectors as flow_collectors
 from grr.lib.rdfvalues import client as rdf_client
+from grr.lib.rdfvalues import crypto as rdf_crypto
 from grr.lib.rdfvalues import paths as rdf_paths
 from grr.lib.rdfvalues import structs as rdf_structs
 from grr.proto import export_pb2
@@ -220,6 +224,32 @@ class ExportConverter(object):
     return ExportConverter.GetConvertersByClass(value.__class__)
 
 
+class ConverterCache(object):
+  """Keeps converter instances for a single export run.
+
+  Converters are created once per value type and reused for every batch of
+  values of that type, so that per-instance caches (like the client metadata
+  cached by GrrMessageConverter) are shared by all the batches.
+  """
+
+  def __init__(self, options=None):
+    super(ConverterCache, self).__init__()
+    self.options = options
+    self._converters = {}
+
+  def GetConverters(self, value_cls):
+    """Returns converter instances for a given value class."""
+    try:
+      return self._converters[value_cls]
+    except KeyError:
+      converters = [
+          cls(self.options)
+          for cls in ExportConverter.GetConvertersByClass(value_cls)
+      ]
+      self._converters[value_cls] = converters
+      return converters
+
+
 class AutoExportedProtoStruct(rdf_structs.RDFProtoStruct):
   """Special base class for auto-exported values."""
 
@@ -245,15 +275,13 @@ class DataAgnosticExportConverter(ExportConverter):
       if metadata:
         self.metadata = metadata
 
-      for desc in value_to_flatten.type_infos:
-        if desc.name == "metadata":
-          continue
-        if hasattr(self, desc.name) and value_to_flatten.HasField(desc.name):
-          setattr(self, desc.name, getattr(value_to_flatten, desc.name))
+      for name in self.flattened_fields:
+        if value_to_flatten.HasField(name):
+          setattr(self, name, getattr(value_to_flatten, name))
 
     output_class = type(
         self.ExportedClassNameForValue(value), (AutoExportedProtoStruct,),
-        dict(Flatten=Flatten))
+        dict(Flatten=Flatten, flattened_fields=[]))
 
     # Metadata is always the first field of exported data.
     output_class.AddDescriptor(
@@ -274,6 +302,9 @@ class DataAgnosticExportConverter(ExportConverter):
                            rdf_structs.ProtoRDFValue, rdf_structs.ProtoEnum)):
         # Incrementing field number by 1, as 1 is always occuppied by metadata.
         output_class.AddDescriptor(desc.Copy(field_number=number + 1))
+        # Names of the fields are precomputed, so that Flatten doesn't have to
+        # check every descriptor of every flattened value.
+        output_class.flattened_fields.append(desc.name)
 
       if (isinstance(desc, rdf_structs.ProtoEnum) and
           not isinstance(desc, rdf_structs.ProtoBoolean)):
@@ -282,22 +313,33 @@ class DataAgnosticExportConverter(ExportConverter):
 
     return output_class
 
-  def Convert(self, metadata, value, token=None):
+  def _GetFlatRDFClass(self, value):
     class_name = self.ExportedClassNameForValue(value)
     try:
-      class_obj = DataAgnosticExportConverter.classes_cache[class_name]
+      return DataAgnosticExportConverter.classes_cache[class_name]
     except KeyError:
       class_obj = self.MakeFlatRDFClass(value)
       DataAgnosticExportConverter.classes_cache[class_name] = class_obj
+      return class_obj
 
-    result_obj = class_obj()
+  def Convert(self, metadata, value, token=None):
+    result_obj = self._GetFlatRDFClass(value)()
     result_obj.Flatten(metadata, value)
     yield result_obj
 
   def BatchConvert(self, metadata_value_pairs, token=None):
+    # The flattened class is only looked up once per run of values of the
+    # same type.
+    prev_value_cls = None
+    class_obj = None
     for metadata, value in metadata_value_pairs:
-      for result in self.Convert(metadata, value, token=token):
-        yield result
+      if value.__class__ is not prev_value_cls:
+        prev_value_cls = value.__class__
+        class_obj = self._GetFlatRDFClass(value)
+
+      result_obj = class_obj()
+      result_obj.Flatten(metadata, value)
+      yield result_obj
 
 
 class StatEntryToExportedFileConverter(ExportConverter):
@@ -436,6 +478,26 @@ class StatEntryToExportedFileConverter(ExportConverter):
       fds_dict = dict([(fd.urn, fd) for fd in fds])
       return fds_dict
 
+  def _FetchHashes(self, metadata_value_pairs, token):
+    """Reads only the hash attribute of all files in one data store call."""
+    aff4_paths = [
+        result.AFF4Path(metadata.client_urn)
+        for metadata, result in metadata_value_pairs
+    ]
+
+    hashes_dict = {}
+    for subject, values in data_store.DB.MultiResolvePrefix(
+        aff4_paths,
+        aff4.AFF4Stream.SchemaCls.HASH.predicate,
+        timestamp=data_store.DB.NEWEST_TIMESTAMP,
+        token=token):
+      if values:
+        _, serialized_hash, _ = values[0]
+        hashes_dict[rdfvalue.RDFURN(subject)] = (
+            rdf_crypto.Hash.FromSerializedString(serialized_hash))
+
+    return hashes_dict
+
   def _ExportHash(self, aff4_object, result):
     """Add hashes from aff4_object to result."""
     if self.options.export_files_hashes:
@@ -486,6 +548,20 @@ class StatEntryToExportedFileConverter(ExportConverter):
       conversion wasn't possible.
     """
     filtered_pairs = self._RemoveRegistryKeys(metadata_value_pairs)
+
+    # Opening AFF4 objects is only needed for contents, hashes can be read
+    # directly from the data store.
+    if (self.options.export_files_hashes and
+        not self.options.export_files_contents):
+      hashes_dict = self._FetchHashes(filtered_pairs, token=token)
+      for metadata, stat_entry in filtered_pairs:
+        result = self._CreateExportedFile(metadata, stat_entry)
+        hash_obj = hashes_dict.get(stat_entry.AFF4Path(metadata.client_urn))
+        if hash_obj:
+          self.ParseFileHash(hash_obj, result)
+        yield result
+      return
+
     fds_dict = self._OpenFilesForRead(filtered_pairs, token=token)
     for metadata, stat_entry in filtered_pairs:
       result = self._CreateExportedFile(metadata, stat_entry)
@@ -710,6 +786,7 @@ class FileFinderResultConverter(StatEntryToExportedFileConverter):
     # We only need to open the file if we're going to export the contents, we
     # already have the hash in the FileFinderResult
     self.open_file_for_read = self.options.export_files_contents
+    self.converter_cache = ConverterCache(self.options)
 
   def _SeparateTypes(self, metadata_value_pairs):
     """Separate files, registry keys, grep matches."""
@@ -771,12 +848,18 @@ class FileFinderResultConverter(StatEntryToExportedFileConverter):
 
     # Now export the registry keys
     for result in ConvertValuesWithMetadata(
-        registry_pairs, token=token, options=self.options):
+        registry_pairs,
+        token=token,
+        options=self.options,
+        converter_cache=self.converter_cache):
       yield result
 
     # Now export the grep matches.
     for result in ConvertValuesWithMetadata(
-        match_pairs, token=token, options=self.options):
+        match_pairs,
+        token=token,
+        options=self.options,
+        converter_cache=self.converter_cache):
       yield result
 
   def Convert(self, metadata, result, token=None):
@@ -914,7 +997,7 @@ class GrrMessageConverter(ExportConverter):
 
   def __init__(self, *args, **kw):
     super(GrrMessageConverter, self).__init__(*args, **kw)
-    self.cached_metadata = {}
+    self.converter_cache = ConverterCache(self.options)
 
   def Convert(self, metadata, grr_message, token=None):
     """Converts GrrMessage into a set of RDFValues.
@@ -949,26 +1032,9 @@ class GrrMessageConverter(ExportConverter):
     for metadata, msg in metadata_value_pairs:
       msg_dict.setdefault(msg.source, []).append((metadata, msg))
 
-    metadata_objects = []
-    metadata_to_fetch = []
-
-    # Open the clients we don't have metadata for and fetch metadata.
-    for client_urn in msg_dict.iterkeys():
-      try:
-        metadata_objects.append(self.cached_metadata[client_urn])
-      except KeyError:
-        metadata_to_fetch.append(client_urn)
-
-    if metadata_to_fetch:
-      client_fds = aff4.FACTORY.MultiOpen(
-          metadata_to_fetch, mode="r", token=token)
-
-      fetched_metadata = [
-          GetMetadata(client_fd, token=token) for client_fd in client_fds
-      ]
-      for metadata in fetched_metadata:
-        self.cached_metadata[metadata.client_urn] = metadata
-      metadata_objects.extend(fetched_metadata)
+    # Metadata of all the distinct clients in the batch is fetched at once.
+    metadata_objects = CLIENT_METADATA_CACHE.GetMany(
+        msg_dict.keys(), token=token)
 
     data_by_type = {}
     for metadata in metadata_objects:
@@ -985,10 +1051,10 @@ class GrrMessageConverter(ExportConverter):
           # Create a dict of values for conversion keyed by type, so we can
           # apply the right converters to the right object types
           if cls_name not in data_by_type:
-            converters_classes = ExportConverter.GetConvertersByValue(
-                message.payload)
             data_by_type[cls_name] = {
-                "converters": [cls(self.options) for cls in converters_classes],
+                "converters":
+                    self.converter_cache.GetConverters(
+                        message.payload.__class__),
                 "batch_data": [(new_metadata, message.payload)]
             }
           else:
@@ -1791,7 +1857,65 @@ def GetMetadata(client, token=None):
   return metadata
 
 
-def ConvertValuesWithMetadata(metadata_value_pairs, token=None, options=None):
+class ClientMetadataCache(object):
+  """Bounded cache of ExportedMetadata objects keyed by client urn.
+
+  Building ExportedMetadata requires opening the client object, so the
+  metadata is shared by all the exports running in the process. Entries
+  expire after max_age seconds, so that label or hostname changes are picked
+  up eventually.
+  """
+
+  def __init__(self, max_size=10000, max_age=300):
+    super(ClientMetadataCache, self).__init__()
+    self._cache = utils.AgeBasedCache(max_size=max_size, max_age=max_age)
+
+  def GetMany(self, client_urns, token=None):
+    """Returns metadata for given clients, fetching missing entries at once.
+
+    Args:
+      client_urns: Iterable with client urns.
+      token: Security token.
+
+    Returns:
+      List of ExportedMetadata objects. Clients that don't exist are
+      silently skipped.
+    """
+    result = []
+    to_fetch = []
+    for client_urn in set(client_urns):
+      try:
+        result.append(self._cache.Get(client_urn))
+      except KeyError:
+        to_fetch.append(client_urn)
+
+    stats.STATS.IncrementCounter(
+        "export_metadata_cache_hits", delta=len(result))
+
+    if to_fetch:
+      stats.STATS.IncrementCounter(
+          "export_metadata_cache_misses", delta=len(to_fetch))
+
+      for client_fd in aff4.FACTORY.MultiOpen(to_fetch, mode="r", token=token):
+        metadata = GetMetadata(client_fd, token=token)
+        self._cache.Put(metadata.client_urn, metadata)
+        result.append(metadata)
+
+    return result
+
+  def Flush(self):
+    self._cache.Flush()
+
+
+# Process-wide cache shared by all the converters. Initialized by
+# ExportInitHook once the configuration is loaded.
+CLIENT_METADATA_CACHE = ClientMetadataCache()
+
+
+def ConvertValuesWithMetadata(metadata_value_pairs,
+                              token=None,
+                              options=None,
+                              converter_cache=None):
   """Converts a set of RDFValues into a set of export-friendly RDFValues.
 
   Args:
@@ -1801,6 +1925,10 @@ def ConvertValuesWithMetadata(metadata_value_pairs, token=None, options=None):
     token: Security token.
     options: rdfvalue.ExportOptions instance that will be passed to
              ExportConverters.
+    converter_cache: Optional ConverterCache. Passing the same cache to
+                     subsequent calls reuses converter instances (and their
+                     caches) across batches. Must have been created with the
+                     same options.
   Yields:
     Converted values. Converted values may be of different types.
 
@@ -1814,6 +1942,9 @@ def ConvertValuesWithMetadata(metadata_value_pairs, token=None, options=None):
                       exception message.
   """
 
+  if converter_cache is None:
+    converter_cache = ConverterCache(options)
+
   no_converter_found_error = None
   for rdf_type, metadata_values_group in utils.GroupBy(
       metadata_value_pairs,
@@ -1821,13 +1952,12 @@ def ConvertValuesWithMetadata(metadata_value_pairs, token=None, options=None):
 
     _ = rdf_type
     _, first_value = metadata_values_group[0]
-    converters_classes = ExportConverter.GetConvertersByValue(first_value)
-    if not converters_classes:
+    converters = converter_cache.GetConverters(first_value.__class__)
+    if not converters:
       no_converter_found_error = "No converters found for value: %s" % str(
           first_value)
       continue
 
-    converters = [cls(options) for cls in converters_classes]
     for converter in converters:
       for result in converter.BatchConvert(metadata_values_group, token=token):
         yield result
@@ -1836,7 +1966,11 @@ def ConvertValuesWithMetadata(metadata_value_pairs, token=None, options=None):
     raise NoConverterFound(no_converter_found_error)
 
 
-def ConvertValues(default_metadata, values, token=None, options=None):
+def ConvertValues(default_metadata,
+                  values,
+                  token=None,
+                  options=None,
+                  converter_cache=None):
   """Converts a set of RDFValues into a set of export-friendly RDFValues.
 
   Args:
@@ -1847,6 +1981,7 @@ def ConvertValues(default_metadata, values, token=None, options=None):
     token: Security token.
     options: rdfvalue.ExportOptions instance that will be passed to
              ExportConverters.
+    converter_cache: Optional ConverterCache shared across calls.
   Returns:
     Converted values. Converted values may be of different types
     (unlike the source values which are all of the same type). This is due to
@@ -1858,4 +1993,22 @@ def ConvertValues(default_metadata, values, token=None, options=None):
   """
 
   batch_data = [(default_metadata, obj) for obj in values]
-  return ConvertValuesWithMetadata(batch_data, token=token, options=options)
+  return ConvertValuesWithMetadata(
+      batch_data,
+      token=token,
+      options=options,
+      converter_cache=converter_cache)
+
+
+class ExportInitHook(registry.InitHook):
+
+  def RunOnce(self):
+    """Registers export metrics and sizes the client metadata cache."""
+    global CLIENT_METADATA_CACHE
+
+    stats.STATS.RegisterCounterMetric("export_metadata_cache_hits")
+    stats.STATS.RegisterCounterMetric("export_metadata_cache_misses")
+
+    CLIENT_METADATA_CACHE = ClientMetadataCache(
+        max_size=config_lib.CONFIG["Export.metadata_cache_size"],
+        max_age=config_lib.CONFIG["Export.metadata_cache_max_age"])
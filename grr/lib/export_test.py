@@ -16,6 +16,7 @@ from grr.lib import export
 from grr.lib import flags
 from grr.lib import queues
 from grr.lib import rdfvalue
+from grr.lib import stats
 from grr.lib import test_lib
 from grr.lib.aff4_objects import aff4_grr
 from grr.lib.aff4_objects import collects
@@ -928,6 +929,59 @@ class ExportTest(ExportTestBase):
     self.assertEqual(results[0].source_urn,
                      "aff4:/hunts/" + str(queues.HUNTS) + ":000000/Results")
 
+  def testGrrMessageConverterReusesConvertersAcrossBatches(self):
+    msg = rdf_flows.GrrMessage(payload=DummyRDFValue4(
+        "some", age=rdfvalue.RDFDatetime().FromSecondsFromEpoch(1)))
+    msg.source = self.client_id
+    test_lib.ClientFixture(msg.source, token=self.token)
+
+    metadata = export.ExportedMetadata(source_urn=rdfvalue.RDFURN(
+        "aff4:/hunts/" + str(queues.HUNTS) + ":000000/Results"))
+
+    converter = export.GrrMessageConverter()
+    list(converter.BatchConvert([(metadata, msg)], token=self.token))
+    converters = converter.converter_cache.GetConverters(DummyRDFValue4)
+    list(converter.BatchConvert([(metadata, msg)], token=self.token))
+
+    self.assertTrue(converters)
+    self.assertTrue(all(
+        a is b
+        for a, b in zip(converters,
+                        converter.converter_cache.GetConverters(
+                            DummyRDFValue4))))
+
+  def testClientMetadataCacheFetchesMissingClientsOnce(self):
+    client_ids = self.SetupClients(2)
+    cache = export.ClientMetadataCache()
+
+    hits = stats.STATS.GetMetricValue("export_metadata_cache_hits")
+    misses = stats.STATS.GetMetricValue("export_metadata_cache_misses")
+
+    results = cache.GetMany(client_ids + client_ids[:1], token=self.token)
+    self.assertItemsEqual([m.client_urn for m in results], client_ids)
+    self.assertEqual(
+        stats.STATS.GetMetricValue("export_metadata_cache_misses"), misses + 2)
+
+    results = cache.GetMany(client_ids, token=self.token)
+    self.assertItemsEqual([m.client_urn for m in results], client_ids)
+    self.assertEqual(
+        stats.STATS.GetMetricValue("export_metadata_cache_hits"), hits + 2)
+    self.assertEqual(
+        stats.STATS.GetMetricValue("export_metadata_cache_misses"), misses + 2)
+
+  def testClientMetadataCacheExpiresEntries(self):
+    client_id = self.SetupClients(1)[0]
+    cache = export.ClientMetadataCache(max_age=10)
+
+    with test_lib.FakeTime(100):
+      cache.GetMany([client_id], token=self.token)
+
+    misses = stats.STATS.GetMetricValue("export_metadata_cache_misses")
+    with test_lib.FakeTime(111):
+      cache.GetMany([client_id], token=self.token)
+    self.assertEqual(
+        stats.STATS.GetMetricValue("export_metadata_cache_misses"), misses + 1)
+
   def testGrrMessageConverterMultipleTypes(self):
     payload1 = DummyRDFValue3(
         "some", age=rdfvalue.RDFDatetime().FromSecondsFromEpoch(1))
@@ -1176,6 +1230,26 @@ class DataAgnosticExportConverterTest(ExportTestBase):
     self.assertEqual(converted_value.datetime_value,
                      rdfvalue.RDFDatetime().FromSecondsFromEpoch(42))
 
+  def testReusesGeneratedClassForValuesOfTheSameType(self):
+    converter = export.DataAgnosticExportConverter()
+    metadata = export.ExportedMetadata(source_urn=rdfvalue.RDFURN("aff4:/foo"))
+    results = list(
+        converter.BatchConvert([(metadata,
+                                 test_lib.DataAgnosticConverterTestValue(
+                                     string_value="foo")),
+                                (metadata,
+                                 test_lib.DataAgnosticConverterTestValue(
+                                     int_value=42))]))
+
+    self.assertEqual(len(results), 2)
+    self.assertTrue(results[0].__class__ is results[1].__class__)
+    self.assertEqual(results[0].string_value, "foo")
+    self.assertEqual(results[1].int_value, 42)
+    self.assertItemsEqual(results[0].flattened_fields, [
+        "string_value", "int_value", "bool_value", "enum_value",
+        "another_enum_value", "urn_value", "datetime_value"
+    ])
+
   def testConvertedValuesCanBeSerializedAndDeserialized(self):
     original_value = test_lib.DataAgnosticConverterTestValue(
         string_value="string value",
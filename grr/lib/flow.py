@@ -848,28 +848,78 @@ class GRRFlow(FlowBase):
   # is killed when the client crashes.
   handles_crashes = False
 
+  # While a flow runs, only the keys of its state which changed are written.
+  # Each key is stored in its own column with this prefix, the full
+  # FLOW_STATE_DICT is only rewritten (compacted) when the flow finishes.
+  FLOW_STATE_KEY_PREFIX = "flow_state:"
+
   def Initialize(self):
     """The initialization method."""
     super(GRRFlow, self).Initialize()
 
+    # The serialized values of the state keys as they are stored in the data
+    # store and the keys which are stored in their own columns.
+    self._stored_state = None
+    self._stored_state_keys = set()
+
     if "r" in self.mode:
-      state = self.Get(self.Schema.FLOW_STATE_DICT)
       self.context = self.Get(self.Schema.FLOW_CONTEXT)
       self.runner_args = self.Get(self.Schema.FLOW_RUNNER_ARGS)
       args = self.Get(self.Schema.FLOW_ARGS)
       if args:
         self.args = args.payload
 
-      if state:
-        self.state = AttributedDict(state.ToDict())
-      else:
-        self.state = AttributedDict()
+      # The state can be large, it's only read when it's used.
+      self._state_loaded = False
 
       self.Load()
 
-    if self.state is None:
+    elif self._state is None:
       self.state = AttributedDict()
 
+  def _GetState(self):
+    if not self._state_loaded:
+      self._state_loaded = True
+      self._state = self._ReadState()
+    return self._state
+
+  def _SetState(self, state):
+    self._state_loaded = True
+    self._state = state
+
+  state = property(_GetState, _SetState)
+
+  def _ReadState(self):
+    """Reads the compacted state and the keys that changed since."""
+    state = AttributedDict()
+    stored = None
+
+    state_dict = self.Get(self.Schema.FLOW_STATE_DICT)
+    if state_dict is not None:
+      stored = {}
+      for key_value in state_dict.dat:
+        stored[key_value.k.GetValue()] = key_value.v.SerializeToString()
+
+    for predicate, value, _ in data_store.DB.ResolvePrefix(
+        self.urn, self.FLOW_STATE_KEY_PREFIX, token=self.token):
+      key = predicate[len(self.FLOW_STATE_KEY_PREFIX):]
+      self._stored_state_keys.add(key)
+      if stored is None:
+        stored = {}
+      stored[key] = value
+
+    self._stored_state = stored
+
+    for key, value in (self._stored_state or {}).iteritems():
+      state[key] = rdf_protodict.DataBlob.FromSerializedString(value).GetValue()
+      try:
+        # Unpack nested AttributedDicts like Dict.ToDict() does.
+        state[key] = state[key].ToDict()
+      except AttributeError:
+        pass
+
+    return state
+
   def CreateRunner(self, **kw):
     """Make a new runner."""
     self.runner = flow_runner.FlowRunner(self, token=self.token, **kw)
@@ -911,8 +961,53 @@ class GRRFlow(FlowBase):
       self.Set(self.Schema.FLOW_ARGS(self.args))
       self.Set(self.Schema.FLOW_CONTEXT(self.context))
       self.Set(self.Schema.FLOW_RUNNER_ARGS(self.runner_args))
-      protodict = rdf_protodict.AttributedDict().FromDict(self.state)
+
+      if self.context is None:
+        # Well known flows have no context, their state is written as a whole.
+        protodict = rdf_protodict.AttributedDict().FromDict(self.state)
+        self.Set(self.Schema.FLOW_STATE_DICT(protodict))
+
+      # If the state was never used it can't have changed. Finished flows
+      # still need to compact their state.
+      elif (self._state_loaded or
+            self.context.state != rdf_flows.FlowContext.State.RUNNING):
+        self._WriteStateChanges()
+
+  def _WriteStateChanges(self):
+    """Writes the keys of the state which changed since the last write."""
+    protodict = rdf_protodict.AttributedDict().FromDict(self.state)
+    serialized = dict((key_value.k.GetValue(), key_value.v.SerializeToString())
+                      for key_value in protodict.dat)
+
+    stored = self._stored_state or {}
+    changed_keys = [
+        key for key, value in serialized.iteritems() if stored.get(key) != value
+    ]
+
+    if (self._stored_state is None or set(stored) - set(serialized) or
+        (self.context.state != rdf_flows.FlowContext.State.RUNNING and
+         (changed_keys or self._stored_state_keys))):
+      # There is no full state yet, keys were removed or the flow is done:
+      # Write the full state and drop the single keys.
       self.Set(self.Schema.FLOW_STATE_DICT(protodict))
+      for key in self._stored_state_keys:
+        self._to_delete.add(self.FLOW_STATE_KEY_PREFIX + key)
+      self._stored_state_keys = set()
+
+    elif changed_keys:
+      changes = {}
+      for key in changed_keys:
+        changes[self.FLOW_STATE_KEY_PREFIX + key] = [serialized[key]]
+        self._stored_state_keys.add(key)
+
+      stats.STATS.IncrementCounter("grr_flow_state_keys_written",
+                                   len(changes))
+      if self.mutation_pool:
+        self.mutation_pool.MultiSet(self.urn, changes)
+      else:
+        data_store.DB.MultiSet(self.urn, changes, token=self.token)
+
+    self._stored_state = serialized
 
   def Status(self, format_str, *args):
     """Flows can call this method to set a status message visible to users."""
@@ -1242,11 +1337,8 @@ class WellKnownFlow(GRRFlow):
 
   def FetchAndRemoveRequestsAndResponses(self, session_id):
     """Removes WellKnownFlow messages from the queue and returns them."""
-    messages = []
     with queue_manager.WellKnownQueueManager(token=self.token) as manager:
-      for _, responses in manager.FetchRequestsAndResponses(session_id):
-        messages.extend(responses)
-        manager.DeleteWellKnownFlowResponses(session_id, responses)
+      messages, _ = manager.FetchAndRemoveResponses(session_id)
 
     return messages
 
@@ -1393,6 +1485,10 @@ class EventListener(WellKnownFlow):
   """
   EVENTS = []
 
+  # If set, events are processed directly by the process which publishes them
+  # instead of being queued for a worker. Only use this for cheap listeners.
+  PROCESS_INLINE = False
+
   __metaclass__ = registry.EventRegistry
 
   @EventHandler(auth_required=True)
@@ -1421,6 +1517,7 @@ class FlowInit(registry.InitHook):
     # Counters defined here
     stats.STATS.RegisterCounterMetric("grr_flow_completed_count")
     stats.STATS.RegisterCounterMetric("grr_flow_errors")
+    stats.STATS.RegisterCounterMetric("grr_flow_state_keys_written")
     stats.STATS.RegisterCounterMetric("grr_flow_invalid_flow_count")
     stats.STATS.RegisterCounterMetric("grr_request_retransmission_count")
     stats.STATS.RegisterCounterMetric("grr_response_out_of_order")
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""Profiles the processing of flows per flow and state.
+
+The profiler is enabled with Worker.flow_profiling. While a worker thread runs
+a state method of a flow (or processes the requests of a flow) it has an open
+span, the data store calls made by the thread are attributed to the innermost
+open span.
+
+For each (flow, state) the profiler records the processing time, the number
+and latency of data store calls and the bytes they read and wrote in
+stats.STATS. It also aggregates the time into folded stacks, e.g.
+
+  GetFile;ProcessCompletedRequests;Stat;datastore:MultiSet 1234
+
+where the number is in microseconds, which can be rendered by flame graph
+tools. The profile is served by the stats server at /flow_profile and written
+to Worker.flow_profile_path when the process exits.
+"""
+
+
+import atexit
+import collections
+import threading
+import time
+
+import logging
+
+from grr.lib import config_lib
+from grr.lib import data_store
+from grr.lib import registry
+from grr.lib import stats
+
+
+class _NoSpan(object):
+  """The span used when the profiler is disabled."""
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class _Span(object):
+  """The processing of a flow state by a thread."""
+
+  def __init__(self, profiler, flow_name, state, parent):
+    self.profiler = profiler
+    self.flow_name = flow_name
+    self.state = state
+    self.parent = parent
+
+    if parent is None:
+      self.stack = (flow_name, state)
+    elif parent.flow_name == flow_name:
+      self.stack = parent.stack + (state,)
+    else:
+      self.stack = parent.stack + (flow_name, state)
+
+    # Time spent in nested spans and data store calls of this span.
+    self.child_time = 0
+    # Data store time by method name.
+    self.datastore_time = collections.defaultdict(float)
+    self.start_time = None
+
+  def __enter__(self):
+    self.profiler.local.span = self
+    self.start_time = time.time()
+    return self
+
+  def __exit__(self, unused_type, unused_value, unused_traceback):
+    duration = time.time() - self.start_time
+    self.profiler.local.span = self.parent
+    if self.parent is not None:
+      self.parent.child_time += duration
+
+    self.profiler.RecordSpan(self, duration)
+
+  def AddDataStoreCall(self, call):
+    self.datastore_time[call.method] += call.duration
+    self.child_time += call.duration
+
+
+class FlowProfiler(object):
+  """Collects the time spent in flow states and their data store calls."""
+
+  def __init__(self):
+    self.local = threading.local()
+    self.lock = threading.Lock()
+    # Microseconds spent by folded stack.
+    self.folded_stacks = collections.defaultdict(int)
+
+  def Span(self, flow_name, state):
+    return _Span(self, flow_name, state, getattr(self.local, "span", None))
+
+  def OnDataStoreCall(self, call):
+    """Attributes a data store call to the current span of this thread."""
+    span = getattr(self.local, "span", None)
+    if span is None:
+      return
+
+    span.AddDataStoreCall(call)
+
+    fields = [span.flow_name, span.state, call.method]
+    stats.STATS.IncrementCounter("flow_state_datastore_calls", fields=fields)
+    stats.STATS.IncrementCounter(
+        "flow_state_datastore_bytes", delta=call.payload_bytes, fields=fields)
+    stats.STATS.RecordEvent(
+        "flow_state_datastore_latency", call.duration, fields=fields)
+
+  def RecordSpan(self, span, duration):
+    stats.STATS.RecordEvent(
+        "flow_state_processing_time",
+        duration,
+        fields=[span.flow_name, span.state])
+
+    with self.lock:
+      self.folded_stacks[span.stack] += int(
+          max(0, duration - span.child_time) * 1e6)
+      for method, method_time in span.datastore_time.iteritems():
+        self.folded_stacks[span.stack + ("datastore:" + method,)] += int(
+            method_time * 1e6)
+
+  def DumpFoldedStacks(self):
+    """Returns the profile in the folded stacks format of flame graphs."""
+    with self.lock:
+      stacks = sorted(self.folded_stacks.iteritems())
+
+    return "".join("%s %d\n" % (";".join(stack), value)
+                   for stack, value in stacks)
+
+  def Reset(self):
+    with self.lock:
+      self.folded_stacks.clear()
+
+  def WriteProfile(self, path):
+    try:
+      with open(path, "wb") as fd:
+        fd.write(self.DumpFoldedStacks())
+    except IOError as e:
+      logging.error("Unable to write the flow profile to %s: %s", path, e)
+
+
+PROFILER = None
+
+
+def Span(flow_name, state):
+  """Returns a context manager profiling a state of the given flow."""
+  if PROFILER is None:
+    return _NO_SPAN
+  return PROFILER.Span(flow_name, state)
+
+
+def StartProfiling():
+  """Enables the profiler in this process."""
+  global PROFILER
+  if PROFILER is None:
+    PROFILER = FlowProfiler()
+    data_store.AddCallObserver(PROFILER.OnDataStoreCall)
+  return PROFILER
+
+
+def StopProfiling():
+  global PROFILER
+  if PROFILER is not None:
+    data_store.RemoveCallObserver(PROFILER.OnDataStoreCall)
+    PROFILER = None
+
+
+class FlowProfilerInit(registry.InitHook):
+  """Enables the profiler if configured."""
+
+  pre = ["DataStoreInit"]
+
+  def RunOnce(self):
+    fields = [("flow", str), ("state", str)]
+    stats.STATS.RegisterEventMetric(
+        "flow_state_processing_time", fields=fields)
+    stats.STATS.RegisterCounterMetric(
+        "flow_state_datastore_calls", fields=fields + [("method", str)])
+    stats.STATS.RegisterCounterMetric(
+        "flow_state_datastore_bytes", fields=fields + [("method", str)])
+    stats.STATS.RegisterEventMetric(
+        "flow_state_datastore_latency", fields=fields + [("method", str)])
+
+    if config_lib.CONFIG["Worker.flow_profiling"]:
+      profiler = StartProfiling()
+
+      profile_path = config_lib.CONFIG["Worker.flow_profile_path"]
+      if profile_path:
+        atexit.register(profiler.WriteProfile, profile_path)
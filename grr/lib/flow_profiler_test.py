@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""Tests for the flow profiler."""
+
+
+import time
+
+from grr.lib import data_store
+from grr.lib import flags
+from grr.lib import flow_profiler
+from grr.lib import stats
+from grr.lib import test_lib
+
+
+class FlowProfilerTest(test_lib.GRRBaseTest):
+  """Tests the FlowProfiler."""
+
+  def setUp(self):
+    super(FlowProfilerTest, self).setUp()
+    self.profiler = flow_profiler.FlowProfiler()
+    data_store.AddCallObserver(self.profiler.OnDataStoreCall)
+
+  def tearDown(self):
+    data_store.RemoveCallObserver(self.profiler.OnDataStoreCall)
+    super(FlowProfilerTest, self).tearDown()
+
+  def _GetCalls(self, flow_name, state, method):
+    return stats.STATS.GetMetricValue(
+        "flow_state_datastore_calls", fields=[flow_name, state, method])
+
+  def testDataStoreCallsAreAttributedToSpans(self):
+    subject = "aff4:/profiler_test"
+    with self.profiler.Span("TestFlow", "Start"):
+      data_store.DB.Set(
+          subject, "metadata:value", "x" * 100, token=self.token)
+
+      with self.profiler.Span("ChildFlow", "Start"):
+        list(
+            data_store.DB.ResolveMulti(
+                subject, ["metadata:value"], token=self.token))
+
+    # Calls outside of spans are not attributed.
+    data_store.DB.Set(subject, "metadata:value", "y", token=self.token)
+
+    self.assertEqual(self._GetCalls("TestFlow", "Start", "Set"), 1)
+    self.assertGreaterEqual(
+        stats.STATS.GetMetricValue(
+            "flow_state_datastore_bytes",
+            fields=["TestFlow", "Start", "Set"]), 100)
+    self.assertEqual(self._GetCalls("TestFlow", "Start", "ResolveMulti"), 0)
+    self.assertEqual(self._GetCalls("ChildFlow", "Start", "ResolveMulti"), 1)
+
+    stacks = [
+        line.split(" ")[0]
+        for line in self.profiler.DumpFoldedStacks().splitlines()
+    ]
+    self.assertItemsEqual(stacks, [
+        "TestFlow;Start", "TestFlow;Start;datastore:Set",
+        "TestFlow;Start;ChildFlow;Start",
+        "TestFlow;Start;ChildFlow;Start;datastore:ResolveMulti"
+    ])
+
+  def testStatesOfTheSameFlowAreNested(self):
+    with self.profiler.Span("NestedFlow", "ProcessCompletedRequests"):
+      with self.profiler.Span("NestedFlow", "Start"):
+        time.sleep(0.01)
+
+    profile = dict(
+        line.split(" ")
+        for line in self.profiler.DumpFoldedStacks().splitlines())
+    self.assertGreaterEqual(
+        int(profile["NestedFlow;ProcessCompletedRequests;Start"]), 10000)
+    # The time of nested spans is not counted twice.
+    self.assertLess(int(profile["NestedFlow;ProcessCompletedRequests"]), 10000)
+
+    self.assertEqual(
+        stats.STATS.GetMetricValue(
+            "flow_state_processing_time", fields=["NestedFlow", "Start"]).count,
+        1)
+
+  def testDisabledProfiler(self):
+    self.assertIsNone(flow_profiler.PROFILER)
+    with flow_profiler.Span("TestFlow", "Start"):
+      pass
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
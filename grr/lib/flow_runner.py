@@ -64,6 +64,7 @@ from grr.lib import aff4
 from grr.lib import config_lib
 from grr.lib import data_store
 from grr.lib import events
+from grr.lib import flow_profiler
 from grr.lib import grr_collections
 from grr.lib import multi_type_collection
 # Note: OutputPluginDescriptor is also needed implicitly by FlowRunnerArgs
@@ -403,7 +404,10 @@ class FlowRunner(object):
           manager.QueueNotification(
               notification, timestamp=notification.timestamp + delay)
 
-  def ProcessCompletedRequests(self, notification, unused_thread_pool=None):
+  def ProcessCompletedRequests(self,
+                               notification,
+                               unused_thread_pool=None,
+                               prefetched_data=None):
     """Go through the list of requests and process the completed ones.
 
     We take a snapshot in time of all requests and responses for this flow. We
@@ -417,22 +421,30 @@ class FlowRunner(object):
 
     Args:
       notification: The notification object that triggered this processing.
+      prefetched_data: Optional queue_manager.PrefetchedFlowData read by the
+                       worker for this notification.
     """
     self.ScheduleKillNotification()
     try:
-      self._ProcessCompletedRequests(notification)
+      self._ProcessCompletedRequests(
+          notification, prefetched_data=prefetched_data)
     finally:
       self.FinalizeProcessCompletedRequests(notification)
 
-  def _ProcessCompletedRequests(self, notification):
+  def _ProcessCompletedRequests(self, notification, prefetched_data=None):
     """Does the actual processing of the completed requests."""
     # First ensure that client messages are all removed. NOTE: We make a new
     # queue manager here because we want only the client messages to be removed
     # ASAP. This must happen before we actually run the flow to ensure the
     # client requests are removed from the client queues.
     with queue_manager.QueueManager(token=self.token) as manager:
-      for request, _ in manager.FetchCompletedRequests(
-          self.session_id, timestamp=(0, notification.timestamp)):
+      if prefetched_data is not None:
+        completed_requests = prefetched_data.completed_requests
+      else:
+        completed_requests = manager.FetchCompletedRequests(
+            self.session_id, timestamp=(0, notification.timestamp))
+
+      for request, _ in completed_requests:
         # Requests which are not destined to clients have no embedded request
         # message.
         if request.HasField("request"):
@@ -450,7 +462,9 @@ class FlowRunner(object):
         # Here we only care about completed requests - i.e. those requests with
         # responses followed by a status message.
         for request, responses in self.queue_manager.FetchCompletedResponses(
-            self.session_id, timestamp=(0, notification.timestamp)):
+            self.session_id,
+            timestamp=(0, notification.timestamp),
+            prefetched_data=prefetched_data):
 
           if request.id == 0:
             continue
@@ -529,7 +543,9 @@ class FlowRunner(object):
           event.wait()
 
         # We did not read all the requests/responses in this run in order to
-        # keep a low memory footprint and have to make another pass.
+        # keep a low memory footprint and have to make another pass. The
+        # prefetched data is out of date by now.
+        prefetched_data = None
         self.FlushMessages()
         self.flow_obj.Flush()
         continue
@@ -582,12 +598,15 @@ class FlowRunner(object):
         raise FlowRunnerError("Flow %s has no state method %s" %
                               (self.flow_obj.__class__.__name__, method))
 
-      method(
-          direct_response=direct_response, request=request, responses=responses)
+      with flow_profiler.Span(self.flow_obj.Name(), method.__name__):
+        method(
+            direct_response=direct_response,
+            request=request,
+            responses=responses)
 
-      if self.sent_replies:
-        self.ProcessRepliesWithOutputPlugins(self.sent_replies)
-        self.sent_replies = []
+        if self.sent_replies:
+          self.ProcessRepliesWithOutputPlugins(self.sent_replies)
+          self.sent_replies = []
 
     # We don't know here what exceptions can be thrown in the flow but we have
     # to continue. Thus, we catch everything.
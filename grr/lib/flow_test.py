@@ -18,6 +18,7 @@ from grr.lib import output_plugin
 from grr.lib import queue_manager
 from grr.lib import rdfvalue
 from grr.lib import server_stubs
+from grr.lib import stats
 from grr.lib import test_lib
 from grr.lib import type_info
 from grr.lib import utils
@@ -438,6 +439,96 @@ class FlowCreationTest(BasicFlowTest):
         ])
 
 
+class FlowStateTest(BasicFlowTest):
+  """Tests the incremental writing of the flow state."""
+
+  def _StoredKeys(self, session_id):
+    return sorted(
+        predicate[len(flow.GRRFlow.FLOW_STATE_KEY_PREFIX):]
+        for predicate, _, _ in data_store.DB.ResolvePrefix(
+            session_id, flow.GRRFlow.FLOW_STATE_KEY_PREFIX, token=self.token))
+
+  def _StartFlow(self):
+    return flow.GRRFlow.StartFlow(
+        client_id=self.client_id, flow_name="FlowOrderTest", token=self.token)
+
+  def testOnlyChangedKeysAreWritten(self):
+    session_id = self._StartFlow()
+
+    with aff4.FACTORY.Open(session_id, mode="rw", token=self.token) as flow_obj:
+      flow_obj.state.files = ["/bin/ls"] * 1000
+      flow_obj.state.counter = 1
+
+    self.assertEqual(self._StoredKeys(session_id), ["counter", "files"])
+
+    written = stats.STATS.GetMetricValue("grr_flow_state_keys_written")
+    with aff4.FACTORY.Open(session_id, mode="rw", token=self.token) as flow_obj:
+      flow_obj.state.counter += 1
+
+    self.assertEqual(
+        stats.STATS.GetMetricValue("grr_flow_state_keys_written"), written + 1)
+
+    flow_obj = aff4.FACTORY.Open(session_id, token=self.token)
+    self.assertEqual(flow_obj.state.counter, 2)
+    self.assertEqual(len(flow_obj.state.files), 1000)
+
+    # The full state is not rewritten while the flow runs.
+    state_dict = flow_obj.Get(flow_obj.Schema.FLOW_STATE_DICT)
+    self.assertNotIn("counter", state_dict)
+
+  def testUnusedStateIsNotWritten(self):
+    session_id = self._StartFlow()
+
+    written = stats.STATS.GetMetricValue("grr_flow_state_keys_written")
+    with aff4.FACTORY.Open(session_id, mode="rw", token=self.token) as flow_obj:
+      flow_obj.Get(flow_obj.Schema.FLOW_CONTEXT)
+
+    self.assertEqual(
+        stats.STATS.GetMetricValue("grr_flow_state_keys_written"), written)
+
+  def testRemovedKeys(self):
+    session_id = self._StartFlow()
+
+    with aff4.FACTORY.Open(session_id, mode="rw", token=self.token) as flow_obj:
+      flow_obj.state.counter = 1
+
+    with aff4.FACTORY.Open(session_id, mode="rw", token=self.token) as flow_obj:
+      del flow_obj.state["counter"]
+
+    self.assertEqual(self._StoredKeys(session_id), [])
+    flow_obj = aff4.FACTORY.Open(session_id, token=self.token)
+    self.assertNotIn("counter", flow_obj.state)
+
+  def testStateIsCompactedWhenFlowFinishes(self):
+    session_id = self._StartFlow()
+
+    with aff4.FACTORY.Open(session_id, mode="rw", token=self.token) as flow_obj:
+      flow_obj.state.counter = 1
+
+    flow.GRRFlow.TerminateFlow(session_id, token=self.token)
+
+    self.assertEqual(self._StoredKeys(session_id), [])
+    flow_obj = aff4.FACTORY.Open(session_id, token=self.token)
+    state_dict = flow_obj.Get(flow_obj.Schema.FLOW_STATE_DICT)
+    self.assertEqual(state_dict["counter"], 1)
+    self.assertEqual(flow_obj.state.counter, 1)
+
+  def testWellKnownFlowStateIsWritten(self):
+    session_id = test_lib.WellKnownSessionTest.well_known_session_id
+
+    # Well known flows have no context.
+    flow_obj = test_lib.WellKnownSessionTest(
+        session_id, mode="rw", token=self.token)
+    self.assertIsNone(flow_obj.context)
+    flow_obj.state.counter = 1
+    flow_obj.Close()
+
+    flow_obj = test_lib.WellKnownSessionTest(
+        session_id, mode="r", token=self.token)
+    self.assertEqual(flow_obj.state.counter, 1)
+    self.assertEqual(self._StoredKeys(session_id), [])
+
+
 class FlowTest(BasicFlowTest):
   """Tests the Flow."""
 
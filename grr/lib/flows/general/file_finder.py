@@ -199,6 +199,7 @@ class FileFinder(transfer.MultiGetFileMixin, fingerprint.FingerprintFileMixin,
     grep_spec = rdf_client.GrepSpec(
         target=response.stat_entry.pathspec,
         literal=options.literal,
+        literals=options.literals,
         mode=options.mode,
         start_offset=options.start_offset,
         length=options.length,
@@ -191,6 +191,10 @@ class MultiGetFileMixin(object):
     stores for files before downloading them, and offer any new files to
     external stores. This should be true unless the external checks are
     misbehaving.
+  - use_content_defined_chunking: boolean. If true, files are split into
+    content defined chunks on the client instead of fixed size blocks, so
+    chunks already in the blob store are found even if data was inserted or
+    removed in the file.
   """
 
   CHUNK_SIZE = 512 * 1024
@@ -202,12 +206,14 @@ class MultiGetFileMixin(object):
   def Start(self,
             file_size=0,
             maximum_pending_files=1000,
-            use_external_stores=False):
+            use_external_stores=False,
+            use_content_defined_chunking=False):
     """Initialize our state."""
     super(MultiGetFileMixin, self).Start()
 
     self.state.files_hashed = 0
     self.state.use_external_stores = use_external_stores
+    self.state.use_content_defined_chunking = use_content_defined_chunking
     self.state.file_size = file_size
     self.state.files_to_fetch = 0
     self.state.files_fetched = 0
@@ -527,32 +533,76 @@ class MultiGetFileMixin(object):
         file_tracker["size_to_download"] = file_tracker["stat_entry"].st_size
 
       # We do not have the file here yet - we need to retrieve it.
-      expected_number_of_hashes = (
-          file_tracker["size_to_download"] / self.CHUNK_SIZE + 1)
-
-      # We just hash ALL the chunks in the file now. NOTE: This maximizes client
-      # VFS cache hit rate and is far more efficient than launching multiple
-      # GetFile flows.
       self.state.files_to_fetch += 1
 
-      for i in range(expected_number_of_hashes):
-        if i == expected_number_of_hashes - 1:
-          # The last chunk is short.
-          length = file_tracker["size_to_download"] % self.CHUNK_SIZE
-        else:
-          length = self.CHUNK_SIZE
+      if self.state.use_content_defined_chunking:
+        # The client splits the file and hashes all the chunks in one go.
         self.CallClient(
-            server_stubs.HashBuffer,
+            server_stubs.HashFileChunks,
             pathspec=file_tracker["stat_entry"].pathspec,
-            offset=i * self.CHUNK_SIZE,
-            length=length,
-            next_state="CheckHash",
+            length=file_tracker["size_to_download"],
+            max_chunk_size=self.CHUNK_SIZE,
+            next_state="CheckChunkHashes",
             request_data=dict(index=index))
+      else:
+        self._HashFileBlocks(index, file_tracker)
 
     if self.state.files_hashed % 100 == 0:
       self.Log("Hashed %d files, skipped %s already stored.",
                self.state.files_hashed, self.state.files_skipped)
 
+  def _HashFileBlocks(self, index, file_tracker):
+    """Asks the client for the hashes of all the fixed size file blocks."""
+    expected_number_of_hashes = (
+        file_tracker["size_to_download"] / self.CHUNK_SIZE + 1)
+
+    # We just hash ALL the chunks in the file now. NOTE: This maximizes client
+    # VFS cache hit rate and is far more efficient than launching multiple
+    # GetFile flows.
+    for i in range(expected_number_of_hashes):
+      if i == expected_number_of_hashes - 1:
+        # The last chunk is short.
+        length = file_tracker["size_to_download"] % self.CHUNK_SIZE
+      else:
+        length = self.CHUNK_SIZE
+      self.CallClient(
+          server_stubs.HashBuffer,
+          pathspec=file_tracker["stat_entry"].pathspec,
+          offset=i * self.CHUNK_SIZE,
+          length=length,
+          next_state="CheckHash",
+          request_data=dict(index=index))
+
+  @flow.StateHandler()
+  def CheckChunkHashes(self, responses):
+    """Adds the hashes of all the content defined chunks of a file."""
+    index = responses.request_data["index"]
+    if index not in self.state.pending_files:
+      return
+
+    file_tracker = self.state.pending_files[index]
+
+    # Support old clients which may not have the HashFileChunks action yet.
+    if not responses.success:
+      self.Log("Failed to hash chunks of %s, falling back to fixed size "
+               "blocks: %s",
+               file_tracker["stat_entry"].pathspec.AFF4Path(self.client_id),
+               responses.status)
+      self._HashFileBlocks(index, file_tracker)
+      return
+
+    hash_responses = list(responses)
+
+    # Chunks have varying sizes, so the file is complete once all of them
+    # were written.
+    file_tracker["expected_chunks"] = len(hash_responses)
+    file_tracker.setdefault("hash_list", []).extend(hash_responses)
+
+    self.state.blob_hashes_pending += len(hash_responses)
+
+    if self.state.blob_hashes_pending > self.MIN_CALL_TO_FILE_STORE:
+      self.FetchFileContent()
+
   @flow.StateHandler()
   def CheckHash(self, responses):
     """Adds the block hash to the file tracker responsible for this vfs URN."""
@@ -643,9 +693,16 @@ class MultiGetFileMixin(object):
       file_tracker.setdefault("blobs", []).append((response.data,
                                                    response.length))
 
-      download_size = file_tracker["size_to_download"]
-      if (response.length < self.CHUNK_SIZE or
-          response.offset + response.length >= download_size):
+      variable_size_chunks = "expected_chunks" in file_tracker
+      if variable_size_chunks:
+        file_done = (
+            len(file_tracker["blobs"]) >= file_tracker["expected_chunks"])
+      else:
+        download_size = file_tracker["size_to_download"]
+        file_done = (response.length < self.CHUNK_SIZE or
+                     response.offset + response.length >= download_size)
+
+      if file_done:
 
         # Write the file to the data store.
         stat_entry = file_tracker["stat_entry"]
@@ -660,7 +717,10 @@ class MultiGetFileMixin(object):
           fd.Set(fd.Schema.CONTENT_LAST(rdfvalue.RDFDatetime().Now()))
 
           for digest, length in file_tracker["blobs"]:
-            fd.AddBlob(digest, length)
+            if variable_size_chunks:
+              fd.AddVariableSizeBlob(digest, length)
+            else:
+              fd.AddBlob(digest, length)
 
           # Save some space.
           del file_tracker["blobs"]
@@ -708,7 +768,8 @@ class MultiGetFile(MultiGetFileMixin, flow.GRRFlow):
     super(MultiGetFile, self).Start(
         file_size=self.args.file_size,
         maximum_pending_files=self.args.maximum_pending_files,
-        use_external_stores=self.args.use_external_stores)
+        use_external_stores=self.args.use_external_stores,
+        use_content_defined_chunking=self.args.use_content_defined_chunking)
 
     unique_paths = set()
 
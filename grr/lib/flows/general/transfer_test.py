@@ -405,6 +405,48 @@ class TestTransfer(test_lib.FlowTestsBaseclass):
 
     self.assertEqual(client_mock.action_counts["TransferBuffer"], 1)
 
+  def testMultiGetFileContentDefinedChunking(self):
+    data = "".join(hashlib.sha256(str(i)).digest() for i in xrange(100000))
+    path = os.path.join(self.temp_dir, "cdc_original.bin")
+    with open(path, "wb") as fd:
+      fd.write(data)
+
+    modified_path = os.path.join(self.temp_dir, "cdc_modified.bin")
+    with open(modified_path, "wb") as fd:
+      fd.write(data[:1000000] + "inserted" + data[1000000:])
+
+    for path, expected_transfers in [(path, None), (modified_path, 2)]:
+      client_mock = action_mocks.MultiGetFileClientMock()
+      pathspec = rdf_paths.PathSpec(
+          pathtype=rdf_paths.PathSpec.PathType.OS, path=path)
+
+      args = transfer.MultiGetFileArgs(
+          pathspecs=[pathspec], use_content_defined_chunking=True)
+      for _ in test_lib.TestFlowHelper(
+          "MultiGetFile",
+          client_mock,
+          token=self.token,
+          client_id=self.client_id,
+          args=args):
+        pass
+
+      self.assertEqual(client_mock.action_counts["HashFileChunks"], 1)
+      self.assertEqual(client_mock.action_counts["HashBuffer"], 0)
+      if expected_transfers is not None:
+        # Only the chunk(s) around the inserted data are transferred.
+        self.assertLessEqual(client_mock.action_counts["TransferBuffer"],
+                             expected_transfers)
+
+      fd = aff4.FACTORY.Open(
+          pathspec.AFF4Path(self.client_id), token=self.token)
+      with open(path, "rb") as model_fd:
+        expected_data = model_fd.read()
+      self.assertEqual(fd.size, len(expected_data))
+      self.assertEqual(fd.Read(len(expected_data)), expected_data)
+
+      fd.Seek(1000001)
+      self.assertEqual(fd.Read(10), expected_data[1000001:1000011])
+
   def testMultiGetFileSetsFileHashAttributeWhenMultipleChunksDownloaded(self):
     client_mock = action_mocks.MultiGetFileClientMock()
     pathspec = rdf_paths.PathSpec(
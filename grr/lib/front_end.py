@@ -2,6 +2,7 @@
 """The GRR frontend server."""
 
 import operator
+import threading
 import time
 
 
@@ -9,6 +10,7 @@ import logging
 
 from grr.lib import access_control
 from grr.lib import aff4
+from grr.lib import client_wakeup
 from grr.lib import communicator
 from grr.lib import config_lib
 from grr.lib import data_store
@@ -152,6 +154,94 @@ class ServerCommunicator(communicator.Communicator):
     return rdf_flows.GrrMessage.AuthorizationState.AUTHENTICATED
 
 
+class ClientTaskTracker(object):
+  """Tracks which client queues might have pending tasks.
+
+  The tracker subscribes to the client wakeup channel. Long polling clients
+  wait on it and queues which were found empty are not queried again until
+  new tasks are published for them or empty_queue_ttl seconds passed. The
+  ttl bounds the delay for tasks written by processes which don't publish to
+  this frontend, or which became available again when their lease expired.
+  """
+
+  # Tasks might be published before they can be read from the data store, a
+  # queue is not considered empty if tasks were published this many seconds
+  # before it was queried.
+  PUBLISH_GRACE_TIME = 5
+
+  def __init__(self, empty_queue_ttl=0, max_size=100000):
+    self.empty_queue_ttl = empty_queue_ttl
+    # Maps queues to the time they were found empty.
+    self.empty_queues = utils.FastStore(max_size=max_size)
+    # Maps queues to the time tasks were last published for them.
+    self.published = utils.FastStore(max_size=max_size)
+    self.waiters = {}
+    self.lock = threading.Lock()
+
+  def OnNewTasks(self, queues):
+    """Channel callback, called with the queues that received new tasks."""
+    now = time.time()
+    with self.lock:
+      for queue in queues:
+        self.empty_queues.ExpireObject(queue)
+        if self.empty_queue_ttl:
+          self.published.Put(queue, now)
+
+        for event in self.waiters.get(queue, []):
+          event.set()
+
+  def MightHaveTasks(self, queue):
+    """Returns False if the queue is known to be empty."""
+    if not self.empty_queue_ttl:
+      return True
+
+    try:
+      empty_since = self.empty_queues.Get(utils.SmartStr(queue))
+    except KeyError:
+      return True
+
+    return time.time() - empty_since > self.empty_queue_ttl
+
+  def MarkEmpty(self, queue, query_time):
+    """Records that the queue was found empty by a query at query_time."""
+    if not self.empty_queue_ttl:
+      return
+
+    queue = utils.SmartStr(queue)
+    with self.lock:
+      try:
+        if self.published.Get(queue) > query_time - self.PUBLISH_GRACE_TIME:
+          return
+      except KeyError:
+        pass
+
+      self.empty_queues.Put(queue, query_time)
+
+  def Wait(self, queue, timeout):
+    """Waits until new tasks are published for the queue.
+
+    Args:
+      queue: The queue URN.
+      timeout: Maximum number of seconds to wait.
+
+    Returns:
+      True if new tasks were published, False on timeout.
+    """
+    queue = utils.SmartStr(queue)
+    event = threading.Event()
+    with self.lock:
+      self.waiters.setdefault(queue, []).append(event)
+
+    try:
+      return event.wait(timeout)
+    finally:
+      with self.lock:
+        waiters = self.waiters[queue]
+        waiters.remove(event)
+        if not waiters:
+          del self.waiters[queue]
+
+
 class FrontEndServer(object):
   """This is the front end server.
 
@@ -205,6 +295,20 @@ class FrontEndServer(object):
     self.well_known_flows_blacklist = set(config_lib.CONFIG[
         "Frontend.DEBUG_well_known_flows_blacklist"])
 
+    self.long_poll_max_time = config_lib.CONFIG["Frontend.long_poll_max_time"]
+    self.long_poll_check_interval = config_lib.CONFIG[
+        "Frontend.long_poll_check_interval"]
+    self.max_long_polls = config_lib.CONFIG["Frontend.max_long_polls"]
+    self.poll_interval_hint = config_lib.CONFIG["Frontend.poll_interval_hint"]
+    self.long_poll_count = 0
+    self.long_poll_lock = threading.Lock()
+
+    self.task_tracker = ClientTaskTracker(
+        empty_queue_ttl=config_lib.CONFIG["Frontend.empty_queue_cache_ttl"])
+    if client_wakeup.CHANNEL is not None:
+      client_wakeup.CHANNEL.Subscribe(self.task_tracker.OnNewTasks)
+      client_wakeup.CHANNEL.Listen()
+
   @stats.Counted("grr_frontendserver_handle_num")
   @stats.Timed("grr_frontendserver_handle_time")
   def HandleMessageBundles(self, request_comms, response_comms):
@@ -238,12 +342,21 @@ class FrontEndServer(object):
     tasks = []
 
     message_list = rdf_flows.MessageList()
+    long_poll_duration = 0
     # Only give the client messages if we are able to receive them in a
     # reasonable time.
     if time.time() - now < 10:
       tasks = self.DrainTaskSchedulerQueueForClient(source, required_count)
+      if not tasks and request_comms.long_poll_timeout:
+        tasks, long_poll_duration = self.LongPoll(
+            source, required_count, request_comms.long_poll_timeout)
       message_list.job = tasks
 
+    if long_poll_duration:
+      response_comms.long_poll_duration = long_poll_duration
+    if self.poll_interval_hint:
+      response_comms.poll_interval_hint = self.poll_interval_hint
+
     # Encode the message_list in the response_comms using the same API version
     # the client used.
     try:
@@ -261,6 +374,57 @@ class FrontEndServer(object):
 
     return source, len(messages)
 
+  def LongPoll(self, client, max_count, timeout):
+    """Holds the request of an idle client until there are tasks for it.
+
+    Args:
+       client: The ClientURN object specifying this client.
+       max_count: The maximum number of messages we will issue for the
+                  client.
+       timeout: The number of seconds the client is willing to wait.
+
+    Returns:
+       A tuple (tasks, duration) of the drained tasks and the number of
+       seconds the request was held.
+    """
+    timeout = min(timeout, self.long_poll_max_time)
+    if timeout <= 0 or max_count <= 0:
+      return [], 0
+
+    with self.long_poll_lock:
+      if self.long_poll_count >= self.max_long_polls:
+        stats.STATS.IncrementCounter("grr_frontendserver_long_polls_rejected")
+        return [], 0
+
+      self.long_poll_count += 1
+      stats.STATS.SetGaugeValue("grr_frontendserver_long_polls",
+                                self.long_poll_count)
+
+    start = time.time()
+    try:
+      tasks = []
+      deadline = start + timeout
+      while not tasks:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+          break
+
+        self.WaitForClientTasks(client,
+                                min(remaining, self.long_poll_check_interval))
+        tasks = self.DrainTaskSchedulerQueueForClient(client, max_count)
+
+      return tasks, time.time() - start
+
+    finally:
+      with self.long_poll_lock:
+        self.long_poll_count -= 1
+        stats.STATS.SetGaugeValue("grr_frontendserver_long_polls",
+                                  self.long_poll_count)
+
+  def WaitForClientTasks(self, client, timeout):
+    """Waits until there might be new tasks for the client."""
+    self.task_tracker.Wait(rdf_client.ClientURN(client).Queue(), timeout)
+
   def DrainTaskSchedulerQueueForClient(self, client, max_count):
     """Drains the client's Task Scheduler queue.
 
@@ -283,13 +447,21 @@ class FrontEndServer(object):
       return []
 
     client = rdf_client.ClientURN(client)
+    queue = client.Queue()
+
+    # Most polls find an empty queue, we skip the data store read if we know
+    # there is nothing for this client.
+    if not self.task_tracker.MightHaveTasks(queue):
+      stats.STATS.IncrementCounter("grr_frontendserver_empty_queue_cache_hits")
+      return []
 
     start_time = time.time()
     # Drain the queue for this client
     new_tasks = queue_manager.QueueManager(token=self.token).QueryAndOwn(
-        queue=client.Queue(),
-        limit=max_count,
-        lease_seconds=self.message_expiry_time)
+        queue=queue, limit=max_count, lease_seconds=self.message_expiry_time)
+
+    if not new_tasks:
+      self.task_tracker.MarkEmpty(queue, start_time)
 
     initial_ttl = rdf_flows.GrrMessage().task_ttl
     check_before_sending = []
@@ -455,12 +627,21 @@ class FrontEndServer(object):
         "Frontend.upload_store"])()
 
     filestore_fd = upload_store.CreateFileStoreFile()
-    out_fd = uploads.GunzipWrapper(filestore_fd)
-    with uploads.DecryptStream(config_lib.CONFIG["PrivateKeys.server_key"],
-                               self._GetClientPublicKey(policy.client_id),
-                               out_fd) as decrypt_fd:
-      for data in data_generator:
-        decrypt_fd.write(data)
+
+    # Data is decrypted and decompressed in this thread while it's hashed and
+    # written out in another one. All stages only buffer a bounded amount of
+    # data so memory use doesn't depend on the size of the upload.
+    writer = uploads.BackgroundWriter(filestore_fd)
+    try:
+      out_fd = uploads.GunzipWrapper(writer)
+      with uploads.DecryptStream(config_lib.CONFIG["PrivateKeys.server_key"],
+                                 self._GetClientPublicKey(policy.client_id),
+                                 out_fd) as decrypt_fd:
+        for data in data_generator:
+          decrypt_fd.write(data)
+    finally:
+      writer.Stop()
+
     return filestore_fd.Finalize()
 
 
@@ -489,6 +670,10 @@ class FrontendInit(registry.InitHook):
 
     stats.STATS.RegisterEventMetric("grr_frontendserver_handle_time")
     stats.STATS.RegisterCounterMetric("grr_frontendserver_handle_num")
+    stats.STATS.RegisterGaugeMetric("grr_frontendserver_long_polls", int)
+    stats.STATS.RegisterCounterMetric("grr_frontendserver_long_polls_rejected")
+    stats.STATS.RegisterCounterMetric(
+        "grr_frontendserver_empty_queue_cache_hits")
     stats.STATS.RegisterGaugeMetric("grr_frontendserver_client_cache_size", int)
     stats.STATS.RegisterCounterMetric("grr_messages_sent")
 
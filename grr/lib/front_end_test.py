@@ -2,7 +2,8 @@
 """Unittest for grr frontend server."""
 
 
-
+import threading
+import time
 
 from grr.lib import communicator
 from grr.lib import config_lib
@@ -261,10 +262,14 @@ class GRRFEServerTest(test_lib.FlowTestsBaseclass):
             self.client_id, "task:", token=self.token))
 
     # The well known flow messages should be waiting in the flow state now:
+    manager = queue_manager.WellKnownQueueManager(token=self.token)
     queued_messages = []
-    for predicate, _, _ in data_store.DB.ResolvePrefix(
-        session_id.Add("state/request:00000000"), "flow:", token=self.token):
-      queued_messages.append(predicate)
+    for shard in range(manager.num_well_known_flow_shards):
+      for predicate, _, _ in data_store.DB.ResolvePrefix(
+          manager.GetWellKnownFlowResponseSubject(session_id, shard),
+          "flow:",
+          token=self.token):
+        queued_messages.append(predicate)
 
     self.assertEqual(len(queued_messages), 9)
 
@@ -418,6 +423,125 @@ class GRRFEServerTest(test_lib.FlowTestsBaseclass):
     # Since the server tried to send it, the ttl must be decremented
     self.assertEqual(tasks[0].task_ttl - new_tasks[0].task_ttl, 1)
 
+  def testLongPollReturnsNewTasks(self):
+    client_id = rdf_client.ClientURN("C." + "3" * 16)
+    self.server.long_poll_max_time = 60
+    waits = []
+
+    def WaitForClientTasks(client, timeout):
+      waits.append(timeout)
+      if len(waits) == 2:
+        flow.GRRFlow.StartFlow(
+            client_id=client,
+            flow_name="SendingFlow",
+            message_count=1,
+            token=self.token)
+
+    with utils.Stubber(self.server, "WaitForClientTasks", WaitForClientTasks):
+      tasks, duration = self.server.LongPoll(client_id, 10, 30)
+
+    self.assertEqual(len(tasks), 1)
+    self.assertEqual(len(waits), 2)
+    self.assertLess(duration, 30)
+    self.assertEqual(self.server.long_poll_count, 0)
+
+  def testLongPollTimeout(self):
+    client_id = rdf_client.ClientURN("C." + "3" * 16)
+    self.server.long_poll_max_time = 20
+
+    with test_lib.FakeTime(1000, increment=1):
+      with utils.Stubber(self.server, "WaitForClientTasks", lambda *_: None):
+        # The client's timeout is capped by the frontend's setting.
+        tasks, duration = self.server.LongPoll(client_id, 10, 3600)
+
+    self.assertEqual(tasks, [])
+    self.assertGreaterEqual(duration, 20)
+    self.assertLess(duration, 30)
+
+  def testLongPollLimits(self):
+    client_id = rdf_client.ClientURN("C." + "3" * 16)
+
+    # Long polling is disabled by default.
+    self.assertEqual(self.server.LongPoll(client_id, 10, 30), ([], 0))
+
+    self.server.long_poll_max_time = 60
+    self.server.max_long_polls = 1
+    self.server.long_poll_count = 1
+    self.assertEqual(self.server.LongPoll(client_id, 10, 30), ([], 0))
+
+    # The client's input queue is full.
+    self.server.long_poll_count = 0
+    self.assertEqual(self.server.LongPoll(client_id, 0, 30), ([], 0))
+
+  def testEmptyQueuesAreNotQueried(self):
+    client_id = rdf_client.ClientURN("C." + "4" * 16)
+    self.server.task_tracker.empty_queue_ttl = 60
+
+    queries = []
+    original_query = queue_manager.QueueManager.QueryAndOwn
+
+    def QueryAndOwn(manager, *args, **kwargs):
+      queries.append(args)
+      return original_query(manager, *args, **kwargs)
+
+    with utils.Stubber(queue_manager.QueueManager, "QueryAndOwn", QueryAndOwn):
+      self.assertEqual(
+          self.server.DrainTaskSchedulerQueueForClient(client_id, 10), [])
+      self.assertEqual(len(queries), 1)
+
+      # We know there is nothing for this client.
+      self.assertEqual(
+          self.server.DrainTaskSchedulerQueueForClient(client_id, 10), [])
+      self.assertEqual(len(queries), 1)
+
+      # New tasks are announced so the queue is queried again.
+      flow.GRRFlow.StartFlow(
+          client_id=client_id,
+          flow_name="SendingFlow",
+          message_count=1,
+          token=self.token)
+      tasks = self.server.DrainTaskSchedulerQueueForClient(client_id, 10)
+      self.assertEqual(len(tasks), 1)
+      self.assertEqual(len(queries), 2)
+
+    # The entries expire.
+    with test_lib.FakeTime(time.time() + 120):
+      self.assertTrue(
+          self.server.task_tracker.MightHaveTasks(client_id.Queue()))
+
+  def testRecentlyPublishedQueuesAreNotMarkedEmpty(self):
+    tracker = front_end.ClientTaskTracker(empty_queue_ttl=60)
+    queue = "aff4:/C.4444444444444444/tasks"
+
+    tracker.OnNewTasks([queue])
+    tracker.MarkEmpty(queue, time.time())
+    self.assertTrue(tracker.MightHaveTasks(queue))
+
+    tracker.MarkEmpty(queue, time.time() + tracker.PUBLISH_GRACE_TIME + 1)
+    self.assertFalse(tracker.MightHaveTasks(queue))
+
+  def testLongPollWakesUpOnNewTasks(self):
+    client_id = rdf_client.ClientURN("C." + "4" * 16)
+    self.server.long_poll_max_time = 60
+    self.server.long_poll_check_interval = 60
+
+    def StartFlow():
+      flow.GRRFlow.StartFlow(
+          client_id=client_id,
+          flow_name="SendingFlow",
+          message_count=1,
+          token=self.token)
+
+    timer = threading.Timer(0.5, StartFlow)
+    timer.start()
+    try:
+      tasks, duration = self.server.LongPoll(client_id, 10, 30)
+    finally:
+      timer.join()
+
+    self.assertEqual(len(tasks), 1)
+    self.assertLess(duration, 30)
+
   def _ScheduleResponseAndStatus(self, client_id, flow_id):
     with queue_manager.QueueManager(token=self.token) as flow_manager:
       # Schedule a response.
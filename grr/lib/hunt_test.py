@@ -7,6 +7,7 @@
 import logging
 
 from grr.lib import aff4
+from grr.lib import data_store
 from grr.lib import flags
 from grr.lib import flow
 
@@ -14,8 +15,10 @@ from grr.lib import flow
 from grr.lib import hunts
 from grr.lib import queues
 from grr.lib import rdfvalue
+from grr.lib import stats
 from grr.lib import test_lib
 from grr.lib import utils
+from grr.lib.hunts import implementation
 from grr.server import foreman as rdf_foreman
 
 
@@ -60,6 +63,11 @@ class DummyHunt(hunts.GRRHunt):
       self.MarkClientDone(client_id)
 
 
+class SuccessfulResponses(list):
+  """Successful responses, as passed to hunt state handlers."""
+  success = True
+
+
 class HuntTest(test_lib.FlowTestsBaseclass):
   """Tests the Hunt."""
 
@@ -363,6 +371,139 @@ class HuntTest(test_lib.FlowTestsBaseclass):
     # But only 8 should have finished.
     self.assertEqual(finished, 8)
 
+  def testOutstandingClientsAreTrackedWithoutCollections(self):
+    client_ids = self.SetupClients(10)
+
+    client_rule_set = rdf_foreman.ForemanClientRuleSet(rules=[
+        rdf_foreman.ForemanClientRule(
+            rule_type=rdf_foreman.ForemanClientRule.Type.REGEX,
+            regex=rdf_foreman.ForemanRegexClientRule(
+                attribute_name="GRR client", attribute_regex="GRR"))
+    ])
+
+    with hunts.GRRHunt.StartHunt(
+        hunt_name="SampleHunt",
+        client_rule_set=client_rule_set,
+        client_rate=0,
+        token=self.token) as hunt:
+
+      hunt.GetRunner().Start()
+
+    foreman = aff4.FACTORY.Open("aff4:/foreman", mode="rw", token=self.token)
+    for client_id in client_ids:
+      foreman.AssignTasksToClient(client_id)
+
+    client_mock = test_lib.SampleHuntMock()
+    test_lib.TestHuntHelper(client_mock, client_ids[1:9], False, self.token)
+
+    hunt_obj = aff4.FACTORY.Open(
+        hunt.session_id, mode="r", age=aff4.ALL_TIMES, token=self.token)
+
+    self.assertTrue(hunt_obj.context.client_counters_enabled)
+    self.assertEqual(hunt_obj.GetOutstandingClients(),
+                     set([client_ids[0], client_ids[9]]))
+
+    clients_by_status = hunt_obj.GetClientsByStatus()
+    self.assertEqual(clients_by_status["OUTSTANDING"],
+                     clients_by_status["STARTED"] -
+                     clients_by_status["COMPLETED"])
+
+    # Counters have to agree with the client collections.
+    started, finished, errors = hunt_obj.GetClientsCounts()
+    self.assertEqual(started, len(clients_by_status["STARTED"]))
+    self.assertEqual(finished, len(clients_by_status["COMPLETED"]))
+    self.assertEqual(errors, len(list(hunt_obj.GetClientsErrors())))
+
+  def testClientBitmap(self):
+    bitmap = implementation.ClientBitmap()
+    for position in [0, 3, 64, 65, 130]:
+      self.assertTrue(bitmap.Set(position))
+    self.assertFalse(bitmap.Set(3))
+
+    # A fully set word is skipped.
+    for position in range(64, 128):
+      bitmap.Set(position)
+
+    restored = implementation.ClientBitmap(bitmap.SerializeToString())
+    self.assertEqual(
+        list(restored.IterUnset(132)),
+        [1, 2] + range(4, 64) + [128, 129, 131])
+
+  def testRegisteringClientsIsIdempotent(self):
+    client_ids = self.SetupClients(3)
+
+    with hunts.GRRHunt.StartHunt(
+        hunt_name="SampleHunt", client_rate=0, token=self.token) as hunt:
+      hunt.RegisterClients(client_ids[:2])
+      hunt.RegisterClient(client_ids[0])
+
+      # Client positions are only written when the hunt is flushed.
+      self.assertIsNone(
+          data_store.DB.Resolve(
+              hunt.client_index_urn,
+              hunt.CLIENT_POSITION_PREFIX + client_ids[0].Basename(),
+              token=self.token)[0])
+
+    with aff4.FACTORY.Open(
+        hunt.session_id, mode="rw", token=self.token) as hunt:
+      hunt.RegisterClients(client_ids)
+      self.assertEqual(hunt.GetClientsCounts(), (3, 0, 0))
+
+    hunt = aff4.FACTORY.Open(hunt.session_id, token=self.token)
+    self.assertEqual(hunt.GetClientsCounts(), (3, 0, 0))
+    self.assertEqual(hunt.GetOutstandingClients(), set(client_ids))
+
+  def testClientsRegisteredByAnUnfinishedFlushAreNotReused(self):
+    client_ids = self.SetupClients(2)
+
+    with hunts.GRRHunt.StartHunt(
+        hunt_name="SampleHunt", client_rate=0, token=self.token) as hunt:
+      pass
+
+    with aff4.FACTORY.Open(
+        hunt.session_id, mode="rw", token=self.token) as hunt:
+      hunt.RegisterClient(client_ids[0])
+      # The positions were written but the hunt context was not.
+      hunt.FlushClientPositions()
+      hunt.context.clients_count = 0
+
+    with aff4.FACTORY.Open(
+        hunt.session_id, mode="rw", token=self.token) as hunt:
+      hunt.RegisterClients(client_ids)
+
+    hunt = aff4.FACTORY.Open(hunt.session_id, token=self.token)
+    self.assertEqual(hunt.GetClientsCounts(), (2, 0, 0))
+    self.assertEqual(hunt.GetOutstandingClients(), set(client_ids))
+
+  def testCompletedClientPositionsAreReadByTheFlush(self):
+    client_ids = self.SetupClients(3)
+
+    with hunts.GRRHunt.StartHunt(
+        hunt_name="SampleHunt", client_rate=0, token=self.token) as hunt:
+      hunt.RegisterClients(client_ids)
+
+    position_reads = []
+    resolve_multi = data_store.DB.ResolveMulti
+
+    def CountingResolveMulti(subject, *args, **kwargs):
+      if subject == hunt.client_index_urn:
+        position_reads.append(subject)
+      return resolve_multi(subject, *args, **kwargs)
+
+    with utils.Stubber(data_store.DB, "ResolveMulti", CountingResolveMulti):
+      with aff4.FACTORY.Open(
+          hunt.session_id, mode="rw", token=self.token) as hunt:
+        for client_id in client_ids[:2]:
+          hunt.MarkClientDone(client_id)
+        self.assertEqual(position_reads, [])
+
+    # The positions of both clients were read at once.
+    self.assertEqual(len(position_reads), 1)
+
+    hunt = aff4.FACTORY.Open(hunt.session_id, token=self.token)
+    self.assertEqual(hunt.GetClientsCounts(), (3, 2, 0))
+    self.assertEqual(hunt.GetOutstandingClients(), set(client_ids[2:]))
+
   def testPausingAndRestartingDoesNotStartHuntTwiceOnTheSameClient(self):
     """This tests if the hunt completes when some clients hang or raise."""
     client_ids = self.SetupClients(10)
@@ -517,7 +658,7 @@ class HuntTest(test_lib.FlowTestsBaseclass):
 
     self.assertEqual(len(TestHuntListener.received_events), 5)
 
-  def _RunRateLimitedHunt(self, client_ids, start_time):
+  def _StartRateLimitedHunt(self, client_ids, client_rate):
     client_rule_set = rdf_foreman.ForemanClientRuleSet(rules=[
         rdf_foreman.ForemanClientRule(
             rule_type=rdf_foreman.ForemanClientRule.Type.REGEX,
@@ -528,7 +669,7 @@ class HuntTest(test_lib.FlowTestsBaseclass):
     with hunts.GRRHunt.StartHunt(
         hunt_name="DummyHunt",
         client_rule_set=client_rule_set,
-        client_rate=1,
+        client_rate=client_rate,
         token=self.token) as hunt:
       hunt.Run()
 
@@ -539,6 +680,10 @@ class HuntTest(test_lib.FlowTestsBaseclass):
       foreman.AssignTasksToClient(client_id)
 
     self.assertEqual(len(DummyHunt.client_ids), 0)
+    return hunt
+
+  def _RunRateLimitedHunt(self, client_ids, start_time):
+    hunt = self._StartRateLimitedHunt(client_ids, 1)
 
     # Run the hunt.
     worker_mock = test_lib.MockWorker(
@@ -593,6 +738,82 @@ class HuntTest(test_lib.FlowTestsBaseclass):
           worker_mock.Simulate()
       self.assertEqual(len(DummyHunt.client_ids), 1)
 
+  def _CountResults(self, hunt_urn):
+    return len(
+        list(
+            implementation.GRRHunt.ResultCollectionForHID(
+                hunt_urn, token=self.token)))
+
+  def testResultsAreBuffered(self):
+    """Check that hunt results are written in batches."""
+    with hunts.GRRHunt.StartHunt(
+        hunt_name="DummyHunt", client_rate=0, token=self.token) as hunt:
+      hunt_urn = hunt.urn
+
+    client_ids = self.SetupClients(3)
+    with test_lib.ConfigOverrider({
+        "Hunt.results_buffer_size": 4,
+        "Hunt.results_buffer_max_delay": 3600
+    }):
+      with aff4.FACTORY.Open(hunt_urn, mode="rw", token=self.token) as hunt:
+        hunt.AddResultsToCollection(
+            SuccessfulResponses([rdfvalue.RDFString("foo")] * 3),
+            client_ids[0])
+        self.assertEqual(self._CountResults(hunt_urn), 0)
+
+        # The buffer is full now.
+        hunt.AddResultsToCollection(
+            SuccessfulResponses([rdfvalue.RDFString("bar")]), client_ids[1])
+        self.assertEqual(self._CountResults(hunt_urn), 4)
+
+        hunt.AddResultsToCollection(
+            SuccessfulResponses([rdfvalue.RDFString("baz")]), client_ids[2])
+        self.assertEqual(self._CountResults(hunt_urn), 4)
+
+      # Closing the hunt writes the rest.
+      self.assertEqual(self._CountResults(hunt_urn), 5)
+
+    clients_with_results = (
+        implementation.GRRHunt.ClientsWithResultsCollectionForHID(
+            hunt_urn, token=self.token))
+    self.assertItemsEqual(list(clients_with_results), client_ids)
+
+  def testHuntClientRateBatches(self):
+    """Check that rate limited clients are started in batches."""
+    start_time = 10
+    client_ids = self.SetupClients(25)
+    batches = stats.STATS.GetMetricValue("hunt_client_batch_size").count
+
+    with test_lib.ConfigOverrider({"Hunt.client_rate_batch_interval": 10}):
+      with test_lib.FakeTime(start_time):
+        self._StartRateLimitedHunt(client_ids, 60)
+
+      worker_mock = test_lib.MockWorker(
+          check_flow_errors=True, queues=queues.HUNTS, token=self.token)
+
+      # The clients the rate allows in ten seconds are started together.
+      with test_lib.FakeTime(start_time + 1):
+        worker_mock.Simulate()
+      self.assertEqual(len(DummyHunt.client_ids), 10)
+
+      # The next batch is due when its first client would have been started
+      # one by one.
+      with test_lib.FakeTime(start_time + 9):
+        worker_mock.Simulate()
+      self.assertEqual(len(DummyHunt.client_ids), 10)
+
+      with test_lib.FakeTime(start_time + 10):
+        worker_mock.Simulate()
+      self.assertEqual(len(DummyHunt.client_ids), 20)
+
+      with test_lib.FakeTime(start_time + 20):
+        worker_mock.Simulate()
+      self.assertEqual(len(DummyHunt.client_ids), 25)
+
+    self.assertEqual(
+        stats.STATS.GetMetricValue("hunt_client_batch_size").count,
+        batches + 3)
+
 
 def main(argv):
   test_lib.GrrTestProgram(argv=argv)
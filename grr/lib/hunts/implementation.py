@@ -7,6 +7,7 @@ of all these flows.
 """
 
 import threading
+import time
 import traceback
 
 import logging
@@ -17,6 +18,7 @@ from grr.lib import config_lib
 from grr.lib import data_store
 from grr.lib import events as events_lib
 from grr.lib import flow
+from grr.lib import flow_profiler
 from grr.lib import flow_runner
 from grr.lib import grr_collections
 from grr.lib import multi_type_collection
@@ -67,6 +69,54 @@ class HuntResultsMetadata(aff4.AFF4Object):
         versioned=False)
 
 
+class ClientBitmap(object):
+  """A compact bitmap indexed by the position a client was registered at.
+
+  Bits are stored in a bytearray so that the bitmap can be persisted as a
+  single attribute. Scanning for unset bits skips fully set 64 bit words, so
+  listing outstanding clients is O(n/64) in the number of hunt clients.
+  """
+
+  _FULL_WORD = "\xff" * 8
+
+  def __init__(self, serialized=None):
+    self.data = bytearray(serialized or "")
+    self.dirty = False
+
+  def Set(self, position):
+    """Sets the bit at position, returns True if it was not set before."""
+    byte_index, bit = divmod(position, 8)
+    if byte_index >= len(self.data):
+      self.data.extend("\x00" * (byte_index - len(self.data) + 1))
+
+    mask = 1 << bit
+    if self.data[byte_index] & mask:
+      return False
+
+    self.data[byte_index] |= mask
+    self.dirty = True
+    return True
+
+  def IsSet(self, position):
+    byte_index, bit = divmod(position, 8)
+    if byte_index >= len(self.data):
+      return False
+    return bool(self.data[byte_index] & (1 << bit))
+
+  def IterUnset(self, size):
+    """Yields all positions smaller than size that are not set."""
+    for word_offset in xrange(0, (size + 63) // 64 * 8, 8):
+      if self.data[word_offset:word_offset + 8] == self._FULL_WORD:
+        continue
+
+      for position in xrange(word_offset * 8, min(size, word_offset * 8 + 64)):
+        if not self.IsSet(position):
+          yield position
+
+  def SerializeToString(self):
+    return str(self.data)
+
+
 class HuntRunner(object):
   """The runner for hunts.
 
@@ -119,7 +169,10 @@ class HuntRunner(object):
     # Populate the hunt object's urn with the session id.
     self.hunt_obj.urn = self.session_id = self.context.session_id
 
-  def ProcessCompletedRequests(self, notification, thread_pool):
+  def ProcessCompletedRequests(self,
+                               notification,
+                               thread_pool,
+                               prefetched_data=None):
     """Go through the list of requests and process the completed ones.
 
     We take a snapshot in time of all requests and responses for this hunt. We
@@ -129,14 +182,21 @@ class HuntRunner(object):
     Args:
       notification: The notification object that triggered this processing.
       thread_pool: The thread pool to process the responses on.
+      prefetched_data: Optional queue_manager.PrefetchedFlowData read by the
+                       worker for this notification.
     """
     # First ensure that client messages are all removed. NOTE: We make a new
     # queue manager here because we want only the client messages to be removed
     # ASAP. This must happen before we actually run the hunt to ensure the
     # client requests are removed from the client queues.
     with queue_manager.QueueManager(token=self.token) as manager:
-      for request, _ in manager.FetchCompletedRequests(
-          self.session_id, timestamp=(0, notification.timestamp)):
+      if prefetched_data is not None:
+        completed_requests = prefetched_data.completed_requests
+      else:
+        completed_requests = manager.FetchCompletedRequests(
+            self.session_id, timestamp=(0, notification.timestamp))
+
+      for request, _ in completed_requests:
         # Requests which are not destined to clients have no embedded request
         # message.
         if request.HasField("request"):
@@ -144,12 +204,16 @@ class HuntRunner(object):
                                        request.request.task_id)
 
     processing = []
+    self.pending_clients = []
+    self.pending_client_requests = []
     while True:
       try:
         # Here we only care about completed requests - i.e. those requests with
         # responses followed by a status message.
         for request, responses in self.queue_manager.FetchCompletedResponses(
-            self.session_id, timestamp=(0, notification.timestamp)):
+            self.session_id,
+            timestamp=(0, notification.timestamp),
+            prefetched_data=prefetched_data):
 
           if request.id == 0 or not responses:
             continue
@@ -172,10 +236,17 @@ class HuntRunner(object):
               request, responses, thread_pool=thread_pool, events=processing)
 
           # At this point we have processed this request - we can remove it and
-          # its responses from the queue.
-          self.queue_manager.DeleteFlowRequestStates(self.session_id, request)
+          # its responses from the queue. AddClient requests are only removed
+          # once their clients have been started.
+          if request.next_state == "AddClient":
+            self.pending_client_requests.append(request)
+          else:
+            self.queue_manager.DeleteFlowRequestStates(self.session_id,
+                                                       request)
           self.context.next_processed_request += 1
 
+        self._StartPendingClients()
+
         # We are done here.
         return
 
@@ -184,10 +255,16 @@ class HuntRunner(object):
         for event in processing:
           event.wait()
 
+        self._StartPendingClients()
+
         # We did not read all the requests/responses in this run in order to
         # keep a low memory footprint and have to make another pass.
-        self.FlushMessages()
+        prefetched_data = None
+        # The results of this pass are written before its requests are
+        # deleted, a crash in between makes us process them again instead of
+        # losing them.
         self.hunt_obj.Flush()
+        self.FlushMessages()
         continue
 
       finally:
@@ -195,6 +272,10 @@ class HuntRunner(object):
         for event in processing:
           event.wait()
 
+        # The results of this pass are written before its requests are
+        # deleted from the queue.
+        self.hunt_obj.FlushResults()
+
   def RunStateMethod(self,
                      method,
                      request=None,
@@ -239,8 +320,11 @@ class HuntRunner(object):
             "Flow %s has no state method %s" %
             (self.hunt_obj.__class__.__name__, method))
 
-      method(
-          direct_response=direct_response, request=request, responses=responses)
+      with flow_profiler.Span(self.hunt_obj.Name(), method.__name__):
+        method(
+            direct_response=direct_response,
+            request=request,
+            responses=responses)
 
     # We don't know here what exceptions can be thrown in the flow but we have
     # to continue. Thus, we catch everything.
@@ -444,22 +528,69 @@ class HuntRunner(object):
     """Flows can call this method to set a status message visible to users."""
     self.Log(format_str, *args)
 
-  def _AddClient(self, client_id):
-    next_client_due = self.hunt_obj.context.next_client_due
-    if self.runner_args.client_rate > 0:
-      self.hunt_obj.context.next_client_due = (
-          next_client_due + 60.0 / self.runner_args.client_rate)
-      self.CallState(
-          messages=[client_id],
-          next_state="RegisterClient",
-          client_id=client_id,
-          start_time=next_client_due)
-    else:
-      self._RegisterAndRunClient(client_id)
+  def _StartPendingClients(self):
+    """Starts the clients added to the hunt during this processing pass.
 
-  def _RegisterAndRunClient(self, client_id):
-    self.hunt_obj.RegisterClient(client_id)
-    self.RunStateMethod("RunClient", direct_response=[client_id])
+    Clients are started in batches of at most Hunt.client_batch_size, every
+    batch needs a single request and notification instead of one per client.
+    With a client_rate, batches are shaped by a token bucket: it holds the
+    clients which may start within Hunt.client_rate_batch_interval and each
+    batch is delayed until the bucket has been refilled for all its clients
+    at client_rate clients a minute.
+    """
+    client_ids, self.pending_clients = self.pending_clients, []
+    requests, self.pending_client_requests = self.pending_client_requests, []
+
+    batch_size = max(1, config_lib.CONFIG["Hunt.client_batch_size"])
+    client_rate = self.runner_args.client_rate
+    if client_rate > 0:
+      bucket_size = int(client_rate *
+                        config_lib.CONFIG["Hunt.client_rate_batch_interval"] /
+                        60.0)
+      batch_size = max(1, min(batch_size, bucket_size))
+
+    for i in xrange(0, len(client_ids), batch_size):
+      batch = client_ids[i:i + batch_size]
+      stats.STATS.RecordEvent("hunt_client_batch_size", len(batch))
+
+      if client_rate > 0:
+        self._ScheduleClients(batch)
+      else:
+        self._RegisterAndRunClients(batch)
+
+    # Only now that the clients have been started (or scheduled) the requests
+    # which added them can go, so a failure before this point leaves them
+    # queued.
+    for request in requests:
+      self.queue_manager.DeleteFlowRequestStates(self.session_id, request)
+
+  def _ScheduleClients(self, client_ids):
+    """Schedules a batch of clients to start once the client_rate allows."""
+    start_time = self.hunt_obj.context.next_client_due
+    self.hunt_obj.context.next_client_due = (
+        start_time + len(client_ids) * 60.0 / self.runner_args.client_rate)
+
+    self.CallState(
+        messages=list(client_ids),
+        next_state="RegisterClient",
+        start_time=start_time)
+
+    stats.STATS.IncrementCounter("hunt_clients_delayed", len(client_ids))
+    backlog = (self.hunt_obj.context.next_client_due.AsSecondsFromEpoch() -
+               rdfvalue.RDFDatetime.Now().AsSecondsFromEpoch())
+    stats.STATS.SetGaugeValue(
+        "hunt_client_backlog_seconds",
+        max(0, backlog),
+        fields=[str(self.session_id)])
+
+  def _RegisterAndRunClients(self, client_ids):
+    self.hunt_obj.RegisterClients(client_ids)
+    stats.STATS.IncrementCounter("hunt_clients_started", len(client_ids))
+
+    # Clients are run one by one so one failing client doesn't stop the
+    # others.
+    for client_id in client_ids:
+      self.RunStateMethod("RunClient", direct_response=[client_id])
 
   def _Process(self, request, responses, thread_pool=None, events=None):
     """Hunts process all responses concurrently in a threadpool."""
@@ -489,9 +620,9 @@ class HuntRunner(object):
       # Update the client count.
       self.hunt_obj.Set(self.hunt_obj.Schema.CLIENT_COUNT(client_count + 1))
 
-      # Add client to list of clients and optionally run it
-      # (if client_rate == 0).
-      self._AddClient(request.client_id)
+      # The client is started with all the others added in this processing
+      # pass.
+      self.pending_clients.append(request.client_id)
       return
 
     if request.next_state == "RegisterClient":
@@ -502,7 +633,12 @@ class HuntRunner(object):
       # hitting the client limit. If a user stops a hunt, it will go into the
       # "STOPPED" state.
       if state in ["STARTED", "PAUSED"]:
-        self._RegisterAndRunClient(request.client_id)
+        # Batches carry their clients as responses.
+        client_ids = [
+            response.payload for response in responses
+            if response.type == rdf_flows.GrrMessage.Type.MESSAGE
+        ]
+        self._RegisterAndRunClients(client_ids or [request.client_id])
       else:
         logging.debug(
             "Not starting client %s on hunt %s which is not running: %s",
@@ -576,7 +712,8 @@ class HuntRunner(object):
         expires=args.expiry_time.Expiry(),
         start_time=rdfvalue.RDFDatetime.Now(),
         usage_stats=rdf_stats.ClientResourcesStats(),
-        remaining_cpu_quota=args.cpu_limit,)
+        remaining_cpu_quota=args.cpu_limit,
+        client_counters_enabled=True)
 
     return context
 
@@ -866,19 +1003,47 @@ class GRRHunt(flow.FlowBase):
         creates_new_object_version=False,
         default="PAUSED")
 
+    COMPLETED_CLIENTS_BITMAP = aff4.Attribute(
+        "aff4:hunt_completed_clients_bitmap",
+        rdfvalue.RDFBytes,
+        "A bitmap of completed clients indexed by client registration order.",
+        versioned=False,
+        creates_new_object_version=False)
+
   args_type = None
 
+  # Attribute prefixes of the rows mapping clients to their registration
+  # positions and back.
+  CLIENT_POSITION_PREFIX = "hunt:client_position:"
+  POSITION_CLIENT_PREFIX = "hunt:position_client:"
+
   def Initialize(self):
     super(GRRHunt, self).Initialize()
     # Hunts run in multiple threads so we need to protect access.
     self.lock = threading.RLock()
     self.processed_responses = False
 
+    # Results waiting to be written by FlushResults, the clients they came
+    # from and when the oldest of them was added.
+    self.buffered_results = []
+    self.clients_with_buffered_results = set()
+    self.results_buffer_start = None
+
+    self.completed_clients_bitmap = ClientBitmap()
+    # Positions of registered clients which are written by the next Flush.
+    self.pending_client_positions = {}
+    # Completed clients which are set in the bitmap by the next Flush.
+    self.pending_completed_clients = []
+
     if "r" in self.mode:
       self.client_count = self.Get(self.Schema.CLIENT_COUNT)
       self.runner_args = self.Get(self.Schema.HUNT_RUNNER_ARGS)
       self.context = self.Get(self.Schema.HUNT_CONTEXT)
 
+      bitmap = self.Get(self.Schema.COMPLETED_CLIENTS_BITMAP)
+      if bitmap:
+        self.completed_clients_bitmap = ClientBitmap(bitmap.SerializeToString())
+
       args = self.Get(self.Schema.HUNT_ARGS)
       if args:
         self.args = args.payload
@@ -1014,6 +1179,11 @@ class GRRHunt(flow.FlowBase):
     return grr_collections.ClientUrnCollection(
         hunt_id.Add("CompletedClients"), token=token)
 
+  # Rows mapping clients to their position in the completed clients bitmap.
+  @property
+  def client_index_urn(self):
+    return self.urn.Add("ClientIndex")
+
   @property
   def results_metadata_urn(self):
     return self.urn.Add("ResultsMetadata")
@@ -1026,9 +1196,9 @@ class GRRHunt(flow.FlowBase):
   def creator(self):
     return self.context.creator
 
-  def _AddURNToCollection(self, urn, collection_urn):
-    grr_collections.ClientUrnCollection.StaticAdd(collection_urn, self.token,
-                                                  urn)
+  def _AddURNToCollection(self, urn, collection_urn, mutation_pool=None):
+    grr_collections.ClientUrnCollection.StaticAdd(
+        collection_urn, self.token, urn, mutation_pool=mutation_pool)
 
   def _AddHuntErrorToCollection(self, error, collection_urn):
     grr_collections.HuntErrorCollection.StaticAdd(collection_urn, self.token,
@@ -1037,12 +1207,116 @@ class GRRHunt(flow.FlowBase):
   def _ClientSymlinkUrn(self, client_id):
     return client_id.Add("flows").Add("%s:hunt" % (self.urn.Basename()))
 
+  def _UsesClientCounters(self):
+    """Hunts created before client counters existed count collections."""
+    return self.context is not None and self.context.client_counters_enabled
+
+  def _GetClientPositions(self, client_urns):
+    """Returns a dict of the registration positions of the given clients."""
+    positions = {}
+    with self.lock:
+      for client_urn in client_urns:
+        if client_urn in self.pending_client_positions:
+          positions[client_urn] = self.pending_client_positions[client_urn]
+
+    attributes = dict(
+        (self.CLIENT_POSITION_PREFIX + client_urn.Basename(), client_urn)
+        for client_urn in client_urns if client_urn not in positions)
+    for batch in utils.Grouper(attributes, 1000):
+      for attribute, value, _ in data_store.DB.ResolveMulti(
+          self.client_index_urn,
+          batch,
+          timestamp=data_store.DB.NEWEST_TIMESTAMP,
+          token=self.token):
+        positions[attributes[attribute]] = int(value)
+
+    return positions
+
   def RegisterClient(self, client_urn):
-    self._AddURNToCollection(client_urn, self.all_clients_collection_urn)
+    self.RegisterClients([client_urn])
+
+  def RegisterClients(self, client_urns):
+    """Registers several clients with one batch of data store writes."""
+    client_urns = [rdf_client.ClientURN(urn) for urn in client_urns]
+
+    if self._UsesClientCounters():
+      client_urns = self._AssignClientPositions(client_urns)
+
+    with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
+      for client_urn in client_urns:
+        self._AddURNToCollection(
+            client_urn,
+            self.all_clients_collection_urn,
+            mutation_pool=mutation_pool)
+
+  def _AssignClientPositions(self, client_urns):
+    """Gives new clients a position, returns the clients that were new.
+
+    The rows mapping clients to positions are only written by the next
+    Flush, right before the hunt context holding the clients count. A
+    client which already has a position is not counted again, unless its
+    rows were written by a flush that failed before the clients count was,
+    in which case the count is moved past its position.
+    """
+    with self.lock:
+      positions = self._GetClientPositions(client_urns)
+
+      new_clients = []
+      for client_urn in client_urns:
+        position = positions.get(client_urn)
+        if position is None:
+          position = self.context.clients_count
+          positions[client_urn] = position
+          self.pending_client_positions[client_urn] = position
+        elif position < self.context.clients_count:
+          continue
+
+        self.context.clients_count = position + 1
+        new_clients.append(client_urn)
+
+      return new_clients
+
+  def _SetCompletedClientsBits(self):
+    """Sets the bits of the clients completed since the last flush."""
+    with self.lock:
+      if not self.pending_completed_clients:
+        return
+
+      positions = self._GetClientPositions(self.pending_completed_clients)
+      for position in positions.itervalues():
+        self.completed_clients_bitmap.Set(position)
+
+      self.pending_completed_clients = []
+
+  def FlushClientPositions(self):
+    """Writes the positions of newly registered and completed clients."""
+    with self.lock:
+      self._SetCompletedClientsBits()
+      if not self.pending_client_positions:
+        return
+
+      with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
+        for client_urn, position in self.pending_client_positions.items():
+          mutation_pool.MultiSet(self.client_index_urn, {
+              self.CLIENT_POSITION_PREFIX + client_urn.Basename(): [position],
+              self.POSITION_CLIENT_PREFIX + "%010d" % position:
+                  [utils.SmartStr(client_urn)]
+          })
+
+      self.pending_client_positions = {}
 
   def RegisterCompletedClient(self, client_urn):
     self._AddURNToCollection(client_urn, self.completed_clients_collection_urn)
 
+    if self._UsesClientCounters():
+      with self.lock:
+        # Like the completed clients collection, the count includes clients
+        # that are marked as done more than once. The bitmap only tracks
+        # which registered clients are outstanding, the positions of all the
+        # clients completed in between two flushes are read at once.
+        self.pending_completed_clients.append(rdf_client.ClientURN(client_urn))
+        self.context.completed_clients_count += 1
+
   def RegisterClientWithResults(self, client_urn):
     self._AddURNToCollection(client_urn,
                              self.clients_with_results_collection_urn)
@@ -1054,6 +1328,10 @@ class GRRHunt(flow.FlowBase):
 
     self._AddHuntErrorToCollection(error, self.clients_errors_collection_urn)
 
+    if self._UsesClientCounters():
+      with self.lock:
+        self.context.clients_errors_count += 1
+
   def OnDelete(self, deletion_pool=None):
     super(GRRHunt, self).OnDelete(deletion_pool=deletion_pool)
 
@@ -1203,31 +1481,87 @@ class GRRHunt(flow.FlowBase):
     self.GetRunner().Stop()
 
   def AddResultsToCollection(self, responses, client_id):
+    """Buffers the results of a client until the next FlushResults.
+
+    Results of many clients are written together, the buffer is flushed when
+    it holds Hunt.results_buffer_size results, when its oldest result is older
+    than Hunt.results_buffer_max_delay seconds and whenever the hunt is
+    flushed or closed.
+
+    Args:
+      responses: The responses of the client's flow.
+      client_id: The client the responses came from.
+    """
     if responses.success:
       with self.lock:
         self.processed_responses = True
 
-        msgs = [
+        if not responses:
+          return
+
+        if not self.buffered_results:
+          self.results_buffer_start = time.time()
+
+        self.buffered_results.extend(
             rdf_flows.GrrMessage(payload=response, source=client_id)
-            for response in responses
-        ]
+            for response in responses)
+        self.clients_with_buffered_results.add(client_id)
+
+        if (len(self.buffered_results) >=
+            config_lib.CONFIG["Hunt.results_buffer_size"] or
+            time.time() - self.results_buffer_start >=
+            config_lib.CONFIG["Hunt.results_buffer_max_delay"]):
+          self.FlushResults()
+    else:
+      self.LogClientError(
+          client_id, log_message=utils.SmartStr(responses.status))
+
+  def FlushResults(self):
+    """Writes all buffered results with a single mutation pool."""
+    with self.lock:
+      msgs = self.buffered_results
+      client_ids = self.clients_with_buffered_results
+      if not msgs:
+        return
 
+      with data_store.DB.GetMutationPool(token=self.token) as mutation_pool:
         for msg in msgs:
           hunts_results.HuntResultCollection.StaticAdd(
-              self.results_collection_urn, self.token, msg)
+              self.results_collection_urn,
+              self.token,
+              msg,
+              mutation_pool=mutation_pool)
 
         for msg in msgs:
           multi_type_collection.MultiTypeCollection.StaticAdd(
-              self.multi_type_output_urn, self.token, msg)
-
-        if responses:
-          self.RegisterClientWithResults(client_id)
-
-        # Update stats.
-        stats.STATS.IncrementCounter("hunt_results_added", delta=len(msgs))
-    else:
-      self.LogClientError(
-          client_id, log_message=utils.SmartStr(responses.status))
+              self.multi_type_output_urn,
+              self.token,
+              msg,
+              mutation_pool=mutation_pool)
+
+        for client_id in client_ids:
+          self._AddURNToCollection(
+              client_id,
+              self.clients_with_results_collection_urn,
+              mutation_pool=mutation_pool)
+
+      self.buffered_results = []
+      self.clients_with_buffered_results = set()
+      self.results_buffer_start = None
+
+      # Update stats.
+      stats.STATS.IncrementCounter("hunt_results_added", delta=len(msgs))
+      stats.STATS.RecordEvent("hunt_results_batch_size", len(msgs))
+
+  def Flush(self, sync=True):
+    self.FlushResults()
+    self.FlushClientPositions()
+    super(GRRHunt, self).Flush(sync=sync)
+
+  def Close(self, sync=True):
+    self.FlushResults()
+    self.FlushClientPositions()
+    super(GRRHunt, self).Close(sync=sync)
 
   def CallFlow(self,
                flow_name=None,
@@ -1354,6 +1688,10 @@ class GRRHunt(flow.FlowBase):
     """
 
   def GetClientsCounts(self):
+    """Returns the number of started, completed and errored clients."""
+    if self._UsesClientCounters():
+      return (self.context.clients_count, self.context.completed_clients_count,
+              self.context.clients_errors_count)
 
     collections_dict = dict(
         (urn, col_type(urn, token=self.token))
@@ -1394,6 +1732,40 @@ class GRRHunt(flow.FlowBase):
         self.session_id, token=self.token)
     return set(col.GenerateItems())
 
+  def GetOutstandingClients(self):
+    """Returns the set of clients that were started but haven't completed."""
+    if not self._UsesClientCounters():
+      return self.GetClients() - self.GetCompletedClients()
+
+    self._SetCompletedClientsBits()
+    attributes = [
+        self.POSITION_CLIENT_PREFIX + "%010d" % position
+        for position in self.completed_clients_bitmap.IterUnset(
+            self.context.clients_count)
+    ]
+
+    outstanding = set()
+    for batch in utils.Grouper(attributes, 1000):
+      for _, value, _ in data_store.DB.ResolveMulti(
+          self.client_index_urn,
+          batch,
+          timestamp=data_store.DB.NEWEST_TIMESTAMP,
+          token=self.token):
+        outstanding.add(rdf_client.ClientURN(value))
+
+    return outstanding
+
+  def GetClientsWithStatus(self, status):
+    """Returns the set of clients with a given status."""
+    if status == "STARTED":
+      return self.GetClients()
+    elif status == "COMPLETED":
+      return self.GetCompletedClients()
+    elif status == "OUTSTANDING":
+      return self.GetOutstandingClients()
+    else:
+      raise ValueError("Unknown client status: %s" % status)
+
   def GetClientsByStatus(self):
     """Get all the clients in a dict of {status: [client_list]}."""
     started = self.GetClients()
@@ -1459,9 +1831,23 @@ class GRRHunt(flow.FlowBase):
       self.Set(self.Schema.HUNT_CONTEXT(self.context))
       self.Set(self.Schema.HUNT_RUNNER_ARGS(self.runner_args))
 
+      if self.completed_clients_bitmap.dirty:
+        self.Set(
+            self.Schema.COMPLETED_CLIENTS_BITMAP(
+                self.completed_clients_bitmap.SerializeToString()))
+        self.completed_clients_bitmap.dirty = False
+
 
 class HuntInitHook(registry.InitHook):
 
   def RunOnce(self):
     """Register standard hunt-related stats."""
     stats.STATS.RegisterCounterMetric("hunt_results_added")
+    stats.STATS.RegisterEventMetric("hunt_results_batch_size")
+
+    stats.STATS.RegisterCounterMetric("hunt_clients_started")
+    stats.STATS.RegisterCounterMetric("hunt_clients_delayed")
+    stats.STATS.RegisterEventMetric("hunt_client_batch_size")
+    # How long the clients scheduled so far wait for the client_rate.
+    stats.STATS.RegisterGaugeMetric(
+        "hunt_client_backlog_seconds", float, fields=[("hunt", str)])
@@ -96,6 +96,7 @@ class HuntResultCollection(sequential_collection.GrrMessageCollection):
                 rdf_value,
                 timestamp=None,
                 suffix=None,
+                mutation_pool=None,
                 **kwargs):
     ts = super(HuntResultCollection, cls).StaticAdd(
         collection_urn,
@@ -103,12 +104,16 @@ class HuntResultCollection(sequential_collection.GrrMessageCollection):
         rdf_value,
         timestamp=timestamp,
         suffix=suffix,
+        mutation_pool=mutation_pool,
         **kwargs)
-    HuntResultQueue.StaticAdd(RESULT_NOTIFICATION_QUEUE, token,
-                              HuntResultNotification(
-                                  result_collection_urn=collection_urn,
-                                  timestamp=ts[0],
-                                  suffix=ts[1]))
+    HuntResultQueue.StaticAdd(
+        RESULT_NOTIFICATION_QUEUE,
+        token,
+        HuntResultNotification(
+            result_collection_urn=collection_urn,
+            timestamp=ts[0],
+            suffix=ts[1]),
+        mutation_pool=mutation_pool)
     return ts
 
 
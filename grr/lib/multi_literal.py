@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""Searching data for many literals in a single pass."""
+
+
+import re
+
+from grr.lib import utils
+
+
+def _TrieToRegex(node):
+  """Builds a regular expression matching all the literals of a trie node."""
+  branches = []
+  for char, child in sorted(node.iteritems()):
+    if not char:
+      continue
+
+    # Collapse chains of nodes with a single child, this keeps the recursion
+    # depth bounded by the number of branching points instead of the length
+    # of the literals.
+    prefix = [char]
+    while len(child) == 1 and "" not in child:
+      char, child = child.items()[0]
+      prefix.append(char)
+
+    branches.append(re.escape("".join(prefix)) + _TrieToRegex(child))
+
+  if not branches:
+    return ""
+
+  if len(branches) == 1 and "" not in node:
+    return branches[0]
+
+  # The longest literal wins when several of them start at the same offset.
+  pattern = "(?:%s)" % "|".join(branches)
+  if "" in node:
+    pattern += "?"
+  return pattern
+
+
+class MultiLiteralMatcher(object):
+  """Finds occurrences of any of a set of literals in a buffer.
+
+  The literals are compiled into a trie which is turned into a regular
+  expression, so the whole buffer is scanned once by the regex engine, no
+  matter how many literals there are. Searches take start and end offsets
+  into the buffer so no data is copied while scanning.
+  """
+
+  def __init__(self, literals):
+    self.literals = sorted(set(utils.SmartStr(l) for l in literals if l))
+    if not self.literals:
+      raise ValueError("At least one non empty literal is needed.")
+
+    self._regex = None
+    if len(self.literals) > 1:
+      trie = {}
+      for literal in self.literals:
+        node = trie
+        for char in literal:
+          node = node.setdefault(char, {})
+        node[""] = {}
+
+      self._regex = re.compile(_TrieToRegex(trie))
+
+  def Search(self, data, pos=0, endpos=None):
+    """Finds the first hit starting at or after pos.
+
+    Args:
+      data: The buffer to search.
+      pos: Offset in the buffer where the search starts.
+      endpos: Offset in the buffer where the search stops, hits have to end
+              before it.
+
+    Returns:
+      A tuple (offset, length) of the hit or (None, 0) if there is none.
+    """
+    if endpos is None:
+      endpos = len(data)
+
+    if self._regex is None:
+      literal = self.literals[0]
+      offset = data.find(literal, pos, endpos)
+      if offset == -1:
+        return None, 0
+      return offset, len(literal)
+
+    match = self._regex.search(data, pos, endpos)
+    if not match:
+      return None, 0
+    return match.start(), match.end() - match.start()
+
+  def FindIter(self, data, pos=0, endpos=None):
+    """Yields (start, end) tuples of all the hits, ordered by offset.
+
+    Hits may overlap, at most one hit (the longest) is reported for each
+    offset.
+
+    Args:
+      data: The buffer to search.
+      pos: Offset in the buffer where the search starts.
+      endpos: Offset in the buffer where the search stops.
+
+    Yields:
+      (start, end) tuples of offsets into the buffer.
+    """
+    while True:
+      offset, length = self.Search(data, pos, endpos)
+      if offset is None:
+        return
+
+      yield offset, offset + length
+      pos = offset + 1
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""Benchmarks searching data for many literals at once."""
+
+
+import os
+import time
+
+from grr.lib import flags
+from grr.lib import multi_literal
+from grr.lib import test_lib
+
+
+class MultiLiteralBenchmark(test_lib.MicroBenchmarks):
+  """Compares scanning throughput with a find() per literal."""
+
+  units = "s"
+
+  DATA_SIZE = 20 * 1024 * 1024
+  LITERAL_COUNTS = [1, 10, 100, 500]
+
+  def setUp(self):
+    super(MultiLiteralBenchmark, self).setUp(["MB/s"], ["<20"])
+    self.data = os.urandom(self.DATA_SIZE)
+
+  def _Literals(self, count):
+    return [os.urandom(4).encode("hex") for _ in xrange(count)]
+
+  def _AddThroughput(self, name, func):
+    start = time.time()
+    func()
+    time_taken = time.time() - start
+
+    self.AddResult(name, time_taken, 1,
+                   "%.2f" % (self.DATA_SIZE / 1024.0 / 1024 / time_taken))
+
+  def testScanThroughput(self):
+    """Scanning random data for sets of literals."""
+    for count in self.LITERAL_COUNTS:
+      literals = self._Literals(count)
+
+      def FindEach(literals=literals):
+        for literal in literals:
+          pos = self.data.find(literal)
+          while pos != -1:
+            pos = self.data.find(literal, pos + 1)
+
+      matcher = multi_literal.MultiLiteralMatcher(literals)
+
+      def FindAll(matcher=matcher):
+        for _ in matcher.FindIter(self.data):
+          pass
+
+      self._AddThroughput("find() x %d" % count, FindEach)
+      self._AddThroughput("MultiLiteralMatcher %d" % count, FindAll)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Tests for grr.lib.multi_literal."""
+
+
+from grr.lib import flags
+from grr.lib import multi_literal
+from grr.lib import test_lib
+
+
+class MultiLiteralMatcherTest(test_lib.GRRBaseTest):
+  """Tests the multi literal matcher."""
+
+  def _BruteForceHits(self, literals, data):
+    hits = []
+    for i in xrange(len(data)):
+      lengths = [len(l) for l in literals if data.startswith(l, i)]
+      if lengths:
+        hits.append((i, i + max(lengths)))
+    return hits
+
+  def testSingleLiteral(self):
+    matcher = multi_literal.MultiLiteralMatcher(["aa"])
+    self.assertEqual(list(matcher.FindIter("aaab")), [(0, 2), (1, 3)])
+    self.assertEqual(matcher.Search("baaa", 2), (2, 2))
+    self.assertEqual(matcher.Search("baaa", 0, 2), (None, 0))
+
+  def testFindsAllLiterals(self):
+    literals = ["he", "she", "his", "hers", "a.c", "\x00\xff", "s"]
+    data = "ushers say his a.c\x00\xff is hers, abc"
+
+    matcher = multi_literal.MultiLiteralMatcher(literals)
+    self.assertEqual(
+        list(matcher.FindIter(data)), self._BruteForceHits(literals, data))
+
+  def testLongestLiteralWins(self):
+    matcher = multi_literal.MultiLiteralMatcher(["ab", "abcd", "abc"])
+    self.assertEqual(matcher.Search("xxabcdx"), (2, 4))
+    self.assertEqual(matcher.Search("xxabcx"), (2, 3))
+    self.assertEqual(matcher.Search("xxabx"), (2, 2))
+
+  def testSearchRespectsOffsets(self):
+    matcher = multi_literal.MultiLiteralMatcher(["foo", "bar"])
+    data = "foo bar foo"
+
+    self.assertEqual(matcher.Search(data, 1), (4, 3))
+    self.assertEqual(matcher.Search(data, 5), (8, 3))
+    # Hits have to end before endpos.
+    self.assertEqual(matcher.Search(data, 1, 6), (None, 0))
+    self.assertEqual(list(matcher.FindIter(data, 1, 10)), [(4, 7)])
+
+  def testManyLongLiterals(self):
+    literals = ["%04d" % i * 100 for i in xrange(500)]
+    data = "x" + literals[123] + "y" + literals[321]
+
+    matcher = multi_literal.MultiLiteralMatcher(literals)
+    self.assertEqual(
+        list(matcher.FindIter(data)), [(1, 401), (402, 802)])
+
+  def testNoLiteralsRaises(self):
+    with self.assertRaises(ValueError):
+      multi_literal.MultiLiteralMatcher(["", ""])
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+"""Plugins that produce results in columnar Parquet files."""
+
+import itertools
+import os
+
+import pyarrow
+from pyarrow import parquet
+import yaml
+
+from grr.lib import instant_output_plugin
+from grr.lib import rdfvalue
+from grr.lib import utils
+from grr.lib.rdfvalues import structs as rdf_structs
+
+
+class _ParquetColumn(object):
+  """A typed column of a Parquet file built from a struct field."""
+
+  def __init__(self, name, path, arrow_type, converter):
+    self.name = name
+    # Names of the fields leading to the value (for embedded structs).
+    self.path = path
+    self.arrow_type = arrow_type
+    self.converter = converter
+
+  def GetValue(self, value):
+    for field_name in self.path[:-1]:
+      value = value.Get(field_name)
+
+    if not value.HasField(self.path[-1]):
+      return None
+
+    return self.converter(value.Get(self.path[-1]))
+
+
+def _AsInteger(value):
+  return int(value.SerializeToDataStore())
+
+
+def _AsMicroseconds(value):
+  return value.AsMicroSecondsFromEpoch()
+
+
+def _SecondsAsMicroseconds(value):
+  # RDFDatetimeSeconds values are stored in seconds.
+  return value.AsSecondsFromEpoch() * 1000000
+
+
+def _AsUnicode(value):
+  return utils.SmartUnicode(value)
+
+
+def _AsBytes(value):
+  return utils.SmartStr(value)
+
+
+def _GetColumnTypeAndConverter(type_info):
+  """Maps a struct field descriptor to an Arrow type and a value converter."""
+  # Order matters: ProtoBoolean is a ProtoEnum, ProtoFloat/ProtoDouble are
+  # ProtoUnsignedIntegers and ProtoEnum is a ProtoSignedInteger.
+  if isinstance(type_info, rdf_structs.ProtoBoolean):
+    return pyarrow.bool_(), bool
+  elif isinstance(type_info, rdf_structs.ProtoEnum):
+    return pyarrow.string(), _AsUnicode
+  elif isinstance(type_info, (rdf_structs.ProtoFloat, rdf_structs.ProtoDouble)):
+    return pyarrow.float64(), float
+  elif isinstance(type_info, rdf_structs.ProtoSignedInteger):
+    return pyarrow.int64(), long
+  elif isinstance(type_info, rdf_structs.ProtoUnsignedInteger):
+    return pyarrow.uint64(), long
+  elif isinstance(type_info, rdf_structs.ProtoBinary):
+    return pyarrow.binary(), _AsBytes
+  elif isinstance(type_info, rdf_structs.ProtoRDFValue):
+    if type_info.type and issubclass(type_info.type,
+                                     rdfvalue.RDFDatetimeSeconds):
+      return pyarrow.timestamp("us"), _SecondsAsMicroseconds
+    elif type_info.type and issubclass(type_info.type, rdfvalue.RDFDatetime):
+      return pyarrow.timestamp("us"), _AsMicroseconds
+
+    primitive_type = type_info.primitive_desc.__class__
+    if primitive_type is rdf_structs.ProtoSignedInteger:
+      return pyarrow.int64(), _AsInteger
+    elif primitive_type is rdf_structs.ProtoUnsignedInteger:
+      return pyarrow.uint64(), _AsInteger
+
+  return pyarrow.string(), _AsUnicode
+
+
+class _ParquetSink(object):
+  """File-like object collecting bytes written by the Parquet writer."""
+
+  def __init__(self):
+    self._stream = utils.RollingMemoryStream()
+    self.closed = False
+
+  def write(self, b):  # pylint: disable=invalid-name
+    self._stream.write(b)
+
+  def flush(self):  # pylint: disable=invalid-name
+    pass
+
+  def tell(self):  # pylint: disable=invalid-name
+    return self._stream.tell()
+
+  def close(self):  # pylint: disable=invalid-name
+    self.closed = True
+
+  def GetValueAndReset(self):
+    return self._stream.GetValueAndReset()
+
+
+class ParquetInstantOutputPlugin(
+    instant_output_plugin.InstantOutputPluginWithExportConversion):
+  """Instant output plugin that writes results to Parquet files."""
+
+  plugin_name = "parquet-zip"
+  friendly_name = "Parquet (zipped)"
+  description = "Output ZIP archive with columnar Parquet files."
+  output_file_extension = ".zip"
+
+  # Number of rows buffered in memory before they're written out as a single
+  # Parquet row group.
+  ROW_GROUP_SIZE = 10000
+  COMPRESSION = "snappy"
+
+  def _GetColumns(self, value_class, prefix=(), name_prefix=""):
+    columns = []
+    for type_info in value_class.type_infos:
+      path = prefix + (type_info.name,)
+      if isinstance(type_info, rdf_structs.ProtoEmbedded):
+        columns.extend(
+            self._GetColumns(
+                type_info.type,
+                prefix=path,
+                name_prefix=name_prefix + type_info.name + "."))
+      else:
+        arrow_type, converter = _GetColumnTypeAndConverter(type_info)
+        columns.append(
+            _ParquetColumn(name_prefix + type_info.name, path, arrow_type,
+                           converter))
+
+    return columns
+
+  def _GetRowGroup(self, columns, schema, values):
+    arrays = []
+    for column in columns:
+      arrays.append(
+          pyarrow.array(
+              [column.GetValue(value) for value in values],
+              type=column.arrow_type))
+
+    return pyarrow.Table.from_arrays(arrays, schema=schema)
+
+  @property
+  def path_prefix(self):
+    prefix, _ = os.path.splitext(self.output_file_name)
+    return prefix
+
+  def Start(self):
+    # Parquet files are already compressed, there's no need to deflate them
+    # once again.
+    self.archive_generator = utils.StreamingZipGenerator()
+    self.export_counts = {}
+    return []
+
+  def ProcessSingleTypeExportedValues(self, original_value_type,
+                                      exported_values):
+    first_value = next(exported_values, None)
+    if not first_value:
+      return
+
+    yield self.archive_generator.WriteFileHeader(
+        "%s/%s/from_%s.parquet" % (self.path_prefix,
+                                   first_value.__class__.__name__,
+                                   original_value_type.__name__))
+
+    # All values are guaranteed to have the same class (see
+    # ProcessSingleTypeExportedValues definition), so the schema is built from
+    # the first one.
+    columns = self._GetColumns(first_value.__class__)
+    schema = pyarrow.schema(
+        [pyarrow.field(column.name, column.arrow_type) for column in columns])
+
+    sink = _ParquetSink()
+    writer = parquet.ParquetWriter(sink, schema, compression=self.COMPRESSION)
+
+    counter = 0
+    for batch in utils.Grouper(
+        itertools.chain([first_value], exported_values), self.ROW_GROUP_SIZE):
+      counter += len(batch)
+
+      writer.write_table(self._GetRowGroup(columns, schema, batch))
+      yield self.archive_generator.WriteFileChunk(sink.GetValueAndReset())
+
+    writer.close()
+    yield self.archive_generator.WriteFileChunk(sink.GetValueAndReset())
+    yield self.archive_generator.WriteFileFooter()
+
+    self.export_counts.setdefault(
+        original_value_type.__name__,
+        dict())[first_value.__class__.__name__] = counter
+
+  def Finish(self):
+    manifest = {"export_stats": self.export_counts}
+
+    yield self.archive_generator.WriteFileHeader(self.path_prefix + "/MANIFEST")
+    yield self.archive_generator.WriteFileChunk(yaml.safe_dump(manifest))
+    yield self.archive_generator.WriteFileFooter()
+    yield self.archive_generator.Close()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""Compares Parquet and CSV instant output plugins on size and throughput."""
+
+import time
+import unittest
+
+from grr.lib import flags
+from grr.lib import rdfvalue
+from grr.lib import test_lib
+from grr.lib.output_plugins import csv_plugin
+from grr.lib.rdfvalues import client as rdf_client
+from grr.lib.rdfvalues import flows as rdf_flows
+from grr.lib.rdfvalues import paths as rdf_paths
+
+try:
+  # pylint: disable=g-import-not-at-top
+  from grr.lib.output_plugins import parquet_plugin
+  # pylint: enable=g-import-not-at-top
+except ImportError:
+  parquet_plugin = None
+
+
+class ParquetPluginBenchmark(test_lib.MicroBenchmarks):
+  """Benchmarks the Parquet plugin against the CSV one."""
+
+  NUM_VALUES = 50000
+
+  def setUp(self):
+    if parquet_plugin is None:
+      raise unittest.SkipTest("pyarrow is not installed, skipping.")
+    super(ParquetPluginBenchmark, self).setUp(["Size (bytes)", "Rows/s"],
+                                              ["<20", "<20"])
+    self.client_id = self.SetupClients(1)[0]
+
+    self.messages = []
+    for i in xrange(self.NUM_VALUES):
+      stat_entry = rdf_client.StatEntry(
+          pathspec=rdf_paths.PathSpec(
+              path="/usr/lib/foo/bar/%d" % i, pathtype="OS"),
+          st_mode=33184,
+          st_ino=1063090 + i,
+          st_size=i * 1024,
+          st_uid=139592,
+          st_gid=5000,
+          st_atime=1336469177 + i,
+          st_mtime=1336129892,
+          st_ctime=1336129892)
+      self.messages.append(
+          rdf_flows.GrrMessage(source=self.client_id, payload=stat_entry))
+
+  def _RunPlugin(self, plugin_cls):
+    plugin = plugin_cls(
+        source_urn=rdfvalue.RDFURN("aff4:/foo/bar"), token=self.token)
+
+    size = 0
+    start = time.time()
+    for chunk in plugin.Start():
+      size += len(chunk)
+    for chunk in plugin.ProcessValues(rdf_client.StatEntry,
+                                      lambda: self.messages):
+      size += len(chunk)
+    for chunk in plugin.Finish():
+      size += len(chunk)
+    time_taken = time.time() - start
+
+    self.AddResult(plugin_cls.__name__, time_taken, 1, size,
+                   "%d" % (self.NUM_VALUES / time_taken))
+
+  def testCSVvsParquet(self):
+    """Archive size and write throughput of StatEntry exports."""
+    self.units = "s"
+    for plugin_cls in [
+        csv_plugin.CSVInstantOutputPlugin,
+        parquet_plugin.ParquetInstantOutputPlugin
+    ]:
+      self._RunPlugin(plugin_cls)
+
+
+def main(argv):
+  test_lib.GrrTestProgram(argv=argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+# -*- mode: python; encoding: utf-8 -*-
+"""Tests for Parquet instant output plugin."""
+
+import datetime
+import os
+import unittest
+import zipfile
+
+import yaml
+
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.lib.output_plugins import test_plugins
+from grr.lib.rdfvalues import client as rdf_client
+from grr.lib.rdfvalues import paths as rdf_paths
+
+try:
+  # pylint: disable=g-import-not-at-top
+  import pyarrow
+  from pyarrow import parquet
+  from grr.lib.output_plugins import parquet_plugin
+  # pylint: enable=g-import-not-at-top
+except ImportError:
+  parquet_plugin = None
+
+
+class ParquetInstantOutputPluginTest(test_plugins.InstantOutputPluginTestBase):
+  """Tests the Parquet instant output plugin."""
+
+  plugin_cls = parquet_plugin and parquet_plugin.ParquetInstantOutputPlugin
+
+  def setUp(self):
+    if parquet_plugin is None:
+      raise unittest.SkipTest("pyarrow is not installed, skipping.")
+    super(ParquetInstantOutputPluginTest, self).setUp()
+
+  def ProcessValuesToZip(self, values_by_cls):
+    fd_path = self.ProcessValues(values_by_cls)
+    file_basename, _ = os.path.splitext(os.path.basename(fd_path))
+    return zipfile.ZipFile(fd_path), file_basename
+
+  def ReadTable(self, zip_fd, path):
+    return parquet.read_table(pyarrow.BufferReader(zip_fd.read(path)))
+
+  def testParquetPluginWithValuesOfSameType(self):
+    responses = []
+    for i in range(10):
+      responses.append(
+          rdf_client.StatEntry(
+              pathspec=rdf_paths.PathSpec(
+                  path="/foo/bar/%d" % i, pathtype="OS"),
+              st_mode=33184,  # octal = 100640 => u=rw,g=r,o= => -rw-r-----
+              st_ino=1063090,
+              st_nlink=1 + i,
+              st_atime=1336469177))
+
+    zip_fd, prefix = self.ProcessValuesToZip({rdf_client.StatEntry: responses})
+    self.assertEqual(
+        set(zip_fd.namelist()), {
+            "%s/MANIFEST" % prefix,
+            "%s/ExportedFile/from_StatEntry.parquet" % prefix
+        })
+
+    parsed_manifest = yaml.load(zip_fd.read("%s/MANIFEST" % prefix))
+    self.assertEqual(parsed_manifest,
+                     {"export_stats": {
+                         "StatEntry": {
+                             "ExportedFile": 10
+                         }
+                     }})
+
+    table = self.ReadTable(zip_fd,
+                           "%s/ExportedFile/from_StatEntry.parquet" % prefix)
+    self.assertEqual(table.num_rows, 10)
+
+    schema = table.schema
+    self.assertEqual(schema.field_by_name("st_mode").type, pyarrow.uint64())
+    self.assertEqual(schema.field_by_name("st_atime").type,
+                     pyarrow.timestamp("us"))
+    self.assertEqual(schema.field_by_name("urn").type, pyarrow.string())
+
+    rows = table.to_pydict()
+    for i in range(10):
+      self.assertEqual(rows["metadata.client_urn"][i], str(self.client_id))
+      self.assertEqual(rows["metadata.source_urn"][i], str(self.results_urn))
+      self.assertEqual(rows["urn"][i],
+                       self.client_id.Add("/fs/os/foo/bar").Add(str(i)))
+      self.assertEqual(rows["st_mode"][i], 33184)
+      self.assertEqual(rows["st_ino"][i], 1063090)
+      self.assertEqual(rows["st_nlink"][i], 1 + i)
+      self.assertEqual(rows["st_atime"][i],
+                       datetime.datetime(2012, 5, 8, 9, 26, 17))
+      # Fields that were not set are exported as nulls.
+      self.assertEqual(rows["st_ctime"][i], None)
+
+  def testParquetPluginWithValuesOfMultipleTypes(self):
+    zip_fd, prefix = self.ProcessValuesToZip({
+        rdf_client.StatEntry: [
+            rdf_client.StatEntry(pathspec=rdf_paths.PathSpec(
+                path="/foo/bar", pathtype="OS"))
+        ],
+        rdf_client.Process: [rdf_client.Process(pid=42)]
+    })
+    self.assertEqual(
+        set(zip_fd.namelist()), {
+            "%s/MANIFEST" % prefix,
+            "%s/ExportedFile/from_StatEntry.parquet" % prefix,
+            "%s/ExportedProcess/from_Process.parquet" % prefix
+        })
+
+    table = self.ReadTable(zip_fd,
+                           "%s/ExportedProcess/from_Process.parquet" % prefix)
+    self.assertEqual(table.to_pydict()["pid"], [42])
+
+  def testParquetPluginWritesUnicodeValuesCorrectly(self):
+    zip_fd, prefix = self.ProcessValuesToZip({
+        rdf_client.StatEntry: [
+            rdf_client.StatEntry(pathspec=rdf_paths.PathSpec(
+                path="/中国新闻网新闻中", pathtype="OS"))
+        ]
+    })
+
+    table = self.ReadTable(zip_fd,
+                           "%s/ExportedFile/from_StatEntry.parquet" % prefix)
+    self.assertEqual(table.to_pydict()["urn"],
+                     [self.client_id.Add("/fs/os/中国新闻网新闻中")])
+
+  def testParquetPluginWritesMoreThanOneRowGroupCorrectly(self):
+    self.plugin.ROW_GROUP_SIZE = 10
+    num_rows = self.plugin.ROW_GROUP_SIZE * 2 + 1
+
+    responses = []
+    for i in range(num_rows):
+      responses.append(
+          rdf_client.StatEntry(pathspec=rdf_paths.PathSpec(
+              path="/foo/bar/%d" % i, pathtype="OS")))
+
+    zip_fd, prefix = self.ProcessValuesToZip({rdf_client.StatEntry: responses})
+    parquet_file = parquet.ParquetFile(
+        pyarrow.BufferReader(
+            zip_fd.read("%s/ExportedFile/from_StatEntry.parquet" % prefix)))
+    self.assertEqual(parquet_file.num_row_groups, 3)
+
+    urns = parquet_file.read().to_pydict()["urn"]
+    self.assertEqual(len(urns), num_rows)
+    for i in range(num_rows):
+      self.assertEqual(urns[i], self.client_id.Add("/fs/os/foo/bar/%d" % i))
+
+
+def main(argv):
+  test_lib.GrrTestProgram(argv=argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
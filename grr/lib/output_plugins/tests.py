@@ -9,5 +9,7 @@ except ImportError:
 
 from grr.lib.output_plugins import csv_plugin_test
 from grr.lib.output_plugins import email_plugin_test
+from grr.lib.output_plugins import parquet_plugin_benchmark_test
+from grr.lib.output_plugins import parquet_plugin_test
 from grr.lib.output_plugins import sqlite_plugin_test
 from grr.lib.output_plugins import yaml_plugin_test
@@ -11,6 +11,8 @@ import time
 
 import logging
 
+from grr.lib import aff4
+from grr.lib import client_wakeup
 from grr.lib import config_lib
 from grr.lib import data_store
 from grr.lib import rdfvalue
@@ -29,6 +31,17 @@ class MoreDataException(Error):
   """Raised when there is more data available."""
 
 
+class PrefetchedFlowData(object):
+  """Completed requests and responses of a flow read together with others."""
+
+  def __init__(self, completed_requests=None, responses=None):
+    # A list of (RequestState, status GrrMessage) tuples.
+    self.completed_requests = completed_requests or []
+    # Lists of (predicate, serialized response, timestamp) keyed by the
+    # response subject.
+    self.responses = responses or {}
+
+
 class QueueManager(object):
   """This class manages the representation of the flow within the data store.
 
@@ -89,6 +102,10 @@ class QueueManager(object):
 
   notification_shard_counters = {}
 
+  # The indices of the notification shards this process reads. None means all
+  # of them, worker processes started by a supervisor only read their share.
+  notification_shards_to_read = None
+
   def __init__(self, store=None, token=None):
     self.token = token
     if store is None:
@@ -110,6 +127,8 @@ class QueueManager(object):
     self.frozen_timestamp = None
 
     self.num_notification_shards = config_lib.CONFIG["Worker.queue_shards"]
+    self.num_well_known_flow_shards = config_lib.CONFIG[
+        "Worker.well_known_flow_shards"]
 
   def GetNotificationShard(self, queue):
     queue_name = str(queue)
@@ -123,6 +142,22 @@ class QueueManager(object):
     else:
       return queue
 
+  def GetNotificationShardToRead(self, queue):
+    """Returns the next notification shard this process should read."""
+    shards = QueueManager.notification_shards_to_read
+    if not shards:
+      return self.GetNotificationShard(queue)
+
+    queue_name = str(queue)
+    QueueManager.notification_shard_counters.setdefault(queue_name, 0)
+    QueueManager.notification_shard_counters[queue_name] += 1
+    notification_shard_index = shards[
+        QueueManager.notification_shard_counters[queue_name] % len(shards)]
+    if notification_shard_index > 0:
+      return queue.Add(str(notification_shard_index))
+    else:
+      return queue
+
   def GetAllNotificationShards(self, queue):
     result = [queue]
     for i in range(1, self.num_notification_shards):
@@ -175,6 +210,14 @@ class QueueManager(object):
     """The subject used to carry all the responses for a specific request_id."""
     return session_id.Add("state/request:%08X" % request_id)
 
+  def GetWellKnownFlowResponseSubject(self, session_id, shard):
+    """The subject used to carry one shard of a well known flow's responses."""
+    subject = self.GetFlowResponseSubject(session_id, 0)
+    if shard > 0:
+      return subject.Add(str(shard))
+    else:
+      return subject
+
   def DeQueueClientRequest(self, client_id, task_id):
     """Remove the message from the client queue that this request forms."""
     # Check this request was actually bound for a client.
@@ -228,15 +271,135 @@ class QueueManager(object):
         yield (rdf_flows.RequestState.FromSerializedString(serialized),
                rdf_flows.GrrMessage.FromSerializedString(status[request_id]))
 
-  def FetchCompletedResponses(self, session_id, timestamp=None, limit=10000):
-    """Fetch only completed requests and responses up to a limit."""
+  def PrefetchCompletedResponses(self, notifications, limit=10000):
+    """Reads the completed requests and responses of many flows at once.
+
+    Instead of two data store round trips per flow this needs two round trips
+    for all the flows. Every flow only gets the data written before its
+    notification, just like FetchCompletedResponses with a timestamp of
+    (0, notification.timestamp) would.
+
+    Args:
+      notifications: The notifications of the flows to read.
+      limit: The number of responses read per flow, more responses are read by
+             FetchCompletedResponses later.
+
+    Returns:
+      A dict of PrefetchedFlowData objects keyed by session id. Flows that
+      have too many requests to read at once are left out.
+    """
+    end_times = {}
+    state_subjects = {}
+    for notification in notifications:
+      session_id = notification.session_id
+      end_times[session_id] = int(notification.timestamp or
+                                  rdfvalue.RDFDatetime.Now())
+      state_subjects[str(session_id.Add("state"))] = session_id
+
+    if not end_times:
+      return {}
+
+    timestamp = (0, max(end_times.values()))
+
+    # The data store applies the limit to all the subjects together so it has
+    # to allow for request_limit values per flow.
+    values_limit = self.request_limit * len(state_subjects)
+    num_values = 0
+
+    result = {session_id: PrefetchedFlowData() for session_id in end_times}
+    requests = {}
+    status = {}
+    for subject, values in self.data_store.MultiResolvePrefix(
+        state_subjects, [self.FLOW_REQUEST_PREFIX, self.FLOW_STATUS_PREFIX],
+        token=self.token,
+        limit=values_limit,
+        timestamp=timestamp):
+      num_values += len(values)
+      session_id = state_subjects[subject]
+      for predicate, serialized, ts in values:
+        if ts > end_times[session_id]:
+          continue
+
+        parts = predicate.split(":", 3)
+        request_id = parts[2]
+        if parts[1] == "status":
+          status.setdefault(session_id, {})[request_id] = serialized
+        else:
+          requests.setdefault(session_id, {})[request_id] = serialized
+
+    if num_values >= values_limit:
+      # Some flows may be missing requests, they are read one by one instead.
+      return {}
+
+    # Same response subjects as the first pass of FetchCompletedResponses.
+    response_subjects = {}
+    for session_id, flow_requests in requests.iteritems():
+      flow_status = status.get(session_id, {})
+      projected_total_size = 0
+      for request_id, serialized in sorted(flow_requests.items()):
+        if request_id not in flow_status:
+          continue
+
+        request = rdf_flows.RequestState.FromSerializedString(serialized)
+        request_status = rdf_flows.GrrMessage.FromSerializedString(
+            flow_status[request_id])
+        result[session_id].completed_requests.append((request, request_status))
+
+        if projected_total_size <= limit:
+          response_subject = self.GetFlowResponseSubject(session_id, request.id)
+          response_subjects[str(response_subject)] = session_id
+          projected_total_size += request_status.response_id
+
+    if response_subjects:
+      response_data = dict(
+          self.data_store.MultiResolvePrefix(
+              response_subjects,
+              self.FLOW_RESPONSE_PREFIX,
+              token=self.token,
+              timestamp=timestamp))
+
+      for response_subject, session_id in response_subjects.iteritems():
+        result[session_id].responses[response_subject] = [
+            value for value in response_data.get(response_subject, [])
+            if value[2] <= end_times[session_id]
+        ]
+
+    return result
+
+  def FetchCompletedResponses(self,
+                              session_id,
+                              timestamp=None,
+                              limit=10000,
+                              prefetched_data=None):
+    """Fetch only completed requests and responses up to a limit.
+
+    Args:
+      session_id: The session id of the flow.
+      timestamp: Tuple (start, end) with a time range. Fetched requests and
+                 responses will have timestamp in this range.
+      limit: The number of responses after which MoreDataException is raised.
+      prefetched_data: A PrefetchedFlowData object as returned by
+                       PrefetchCompletedResponses for the same timestamp. Only
+                       the responses missing from it are read.
+
+    Yields:
+      Tuples of (request, list of responses) in ascending order of request
+      ids.
+
+    Raises:
+      MoreDataException: When there is more data available than the limit.
+    """
 
     if timestamp is None:
       timestamp = (0, self.frozen_timestamp or rdfvalue.RDFDatetime.Now())
 
-    completed_requests = collections.deque(
-        self.FetchCompletedRequests(
-            session_id, timestamp=timestamp))
+    if prefetched_data is not None:
+      completed_requests = collections.deque(
+          prefetched_data.completed_requests)
+    else:
+      completed_requests = collections.deque(
+          self.FetchCompletedRequests(
+              session_id, timestamp=timestamp))
 
     total_size = 0
     while True:
@@ -263,12 +426,19 @@ class QueueManager(object):
         if projected_total_size > limit:
           break
 
-      response_data = dict(
-          self.data_store.MultiResolvePrefix(
-              response_subjects,
-              self.FLOW_RESPONSE_PREFIX,
-              token=self.token,
-              timestamp=timestamp))
+      if prefetched_data is not None and all(
+          str(subject) in prefetched_data.responses
+          for subject in response_subjects):
+        response_data = dict(
+            (subject, prefetched_data.responses[str(subject)])
+            for subject in response_subjects)
+      else:
+        response_data = dict(
+            self.data_store.MultiResolvePrefix(
+                response_subjects,
+                self.FLOW_RESPONSE_PREFIX,
+                token=self.token,
+                timestamp=timestamp))
       for response_urn, request in sorted(response_subjects.items()):
         responses = []
         for _, serialized, _ in response_data.get(response_urn, []):
@@ -410,6 +580,11 @@ class QueueManager(object):
               timestamp=timestamp,
               mutation_pool=mutation_pool)
 
+    # Only announce the new tasks once they are written.
+    if self.new_client_messages:
+      client_wakeup.PublishQueues(
+          set(msg.queue for msg, _ in self.new_client_messages))
+
     if self.notifications:
       for notification, timestamp in self.notifications.itervalues():
         self.NotifyQueue(
@@ -423,6 +598,24 @@ class QueueManager(object):
     self.notifications = {}
     self.new_client_messages = []
 
+  # The session ids of the well known flows and the number of registered AFF4
+  # classes they were collected from.
+  _well_known_session_ids = (0, frozenset())
+
+  def _IsWellKnownFlow(self, session_id):
+    """Returns True if session_id belongs to a registered well known flow."""
+    classes = aff4.AFF4Object.classes
+    num_classes, session_ids = QueueManager._well_known_session_ids
+    if num_classes != len(classes):
+      # Flows can be registered at any time, e.g. by tests.
+      session_ids = frozenset(
+          utils.SmartStr(cls.well_known_session_id)
+          for cls in classes.values()
+          if getattr(cls, "well_known_session_id", None))
+      QueueManager._well_known_session_ids = (len(classes), session_ids)
+
+    return utils.SmartStr(session_id) in session_ids
+
   def QueueResponse(self, session_id, response, timestamp=None):
     """Queues the message on the flow's state."""
     if timestamp is None:
@@ -437,7 +630,15 @@ class QueueManager(object):
       queue.setdefault(self.FLOW_STATUS_TEMPLATE % response.request_id,
                        []).append((response.SerializeToString(), timestamp))
 
-    subject = self.GetFlowResponseSubject(session_id, response.request_id)
+    if response.request_id == 0 and self._IsWellKnownFlow(session_id):
+      # Responses to well known flows are spread over several subjects so
+      # they can be drained by several workers at the same time.
+      shard = hash((utils.SmartStr(response.source),
+                    response.response_id)) % self.num_well_known_flow_shards
+      subject = self.GetWellKnownFlowResponseSubject(session_id, shard)
+    else:
+      subject = self.GetFlowResponseSubject(session_id, response.request_id)
+
     queue = self.to_write.setdefault(subject, {})
     queue.setdefault(QueueManager.FLOW_RESPONSE_TEMPLATE %
                      (response.request_id, response.response_id), []).append(
@@ -523,9 +724,11 @@ class QueueManager(object):
     if timestamp is None:
       timestamp = self.frozen_timestamp
 
+    queues = []
     for queue, queued_tasks in utils.GroupBy(tasks,
                                              lambda x: x.queue).iteritems():
       if queue:
+        queues.append(queue)
         to_schedule = dict([(self._TaskIdToColumn(task.task_id),
                              [task.SerializeToString()])
                             for task in queued_tasks])
@@ -540,6 +743,11 @@ class QueueManager(object):
               sync=sync,
               token=self.token)
 
+    # Tasks written through a mutation pool are announced by the caller once
+    # the pool is flushed.
+    if not mutation_pool:
+      client_wakeup.PublishQueues(queues)
+
   def _SortByPriority(self, notifications, queue, output_dict=None):
     """Sort notifications by priority into output_dict."""
     if output_dict is None:
@@ -565,7 +773,7 @@ class QueueManager(object):
     """Retrieves session ids for processing grouped by priority."""
     # Check which sessions have new data.
     # Read all the sessions that have notifications.
-    queue_shard = self.GetNotificationShard(queue)
+    queue_shard = self.GetNotificationShardToRead(queue)
     return self._SortByPriority(
         self._GetUnsortedNotifications(queue_shard).values(), queue)
 
@@ -588,7 +796,7 @@ class QueueManager(object):
 
   def GetNotifications(self, queue):
     """Returns all queue notifications sorted by priority."""
-    queue_shard = self.GetNotificationShard(queue)
+    queue_shard = self.GetNotificationShardToRead(queue)
     notifications = self._GetUnsortedNotifications(queue_shard).values()
     notifications.sort(
         key=lambda notification: notification.priority, reverse=True)
@@ -907,20 +1115,35 @@ class QueueManager(object):
 
 
 class WellKnownQueueManager(QueueManager):
-  """A flow manager for well known flows."""
+  """A flow manager for well known flows.
+
+  The responses to a well known flow are spread over
+  Worker.well_known_flow_shards subjects. Each shard is locked on its own while
+  it is read and emptied, so several workers can drain a busy well known flow
+  at the same time without locking the flow itself.
+  """
 
   response_limit = 10000
 
+  def _WellKnownFlowResponseSubjects(self, session_id):
+    return [
+        self.GetWellKnownFlowResponseSubject(session_id, shard)
+        for shard in range(self.num_well_known_flow_shards)
+    ]
+
   def DeleteWellKnownFlowResponses(self, session_id, responses):
     """Deletes given responses from the flow state queue."""
-    subject = session_id.Add("state/request:00000000")
     predicates = []
     for response in responses:
       predicates.append(QueueManager.FLOW_RESPONSE_TEMPLATE %
                         (response.request_id, response.response_id))
 
-    self.data_store.DeleteAttributes(
-        subject, predicates, sync=True, start=0, token=self.token)
+    self.data_store.MultiDeleteAttributes(
+        self._WellKnownFlowResponseSubjects(session_id),
+        predicates,
+        sync=True,
+        start=0,
+        token=self.token)
 
   def FetchRequestsAndResponses(self, session_id):
     """Well known flows do not have real requests.
@@ -934,17 +1157,16 @@ class WellKnownQueueManager(QueueManager):
     Yields:
       A tuple of request (None) and responses.
     """
-    subject = session_id.Add("state/request:00000000")
+    response_data = self.data_store.MultiResolvePrefix(
+        self._WellKnownFlowResponseSubjects(session_id),
+        self.FLOW_RESPONSE_PREFIX,
+        token=self.token,
+        limit=self.response_limit,
+        timestamp=(0, self.frozen_timestamp or rdfvalue.RDFDatetime.Now()))
 
     # Get some requests
     for _, serialized, _ in sorted(
-        self.data_store.ResolvePrefix(
-            subject,
-            self.FLOW_RESPONSE_PREFIX,
-            token=self.token,
-            limit=self.response_limit,
-            timestamp=(0, self.frozen_timestamp or rdfvalue.RDFDatetime.Now()
-                      ))):
+        value for _, values in response_data for value in values):
 
       # The predicate format is flow:response:REQUEST_ID:RESPONSE_ID. For well
       # known flows both request_id and response_id are randomized.
@@ -952,6 +1174,76 @@ class WellKnownQueueManager(QueueManager):
 
       yield rdf_flows.RequestState(id=0), [response]
 
+  def FetchAndRemoveShardResponses(self, session_id, shard, lease_time=None):
+    """Reads and deletes the responses in one shard of a well known flow.
+
+    Args:
+      session_id: The session_id of the well known flow.
+      shard: The index of the shard.
+      lease_time: How long the shard stays locked at most.
+
+    Returns:
+      A list of responses.
+
+    Raises:
+      DBSubjectLockError: If another worker is draining this shard.
+    """
+    subject = self.GetWellKnownFlowResponseSubject(session_id, shard)
+    with self.data_store.LockRetryWrapper(
+        subject, blocking=False, lease_time=lease_time, token=self.token):
+      predicates = []
+      responses = []
+      for predicate, serialized, _ in sorted(
+          self.data_store.ResolvePrefix(
+              subject,
+              self.FLOW_RESPONSE_PREFIX,
+              token=self.token,
+              limit=self.response_limit,
+              timestamp=(0, self.frozen_timestamp or
+                         rdfvalue.RDFDatetime.Now()))):
+        predicates.append(predicate)
+        responses.append(rdf_flows.GrrMessage.FromSerializedString(serialized))
+
+      if predicates:
+        self.data_store.DeleteAttributes(
+            subject, predicates, sync=True, start=0, token=self.token)
+
+    stats.STATS.SetGaugeValue(
+        "well_known_flow_shard_backlog",
+        len(responses),
+        fields=[session_id.FlowName(), str(shard)])
+    return responses
+
+  def FetchAndRemoveResponses(self, session_id, lease_time=None):
+    """Drains all the shards of a well known flow which are not busy.
+
+    Args:
+      session_id: The session_id of the well known flow.
+      lease_time: How long each shard stays locked at most.
+
+    Returns:
+      A tuple of the list of responses and the number of shards which were
+      skipped because another worker is draining them.
+    """
+    responses = []
+    busy_shards = 0
+
+    # Start at a random shard so workers don't queue up behind each other.
+    offset = random.randrange(self.num_well_known_flow_shards)
+    for i in range(self.num_well_known_flow_shards):
+      shard = (offset + i) % self.num_well_known_flow_shards
+      try:
+        responses.extend(
+            self.FetchAndRemoveShardResponses(
+                session_id, shard, lease_time=lease_time))
+      except data_store.DBSubjectLockError:
+        busy_shards += 1
+        stats.STATS.IncrementCounter(
+            "well_known_flow_shard_lock_errors",
+            fields=[session_id.FlowName()])
+
+    return responses, busy_shards
+
 
 class QueueManagerInit(registry.InitHook):
   """Registers vars used by the QueueManager."""
@@ -960,6 +1252,12 @@ class QueueManagerInit(registry.InitHook):
     # Counters used by the QueueManager.
     stats.STATS.RegisterCounterMetric("grr_task_retransmission_count")
     stats.STATS.RegisterCounterMetric("grr_task_ttl_expired_count")
+    stats.STATS.RegisterGaugeMetric(
+        "well_known_flow_shard_backlog",
+        int,
+        fields=[("flow", str), ("shard", str)])
+    stats.STATS.RegisterCounterMetric(
+        "well_known_flow_shard_lock_errors", fields=[("flow", str)])
     stats.STATS.RegisterGaugeMetric(
         "notification_queue_count",
         int,
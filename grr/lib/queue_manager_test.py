@@ -13,6 +13,7 @@ from grr.lib import queues
 from grr.lib import rdfvalue
 from grr.lib import stats
 from grr.lib import test_lib
+from grr.lib import utils
 from grr.lib.rdfvalues import flows as rdf_flows
 
 # pylint: mode=test
@@ -160,6 +161,166 @@ class QueueManagerTest(test_lib.FlowTestsBaseclass):
       # Responses contain just the status message.
       self.assertEqual(len(responses), 1)
 
+  def testPrefetchCompletedResponses(self):
+    session_ids = [
+        rdfvalue.SessionID(flow_name="prefetch%d" % i) for i in range(3)
+    ]
+
+    with queue_manager.QueueManager(token=self.token) as manager:
+      for i, session_id in enumerate(session_ids):
+        # Flow i has i completed requests and one without a status.
+        for request_id in range(1, i + 2):
+          manager.QueueRequest(session_id,
+                               rdf_flows.RequestState(
+                                   id=request_id,
+                                   client_id=self.client_id,
+                                   next_state="TestState",
+                                   session_id=session_id))
+          for response_id in range(1, 5):
+            manager.QueueResponse(session_id,
+                                  rdf_flows.GrrMessage(
+                                      request_id=request_id,
+                                      response_id=response_id))
+
+          if request_id <= i:
+            manager.QueueResponse(
+                session_id,
+                rdf_flows.GrrMessage(
+                    request_id=request_id,
+                    response_id=5,
+                    type=rdf_flows.GrrMessage.Type.STATUS))
+
+    manager = queue_manager.QueueManager(token=self.token)
+    notifications = [
+        rdf_flows.GrrNotification(
+            session_id=session_id, timestamp=rdfvalue.RDFDatetime.Now())
+        for session_id in session_ids
+    ]
+
+    calls = []
+
+    def CountingMultiResolvePrefix(*args, **kwargs):
+      calls.append(args)
+      return multi_resolve_prefix(*args, **kwargs)
+
+    multi_resolve_prefix = data_store.DB.MultiResolvePrefix
+    with utils.Stubber(data_store.DB, "MultiResolvePrefix",
+                       CountingMultiResolvePrefix):
+      prefetched = manager.PrefetchCompletedResponses(notifications)
+      # Two round trips for all the flows.
+      self.assertEqual(len(calls), 2)
+
+      for i, session_id in enumerate(session_ids):
+        self.assertEqual(len(prefetched[session_id].completed_requests), i)
+        self.assertEqual(
+            list(
+                manager.FetchCompletedResponses(
+                    session_id, prefetched_data=prefetched[session_id])),
+            list(manager.FetchCompletedResponses(session_id)))
+
+      # Reading only the prefetched data doesn't use the data store.
+      del calls[:]
+      list(
+          manager.FetchCompletedResponses(
+              session_ids[2], prefetched_data=prefetched[session_ids[2]]))
+      self.assertEqual(calls, [])
+
+    # Data written after the notification is not prefetched.
+    self._current_mock_time += 10
+    with queue_manager.QueueManager(token=self.token) as manager:
+      manager.QueueResponse(
+          session_ids[0],
+          rdf_flows.GrrMessage(
+              request_id=1,
+              response_id=5,
+              type=rdf_flows.GrrMessage.Type.STATUS))
+
+    prefetched = manager.PrefetchCompletedResponses(notifications)
+    self.assertEqual(prefetched[session_ids[0]].completed_requests, [])
+
+  def testPrefetchCompletedResponsesLimitsRequestsPerFlow(self):
+    session_ids = [
+        rdfvalue.SessionID(flow_name="prefetch_limit%d" % i) for i in range(2)
+    ]
+
+    with queue_manager.QueueManager(token=self.token) as manager:
+      # The first flow has many completed requests, the second just one.
+      for session_id, num_requests in zip(session_ids, [5, 1]):
+        for request_id in range(1, num_requests + 1):
+          manager.QueueRequest(session_id,
+                               rdf_flows.RequestState(
+                                   id=request_id,
+                                   client_id=self.client_id,
+                                   next_state="TestState",
+                                   session_id=session_id))
+          manager.QueueResponse(
+              session_id,
+              rdf_flows.GrrMessage(
+                  request_id=request_id,
+                  response_id=1,
+                  type=rdf_flows.GrrMessage.Type.STATUS))
+
+    notifications = [
+        rdf_flows.GrrNotification(
+            session_id=session_id, timestamp=rdfvalue.RDFDatetime.Now())
+        for session_id in session_ids
+    ]
+
+    # Each flow fits into the limit on its own.
+    manager = queue_manager.QueueManager(token=self.token)
+    manager.request_limit = 10
+    prefetched = manager.PrefetchCompletedResponses(notifications)
+    self.assertEqual(len(prefetched[session_ids[0]].completed_requests), 5)
+    self.assertEqual(len(prefetched[session_ids[1]].completed_requests), 1)
+
+    # The first flow doesn't fit, so the flows are left for the per flow reads
+    # instead of being prefetched with missing requests.
+    manager.request_limit = 4
+    prefetched = manager.PrefetchCompletedResponses(notifications)
+    self.assertEqual(prefetched, {})
+    self.assertEqual(
+        len(list(manager.FetchCompletedRequests(session_ids[1]))), 1)
+
+  def testWellKnownFlowResponseShards(self):
+    session_id = test_lib.WellKnownSessionTest.well_known_session_id
+
+    with queue_manager.QueueManager(token=self.token) as manager:
+      for i in range(1, 21):
+        manager.QueueResponse(session_id,
+                              rdf_flows.GrrMessage(
+                                  session_id=session_id,
+                                  request_id=0,
+                                  response_id=i))
+
+    manager = queue_manager.WellKnownQueueManager(token=self.token)
+    used_shards = set()
+    for shard in range(manager.num_well_known_flow_shards):
+      if data_store.DB.ResolvePrefix(
+          manager.GetWellKnownFlowResponseSubject(session_id, shard),
+          manager.FLOW_RESPONSE_PREFIX,
+          token=self.token):
+        used_shards.add(shard)
+    self.assertGreater(len(used_shards), 1)
+
+    # All the shards are read together.
+    self.assertEqual(len(list(manager.FetchRequestsAndResponses(session_id))),
+                     20)
+
+    responses, busy_shards = manager.FetchAndRemoveResponses(session_id)
+    self.assertEqual(busy_shards, 0)
+    self.assertEqual(
+        sorted(response.response_id for response in responses),
+        range(1, 21))
+
+    total_backlog = sum(
+        stats.STATS.GetMetricValue(
+            "well_known_flow_shard_backlog", fields=["TestSessionId", str(i)])
+        for i in range(manager.num_well_known_flow_shards))
+    self.assertEqual(total_backlog, 20)
+
+    # Nothing is left.
+    self.assertEqual(list(manager.FetchRequestsAndResponses(session_id)), [])
+
   def testDeleteFlowRequestStates(self):
     """Check that we can efficiently destroy a single flow request."""
     session_id = rdfvalue.SessionID(flow_name="test3")
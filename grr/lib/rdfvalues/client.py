@@ -569,6 +569,11 @@ class BufferReference(structs.RDFProtoStruct):
     return self.data == other
 
 
+class FileChunkingRequest(structs.RDFProtoStruct):
+  """A request to hash a file in content defined chunks."""
+  protobuf = jobs_pb2.FileChunkingRequest
+
+
 class Process(structs.RDFProtoStruct):
   """Represent a process on the client."""
   protobuf = sysinfo_pb2.Process
@@ -27,12 +27,15 @@ class RegularExpression(rdfvalue.RDFString):
     except re.error:
       raise type_info.TypeValueError("Not a valid regular expression.")
 
-  def Search(self, text):
-    """Search the text for our value."""
+  def Search(self, text, pos=0, endpos=None):
+    """Search the text for our value, optionally between the given offsets."""
     if isinstance(text, rdfvalue.RDFString):
       text = str(text)
 
-    return self._regex.search(text)
+    if endpos is None:
+      endpos = len(text)
+
+    return self._regex.search(text, pos, endpos)
 
   def Match(self, text):
     if isinstance(text, rdfvalue.RDFString):
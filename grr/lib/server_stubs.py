@@ -219,6 +219,13 @@ class HashBuffer(ClientActionStub):
   out_rdfvalues = [rdf_client.BufferReference]
 
 
+class HashFileChunks(ClientActionStub):
+  """Splits a file into content defined chunks and returns their hashes."""
+
+  in_rdfvalue = rdf_client.FileChunkingRequest
+  out_rdfvalues = [rdf_client.BufferReference]
+
+
 class HashFile(ClientActionStub):
   """Hash an entire file using multiple algorithms."""
 
@@ -53,6 +53,7 @@ from grr.lib import config_lib
 from grr.lib import data_store
 from grr.lib import email_alerts
 from grr.lib import events
+from grr.lib import export
 from grr.lib import flags
 from grr.lib import flow
 # pylint: disable=unused-import
@@ -464,6 +465,7 @@ class GRRBaseTest(unittest.TestCase):
       self.InitDatastore()
 
     aff4.FACTORY.Flush()
+    export.CLIENT_METADATA_CACHE.Flush()
 
     # Create a Foreman and Filestores, they are used in many tests.
     aff4_grr.GRRAFF4Init().Run()
@@ -17,15 +17,19 @@ except ImportError:
 
 from grr.lib import build_test
 from grr.lib import client_index_test
+from grr.lib import client_wakeup_test
+from grr.lib import communicator_benchmark_test
 from grr.lib import communicator_test
 from grr.lib import config_lib_test
 from grr.lib import config_validation_test
 from grr.lib import console_utils_test
 from grr.lib import data_store_test
+from grr.lib import data_store_tracer_test
 from grr.lib import email_alerts_test
 from grr.lib import events_test
 from grr.lib import export_test
 from grr.lib import export_utils_test
+from grr.lib import flow_profiler_test
 from grr.lib import flow_test
 from grr.lib import flow_utils_test
 from grr.lib import front_end_test
@@ -35,6 +39,8 @@ from grr.lib import instant_output_plugin_test
 from grr.lib import ipv6_utils_test
 from grr.lib import lexer_test
 from grr.lib import log_test
+from grr.lib import multi_literal_benchmark_test
+from grr.lib import multi_literal_test
 from grr.lib import multi_type_collection_test
 from grr.lib import objectfilter_test
 from grr.lib import output_plugin_test
@@ -46,6 +52,7 @@ from grr.lib import sequential_collection_test
 from grr.lib import server_stubs_test
 from grr.lib import stats_test
 from grr.lib import test_lib
+from grr.lib import threadpool_benchmark_test
 from grr.lib import threadpool_test
 from grr.lib import throttle_test
 from grr.lib import type_info_test
@@ -13,6 +13,10 @@ ThreadPool, a log entry will be written but execution will continue
 using a smaller pool of workers. In this case, consider reducing the
 --threadpool_size.
 
+Pools which run tasks of very different lengths can be created as a
+PriorityThreadPool (see ThreadPool.Factory) so that short, urgent tasks do not
+queue behind a backlog of long ones.
+
 Example usage:
 >>> def PrintMsg(value):
 >>>   print "Message: %s" % value
@@ -23,9 +27,11 @@ Example usage:
 """
 
 
+import collections
 import itertools
 import os
 import Queue
+import thread
 import threading
 import time
 
@@ -168,6 +174,159 @@ class _WorkerThread(threading.Thread):
         return
 
 
+class _PriorityWorkerThread(_WorkerThread):
+  """A worker which also records its timings per task name."""
+
+  def ProcessTask(self, target, args, name, queueing_time):
+    start_time = time.time()
+    super(_PriorityWorkerThread, self).ProcessTask(target, args, name,
+                                                   queueing_time)
+
+    if self.pool.name:
+      stats.STATS.RecordEvent(
+          self.pool.name + "_task_queueing_time",
+          start_time - queueing_time,
+          fields=[name])
+      stats.STATS.RecordEvent(
+          self.pool.name + "_task_working_time",
+          time.time() - start_time,
+          fields=[name])
+
+
+class _LaneQueue(object):
+  """A queue with priority lanes, used by the PriorityThreadPool.
+
+  This implements the parts of the Queue.Queue interface used by the thread
+  pool. Tasks are put into the lane of their priority and workers always take
+  the oldest task of the highest priority lane which is below its concurrency
+  limit. Workers are shared by all lanes, so an idle worker picks up work from
+  lower priority lanes as soon as the higher priority ones are empty.
+  """
+
+  def __init__(self, lanes, maxsize, default_lane):
+    """Constructor.
+
+    Args:
+      lanes: A list of (lane name, concurrency limit) tuples, highest priority
+             first. A limit of None means the lane can use all the workers.
+      maxsize: The number of tasks each lane can hold.
+      default_lane: The lane of tasks put without a lane.
+    """
+    self.lanes = [lane for lane, _ in lanes]
+    self.limits = dict(lanes)
+    self.maxsize = maxsize
+    self.default_lane = default_lane
+
+    self.tasks = dict((lane, collections.deque()) for lane in self.lanes)
+    self.active = dict((lane, 0) for lane in self.lanes)
+    # Stop messages bypass the lanes and their limits.
+    self.control = collections.deque()
+    self.unfinished_tasks = 0
+    # The lane of the task each worker is processing, keyed by thread id.
+    self.worker_lanes = {}
+
+    self.mutex = threading.Lock()
+    self.not_empty = threading.Condition(self.mutex)
+    self.not_full = threading.Condition(self.mutex)
+    self.all_tasks_done = threading.Condition(self.mutex)
+
+  def qsize(self, lane=None):
+    with self.mutex:
+      if lane is not None:
+        return len(self.tasks[lane])
+      return sum(len(tasks) for tasks in self.tasks.values())
+
+  def ActiveTasks(self, lane):
+    with self.mutex:
+      return self.active[lane]
+
+  def _Wait(self, condition, endtime):
+    """Waits on condition, returns False if endtime has passed."""
+    if endtime is None:
+      condition.wait()
+      return True
+
+    remaining = endtime - time.time()
+    if remaining <= 0:
+      return False
+    condition.wait(remaining)
+    return True
+
+  def put(self, item, block=True, timeout=None, lane=None):
+    """Puts item into the given lane."""
+    if lane is None:
+      lane = self.default_lane
+
+    with self.not_full:
+      if item == STOP_MESSAGE:
+        self.control.append(item)
+      else:
+        if lane not in self.tasks:
+          raise ValueError("Unknown thread pool lane: %s" % lane)
+
+        endtime = None
+        if block and timeout is not None:
+          endtime = time.time() + timeout
+
+        while self.maxsize and len(self.tasks[lane]) >= self.maxsize:
+          if not block or not self._Wait(self.not_full, endtime):
+            raise Queue.Full()
+
+        self.tasks[lane].append(item)
+
+      self.unfinished_tasks += 1
+      self.not_empty.notify()
+
+  def _NextLane(self):
+    for lane in self.lanes:
+      limit = self.limits[lane]
+      if self.tasks[lane] and (limit is None or self.active[lane] < limit):
+        return lane
+
+  def get(self, block=True, timeout=None):
+    """Takes the next task to be processed."""
+    endtime = None
+    if block and timeout is not None:
+      endtime = time.time() + timeout
+
+    with self.not_empty:
+      while True:
+        if self.control:
+          item, lane = self.control.popleft(), None
+          break
+
+        lane = self._NextLane()
+        if lane is not None:
+          item = self.tasks[lane].popleft()
+          self.active[lane] += 1
+          break
+
+        if not block or not self._Wait(self.not_empty, endtime):
+          raise Queue.Empty()
+
+      self.worker_lanes[thread.get_ident()] = lane
+      self.not_full.notify_all()
+      return item
+
+  def task_done(self):
+    """Marks the task taken by the calling thread as done."""
+    with self.mutex:
+      lane = self.worker_lanes.pop(thread.get_ident(), None)
+      if lane is not None:
+        self.active[lane] -= 1
+        # A task waiting for a free slot in this lane can run now.
+        self.not_empty.notify()
+
+      self.unfinished_tasks -= 1
+      if self.unfinished_tasks <= 0:
+        self.all_tasks_done.notify_all()
+
+  def join(self):
+    with self.all_tasks_done:
+      while self.unfinished_tasks:
+        self.all_tasks_done.wait()
+
+
 THREADPOOL = None
 
 
@@ -192,8 +351,11 @@ class ThreadPool(object):
   POOLS = {}
   factory_lock = threading.Lock()
 
+  worker_class = _WorkerThread
+
   @classmethod
-  def Factory(cls, name, min_threads, max_threads=None):
+  def Factory(cls, name, min_threads, max_threads=None, pool_class=None,
+              **kwargs):
     """Creates a new thread pool with the given name.
 
     If the thread pool of this name already exist, we just return the existing
@@ -205,16 +367,23 @@ class ThreadPool(object):
       min_threads: The number of threads in the pool.
       max_threads: The maximum number of threads to grow the pool to. If not set
         we do not grow the pool.
+      pool_class: The thread pool implementation to use for a new pool, e.g.
+        PriorityThreadPool. Defaults to this class.
+      **kwargs: Further arguments to the constructor of pool_class.
 
     Returns:
       A threadpool instance.
     """
+    if pool_class is None:
+      pool_class = cls
+
     with cls.factory_lock:
       result = cls.POOLS.get(name)
       if result is None:
-        cls.POOLS[name] = result = cls(name,
-                                       min_threads,
-                                       max_threads=max_threads)
+        cls.POOLS[name] = result = pool_class(name,
+                                              min_threads,
+                                              max_threads=max_threads,
+                                              **kwargs)
 
       return result
 
@@ -238,7 +407,7 @@ class ThreadPool(object):
       max_threads = min_threads
 
     self.max_threads = max_threads
-    self._queue = Queue.Queue(maxsize=max_threads)
+    self._queue = self._CreateQueue()
     self.name = name
     self.started = False
     self.process = psutil.Process(os.getpid())
@@ -269,6 +438,13 @@ class ThreadPool(object):
       stats.STATS.RegisterEventMetric(self.name + "_working_time")
       stats.STATS.RegisterEventMetric(self.name + "_queueing_time")
 
+  def _CreateQueue(self):
+    return Queue.Queue(maxsize=self.max_threads)
+
+  def _PutTask(self, task, priority, block=True, timeout=None):
+    _ = priority
+    self._queue.put(task, block=block, timeout=timeout)
+
   def __del__(self):
     if self.started:
       self.Stop()
@@ -295,7 +471,7 @@ class ThreadPool(object):
 
   @utils.Synchronized
   def _AddWorker(self):
-    worker = _WorkerThread(self._queue, self)
+    worker = self.worker_class(self._queue, self)
     worker.start()
 
     self._workers[worker.name] = worker
@@ -334,7 +510,8 @@ class ThreadPool(object):
               args,
               name="Unnamed task",
               blocking=True,
-              inline=True):
+              inline=True,
+              priority=None):
     """Adds a task to be processed later.
 
     Args:
@@ -353,6 +530,9 @@ class ThreadPool(object):
         can generally block the calling thread even after the threadpool is
         available again and therefore decrease efficiency.
 
+      priority: The lane of this task in a PriorityThreadPool, ignored by
+        other pools.
+
     Raises:
       Full() if the pool is full and can not accept new jobs.
     """
@@ -368,7 +548,8 @@ class ThreadPool(object):
       while True:
         try:
           # Push the task on the queue but raise if unsuccessful.
-          self._queue.put((target, args, name, time.time()), block=False)
+          self._PutTask((target, args, name, time.time()), priority,
+                        block=False)
           return
         except Queue.Full:
           # We increase the number of active threads if we do not exceed the
@@ -393,9 +574,8 @@ class ThreadPool(object):
           # We should block and try again soon.
           elif blocking:
             try:
-              self._queue.put((target, args, name, time.time()),
-                              block=True,
-                              timeout=1)
+              self._PutTask((target, args, name, time.time()), priority,
+                            block=True, timeout=1)
               return
             except Queue.Full:
               continue
@@ -405,7 +585,11 @@ class ThreadPool(object):
 
     # We don't want to hold the lock while running the task inline
     if inline:
-      target(*args)
+      self._ProcessTaskInline(target, args, name)
+
+  def _ProcessTaskInline(self, target, args, name):
+    _ = name
+    target(*args)
 
   def CPUUsage(self):
     # Do not block this call.
@@ -416,6 +600,155 @@ class ThreadPool(object):
     self._queue.join()
 
 
+class PriorityThreadPool(ThreadPool):
+  """A thread pool with priority lanes.
+
+  Every task is added to the lane given as its priority. Workers are shared by
+  all lanes and always take the oldest task of the highest priority lane which
+  is below its concurrency limit, so short urgent tasks don't wait behind long
+  ones and limited lanes can't occupy all the threads.
+
+  In addition to the ThreadPool stats, queueing and working times are recorded
+  per task name and the outstanding and active tasks are exported per lane.
+  """
+
+  DEFAULT_LANES = [("high", None), ("normal", None), ("low", None)]
+
+  worker_class = _PriorityWorkerThread
+
+  def __init__(self,
+               name,
+               min_threads,
+               max_threads=None,
+               lanes=None,
+               default_lane="normal"):
+    """Constructor.
+
+    Args:
+      name: A prefix to identify this thread pool in the exported stats.
+      min_threads: The minimum number of worker threads this pool should have.
+      max_threads: The maximum number of threads to grow the pool to. If not set
+        we do not grow the pool.
+      lanes: A list of (lane name, concurrency limit) tuples, highest priority
+        first. A limit of None lets the lane use all the threads. Defaults to
+        DEFAULT_LANES.
+      default_lane: The lane of tasks added without a priority.
+
+    Raises:
+      ValueError: If default_lane is not one of the lanes.
+    """
+    if lanes is None:
+      lanes = self.DEFAULT_LANES
+    self.lanes = list(lanes)
+    self.default_lane = default_lane
+
+    if default_lane not in dict(self.lanes):
+      raise ValueError("Unknown default lane: %s" % default_lane)
+
+    super(PriorityThreadPool, self).__init__(name,
+                                             min_threads,
+                                             max_threads=max_threads)
+
+    if self.name:
+      stats.STATS.RegisterEventMetric(
+          self.name + "_task_queueing_time", fields=[("task", str)])
+      stats.STATS.RegisterEventMetric(
+          self.name + "_task_working_time", fields=[("task", str)])
+
+      stats.STATS.RegisterGaugeMetric(
+          self.name + "_lane_outstanding_tasks", int, fields=[("lane", str)])
+      stats.STATS.RegisterGaugeMetric(
+          self.name + "_lane_active_tasks", int, fields=[("lane", str)])
+      for lane, _ in self.lanes:
+        stats.STATS.SetGaugeCallback(
+            self.name + "_lane_outstanding_tasks",
+            lambda lane=lane: self._queue.qsize(lane),
+            fields=[lane])
+        stats.STATS.SetGaugeCallback(
+            self.name + "_lane_active_tasks",
+            lambda lane=lane: self._queue.ActiveTasks(lane),
+            fields=[lane])
+
+  def _CreateQueue(self):
+    return _LaneQueue(self.lanes, self.max_threads, self.default_lane)
+
+  def _PutTask(self, task, priority, block=True, timeout=None):
+    self._queue.put(task, block=block, timeout=timeout, lane=priority)
+
+  def AddTask(self,
+              target,
+              args,
+              name="Unnamed task",
+              blocking=True,
+              inline=True,
+              priority=None):
+    """Adds a task to be processed later, see ThreadPool.AddTask.
+
+    Tasks of lanes with a concurrency limit are never processed inline, that
+    would run them regardless of the limit. When their lane is full they wait
+    for space in it instead, unless neither blocking nor inline is set.
+
+    Args:
+      target: A callable which should be processed by one of the workers.
+      args: A tuple of arguments to target.
+      name: The name of this task. Used to identify tasks in the log.
+      blocking: If True we block until the task is queued, otherwise we raise
+        Queue.Full
+      inline: If set, process the task inline when the queue is full. Tasks of
+        limited lanes block instead.
+      priority: The lane of this task.
+
+    Raises:
+      Full() if the pool is full and can not accept new jobs.
+    """
+    lane = priority or self.default_lane
+    limit = self._queue.limits.get(lane)
+    if self.max_threads == 0 or limit is None:
+      return super(PriorityThreadPool, self).AddTask(
+          target,
+          args,
+          name=name,
+          blocking=blocking,
+          inline=inline,
+          priority=priority)
+
+    with self.lock:
+      try:
+        self._PutTask((target, args, name, time.time()), lane, block=False)
+        return
+      except Queue.Full:
+        # Another worker only helps if the lane is below its limit, otherwise
+        # the new worker couldn't take any of the lane's tasks.
+        if (len(self) < self.max_threads and
+            self._queue.ActiveTasks(lane) < limit and self.CPUUsage() < 90):
+          try:
+            self._AddWorker()
+          except (RuntimeError, threading.ThreadError):
+            logging.error("Threadpool exception: "
+                          "Could not spawn worker threads.")
+
+    if not blocking and not inline:
+      raise Full()
+
+    # The pool lock isn't held while waiting, so tasks can still be added to
+    # the other lanes.
+    self._PutTask((target, args, name, time.time()), lane, block=True)
+
+  def _ProcessTaskInline(self, target, args, name):
+    """Runs a task in the calling thread, recording its timings."""
+    start_time = time.time()
+    try:
+      target(*args)
+    finally:
+      if self.name:
+        stats.STATS.RecordEvent(
+            self.name + "_task_queueing_time", 0, fields=[name])
+        stats.STATS.RecordEvent(
+            self.name + "_task_working_time",
+            time.time() - start_time,
+            fields=[name])
+
+
 class MockThreadPool(object):
   """A mock thread pool which runs all jobs serially."""
 
@@ -425,8 +758,9 @@ class MockThreadPool(object):
     _ = max_threads
     self.ignore_errors = ignore_errors
 
-  def AddTask(self, target, args, name="Unnamed task"):
+  def AddTask(self, target, args, name="Unnamed task", priority=None):
     _ = name
+    _ = priority
     try:
       target(*args)
       # The real threadpool can not raise from a task. We emulate this here.
@@ -436,7 +770,7 @@ class MockThreadPool(object):
         raise
 
   @classmethod
-  def Factory(cls, name, min_threads, max_threads=None):
+  def Factory(cls, name, min_threads, max_threads=None, **_):
     return cls(name, min_threads, max_threads=max_threads)
 
   def Start(self):
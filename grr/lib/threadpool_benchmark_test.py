@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""Load tests comparing the thread pool implementations."""
+
+
+import threading
+import time
+
+from grr.lib import flags
+from grr.lib import test_lib
+from grr.lib import threadpool
+
+
+class ThreadPoolLoadBenchmark(test_lib.MicroBenchmarks):
+  """Queueing time of short tasks added together with long ones."""
+
+  units = "ms"
+
+  THREADS = 10
+  LONG_TASKS = 200
+  SHORT_TASKS = 200
+  LONG_TASK_TIME = 0.02
+
+  def setUp(self):
+    super(ThreadPoolLoadBenchmark, self).setUp(
+        ["Short task wait (ms)", "Long task wait (ms)"], ["<20", "<20"])
+
+  def _RunLoad(self, name, **kwargs):
+    """Runs a mix of long and short tasks, returns the mean waits."""
+    pool = threadpool.ThreadPool.Factory(
+        name, self.THREADS, max_threads=self.THREADS, **kwargs)
+    pool.Start()
+
+    waits = dict(short=[], long=[])
+    lock = threading.Lock()
+
+    def Task(kind, queued, duration):
+      with lock:
+        waits[kind].append(time.time() - queued)
+      time.sleep(duration)
+
+    try:
+      start = time.time()
+      for i in xrange(self.LONG_TASKS + self.SHORT_TASKS):
+        # Interleave one short task with every long one.
+        if i % 2:
+          pool.AddTask(Task, ("short", time.time(), 0), name="short",
+                       blocking=True, inline=False, priority="high")
+        else:
+          pool.AddTask(Task, ("long", time.time(), self.LONG_TASK_TIME),
+                       name="long", blocking=True, inline=False,
+                       priority="low")
+      pool.Join()
+      time_taken = time.time() - start
+    finally:
+      pool.Stop()
+
+    mean = lambda values: 1e3 * sum(values) / max(len(values), 1)
+    return time_taken, mean(waits["short"]), mean(waits["long"])
+
+  def testMixedLoad(self):
+    """Short and long tasks in a ThreadPool and a PriorityThreadPool."""
+    for pool_class in [threadpool.ThreadPool, threadpool.PriorityThreadPool]:
+      time_taken, short_wait, long_wait = self._RunLoad(
+          "load-%s" % pool_class.__name__, pool_class=pool_class)
+      self.AddResult(pool_class.__name__, time_taken,
+                     self.LONG_TASKS + self.SHORT_TASKS, "%.2f" % short_wait,
+                     "%.2f" % long_wait)
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
@@ -305,6 +305,145 @@ class ThreadPoolTest(test_lib.GRRBaseTest):
     pool.Stop()
 
 
+class PriorityThreadPoolTest(test_lib.GRRBaseTest):
+  """Tests for the PriorityThreadPool class."""
+
+  def _CreatePool(self, min_threads, max_threads, lanes=None):
+    pool = threadpool.ThreadPool.Factory(
+        "pool-%s" % self._testMethodName,
+        min_threads,
+        max_threads=max_threads,
+        pool_class=threadpool.PriorityThreadPool,
+        lanes=lanes)
+    pool.Start()
+    self.addCleanup(pool.Stop)
+    return pool
+
+  def testFactory(self):
+    pool = self._CreatePool(1, 1)
+    self.assertIsInstance(pool, threadpool.PriorityThreadPool)
+
+    # Existing pools are returned whatever class is asked for.
+    self.assertIs(threadpool.ThreadPool.Factory(pool.name, 1), pool)
+
+  def testHighPriorityTasksRunFirst(self):
+    pool = self._CreatePool(1, 10)
+    blocker = threading.Event()
+    pool.AddTask(blocker.wait, (10,), priority="normal")
+
+    order = []
+    for i in range(5):
+      pool.AddTask(order.append, ("low%d" % i,), priority="low")
+    for i in range(5):
+      pool.AddTask(order.append, ("high%d" % i,), priority="high")
+
+    blocker.set()
+    pool.Join()
+
+    self.assertEqual(order, ["high%d" % i for i in range(5)] +
+                     ["low%d" % i for i in range(5)])
+
+  def testLaneConcurrencyLimit(self):
+    pool = self._CreatePool(
+        4, 4, lanes=[("high", None), ("normal", None), ("low", 1)])
+    lock = threading.Lock()
+    running = [0]
+    max_running = [0]
+    blocker = threading.Event()
+
+    def LowPriorityTask():
+      with lock:
+        running[0] += 1
+        max_running[0] = max(max_running[0], running[0])
+      blocker.wait(10)
+      with lock:
+        running[0] -= 1
+
+    for _ in range(3):
+      pool.AddTask(LowPriorityTask, (), priority="low")
+
+    # The limited lane leaves threads for the other lanes.
+    done = threading.Event()
+    pool.AddTask(done.set, (), priority="high")
+    self.assertTrue(done.wait(10))
+
+    blocker.set()
+    pool.Join()
+    self.assertEqual(max_running[0], 1)
+
+  def testLimitedLaneTasksAreNotProcessedInline(self):
+    pool = self._CreatePool(2, 4, lanes=[("normal", None), ("low", 1)])
+    started = threading.Event()
+    blocker = threading.Event()
+    threads = []
+
+    def LowPriorityTask():
+      threads.append(threading.current_thread())
+      started.set()
+      blocker.wait(10)
+
+    # One task runs, the lane is full with the others.
+    pool.AddTask(LowPriorityTask, (), priority="low")
+    self.assertTrue(started.wait(10))
+    for _ in range(4):
+      pool.AddTask(LowPriorityTask, (), priority="low")
+
+    adder = threading.Thread(
+        target=pool.AddTask, args=(LowPriorityTask, ()),
+        kwargs=dict(priority="low"))
+    adder.start()
+
+    # Tasks of other lanes can be added while the adder waits.
+    done = threading.Event()
+    pool.AddTask(done.set, ())
+    self.assertTrue(done.wait(10))
+    self.assertTrue(adder.is_alive())
+    self.assertEqual(len(threads), 1)
+
+    # The lane is at its limit, more threads wouldn't help.
+    self.assertEqual(len(pool), 2)
+
+    blocker.set()
+    adder.join(10)
+    self.assertFalse(adder.is_alive())
+    pool.Join()
+
+    self.assertEqual(len(threads), 6)
+    self.assertNotIn(adder, threads)
+
+  def testLimitedLaneRaisesWhenFull(self):
+    pool = self._CreatePool(1, 1, lanes=[("normal", None), ("low", 1)])
+    blocker = threading.Event()
+    self.addCleanup(blocker.set)
+
+    for _ in range(2):
+      pool.AddTask(blocker.wait, (10,), priority="low")
+
+    with self.assertRaises(threadpool.Full):
+      pool.AddTask(
+          blocker.wait, (10,), blocking=False, inline=False, priority="low")
+
+  def testPerTaskStats(self):
+    pool = self._CreatePool(2, 2)
+    for _ in range(3):
+      pool.AddTask(time.sleep, (0,), name="Sleep", priority="low")
+    pool.AddTask(time.sleep, (0,), name="Nap")
+    pool.Join()
+
+    for metric in ["_task_queueing_time", "_task_working_time"]:
+      self.assertEqual(
+          stats.STATS.GetMetricValue(pool.name + metric, fields=["Sleep"])
+          .count, 3)
+      self.assertEqual(
+          stats.STATS.GetMetricValue(pool.name + metric, fields=["Nap"])
+          .count, 1)
+
+  def testUnknownLane(self):
+    pool = self._CreatePool(1, 1)
+    with self.assertRaises(ValueError):
+      pool.AddTask(time.sleep, (0,), priority="urgent")
+
+
 class DummyConverter(threadpool.BatchConverter):
 
   def __init__(self, **kwargs):
@@ -3,9 +3,10 @@
 import collections
 import gzip
 import hashlib
-import StringIO
+import Queue
 import struct
 import sys
+import threading
 import zlib
 
 
@@ -143,8 +144,12 @@ class DecryptStream(object):
   stream. It will collect all parts written into it and in turn write those to
   the wrapped stream.
 
+  At most one part is buffered at any time, parts larger than MAX_PART_SIZE
+  are rejected so a client can't make us buffer arbitrary amounts of data.
   """
 
+  MAX_PART_SIZE = 16 * 1024 * 1024
+
   def __init__(self, readers_private_key, writers_public_key, outfd):
     """Constructor.
 
@@ -160,31 +165,41 @@ class DecryptStream(object):
     self.writers_public_key = writers_public_key
     self.header = None
     self.part_end = None
-    self.buffer = BufferedReader()
+    # Parts are collected in a bytearray, appending to it and removing
+    # processed parts from its front doesn't copy the whole buffer.
+    self.buffer = bytearray()
     self.cipher = None
 
   def Write(self, data):
     """Write some data into the stream."""
-    self.buffer.write(data)
+    self.buffer.extend(data)
 
     while 1:
       # We are looking for the next part header.
       if self.part_end is None:
         # Not enough data to process a part.
-        if self.buffer.len < HEADER_SIZE:
+        if len(self.buffer) < HEADER_SIZE:
           return
 
         # Parse the header.
-        packed_header = self.buffer.getvalue()[:HEADER_SIZE]
-        self.header = EncryptedHeader(*struct.unpack(HEADER_FMT, packed_header))
+        self.header = EncryptedHeader(
+            *struct.unpack_from(HEADER_FMT, self.buffer))
         if self.header.Magic != HEADER_MAGIC or self.header.Version != 1:
           raise IOError("Invalid header.")
 
+        if self.header.PartLength > self.MAX_PART_SIZE:
+          raise IOError("Part too large: %d" % self.header.PartLength)
+
+        for start, length in ((self.header.DataStart, self.header.DataLength),
+                              (self.header.HMACStart, self.header.HMACLength)):
+          if start + length > self.header.PartLength:
+            raise IOError("Invalid header.")
+
         # We need to wait until we have this much data in the buffer.
         self.part_end = self.header.PartLength
 
       # We do not have a full part yet.
-      if self.buffer.len < self.part_end:
+      if len(self.buffer) < self.part_end:
         return
 
       self._ProcessPart()
@@ -197,11 +212,11 @@ class DecryptStream(object):
     Raises:
       IOError: if there is anything wrong with the data.
     """
-    payload_data = self.buffer.getvalue()[
-        self.header.DataStart:self.header.DataStart + self.header.DataLength]
+    payload_data = str(self.buffer[self.header.DataStart:self.header.DataStart
+                                   + self.header.DataLength])
 
-    payload_hmac = self.buffer.getvalue()[
-        self.header.HMACStart:self.header.HMACStart + self.header.HMACLength]
+    payload_hmac = str(self.buffer[self.header.HMACStart:self.header.HMACStart
+                                   + self.header.HMACLength])
 
     # Now process the part.
     # First header - we need to initialize the cipher.
@@ -237,11 +252,11 @@ class DecryptStream(object):
       raise IOError("HMAC not verified")
 
     # Remove the part from the buffer.
-    self.buffer.ReadFromFront(self.part_end)
+    del self.buffer[:self.part_end]
     self.part_end = None
 
   def Close(self):
-    if self.buffer.len > 0:
+    if self.buffer:
       raise IOError("Partial Message Received")
     self.flush()
     self.outfd.close()
@@ -260,14 +275,32 @@ class DecryptStream(object):
     return self.close()
 
 
-class BufferedReader(StringIO.StringIO):
-  """A FLO which can be written to the back and read from the front."""
+class BufferedReader(object):
+  """A FLO which can be written to the back and read from the front.
+
+  Reading from the front only copies the data which is returned.
+  """
+
+  def __init__(self):
+    self._buffer = bytearray()
+
+  @property
+  def len(self):
+    return len(self._buffer)
+
+  def write(self, data):  # pylint: disable=invalid-name
+    self._buffer.extend(data)
+
+  def flush(self):  # pylint: disable=invalid-name
+    pass
+
+  def getvalue(self):  # pylint: disable=invalid-name
+    return str(self._buffer)
 
   def ReadFromFront(self, length):
-    result_data = self.getvalue()
-    self.truncate(0)
-    self.write(result_data[length:])
-    return result_data[:length]
+    result_data = str(self._buffer[:length])
+    del self._buffer[:length]
+    return result_data
 
 
 class GzipWrapper(object):
@@ -338,7 +371,12 @@ class GzipWrapper(object):
 
 
 class GunzipWrapper(object):
-  """Wraps a file like object and decompresses it."""
+  """Wraps a file like object and decompresses it.
+
+  Highly compressible data (e.g. empty regions of memory or disk images) can
+  expand a single write to gigabytes, the output is written in slices of at
+  most BUFFER_SIZE bytes instead.
+  """
   BUFFER_SIZE = 1024 * 1024
 
   def __init__(self, outfd):
@@ -350,12 +388,79 @@ class GunzipWrapper(object):
     self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
 
   def Write(self, data):
-    self.outfd.write(self.decompressor.decompress(data))
+    while data:
+      decompressed = self.decompressor.decompress(data, self.BUFFER_SIZE)
+      if decompressed:
+        self.outfd.write(decompressed)
+      data = self.decompressor.unconsumed_tail
 
   def Flush(self):
     self.outfd.flush()
 
   def Close(self):
+    remaining = self.decompressor.flush()
+    if remaining:
+      self.outfd.write(remaining)
+    self.outfd.close()
+
+  write = Write
+  flush = Flush
+  close = Close
+
+
+class BackgroundWriter(object):
+  """Writes to another file like object in a separate thread.
+
+  This allows to hash and store data while the next data is decrypted and
+  decompressed. At most max_pending writes are queued, further writes block
+  until the writer thread catches up which in turn stops reading from the
+  network.
+  """
+
+  def __init__(self, outfd, max_pending=4):
+    self.outfd = outfd
+    self.queue = Queue.Queue(maxsize=max_pending)
+    self.error = None
+
+    self.thread = threading.Thread(
+        name="BackgroundWriter", target=self._WriterLoop)
+    self.thread.daemon = True
+    self.thread.start()
+
+  def _WriterLoop(self):
+    while True:
+      data = self.queue.get()
+      if data is None:
+        return
+
+      # After an error, the queue is still drained so writers don't block.
+      if self.error is None:
+        try:
+          self.outfd.write(data)
+        except Exception as e:  # pylint: disable=broad-except
+          self.error = e
+
+  def _CheckError(self):
+    if self.error is not None:
+      raise IOError("Write failed: %s" % self.error)
+
+  def Write(self, data):
+    self._CheckError()
+    if data:
+      self.queue.put(data)
+
+  def Flush(self):
+    self._CheckError()
+
+  def Stop(self):
+    """Waits for pending writes and stops the writer thread."""
+    if self.thread.is_alive():
+      self.queue.put(None)
+      self.thread.join()
+
+  def Close(self):
+    self.Stop()
+    self._CheckError()
     self.outfd.close()
 
   write = Write
@@ -2,6 +2,7 @@
 """Test the Upload functionality."""
 import gzip
 import StringIO
+import struct
 
 from grr.lib import flags
 from grr.lib import test_lib
@@ -165,6 +166,68 @@ class UploadTests(test_lib.GRRBaseTest):
     self.assertEqual(outfd.getvalue(), self.test_string)
 
 
+  def testGUnzipWrapperBoundedWrites(self):
+    data = "\x00" * (10 * uploads.GunzipWrapper.BUFFER_SIZE) + "end"
+    gzip_data = "".join(uploads.GzipWrapper(StringIO.StringIO(data)))
+
+    writes = []
+
+    class Recorder(object):
+
+      def write(self, data):  # pylint: disable=invalid-name
+        writes.append(data)
+
+      def close(self):  # pylint: disable=invalid-name
+        pass
+
+    wrapped = uploads.GunzipWrapper(Recorder())
+    wrapped.write(gzip_data)
+    wrapped.close()
+
+    self.assertEqual("".join(writes), data)
+    self.assertLessEqual(
+        max(len(w) for w in writes), uploads.GunzipWrapper.BUFFER_SIZE)
+
+  def testUploadWrapperRejectsLargeParts(self):
+    encrypted_data = self.encrypt_wrapper.read(1024 * 1024 * 100)
+    header = uploads.EncryptedHeader(
+        *struct.unpack_from(uploads.HEADER_FMT, encrypted_data))
+    header = header._replace(PartLength=uploads.DecryptStream.MAX_PART_SIZE + 1)
+
+    with self.assertRaisesRegexp(IOError, "Part too large"):
+      self.decrypt_wrapper.write(
+          struct.pack(uploads.HEADER_FMT, *header) +
+          encrypted_data[uploads.HEADER_SIZE:])
+
+  def testBackgroundWriter(self):
+    writer = uploads.BackgroundWriter(self.outfd, max_pending=1)
+    wrapped = uploads.GunzipWrapper(writer)
+    self.decrypt_wrapper.outfd = wrapped
+
+    gzip_fd = uploads.GzipWrapper(self.infd)
+    self.encrypt_wrapper.fd = gzip_fd
+    self.decrypt_wrapper.write(self.encrypt_wrapper.read(1024 * 1024 * 100))
+
+    writer.Stop()
+    self.assertEqual(self.outfd.getvalue(), self.test_string)
+
+  def testBackgroundWriterErrors(self):
+
+    class FailingFile(object):
+
+      def write(self, unused_data):  # pylint: disable=invalid-name
+        raise IOError("Disk full")
+
+      def close(self):  # pylint: disable=invalid-name
+        pass
+
+    writer = uploads.BackgroundWriter(FailingFile(), max_pending=1)
+    writer.write("data")
+
+    with self.assertRaisesRegexp(IOError, "Disk full"):
+      writer.close()
+
+
 def main(argv):
   # Run the full test suite
   test_lib.GrrTestProgram(argv=argv)
@@ -882,6 +882,13 @@ class RollingMemoryStream(object):
   def tell(self):  # pylint: disable=invalid-name
     return self._offset
 
+  def Skip(self, length):
+    """Advances the offset as if length bytes were written and discarded."""
+    if not self._stream:
+      raise ArchiveAlreadyClosedError("Attempting to skip in a closed stream.")
+
+    self._offset += length
+
   def close(self):  # pylint: disable=invalid-name
     self._stream = None
 
@@ -912,6 +919,7 @@ class StreamingZipGenerator(object):
     self._zip_fd = zipfile.ZipFile(
         self._stream, mode="w", compression=compression, allowZip64=True)
     self._compression = compression
+    self.last_zinfo = None
 
     self._ResetState()
 
@@ -1107,10 +1115,57 @@ class StreamingZipGenerator(object):
     self._zip_fd.filelist.append(self.cur_zinfo)
     self._zip_fd.NameToInfo[self.cur_zinfo.filename] = self.cur_zinfo
 
+    self.last_zinfo = self.cur_zinfo
     self._ResetState()
 
     return self._stream.GetValueAndReset()
 
+  def SkipFile(self,
+               arcname=None,
+               crc=0,
+               file_size=0,
+               compress_size=0,
+               compress_type=None,
+               st=None):
+    """Registers a file that was already written by a previous generator.
+
+    The output offset is advanced by the size the file would have taken in
+    the archive and the file is added to the central directory, but no data
+    is produced. This allows resuming a deterministic archive generation
+    without reading the contents of files that were already sent.
+
+    Args:
+      arcname: The name in the archive this should take.
+      crc: CRC32 of the uncompressed file data.
+      file_size: Size of the uncompressed file data.
+      compress_size: Size of the compressed file data.
+      compress_type: Compression type (zipfile.ZIP_DEFLATED, or ZIP_STORED)
+      st: An optional stat object to be used for setting headers.
+
+    Raises:
+      ArchiveAlreadyClosedError: If the zip if already closed.
+    """
+    if not self._stream:
+      raise ArchiveAlreadyClosedError(
+          "Attempting to write to a ZIP archive that was already closed.")
+
+    zinfo = self._GenerateZipInfo(
+        arcname=arcname, compress_type=compress_type, st=st)
+    zinfo.header_offset = self._stream.tell()
+    self._zip_fd._writecheck(zinfo)  # pylint: disable=protected-access
+    self._zip_fd._didModify = True  # pylint: disable=protected-access
+
+    # File header, compressed data and the "<LLL" data descriptor.
+    self._stream.Skip(len(zinfo.FileHeader()) + compress_size + 12)
+
+    zinfo.CRC = crc
+    zinfo.file_size = file_size
+    zinfo.compress_size = compress_size
+    self._zip_fd.filelist.append(zinfo)
+    self._zip_fd.NameToInfo[zinfo.filename] = zinfo
+
+    self.last_zinfo = zinfo
+
   @property
   def is_file_write_in_progress(self):
     return self.cur_zinfo
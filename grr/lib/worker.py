@@ -13,6 +13,7 @@ from grr.lib import aff4
 from grr.lib import config_lib
 from grr.lib import flags
 from grr.lib import flow
+from grr.lib import flow_profiler
 from grr.lib import master
 from grr.lib import queue_manager as queue_manager_lib
 from grr.lib import queues as queues_config
@@ -49,6 +50,12 @@ class GRRWorker(object):
   # A class global threadpool to be used for all workers.
   thread_pool = None
 
+  # Lanes of the thread pool when Worker.priority_threadpool is set. Tasks
+  # added by flows and hunts themselves go into the flow lane.
+  WELL_KNOWN_FLOW_LANE = "well_known_flows"
+  FLOW_LANE = "flows"
+  HUNT_LANE = "hunts"
+
   # This is a timed cache of locked flows. If this worker encounters a lock
   # failure on a flow, it will not attempt to grab this flow until the timeout.
   queued_flows = None
@@ -81,8 +88,20 @@ class GRRWorker(object):
       if threadpool_size is None:
         threadpool_size = config_lib.CONFIG["Threadpool.size"]
 
+      pool_args = {}
+      if config_lib.CONFIG["Worker.priority_threadpool"]:
+        hunt_lane_threads = config_lib.CONFIG["Worker.hunt_lane_threads"]
+        pool_args = dict(
+            pool_class=threadpool.PriorityThreadPool,
+            lanes=[(self.WELL_KNOWN_FLOW_LANE, None), (self.FLOW_LANE, None),
+                   (self.HUNT_LANE, hunt_lane_threads or None)],
+            default_lane=self.FLOW_LANE)
+
       GRRWorker.thread_pool = threadpool.ThreadPool.Factory(
-          threadpool_prefix, min_threads=2, max_threads=threadpool_size)
+          threadpool_prefix,
+          min_threads=2,
+          max_threads=threadpool_size,
+          **pool_args)
 
       GRRWorker.thread_pool.Start()
 
@@ -94,6 +113,7 @@ class GRRWorker(object):
     self.flow_lease_time = config_lib.CONFIG["Worker.flow_lease_time"]
     self.well_known_flow_lease_time = config_lib.CONFIG[
         "Worker.well_known_flow_lease_time"]
+    self.prefetch_batch_size = config_lib.CONFIG["Worker.prefetch_batch_size"]
 
   def Run(self):
     """Event loop."""
@@ -228,6 +248,7 @@ class GRRWorker(object):
     """
     now = time.time()
     processed = 0
+    batch = []
     for notification in active_notifications:
       if notification.session_id not in self.queued_flows:
         if time_limit and time.time() - now > time_limit:
@@ -235,14 +256,94 @@ class GRRWorker(object):
 
         processed += 1
         self.queued_flows.Put(notification.session_id, 1)
-        self.thread_pool.AddTask(
-            target=self._ProcessMessages,
-            args=(notification, queue_manager.Copy()),
-            name=self.__class__.__name__)
+
+        # Regular flows are locked and read in batches, this saves lots of
+        # data store round trips when there are many small flows.
+        if (self.prefetch_batch_size > 1 and
+            notification.session_id.FlowName() not in self.well_known_flows):
+          batch.append(notification)
+          if len(batch) >= self.prefetch_batch_size:
+            self._AddBatchTask(batch, queue_manager)
+            batch = []
+          continue
+
+        self._AddTask(notification, queue_manager)
+
+    if batch:
+      self._AddBatchTask(batch, queue_manager)
 
     return processed
 
-  def _ProcessRegularFlowMessages(self, flow_obj, notification):
+  def _GetLane(self, session_id):
+    if session_id.FlowName() in self.well_known_flows:
+      return self.WELL_KNOWN_FLOW_LANE
+    if session_id.Queue() == queues_config.HUNTS:
+      return self.HUNT_LANE
+    return self.FLOW_LANE
+
+  def _AddTask(self, notification, queue_manager, flow_obj=None,
+               prefetched_data=None):
+    """Processes the messages of a single flow in the thread pool."""
+    lane = self._GetLane(notification.session_id)
+    self.thread_pool.AddTask(
+        target=self._ProcessMessages,
+        args=(notification, queue_manager.Copy(), flow_obj, prefetched_data),
+        name="%s.%s" % (self.__class__.__name__, lane),
+        priority=lane)
+
+  def _AddBatchTask(self, notifications, queue_manager):
+    if len(notifications) == 1:
+      self._AddTask(notifications[0], queue_manager)
+    else:
+      self.thread_pool.AddTask(
+          target=self._ProcessMessageBatch,
+          args=(notifications, queue_manager.Copy()),
+          name="%s.batch" % self.__class__.__name__,
+          priority=self.FLOW_LANE)
+
+  def _ProcessMessageBatch(self, notifications, queue_manager):
+    """Locks and reads a batch of flows, then processes each of them."""
+    flow_objs = None
+    prefetched_data = {}
+    try:
+      flow_objs = aff4.FACTORY.MultiOpenWithLock(
+          [notification.session_id for notification in notifications],
+          lease_time=self.flow_lease_time,
+          token=self.token)
+
+      prefetched_data = queue_manager.PrefetchCompletedResponses([
+          notification for notification in notifications
+          if notification.session_id in flow_objs
+      ])
+
+    except Exception as e:  # pylint: disable=broad-except
+      # Without the prefetched data every flow can still be processed on its
+      # own.
+      logging.exception("Unable to prefetch flows: %s", e)
+      stats.STATS.IncrementCounter("worker_prefetch_errors")
+
+    stats.STATS.RecordEvent("worker_prefetch_batch_size", len(notifications))
+
+    for notification in notifications:
+      session_id = notification.session_id
+      flow_obj = None
+      if flow_objs is not None:
+        flow_obj = flow_objs.get(session_id)
+        if flow_obj is None:
+          # Another worker is dealing with this flow right now.
+          stats.STATS.IncrementCounter("worker_flow_lock_error")
+          continue
+
+      self._AddTask(
+          notification,
+          queue_manager,
+          flow_obj=flow_obj,
+          prefetched_data=prefetched_data.get(session_id))
+
+  def _ProcessRegularFlowMessages(self,
+                                  flow_obj,
+                                  notification,
+                                  prefetched_data=None):
     """Processes messages for a given flow."""
     session_id = notification.session_id
     if not isinstance(flow_obj, flow.FlowBase):
@@ -255,7 +356,9 @@ class GRRWorker(object):
 
     runner = flow_obj.GetRunner()
     try:
-      runner.ProcessCompletedRequests(notification, self.thread_pool)
+      with flow_profiler.Span(flow_obj.Name(), "ProcessCompletedRequests"):
+        runner.ProcessCompletedRequests(
+            notification, self.thread_pool, prefetched_data=prefetched_data)
     except Exception as e:  # pylint: disable=broad-except
       # Something went wrong - log it in the flow.
       runner.context.state = rdf_flows.FlowContext.State.ERROR
@@ -263,56 +366,81 @@ class GRRWorker(object):
       logging.error("Flow %s: %s", flow_obj, e)
       raise FlowProcessingError(e)
 
-  def _ProcessMessages(self, notification, queue_manager):
-    """Does the real work with a single flow."""
-    flow_obj = None
+  def _ProcessWellKnownFlowMessages(self, flow_obj, notification,
+                                    queue_manager):
+    """Drains the response shards of a well known flow.
+
+    Well known flows have no state so they are never locked. Each shard of
+    their responses is locked while it is read and emptied instead, other
+    workers drain the remaining shards at the same time.
+
+    Args:
+      flow_obj: The well known flow.
+      notification: The notification for the flow.
+      queue_manager: The QueueManager to use.
+    """
     session_id = notification.session_id
+    stats.STATS.IncrementCounter(
+        "well_known_flow_requests", fields=[str(session_id)])
+
+    # We remove requests first and then process them in the thread pool.
+    # This approach increases the risk of losing requests in case the worker
+    # process dies but the shards are not locked while requests are
+    # processed.
+    with queue_manager_lib.WellKnownQueueManager(token=self.token) as manager:
+      responses, busy_shards = manager.FetchAndRemoveResponses(
+          session_id, lease_time=self.well_known_flow_lease_time)
+
+    # Some responses might be left in the shards other workers are draining,
+    # the notification makes sure we look at them again.
+    if not busy_shards:
+      queue_manager.DeleteNotification(session_id, end=notification.timestamp)
 
-    try:
-      # Take a lease on the flow:
-      flow_name = session_id.FlowName()
-      if flow_name in self.well_known_flows:
-        # Well known flows are not necessarily present in the data store so
-        # we need to create them instead of opening.
-        expected_flow = self.well_known_flows[flow_name].__class__
-        flow_obj = aff4.FACTORY.CreateWithLock(
-            session_id,
-            expected_flow,
-            lease_time=self.well_known_flow_lease_time,
-            blocking=False,
-            token=self.token)
-      else:
-        flow_obj = aff4.FACTORY.OpenWithLock(
-            session_id,
-            lease_time=self.flow_lease_time,
-            blocking=False,
-            token=self.token)
+    flow_obj.ProcessResponses(responses, self.thread_pool)
 
-      now = time.time()
-      logging.debug("Got lock on %s", session_id)
+  def _ProcessMessages(self,
+                       notification,
+                       queue_manager,
+                       flow_obj=None,
+                       prefetched_data=None):
+    """Does the real work with a single flow.
 
-      # If we get here, we now own the flow. We can delete the notifications
-      # we just retrieved but we need to make sure we don't delete any that
-      # came in later.
-      queue_manager.DeleteNotification(session_id, end=notification.timestamp)
+    Args:
+      notification: The notification for the flow.
+      queue_manager: The QueueManager to use.
+      flow_obj: The flow if it was already opened with a lock.
+      prefetched_data: The flow's queue_manager.PrefetchedFlowData, if any.
+    """
+    session_id = notification.session_id
 
+    try:
+      flow_name = session_id.FlowName()
       if flow_name in self.well_known_flows:
-        stats.STATS.IncrementCounter(
-            "well_known_flow_requests", fields=[str(session_id)])
-
-        # We remove requests first and then process them in the thread pool.
-        # On one hand this approach increases the risk of losing requests in
-        # case the worker process dies. On the other hand, it doesn't hold
-        # the lock while requests are processed, so other workers can
-        # process well known flows requests as well.
-        with flow_obj:
-          responses = flow_obj.FetchAndRemoveRequestsAndResponses(session_id)
-
-        flow_obj.ProcessResponses(responses, self.thread_pool)
+        now = time.time()
+        flow_obj = self.well_known_flows[flow_name]
+        self._ProcessWellKnownFlowMessages(flow_obj, notification,
+                                           queue_manager)
 
       else:
+        # Take a lease on the flow unless the batch already got one.
+        if flow_obj is None:
+          flow_obj = aff4.FACTORY.OpenWithLock(
+              session_id,
+              lease_time=self.flow_lease_time,
+              blocking=False,
+              token=self.token)
+
+        now = time.time()
+        logging.debug("Got lock on %s", session_id)
+
+        # If we get here, we now own the flow. We can delete the notifications
+        # we just retrieved but we need to make sure we don't delete any that
+        # came in later.
+        queue_manager.DeleteNotification(session_id, end=notification.timestamp)
+
         with flow_obj:
-          self._ProcessRegularFlowMessages(flow_obj, notification)
+          self._ProcessRegularFlowMessages(
+              flow_obj, notification, prefetched_data=prefetched_data)
 
       elapsed = time.time() - now
       logging.debug("Done processing %s: %s sec", session_id, elapsed)
@@ -364,3 +492,6 @@ class WorkerInit(registry.InitHook):
     stats.STATS.RegisterEventMetric(
         "worker_flow_processing_time", fields=[("flow", str)])
     stats.STATS.RegisterEventMetric("worker_time_to_retrieve_notifications")
+    stats.STATS.RegisterEventMetric(
+        "worker_prefetch_batch_size", bins=[1, 2, 5, 10, 20, 50, 100, 200])
+    stats.STATS.RegisterCounterMetric("worker_prefetch_errors")
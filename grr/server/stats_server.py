@@ -14,6 +14,8 @@ import threading
 import logging
 
 from grr.lib import config_lib
+from grr.lib import data_store_tracer
+from grr.lib import flow_profiler
 from grr.lib import registry
 from grr.lib import stats
 from grr.lib import utils
@@ -64,6 +66,80 @@ def BuildVarzJsonString():
   return encoder.encode(results)
 
 
+def ParseVarzJsonString(varz_json):
+  """Parses the output of BuildVarzJsonString()."""
+  return json.loads(varz_json, object_pairs_hook=collections.OrderedDict)
+
+
+def _ZeroMetricValue(metric_type):
+  if metric_type == stats.MetricType.EVENT.name:
+    return dict(sum=0, counter=0, bins_heights={})
+  return 0
+
+
+def _AddMetricValues(metric_type, value, other, sign):
+  if metric_type == stats.MetricType.EVENT.name:
+    bins_heights = collections.OrderedDict(value["bins_heights"])
+    for bin_value, height in other["bins_heights"].iteritems():
+      bins_heights[bin_value] = bins_heights.get(bin_value, 0) + sign * height
+
+    return dict(
+        sum=value["sum"] + sign * other["sum"],
+        counter=value["counter"] + sign * other["counter"],
+        bins_heights=bins_heights)
+
+  if not isinstance(other, (int, long, float)):
+    # Values of non numeric gauges can't be added, the last one wins.
+    return other if sign > 0 else value
+
+  return value + sign * other
+
+
+def AddVarz(varz, other, sign=1, metric_types=None):
+  """Adds the metric values of two parsed varz dicts.
+
+  This is used to aggregate the metrics of several processes.
+
+  Args:
+    varz: A dict as returned by ParseVarzJsonString(), it is not modified.
+    other: The varz dict to add.
+    sign: Use -1 to subtract other instead.
+    metric_types: If given, only metrics of these types (e.g. "COUNTER") are
+                  added.
+
+  Returns:
+    A new varz dict.
+  """
+  result = collections.OrderedDict(varz)
+  for name, metric in other.iteritems():
+    info = metric["info"]
+    metric_type = info["metric_type"]
+    if metric_types and metric_type not in metric_types:
+      continue
+
+    if info.get("fields_defs"):
+      value = collections.OrderedDict(result.get(name, {}).get("value", {}))
+      for fields, field_value in metric["value"].iteritems():
+        value[fields] = _AddMetricValues(
+            metric_type,
+            value.get(fields, _ZeroMetricValue(metric_type)), field_value, sign)
+    else:
+      value = _AddMetricValues(
+          metric_type,
+          result.get(name, {}).get("value", _ZeroMetricValue(metric_type)),
+          metric["value"], sign)
+
+    result[name] = dict(info=result.get(name, metric)["info"], value=value)
+
+  return result
+
+
+# If set, a function returning the parsed varz which are served instead of the
+# ones of this process. This allows a supervisor to serve the aggregated
+# metrics of its child processes.
+VARZ_PROVIDER = None
+
+
 class StatsServerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
   """Default stats server implementation."""
 
@@ -73,7 +149,30 @@ class StatsServerHandler(BaseHTTPServer.BaseHTTPRequestHandler):
       self.send_header("Content-type", "application/json")
       self.end_headers()
 
-      self.wfile.write(BuildVarzJsonString())
+      if VARZ_PROVIDER is not None:
+        self.wfile.write(json.dumps(VARZ_PROVIDER()))
+      else:
+        self.wfile.write(BuildVarzJsonString())
+    elif self.path == "/flow_profile":
+      if flow_profiler.PROFILER is None:
+        self.send_error(404, "Flow profiling is disabled.")
+        return
+
+      self.send_response(200)
+      self.send_header("Content-type", "text/plain")
+      self.end_headers()
+      self.wfile.write(flow_profiler.PROFILER.DumpFoldedStacks())
+    elif self.path == "/datastore_slow_queries":
+      if data_store_tracer.TRACER is None:
+        self.send_error(404, "Data store tracing is disabled.")
+        return
+
+      self.send_response(200)
+      self.send_header("Content-type", "application/json")
+      self.end_headers()
+      self.wfile.write(
+          json.dumps([query._asdict()
+                      for query in data_store_tracer.GetSlowQueries()]))
     else:
       self.send_error(403, "Access forbidden: %s" % self.path)
 
@@ -51,6 +51,47 @@ class StatsServerTest(test_lib.GRRBaseTest):
         )), set(["sum", "bins_heights", "counter"]))
 
 
+  def testAddVarz(self):
+    stats.STATS.RegisterCounterMetric("test_counter")
+    stats.STATS.RegisterCounterMetric("test_counter_with_fields",
+                                      fields=[("type", str)])
+    stats.STATS.RegisterEventMetric("test_event")
+    stats.STATS.RegisterGaugeMetric("test_gauge", str)
+
+    stats.STATS.IncrementCounter("test_counter", 2)
+    stats.STATS.IncrementCounter("test_counter_with_fields", fields=["a"])
+    stats.STATS.RecordEvent("test_event", 15)
+    stats.STATS.SetGaugeValue("test_gauge", "foo")
+    varz = stats_server.ParseVarzJsonString(stats_server.BuildVarzJsonString())
+
+    stats.STATS.IncrementCounter("test_counter_with_fields", fields=["b"])
+    stats.STATS.SetGaugeValue("test_gauge", "bar")
+    other = stats_server.ParseVarzJsonString(
+        stats_server.BuildVarzJsonString())
+
+    result = stats_server.AddVarz(varz, other)
+    self.assertEqual(result["test_counter"]["value"], 4)
+    self.assertEqual(result["test_counter_with_fields"]["value"],
+                     {"a": 2,
+                      "b": 1})
+    self.assertEqual(result["test_event"]["value"]["counter"], 2)
+    self.assertEqual(result["test_event"]["value"]["sum"], 30)
+    self.assertEqual(result["test_gauge"]["value"], "bar")
+
+    # Subtracting the original values yields the changes.
+    result = stats_server.AddVarz(other, varz, sign=-1)
+    self.assertEqual(result["test_counter"]["value"], 0)
+    self.assertEqual(result["test_counter_with_fields"]["value"],
+                     {"a": 0,
+                      "b": 1})
+    self.assertEqual(result["test_event"]["value"]["counter"], 0)
+
+    # Metrics of some types can be skipped.
+    result = stats_server.AddVarz(varz, other, metric_types=["COUNTER"])
+    self.assertEqual(result["test_event"]["value"]["counter"], 1)
+    self.assertEqual(result["test_gauge"]["value"], "foo")
+
+
 def main(args):
   test_lib.main(args)
 
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+"""Runs several worker processes and supervises them.
+
+A single worker process can't use more than one core since the flow
+processing threads share the GIL. The supervisor forks worker processes after
+the (expensive) initialization so the imported modules and the configuration
+are shared copy-on-write. Every process only reads its share of the
+notification shards so they don't compete for the same notifications, dead
+processes are restarted and the stats of all processes are served as a single
+/varz export by the supervisor.
+"""
+
+
+import errno
+import json
+import os
+import signal
+import struct
+import sys
+import threading
+import time
+
+
+import logging
+
+from grr.lib import config_lib
+from grr.lib import data_store
+from grr.lib import queue_manager
+from grr.lib import registry
+from grr.lib import stats
+from grr.server import stats_server
+
+
+def AssignNotificationShards(index, num_processes, num_shards):
+  """Returns the notification shards read by worker process number index."""
+  if num_processes <= num_shards:
+    return [i for i in range(num_shards) if i % num_processes == index]
+
+  # There are more processes than shards, some of them share a shard.
+  return [index % num_shards]
+
+
+def _ReinitializeLoggingLocks():
+  """Replaces the locks of the logging module in a forked process.
+
+  Other threads of the supervisor might have held them when we forked. These
+  threads don't exist in the child, so the locks would never be released and
+  the first log message would dead lock.
+  """
+  # pylint: disable=protected-access
+  logging._lock = threading.RLock()
+  for handler_ref in logging._handlerList:
+    handler = handler_ref()
+    if handler is not None:
+      handler.createLock()
+  # pylint: enable=protected-access
+
+
+class _Child(object):
+  """A worker process started by the supervisor."""
+
+  def __init__(self, index, pid, stats_fd):
+    self.index = index
+    self.pid = pid
+    self.stats_fd = stats_fd
+    self.start_time = time.time()
+    self.stats_thread = None
+
+
+class WorkerSupervisor(object):
+  """Forks worker processes and restarts them when they die."""
+
+  _LENGTH_FMT = "!I"
+
+  def __init__(self,
+               num_processes,
+               target,
+               restart_delay=None,
+               stats_interval=None):
+    """Constructor.
+
+    Args:
+      num_processes: The number of worker processes to run.
+      target: The function run in each worker process, the process exits when
+              it returns.
+      restart_delay: Processes which die faster than this are restarted after
+                     this many seconds, defaults to
+                     Worker.process_restart_delay.
+      stats_interval: How often processes send their stats, defaults to
+                      Worker.process_stats_interval.
+    """
+    if restart_delay is None:
+      restart_delay = config_lib.CONFIG["Worker.process_restart_delay"]
+    if stats_interval is None:
+      stats_interval = config_lib.CONFIG["Worker.process_stats_interval"]
+
+    self.num_processes = num_processes
+    self.target = target
+    self.restart_delay = restart_delay
+    self.stats_interval = stats_interval
+
+    self.children = {}
+    self.lock = threading.Lock()
+    self.send_lock = threading.Lock()
+    self.running = False
+
+    # The latest stats reported by each process, as changes since it was
+    # forked.
+    self.child_varz = {}
+    # Counters and events of processes which exited.
+    self.exited_varz = {}
+
+  def Start(self):
+    """Starts all the worker processes."""
+    self.running = True
+    for index in range(self.num_processes):
+      self._StartChild(index)
+
+  def Run(self):
+    """Runs the worker processes until we are interrupted."""
+    # Once we serve the aggregated stats the supervisor's own stats are only
+    # a baseline.
+    stats_server.VARZ_PROVIDER = self.GetVarz
+    signal.signal(signal.SIGTERM,
+                  lambda unused_signum, unused_frame: sys.exit())
+
+    self.Start()
+    try:
+      while self.running:
+        self.CheckChildren(block=True)
+    except (KeyboardInterrupt, SystemExit):
+      logging.info("Stopping worker processes.")
+    finally:
+      self.Stop()
+
+  def _StartChild(self, index):
+    read_fd, write_fd = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+      os.close(read_fd)
+      self._RunChild(index, write_fd)
+
+    os.close(write_fd)
+    logging.info("Started worker process %d with pid %d.", index, pid)
+
+    child = _Child(index, pid, read_fd)
+    child.stats_thread = threading.Thread(
+        name="WorkerStatsReader%d" % index,
+        target=self._ReadChildStats,
+        args=(child,))
+    child.stats_thread.daemon = True
+    child.stats_thread.start()
+
+    with self.lock:
+      self.children[pid] = child
+
+  def _RunChild(self, index, stats_fd):
+    """Runs in the forked worker process, never returns."""
+    exit_code = 0
+    try:
+      # The supervisor's threads don't exist in this process, the locks they
+      # might have held at the time of the fork would never be released.
+      _ReinitializeLoggingLocks()
+      self.lock = threading.Lock()
+      self.send_lock = threading.Lock()
+
+      # Close the file descriptors we inherited from the other processes.
+      for child in self.children.values():
+        try:
+          os.close(child.stats_fd)
+        except OSError:
+          pass
+      self.children = {}
+      self.child_varz = {}
+
+      signal.signal(signal.SIGTERM,
+                    lambda unused_signum, unused_frame: self._Interrupt())
+      stats_server.VARZ_PROVIDER = None
+
+      queue_manager.QueueManager.notification_shards_to_read = (
+          AssignNotificationShards(index, self.num_processes,
+                                   config_lib.CONFIG["Worker.queue_shards"]))
+
+      # Connections to the data store must not be shared between processes.
+      data_store.DB = data_store.DB.__class__()
+      data_store.DB.Initialize()
+
+      baseline = self._GetVarz()
+      reporter = threading.Thread(
+          name="WorkerStatsReporter",
+          target=self._ReportStats,
+          args=(stats_fd, baseline))
+      reporter.daemon = True
+      reporter.start()
+
+      try:
+        self.target()
+      except KeyboardInterrupt:
+        pass
+
+      data_store.DB.Flush()
+      self._SendStats(stats_fd, baseline)
+
+    except Exception as e:  # pylint: disable=broad-except
+      logging.exception("Worker process %d failed: %s", index, e)
+      exit_code = 1
+
+    finally:
+      # Don't run any of the supervisor's cleanup handlers.
+      os._exit(exit_code)  # pylint: disable=protected-access
+
+  def _Interrupt(self):
+    raise KeyboardInterrupt()
+
+  def _GetVarz(self):
+    return stats_server.ParseVarzJsonString(
+        stats_server.BuildVarzJsonString())
+
+  def _SendStats(self, stats_fd, baseline):
+    varz = stats_server.AddVarz(self._GetVarz(), baseline, sign=-1)
+    data = json.dumps(varz)
+    data = struct.pack(self._LENGTH_FMT, len(data)) + data
+    with self.send_lock:
+      while data:
+        data = data[os.write(stats_fd, data):]
+
+  def _ReportStats(self, stats_fd, baseline):
+    while True:
+      time.sleep(self.stats_interval)
+      try:
+        self._SendStats(stats_fd, baseline)
+      except OSError as e:
+        logging.error("Supervisor went away (%s), exiting.", e)
+        os._exit(1)  # pylint: disable=protected-access
+
+  def _ReadExactly(self, fd, length):
+    data = ""
+    while len(data) < length:
+      chunk = os.read(fd, length - len(data))
+      if not chunk:
+        return None
+      data += chunk
+    return data
+
+  def _ReadChildStats(self, child):
+    """Receives the stats of a child until it exits."""
+    length_size = struct.calcsize(self._LENGTH_FMT)
+    try:
+      while True:
+        header = self._ReadExactly(child.stats_fd, length_size)
+        if header is None:
+          return
+
+        data = self._ReadExactly(child.stats_fd,
+                                 struct.unpack(self._LENGTH_FMT, header)[0])
+        if data is None:
+          return
+
+        varz = stats_server.ParseVarzJsonString(data)
+        with self.lock:
+          self.child_varz[child.pid] = varz
+    except (OSError, ValueError) as e:
+      logging.warning("Unable to read stats of worker process %d: %s",
+                      child.index, e)
+
+  def _ChildExited(self, pid, status):
+    with self.lock:
+      child = self.children.pop(pid, None)
+    if child is None:
+      return
+
+    child.stats_thread.join()
+    # The pipe is only closed once the child is no longer listed, processes
+    # forked later close the pipes of all the listed children and must not
+    # close a reused file descriptor.
+    os.close(child.stats_fd)
+
+    with self.lock:
+      varz = self.child_varz.pop(pid, None)
+      if varz:
+        # The gauges of exited processes are no longer valid.
+        self.exited_varz = stats_server.AddVarz(
+            self.exited_varz,
+            varz,
+            metric_types=[
+                stats.MetricType.COUNTER.name, stats.MetricType.EVENT.name
+            ])
+
+    if not self.running:
+      return
+
+    logging.error("Worker process %d (pid %d) exited with status %d.",
+                  child.index, pid, status)
+    stats.STATS.IncrementCounter("grr_worker_process_restarts")
+
+    if time.time() - child.start_time < self.restart_delay:
+      time.sleep(self.restart_delay)
+
+    self._StartChild(child.index)
+
+  def CheckChildren(self, block=False):
+    """Restarts worker processes which exited.
+
+    Args:
+      block: If True, waits until a process exits.
+    """
+    while self.children:
+      try:
+        pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+      except OSError as e:
+        if e.errno == errno.EINTR:
+          continue
+        if e.errno == errno.ECHILD:
+          return
+        raise
+
+      if pid == 0:
+        return
+
+      self._ChildExited(pid, status)
+      if block:
+        return
+
+  def Stop(self):
+    """Stops all worker processes and waits for them to exit."""
+    self.running = False
+
+    with self.lock:
+      pids = list(self.children)
+
+    for pid in pids:
+      try:
+        os.kill(pid, signal.SIGTERM)
+      except OSError:
+        pass
+
+    while self.children:
+      self.CheckChildren(block=True)
+
+  def GetVarz(self):
+    """Returns the aggregated stats of all worker processes."""
+    with self.lock:
+      varz = stats_server.AddVarz(self._GetVarz(), self.exited_varz)
+      for child_varz in self.child_varz.values():
+        varz = stats_server.AddVarz(varz, child_varz)
+
+    return varz
+
+
+class WorkerSupervisorInit(registry.InitHook):
+
+  def RunOnce(self):
+    stats.STATS.RegisterCounterMetric("grr_worker_process_restarts")
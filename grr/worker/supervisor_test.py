@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""Tests for the worker supervisor."""
+
+
+import os
+import signal
+import threading
+import time
+
+
+import logging
+
+from grr.lib import flags
+from grr.lib import stats
+from grr.lib import test_lib
+from grr.worker import supervisor
+
+
+class WorkerSupervisorTest(test_lib.GRRBaseTest):
+  """Tests the WorkerSupervisor."""
+
+  def testAssignNotificationShards(self):
+    self.assertEqual([
+        supervisor.AssignNotificationShards(i, 2, 5) for i in range(2)
+    ], [[0, 2, 4], [1, 3]])
+
+    # All processes get a shard if there are not enough of them.
+    self.assertEqual([
+        supervisor.AssignNotificationShards(i, 4, 3) for i in range(4)
+    ], [[0], [1], [2], [0]])
+
+  def testRestartsProcessesAndAggregatesStats(self):
+    stats.STATS.RegisterCounterMetric("supervisor_test_counter")
+    pid_file = os.path.join(self.temp_dir, "pids")
+
+    def Target():
+      with open(pid_file, "a") as fd:
+        fd.write("%d\n" % os.getpid())
+      stats.STATS.IncrementCounter("supervisor_test_counter")
+
+    restarts = stats.STATS.GetMetricValue("grr_worker_process_restarts")
+
+    worker_supervisor = supervisor.WorkerSupervisor(
+        2, Target, restart_delay=0, stats_interval=3600)
+    worker_supervisor.Start()
+    try:
+      while (stats.STATS.GetMetricValue("grr_worker_process_restarts") <
+             restarts + 4):
+        worker_supervisor.CheckChildren(block=True)
+    finally:
+      worker_supervisor.Stop()
+
+    with open(pid_file) as fd:
+      pids = fd.read().split()
+
+    self.assertGreaterEqual(len(set(pids)), 4)
+    self.assertNotIn(str(os.getpid()), pids)
+
+    # Every process which exited reported its stats.
+    varz = worker_supervisor.GetVarz()
+    self.assertGreaterEqual(varz["supervisor_test_counter"]["value"], 4)
+
+  def testChildrenCanLogWhileAnotherThreadHoldsTheLoggingLock(self):
+    pid_file = os.path.join(self.temp_dir, "pids")
+
+    def Target():
+      # Creating a logger needs the lock of the logging module.
+      logging.getLogger("supervisor_test").info("Worker started.")
+      with open(pid_file, "a") as fd:
+        fd.write("%d\n" % os.getpid())
+
+    locked = threading.Event()
+    release = threading.Event()
+
+    def HoldLoggingLock():
+      logging._acquireLock()  # pylint: disable=protected-access
+      try:
+        locked.set()
+        release.wait(10)
+      finally:
+        logging._releaseLock()  # pylint: disable=protected-access
+
+    thread = threading.Thread(target=HoldLoggingLock)
+    thread.start()
+    locked.wait(10)
+
+    worker_supervisor = supervisor.WorkerSupervisor(
+        1, Target, restart_delay=3600, stats_interval=3600)
+    worker_supervisor.Start()
+    try:
+      for _ in range(100):
+        if os.path.exists(pid_file):
+          break
+        time.sleep(0.1)
+
+      self.assertTrue(os.path.exists(pid_file))
+    finally:
+      release.set()
+      thread.join()
+      # A dead locked process doesn't handle SIGTERM.
+      if not os.path.exists(pid_file):
+        for pid in worker_supervisor.children:
+          os.kill(pid, signal.SIGKILL)
+      worker_supervisor.Stop()
+
+
+def main(argv):
+  test_lib.main(argv)
+
+
+if __name__ == "__main__":
+  flags.StartMain(main)
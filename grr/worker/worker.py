@@ -16,6 +16,13 @@ from grr.lib import config_lib
 from grr.lib import flags
 from grr.lib import server_startup
 from grr.lib import worker
+from grr.worker import supervisor
+
+
+def RunWorker():
+  token = access_control.ACLToken(username="GRRWorker").SetUID()
+  worker_obj = worker.GRRWorker(token=token)
+  worker_obj.Run()
 
 
 def main(unused_argv):
@@ -25,9 +32,12 @@ def main(unused_argv):
 
   # Initialise flows
   server_startup.Init()
-  token = access_control.ACLToken(username="GRRWorker").SetUID()
-  worker_obj = worker.GRRWorker(token=token)
-  worker_obj.Run()
+
+  num_processes = config_lib.CONFIG["Worker.num_processes"]
+  if num_processes > 1:
+    supervisor.WorkerSupervisor(num_processes, RunWorker).Run()
+  else:
+    RunWorker()
 
 
 if __name__ == "__main__":
@@ -343,6 +343,39 @@ class GrrWorkerTest(test_lib.FlowTestsBaseclass):
         flow_obj.context.state == rdf_flows.FlowContext.State.TERMINATED)
     self.assertEqual(flow_obj.context.current_state, "End")
 
+  def testProcessMessagesInBatches(self):
+    """Regular flows are locked and read in batches."""
+    session_ids = []
+    for _ in range(5):
+      flow_obj = self.FlowSetup("WorkerSendingTestFlow2")
+      session_ids.append(flow_obj.session_id)
+      flow_obj.Close()
+
+    for session_id in session_ids:
+      self.SendResponse(session_id, "Hello")
+
+    with test_lib.ConfigOverrider({"Worker.prefetch_batch_size": 3}):
+      worker_obj = worker.GRRWorker(token=self.token)
+
+    def OpenWithLock(*unused_args, **unused_kwargs):
+      raise AssertionError("Flows should not be locked one by one.")
+
+    # Another worker is processing the last flow.
+    with aff4.FACTORY.OpenWithLock(session_ids[-1], token=self.token):
+      with utils.Stubber(aff4.FACTORY, "OpenWithLock", OpenWithLock):
+        worker_obj.RunOnce()
+        worker_obj.thread_pool.Join()
+
+    self.assertEqual(RESULTS, ["Hello"] * 4)
+    for session_id in session_ids[:-1]:
+      flow_obj = aff4.FACTORY.Open(session_id, token=self.token)
+      self.assertEqual(flow_obj.context.state,
+                       rdf_flows.FlowContext.State.TERMINATED)
+
+    flow_obj = aff4.FACTORY.Open(session_ids[-1], token=self.token)
+    self.assertEqual(flow_obj.context.state,
+                     rdf_flows.FlowContext.State.RUNNING)
+
   def testNoNotificationRescheduling(self):
     """Test that no notifications are rescheduled when a flow raises."""
 
@@ -699,6 +732,63 @@ class GrrWorkerTest(test_lib.FlowTestsBaseclass):
     client = aff4.FACTORY.Open(client_id.Add("stats"), token=self.token)
     self.assertIsNone(client.Get(client.Schema.STATS))
 
+  def testWellKnownFlowShardsAreDrainedIndependently(self):
+    session_id = WorkerSendingWKTestFlow.well_known_session_id
+    with queue_manager.QueueManager(token=self.token) as manager:
+      for i in range(20):
+        manager.QueueResponse(
+            session_id,
+            rdf_flows.GrrMessage(
+                source=rdf_client.ClientURN("C.%016X" % i),
+                session_id=session_id,
+                payload=rdfvalue.RDFInteger(i),
+                request_id=0,
+                response_id=i + 1))
+      manager.QueueNotification(session_id=session_id)
+
+    manager = queue_manager.WellKnownQueueManager(token=self.token)
+    shard_sizes = []
+    for shard in range(manager.num_well_known_flow_shards):
+      shard_sizes.append(
+          len(
+              data_store.DB.ResolvePrefix(
+                  manager.GetWellKnownFlowResponseSubject(session_id, shard),
+                  manager.FLOW_RESPONSE_PREFIX,
+                  token=self.token)))
+
+    self.assertEqual(sum(shard_sizes), 20)
+    # The responses are spread over the shards.
+    self.assertLess(max(shard_sizes), 20)
+
+    worker_obj = worker.GRRWorker(token=self.token)
+
+    # Another worker is draining the largest shard. We don't need the lock of
+    # the flow to drain the others.
+    busy_shard = shard_sizes.index(max(shard_sizes))
+    with aff4.FACTORY.OpenWithLock(session_id, token=self.token):
+      with data_store.DB.LockRetryWrapper(
+          manager.GetWellKnownFlowResponseSubject(session_id, busy_shard),
+          blocking=False,
+          token=self.token):
+        worker_obj.RunOnce()
+        worker_obj.thread_pool.Join()
+
+    self.assertEqual(len(RESULTS), 20 - shard_sizes[busy_shard])
+
+    # The notification is kept so the busy shard is drained later.
+    notifications = manager.GetNotificationsForAllShards(session_id.Queue())
+    self.assertIn(session_id,
+                  [notification.session_id for notification in notifications])
+
+    worker_obj.RunOnce()
+    worker_obj.thread_pool.Join()
+
+    self.assertEqual(len(RESULTS), 20)
+    notifications = manager.GetNotificationsForAllShards(session_id.Queue())
+    self.assertNotIn(
+        session_id,
+        [notification.session_id for notification in notifications])
+
   def CheckNotificationsDisappear(self, session_id):
     worker_obj = worker.GRRWorker(token=self.token)
     manager = queue_manager.QueueManager(token=self.token)